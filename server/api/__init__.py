@@ -8,9 +8,28 @@ from flask_jwt_extended import JWTManager
 # internal imports
 from api.config import Config
 from api.errors import register_error_handlers
+from api.utils.indexes import register_indexes
+from api.utils.bulk_transfer import register_bulk_transfer
+from api.utils.geo_index import PostalCodeIndex
+from api.utils.distance_cache import DistanceCache
+from api.utils.lane_table import LaneTable
+from api.utils.model_registry import ModelRegistry
+from api.utils.metrics import RequestMetrics
+from api.utils.mongo_pool import PoolMonitor, client_options
+from api.utils.ping_buffer import PingBuffer
+from api.utils.carrier_index import CarrierIndex
+from api.utils.preload import preload_dependencies
 
 mongo = PyMongo()
 jwt = JWTManager()
+geo_index = PostalCodeIndex()
+distance_cache = DistanceCache()
+lane_table = LaneTable()
+model_registry = ModelRegistry()
+request_metrics = RequestMetrics()
+pool_monitor = PoolMonitor()
+ping_buffer = PingBuffer()
+carrier_index = CarrierIndex()
 
 def create_app(config_class = Config):
     '''
@@ -32,19 +51,44 @@ def create_app(config_class = Config):
         supports_credentials = True
     )
     
-    mongo.init_app(app)
+    # the command listener times the MongoDB calls of every request, the pool monitor tracks the connections
+    mongo.init_app(app, **client_options(app.config), event_listeners=[request_metrics.listener, pool_monitor])
+    pool_monitor.init_app(app)
     jwt.init_app(app)
+    geo_index.init_app(app)
+    distance_cache.init_app(app)
+    lane_table.init_app(app)
+    model_registry.init_app(app)
+    request_metrics.init_app(app)
+    ping_buffer.init_app(app)
+    carrier_index.init_app(app)
 
     register_error_handlers(app)
+    register_indexes(app)
+    register_bulk_transfer(app)
+    preload_dependencies(app)
 
     # importing blueprints inside the factory function 
     # to avoid circular imports
     from api.user import user_bp
     from api.shipment import ship_bp
     from api.services import services_bp
+    from api.admin import admin_bp
+    from api.tracking import tracking_bp
+    from api.services.training import register_model_cli
+    from api.services.route_routes import register_route_cli
+    from api.utils.geo_search import register_geo_cli
+    from api.utils.lane_table import register_lane_cli
+
+    register_model_cli(app)
+    register_route_cli(app)
+    register_geo_cli(app)
+    register_lane_cli(app)
 
     app.register_blueprint(user_bp, url_prefix = '/users')
     app.register_blueprint(ship_bp, url_prefix = '/shipments')
     app.register_blueprint(services_bp, url_prefix = '/services')
+    app.register_blueprint(admin_bp, url_prefix = '/admin')
+    app.register_blueprint(tracking_bp, url_prefix = '/tracking')
 
     return app
\ No newline at end of file
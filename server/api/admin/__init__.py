@@ -0,0 +1,18 @@
+from functools import wraps
+from flask import Blueprint, current_app, abort
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+admin_bp = Blueprint('admin', __name__)
+
+def admin_required(fn):
+    """Restricts an endpoint to the users listed in ADMIN_USER_IDS."""
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        if get_jwt_identity() not in current_app.config.get('ADMIN_USER_IDS', []):
+            abort(403, 'Admin access required.')
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+from api.admin import transfer_routes, pool_routes
@@ -0,0 +1,34 @@
+# external imports
+from typing import Tuple, Dict, Any
+from flask import request, current_app, jsonify
+
+# internal imports
+from api import pool_monitor
+from api.admin import admin_bp, admin_required
+from api.utils.mongo_pool import client_options
+
+@admin_bp.route('/db/pool-stats', methods=['GET'])
+@admin_required
+def get_pool_stats() -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to fetch the MongoDB connection pool statistics of this worker, with the pool
+    settings in effect. ?reset=true starts the peaks and wait samples over.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    try:
+        reset = request.args.get('reset', 'false').lower() in ['true', 'yes']
+
+        return jsonify({
+            'message': 'Pool stats fetched successfully.',
+            'data': {
+                **pool_monitor.stats(reset_peaks=reset),
+                'options': client_options(current_app.config),
+                'read_preference': pool_monitor.read_preference.mongos_mode
+            }
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while fetching pool stats: %s', e)
+        raise e
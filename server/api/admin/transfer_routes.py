@@ -0,0 +1,120 @@
+# external imports
+import os
+import shutil
+import tempfile
+from bson import ObjectId
+from typing import Tuple, Dict, Any
+from flask import Response, request, current_app, abort, jsonify, send_file, stream_with_context
+
+# internal imports
+from api import mongo
+from api.admin import admin_bp, admin_required
+from api.utils.mongo_pool import read_db
+from api.utils.streaming import NDJSON_MIMETYPE
+from api.utils.bulk_transfer import (
+    TRANSFER_MODELS, TRANSFER_FORMATS, export_chunks, ndjson_lines, write_parquet,
+    read_ndjson, read_parquet, import_documents
+)
+
+MAX_CHUNK_SIZE = 10000
+
+def _transfer_args(collection: str) -> Tuple[type, str, int]:
+    """Validates the collection, format and chunk size of a transfer request."""
+    if collection not in TRANSFER_MODELS:
+        abort(404, f'Unknown collection, use one of {list(TRANSFER_MODELS)}.')
+
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        chunk_size = int(request.args.get('chunk_size', 1000))
+    except ValueError:
+        abort(400, 'Invalid chunk_size.')
+
+    if fmt not in TRANSFER_FORMATS or not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        abort(400, 'Invalid arguments.')
+
+    return TRANSFER_MODELS[collection], fmt, chunk_size
+
+@admin_bp.route('/export/<string:collection>', methods=['GET'])
+@admin_required
+def export_collection(collection: str) -> Response:
+    """
+    Endpoint to export a collection in _id order, validated through its model. NDJSON is streamed
+    chunk by chunk; an interrupted download resumes with ?after=<last _id received>.
+
+    Args
+        collection: shipments, bids or vehicles.
+
+    Returns
+        [Response]: NDJSON stream or Parquet file.
+    """
+    try:
+        model, fmt, chunk_size = _transfer_args(collection)
+
+        after = request.args.get('after')
+        if after is not None and not ObjectId.is_valid(after):
+            abort(400, 'Invalid object id.')
+
+        stats = { 'read': 0, 'written': 0, 'invalid': 0, 'duplicates': 0, 'errors': [] }
+        chunks = export_chunks(read_db()[collection], model, chunk_size, ObjectId(after) if after else None, stats)
+
+        if fmt == 'ndjson':
+            def lines():
+                for chunk, _ in chunks:
+                    yield ndjson_lines(chunk)
+                if stats['invalid']:
+                    current_app.logger.warning('Export of %s skipped %d invalid documents: %s', collection, stats['invalid'], stats['errors'])
+
+            return Response(stream_with_context(lines()), mimetype=NDJSON_MIMETYPE)
+
+        # parquet needs its footer before it can be read, the file is built first
+        with tempfile.NamedTemporaryFile(suffix='.parquet', delete=False) as tmp:
+            path = tmp.name
+        try:
+            write_parquet(path, model, chunks)
+            f = open(path, 'rb')
+        finally:
+            os.remove(path) # the open handle keeps the data readable until the response is sent
+
+        return send_file(f, mimetype='application/vnd.apache.parquet', as_attachment=True, download_name=f'{collection}.parquet')
+
+    except Exception as e:
+        current_app.logger.error('Error while exporting %s: %s', collection, e)
+        raise e
+
+@admin_bp.route('/import/<string:collection>', methods=['POST'])
+@admin_required
+def import_collection(collection: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to import NDJSON or Parquet sent as the request body. Documents are validated through
+    the collection's model and inserted with unordered insert_many per chunk; existing _ids count as
+    duplicates. ?offset=N skips the first N records, e.g. those imported by an interrupted request.
+
+    Args
+        collection: shipments, bids or vehicles.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    try:
+        model, fmt, chunk_size = _transfer_args(collection)
+        offset = int(request.args.get('offset', 0))
+
+        if offset < 0:
+            abort(400, 'Invalid arguments.')
+
+        if fmt == 'ndjson':
+            stats = import_documents(mongo.db[collection], model, read_ndjson(request.stream, offset), chunk_size)
+        else:
+            with tempfile.NamedTemporaryFile(suffix='.parquet') as tmp:
+                shutil.copyfileobj(request.stream, tmp)
+                tmp.flush()
+                stats = import_documents(mongo.db[collection], model, read_parquet(tmp.name, offset, chunk_size), chunk_size)
+
+        return jsonify({
+            'message': f'{collection} imported successfully.',
+            'data': { **stats, 'offset': offset + stats['read'] }
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while importing %s: %s', collection, e)
+        raise e
@@ -0,0 +1,99 @@
+# external imports
+import os
+import logging
+import warnings
+import contextlib
+from pymongo import AsyncMongoClient
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Route, Mount
+from werkzeug.exceptions import HTTPException, InternalServerError
+
+with warnings.catch_warnings():
+    # starlette suggests a2wsgi instead, which is not a dependency
+    warnings.simplefilter('ignore', DeprecationWarning)
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+# internal imports
+from api import create_app, request_metrics, pool_monitor
+from api.config import Config
+from api.errors import error_body
+from api.utils.mongo_pool import client_options
+from api.asgi.helpers import AuthError, MetricsMiddleware, json_response
+from api.asgi.routes import ROUTES
+
+logger = logging.getLogger(__name__)
+
+def create_asgi_app(config_class = Config) -> Starlette:
+    '''
+    Factory function of the ASGI app, an alternative to serving create_app with a WSGI server.
+
+    The hot paths (api.asgi.routes.ROUTES) are served by async handlers over pymongo's
+    AsyncMongoClient, with model scoring and distance calculations pushed to a thread pool of
+    ASGI_CPU_WORKERS threads. Every other route is served by the flask app of create_app, mounted
+    as a WSGI app, which also provides the configuration, the JWT settings, the json provider and
+    the resident model and geo index shared with the async handlers.
+
+    Serve with e.g. `uvicorn asgi:app --workers 4` or
+    `gunicorn -w 4 -k uvicorn.workers.UvicornWorker asgi:app` from the server directory.
+
+    Args
+        config_class: Python class containing app configurations
+
+    Returns
+        app: Starlette app
+    '''
+    flask_app = create_app(config_class)
+    config = flask_app.config
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        # created per worker process, after a preloading master forked
+        app.state.client = AsyncMongoClient(
+            config.get('MONGO_URI'), **client_options(config), event_listeners=[request_metrics.listener, pool_monitor]
+        )
+        app.state.db = app.state.client.get_default_database()
+        app.state.read_db = app.state.db.with_options(read_preference=pool_monitor.read_preference)
+        app.state.executor = ThreadPoolExecutor(
+            max_workers=config.get('ASGI_CPU_WORKERS') or os.cpu_count(), thread_name_prefix='asgi-cpu'
+        )
+        try:
+            yield
+        finally:
+            await app.state.client.close()
+            app.state.executor.shutdown(wait=False)
+
+    async def http_error(request: Request, error: HTTPException) -> Response:
+        return json_response(request, error_body(error.code, error), error.code)
+
+    async def auth_error(request: Request, error: AuthError) -> Response:
+        return json_response(request, { 'msg': error.msg }, error.status)
+
+    async def server_error(request: Request, error: Exception) -> Response:
+        return json_response(request, error_body(500, InternalServerError(original_exception=error)), 500)
+
+    # same policy as create_app; flask_cors handles the mounted routes
+    middleware = [Middleware(
+        CORSMiddleware,
+        allow_origins=['http://localhost:5173'],
+        allow_headers=['Authorization', 'Content-Type'],
+        allow_credentials=True
+    ), Middleware(MetricsMiddleware)]
+
+    app = Starlette(
+        routes=[
+            *[Route(path, endpoint, methods=methods, middleware=middleware) for path, endpoint, methods in ROUTES],
+            Mount('/', app=WSGIMiddleware(flask_app))
+        ],
+        exception_handlers={ HTTPException: http_error, AuthError: auth_error, Exception: server_error },
+        lifespan=lifespan
+    )
+    app.state.flask_app = flask_app
+    app.state.config = config
+
+    return app
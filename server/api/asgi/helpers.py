@@ -0,0 +1,151 @@
+# external imports
+import re
+import time
+import asyncio
+import functools
+from typing import Callable, Dict, TypeVar, Any
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+from starlette.requests import Request
+from starlette.responses import Response
+from werkzeug.exceptions import abort
+from flask_jwt_extended import decode_token
+from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
+
+# internal imports
+from api import request_metrics
+from api.utils.metrics import Breakdown, current_breakdown
+
+T = TypeVar('T')
+
+class AuthError(Exception):
+    """Missing or invalid access token, rendered like flask_jwt_extended does: {msg}."""
+
+    def __init__(self, status: int, msg: str):
+        super().__init__(msg)
+        self.status = status
+        self.msg = msg
+
+def json_response(request: Request, body: Dict[str, Any], status: int = 200) -> Response:
+    """
+    Renders a body with the json provider of the flask app, so that both apps emit the same json.
+
+    Args
+        request: current request.
+        body: response body.
+        status: http status code.
+
+    Returns
+        [Response]: json response.
+    """
+    return Response(request.app.state.flask_app.json.dumps(body), status_code=status, media_type='application/json')
+
+async def read_json(request: Request) -> Any:
+    """
+    Parses the json body of a request.
+
+    Args
+        request: current request.
+
+    Returns
+        [Any]: decoded body.
+    """
+    try:
+        return await request.json()
+    except ValueError:
+        abort(400, 'Invalid json body.')
+
+def current_user_id(request: Request) -> str:
+    """
+    Verifies the bearer token with the JWT settings of the flask app.
+
+    Args
+        request: current request.
+
+    Returns
+        [str]: identity of the token.
+
+    Raises
+        [AuthError]: missing, expired or invalid token.
+    """
+    # same checks and messages as flask_jwt_extended, which also accepts comma separated credentials
+    header = request.headers.get('Authorization', '').strip().strip(',')
+    if not header:
+        raise AuthError(401, 'Missing Authorization Header')
+
+    bearer = [value for value in re.split(r',\s*', header) if value.split()[0] == 'Bearer']
+    if len(bearer) != 1:
+        raise AuthError(401, "Missing 'Bearer' type in 'Authorization' header. Expected 'Authorization: Bearer <JWT>'")
+
+    parts = bearer[0].split()
+    if len(parts) != 2:
+        raise AuthError(422, "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'")
+    token = parts[1]
+
+    flask_app = request.app.state.flask_app
+    try:
+        with flask_app.app_context():
+            claims = decode_token(token)
+    except ExpiredSignatureError:
+        raise AuthError(401, 'Token has expired')
+    except InvalidTokenError as e:
+        raise AuthError(422, str(e))
+
+    if claims.get('type') != 'access':
+        raise AuthError(422, 'Only non-refresh tokens are allowed')
+
+    return claims[flask_app.config.get('JWT_IDENTITY_CLAIM', 'sub')]
+
+async def run_cpu(request: Request, fn: Callable[..., T], *args: Any) -> T:
+    """
+    Runs CPU-bound work (model scoring, geodesic distances) on the executor of the app, so that
+    the event loop keeps serving other requests.
+
+    Args
+        request: current request.
+        fn: function to run.
+        args: its arguments.
+
+    Returns
+        [T]: value returned by fn.
+    """
+    loop = asyncio.get_running_loop()
+    # executor threads do not share the context of the request
+    parent = current_breakdown()
+    if parent is not None:
+        fn, args = parent.fork().run, (fn, *args)
+    return await loop.run_in_executor(request.app.state.executor, functools.partial(fn, *args))
+
+class MetricsMiddleware:
+    """
+    Route middleware recording the requests of the native handlers in request_metrics, as the
+    request hooks of the flask app do for the mounted routes. The endpoint label is
+    asgi.<handler name>.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not request_metrics.enabled:
+            return await self.app(scope, receive, send)
+
+        # unhandled exceptions are rendered by the app's 500 handler, outside of the route
+        status = 500
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        breakdown = Breakdown()
+        start = time.perf_counter()
+        try:
+            with breakdown.active():
+                await self.app(scope, receive, send_status)
+        finally:
+            query = scope.get('query_string', b'').decode('latin-1')
+            request_metrics.observe(
+                f'asgi.{scope["endpoint"].__name__}', scope['method'], status, time.perf_counter() - start,
+                breakdown, scope['path'] + (f'?{query}' if query else '')
+            )
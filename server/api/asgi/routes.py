@@ -0,0 +1,303 @@
+# external imports
+import time
+import asyncio
+import logging
+import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument
+from starlette.requests import Request
+from starlette.responses import Response
+from werkzeug.exceptions import abort
+
+# internal imports
+from api.asgi.helpers import json_response, read_json, current_user_id, run_cpu
+from api.utils.geo import calculate_distance, geo_point
+from api.utils.transactions import run_in_transaction_async
+from api.services.distance_routes import parse_distance_matrix_request, distance_matrix_data
+from api.services.ranking_routes import parse_top_bids_request, top_bids_results
+from api.services.predict_top_bid import bid_feature_pipeline, feature_arrays, rank_bids, score_bid, push_bid_update
+from api.shipment.bidding import SCORING_FIELDS, parse_bid
+from api.db_models.user_models import Carrier
+from api.db_models.shipment_models import Shipment, Bid
+
+logger = logging.getLogger(__name__)
+
+async def get_shipment(request: Request) -> Response:
+    """
+    Async GET /shipments/<s_id>, see api.shipment.management.get_shipment.
+    """
+    db, config = request.app.state.read_db, request.app.state.config
+    s_id = request.path_params['s_id']
+    try:
+        if not ObjectId.is_valid(s_id):
+            abort(400, 'Invalid object id.')
+
+        res = await db.shipments.find_one({ '_id': ObjectId(s_id) })
+        if not res:
+            abort(404, 'Shipment not found.')
+
+        return json_response(request, {
+            'message': 'Shipment fetched successfully.',
+            'data': Shipment.serialize_document(res, config.get('TRUSTED_READS'))
+        }, 200)
+
+    except Exception as e:
+        logger.error('Error while fetching shipment %s: %s', s_id, e)
+        raise e
+
+async def create_shipment(request: Request) -> Response:
+    """
+    Async POST /shipments/, see api.shipment.management.create_shipment. The distance is
+    calculated on the executor while the postal codes are checked.
+    """
+    state = request.app.state
+    db = state.db
+    try:
+        user_id = current_user_id(request)
+        data = await read_json(request)
+        req_fields = [
+            'origin_code',
+            'destination_code',
+            'cargo_load'
+        ]
+
+        if not isinstance(data, dict) or not all(field in data for field in req_fields):
+            abort(400, 'Missing required fields.')
+
+        origin_code = str(data.get('origin_code')).strip()
+        destination_code = str(data.get('destination_code')).strip()
+
+        try:
+            cargo_load = float(data.get('cargo_load'))
+        except (TypeError, ValueError):
+            abort(400, 'Invalid cargo load.')
+
+        known_codes, distance_km = await asyncio.gather(
+            db.shippers.distinct('postal_code', { 'postal_code': { '$in': [origin_code, destination_code] } }),
+            run_cpu(request, calculate_distance, origin_code, destination_code),
+            return_exceptions=True
+        )
+        if isinstance(known_codes, BaseException):
+            raise known_codes
+        if not { origin_code, destination_code } <= set(known_codes):
+            abort(404, 'Origin or destination not found.')
+        if isinstance(distance_km, ValueError):
+            abort(400, 'Could not calculate the distance between origin and destination.')
+        if isinstance(distance_km, BaseException):
+            raise distance_km
+
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        new_shipment = Shipment(**{
+            '_id': ObjectId(),
+            'origin_code': origin_code,
+            'destination_code': destination_code,
+            'pickup_location': geo_point(origin_code),
+            'distance': distance_km,
+            'status': 'waiting',
+            'cargo_load': cargo_load,
+            'created_at': now,
+            'updated_at': now
+        })
+
+        async def create(session):
+            # appending first also resolves the shipper of the current user
+            shipper = await db.shippers.find_one_and_update(
+                { 'user_id': ObjectId(user_id) },
+                { '$push': { 'sent_shipments': new_shipment.id } },
+                projection={ '_id': 1 },
+                session=session
+            )
+            if not shipper:
+                abort(404, 'Shipper not found.')
+
+            new_shipment.shipper_id = shipper['_id']
+            try:
+                await db.shipments.insert_one(new_shipment.to_bson(), session=session)
+            except Exception as e:
+                # without a transaction, the id appended to the shipper is taken back
+                if session is None:
+                    await db.shippers.update_one({ '_id': shipper['_id'] }, { '$pull': { 'sent_shipments': new_shipment.id } })
+                raise e
+
+        await run_in_transaction_async(state.client, create, state.config.get('MONGO_TRANSACTIONS'))
+
+        return json_response(request, {
+            'message': 'Shipment created successfully.',
+            'data': {
+                'shipment': new_shipment.to_json()
+            }
+        }, 201)
+
+    except Exception as e:
+        logger.error('Error while creating shipment: %s', e)
+        raise e
+
+async def add_bid(request: Request) -> Response:
+    """
+    Async POST /shipments/<sh_id>/bids, see api.shipment.bidding.add_bid. The bid is scored on
+    the executor.
+    """
+    state = request.app.state
+    db, config = state.db, state.config
+    sh_id = request.path_params['sh_id']
+    try:
+        user_id = current_user_id(request)
+        if not ObjectId.is_valid(sh_id):
+            abort(400, 'Invalid object id.')
+
+        try:
+            bid_data = parse_bid(await read_json(request))
+        except ValueError as e:
+            abort(400, str(e))
+
+        return_documents = request.query_params.get('return_documents', 'false').lower() in ['true', 'yes']
+
+        carrier_res, shipment_res = await asyncio.gather(
+            db.carriers.find_one({ 'user_id': ObjectId(user_id) }, { '_id': 1 }),
+            db.shipments.find_one({ '_id': ObjectId(sh_id) }, SCORING_FIELDS)
+        )
+        if not carrier_res:
+            abort(404, 'Carrier not found.')
+        if not shipment_res:
+            abort(404, 'Shipment not found.')
+
+        bid_data.update({ '_id': ObjectId(), 'shipment_id': ObjectId(sh_id), 'carrier_id': carrier_res['_id'] })
+
+        try:
+            bid_data['score'] = await run_cpu(request, score_bid, bid_data, shipment_res)
+        except Exception as e:
+            logger.warning('Could not score bid for shipment %s: %s', sh_id, e)
+
+        bid = Bid(**bid_data)
+
+        async def place(session):
+            await db.bids.insert_one(bid.to_bson(), session=session)
+
+            shipment_filter = { '_id': ObjectId(sh_id) }
+            shipment_update = push_bid_update(bid_data['_id'], bid.score)
+            carrier_filter = { '_id': carrier_res['_id'] }
+            carrier_update = { '$push': { 'bids': bid_data['_id'] } }
+
+            if return_documents:
+                shipment = await db.shipments.find_one_and_update(
+                    shipment_filter, shipment_update, return_document=ReturnDocument.AFTER, session=session
+                )
+            else:
+                shipment = (await db.shipments.update_one(shipment_filter, shipment_update, session=session)).matched_count
+
+            if not shipment:
+                # a shipment deleted since it was read: aborting rolls the transaction back, without
+                # one the bid is deleted
+                if session is None:
+                    await db.bids.delete_one({ '_id': bid_data['_id'] })
+                abort(404, 'Shipment not found.')
+
+            if not return_documents:
+                await db.carriers.update_one(carrier_filter, carrier_update, session=session)
+                return None, None
+
+            carrier = await db.carriers.find_one_and_update(
+                carrier_filter, carrier_update, return_document=ReturnDocument.AFTER, session=session
+            )
+            return shipment, carrier
+
+        shipment, carrier = await run_in_transaction_async(state.client, place, config.get('MONGO_TRANSACTIONS'))
+
+        response = { 'bid': bid.to_json() }
+        if return_documents:
+            trusted = config.get('TRUSTED_READS')
+            response.update({
+                'shipment': Shipment.serialize_document(shipment, trusted),
+                'carrier': Carrier.serialize_document(carrier, trusted)
+            })
+
+        return json_response(request, {
+            'message': 'Bid placed successfully.',
+            'data': response
+        }, 200)
+
+    except Exception as e:
+        logger.error('Error while adding bid to shipment %s: %s', sh_id, e)
+        raise e
+
+def rank_documents(docs):
+    """Builds the feature matrix of aggregated bids and ranks them, on the executor."""
+    return rank_bids(*feature_arrays(docs, expected=len(docs)))
+
+async def get_top_bids_batch(request: Request) -> Response:
+    """
+    Async POST /services/top-bids:batch, see api.services.ranking_routes.get_top_bids_batch.
+    The features are aggregated by the server, scoring and selection run on the executor.
+    """
+    db, config = request.app.state.db, request.app.state.config
+    try:
+        current_user_id(request)
+        start = time.perf_counter()
+
+        try:
+            sh_ids = parse_top_bids_request(await read_json(request), config.get('TOP_BIDS_BATCH_MAX'))
+        except ValueError as e:
+            abort(400, str(e))
+
+        timings = {}
+        fetch_start = time.perf_counter()
+        cursor = await db.bids.aggregate(bid_feature_pipeline({ 'shipment_id': { '$in': [ObjectId(sh_id) for sh_id in sh_ids] } }))
+        docs = await cursor.to_list(None)
+        timings['fetch_ms'] = (time.perf_counter() - fetch_start) * 1e3
+
+        winners, rank_timings = await run_cpu(request, rank_documents, docs)
+        timings.update(rank_timings)
+
+        load_start = time.perf_counter()
+        trusted = config.get('TRUSTED_READS')
+        top_bids = {
+            doc['_id']: Bid.serialize_document(doc, trusted)
+            for doc in await db.bids.find({ '_id': { '$in': [bid_id for bid_id, _ in winners.values()] } }).to_list(None)
+        }
+        timings['load_ms'] = (time.perf_counter() - load_start) * 1e3
+        timings['total_ms'] = (time.perf_counter() - start) * 1e3
+
+        return json_response(request, {
+            'message': 'Top bids fetched successfully.',
+            'data': {
+                'results': top_bids_results(sh_ids, winners, top_bids),
+                'timings': { stage: round(ms, 3) for stage, ms in timings.items() }
+            }
+        }, 200)
+
+    except Exception as e:
+        logger.error('Error while getting top bids in batch: %s', e)
+        raise e
+
+async def get_distance_matrix(request: Request) -> Response:
+    """
+    Async POST /services/distance-matrix, see api.services.distance_routes.get_distance_matrix.
+    The matrix is calculated on the executor.
+    """
+    try:
+        current_user_id(request)
+
+        try:
+            origins, destinations, country, method = parse_distance_matrix_request(
+                await read_json(request), request.app.state.config.get('DISTANCE_MATRIX_MAX_CELLS')
+            )
+        except ValueError as e:
+            abort(400, str(e))
+
+        return json_response(request, {
+            'message': 'Distance matrix calculated successfully.',
+            'data': await run_cpu(request, distance_matrix_data, origins, destinations, country, method)
+        }, 200)
+
+    except Exception as e:
+        logger.error('Error while calculating distance matrix: %s', e)
+        raise e
+
+# (path, endpoint, methods) served natively; every other route is served by the flask app
+ROUTES = [
+    ('/shipments/{s_id}', get_shipment, ['GET']),
+    ('/shipments/', create_shipment, ['POST']),
+    ('/shipments/{sh_id}/bids', add_bid, ['POST']),
+    ('/services/top-bids:batch', get_top_bids_batch, ['POST']),
+    ('/services/distance-matrix', get_distance_matrix, ['POST']),
+]
@@ -10,8 +10,63 @@ class Config:
 
     TESTING = os.environ.get('TESTING', 'False').lower() in ['true', 'yes']
     MODEL_DIR = os.path.join(base_dir, 'models')
+    MODEL_FILE = os.environ.get('MODEL_FILE', 'model.pkl') # *.joblib files can be memory-mapped
+    MODEL_MMAP = os.environ.get('MODEL_MMAP', 'True').lower() in ['true', 'yes']
+    MODEL_PRELOAD = os.environ.get('MODEL_PRELOAD', 'False').lower() in ['true', 'yes'] # load in create_app, e.g. with gunicorn --preload
+    SCORING_BACKEND = os.environ.get('SCORING_BACKEND', 'sklearn') # sklearn, forest (flat numpy arrays) or linear, see api.utils.scoring_backends
+    MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 5)) # seconds between checks of the model file's mtime
+    TOP_BIDS_BATCH_MAX = int(os.environ.get('TOP_BIDS_BATCH_MAX', 200)) # shipments per /services/top-bids:batch request
+    BIDS_BULK_MAX = int(os.environ.get('BIDS_BULK_MAX', 500)) # bids per /shipments/bids:bulk request
+    GEO_DATA_DIR = os.environ.get('GEO_DATA_DIR', os.path.join(base_dir, 'data', 'geo'))
+    GEO_PRELOAD_COUNTRIES = [c.strip() for c in os.environ.get('GEO_PRELOAD_COUNTRIES', '').split(',') if c.strip()] # countries loaded in create_app, e.g. IN; loaded on first use otherwise
+    PRELOAD_MODULES = [m.strip() for m in os.environ.get('PRELOAD_MODULES', '').split(',') if m.strip()] # heavy dependencies imported in create_app, e.g. fastapi.encoders,geopy.distance (see api.utils.preload)
+    DISTANCE_CACHE_SIZE = int(os.environ.get('DISTANCE_CACHE_SIZE', 10000)) # lanes kept in memory per worker
+    DISTANCE_CACHE_PATH = os.environ.get('DISTANCE_CACHE_PATH', os.path.join(base_dir, 'data', 'distance_cache.sqlite3')) # empty to disable the on-disk spill
+    LANE_TABLE_PATH = os.environ.get('LANE_TABLE_PATH', os.path.join(base_dir, 'data', 'lanes.npy')) # built by `flask lanes build`, lanes are computed live while it does not exist
+    LANE_TABLE_RELOAD_INTERVAL = float(os.environ.get('LANE_TABLE_RELOAD_INTERVAL', 5)) # seconds between checks of the lane table file's mtime, a rebuilt table is mapped by running workers
+    LANE_TABLE_TOP = int(os.environ.get('LANE_TABLE_TOP', 200000)) # most frequent lanes kept by `flask lanes build`, 24 bytes per slot at half load
+    DISTANCE_MATRIX_MAX_CELLS = int(os.environ.get('DISTANCE_MATRIX_MAX_CELLS', 250000)) # e.g. 500 origins x 500 destinations
+    PAGINATION_COUNT_TTL = float(os.environ.get('PAGINATION_COUNT_TTL', 30)) # seconds a list endpoint's count=cached total is reused
+    STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 20)) # documents per database round trip of streamed list responses
+    STREAM_MAX_PER_PAGE = int(os.environ.get('STREAM_MAX_PER_PAGE', 1000)) # per_page limit of format=json-stream|ndjson
+    TRUSTED_READS = os.environ.get('TRUSTED_READS', 'True').lower() in ['true', 'yes'] # serialize documents read from the database without validating them
+    NEARBY_DEFAULT_RADIUS_KM = float(os.environ.get('NEARBY_DEFAULT_RADIUS_KM', 50)) # radius of nearby shipment/carrier searches without ?radius=
+    NEARBY_MAX_RADIUS_KM = float(os.environ.get('NEARBY_MAX_RADIUS_KM', 500))
+    MATCHING_DEFAULT_RADIUS_KM = float(os.environ.get('MATCHING_DEFAULT_RADIUS_KM', 200)) # farthest carrier base from the pickup of matched carriers without ?radius=
+    MATCHING_MAX_CANDIDATES = int(os.environ.get('MATCHING_MAX_CANDIDATES', 50)) # carriers per match request
+    MATCHING_REFRESH_INTERVAL = float(os.environ.get('MATCHING_REFRESH_INTERVAL', 5)) # seconds between polls of carrier changes made by other workers
+    MATCHING_RELOAD_INTERVAL = float(os.environ.get('MATCHING_RELOAD_INTERVAL', 600)) # seconds between full reloads of the carrier index, which drop deleted carriers; 0 to load once
+    MATCHING_REQUIRE_VEHICLE = os.environ.get('MATCHING_REQUIRE_VEHICLE', 'True').lower() in ['true', 'yes'] # only carriers with a registered vehicle are matched
+    ROUTE_GRAPH_PATH = os.environ.get('ROUTE_GRAPH_PATH', '') # road graph .npz of the route optimizer, see api.utils.road_graph; great-circle distances when empty
+    ROUTE_AVERAGE_SPEED_KMH = float(os.environ.get('ROUTE_AVERAGE_SPEED_KMH', 40)) # estimated_duration of optimized routes
+    ROUTE_TIME_LIMIT = float(os.environ.get('ROUTE_TIME_LIMIT', 2)) # seconds spent improving one route
+    ROUTE_MAX_STOPS = int(os.environ.get('ROUTE_MAX_STOPS', 2000)) # stops of one route optimized per request
+    ROUTE_PROCESSES = int(os.environ.get('ROUTE_PROCESSES', 0)) # processes of `flask routes optimize`, 0 for the cpu count
+    ROUTE_PARALLEL_MIN_STOPS = int(os.environ.get('ROUTE_PARALLEL_MIN_STOPS', 500)) # smaller batches of routes are solved in-process
+    TRACKING_BATCH_MAX = int(os.environ.get('TRACKING_BATCH_MAX', 1000)) # location pings per POST /tracking/pings and per page of ping history
+    TRACKING_FLUSH_INTERVAL = float(os.environ.get('TRACKING_FLUSH_INTERVAL', 1.0)) # seconds between writes of buffered pings, 0 to write them before answering
+    TRACKING_FLUSH_SIZE = int(os.environ.get('TRACKING_FLUSH_SIZE', 5000)) # buffered pings that trigger a write before the interval
+    TRACKING_BUFFER_MAX = int(os.environ.get('TRACKING_BUFFER_MAX', 100000)) # buffered pings per worker before requests wait for the write
     CLIENT_URL = os.environ.get('CLIENT_URL')
     MONGO_URI = os.environ.get('MONGO_URI')
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)) # connections per server and worker; MONGO_* pool settings override MONGO_URI options
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)) # connections kept open while idle
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 0)) # wait for a free connection before failing, 0 for no limit
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 20000))
+    MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary') # of the read-only GET routes, e.g. secondaryPreferred
+    MONGO_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', 0)) # lag limit of secondary reads, 0 for none (at least 90 otherwise)
+    MONGO_WRITE_CONCERN = os.environ.get('MONGO_WRITE_CONCERN', '') # w of the client, e.g. majority or 1; empty for the server default
+    MONGO_WRITE_TIMEOUT_MS = int(os.environ.get('MONGO_WRITE_TIMEOUT_MS', 0)) # wtimeout of the write concern, 0 for none
+    MONGO_TRANSACTIONS = { 'true': True, 'yes': True, 'auto': 'auto' }.get(os.environ.get('MONGO_TRANSACTIONS', 'auto').lower(), False) # true, false or auto: used when the server is a replica set member or mongos, checked once
+    MONGO_ENSURE_INDEXES = os.environ.get('MONGO_ENSURE_INDEXES', 'False').lower() in ['true', 'yes'] # create missing indexes in create_app; deployments run `flask indexes ensure` instead
+    ASGI_CPU_WORKERS = int(os.environ.get('ASGI_CPU_WORKERS', 0)) # threads scoring bids and calculating distances in the ASGI app, 0 for the cpu count
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() in ['true', 'yes'] # per-request timing breakdown, see api.utils.metrics
+    METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics') # Prometheus endpoint, empty to not expose it
+    METRICS_DIR = os.environ.get('METRICS_DIR', '') # directory shared by the workers of a host, /metrics then sums every worker
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5)) # seconds between writes of a worker's metrics to METRICS_DIR
+    SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000)) # requests logged with their breakdown, 0 to disable
+    ADMIN_USER_IDS = [i.strip() for i in os.environ.get('ADMIN_USER_IDS', '').split(',') if i.strip()] # users allowed on /admin
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = int(os.environ.get('JWT_ACCESS_TOKEN_EXPIRES', 86400)) # 60 * 60 * 24 = 86400 i.e. 24 hours
     LOGGING_CONFIG = {
@@ -1,35 +1,166 @@
 # external imports
+import types
+import datetime
+from enum import Enum
 from bson import ObjectId
-from typing import Dict, Any
 from pydantic import BaseModel
-from fastapi.encoders import jsonable_encoder
+from werkzeug.http import http_date
+from pydantic_core import PydanticUndefined
+from flask import current_app, has_app_context
+from typing import Dict, List, Tuple, Callable, Optional, Union, Any, get_args, get_origin
 
 # internal imports
 from api.utils.object_id import PydanticObjectId
+from api.utils.metrics import timed
+
+# (attribute name, json/bson key, converter or None, default of missing keys) of every field, per model class
+_plans: Dict[type, List[Tuple[str, str, Optional[Callable[[Any], Any]], Callable[[], Any]]]] = {}
+
+def jsonable_encoder(value: Any) -> Any:
+    """fastapi's jsonable_encoder, imported on first use: fastapi takes about half a second to import."""
+    from fastapi.encoders import jsonable_encoder as encode
+    return encode(value)
+
+def _object_id(value: Any) -> Any:
+    return str(value) if isinstance(value, ObjectId) else value
+
+def _datetime(value: Any) -> Any:
+    # the RFC 822 format of flask's json provider, e.g. 'Mon, 05 Jan 2026 10:30:00 GMT'
+    if isinstance(value, datetime.date):
+        return http_date(value)
+    return value.isoformat() if isinstance(value, datetime.time) else value
+
+def _timedelta(value: Any) -> Any:
+    return value.total_seconds() if isinstance(value, datetime.timedelta) else value
+
+def _enum(value: Any) -> Any:
+    return value.value if isinstance(value, Enum) else value
+
+def _converter(annotation: Any) -> Optional[Callable[[Any], Any]]:
+    """
+    Picks the function turning a BSON value of the annotated type into a JSON value.
+
+    Args
+        annotation: type annotation of a model field.
+
+    Returns
+        [Optional[Callable[[Any], Any]]]: converter, None for values that already are JSON.
+    """
+    origin = get_origin(annotation)
+
+    if origin in (Union, types.UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _converter(args[0]) if len(args) == 1 else jsonable_encoder
+
+    if origin in (list, tuple, set):
+        args = [arg for arg in get_args(annotation) if arg is not Ellipsis]
+        item = _converter(args[0]) if len(set(args)) == 1 else None
+        if item is None:
+            return lambda value: None if value is None else list(value)
+        return lambda value: None if value is None else [item(v) for v in value]
+
+    if isinstance(annotation, type):
+        if issubclass(annotation, ObjectId):
+            return _object_id
+        if issubclass(annotation, (datetime.date, datetime.time)):
+            return _datetime
+        if issubclass(annotation, datetime.timedelta):
+            return _timedelta
+        if issubclass(annotation, Enum):
+            return _enum
+        if issubclass(annotation, (str, int, float, bool)):
+            return None
+
+    return jsonable_encoder
 
 class Serialization(BaseModel):
     """Base serialization model that is inherited by all db models."""
+
+    @timed('validation')
+    def __init__(self, /, **data: Any):
+        """Validates the fields, timed as validation of the current request."""
+        super().__init__(**data)
+
+    @classmethod
+    def _plan(cls) -> List[Tuple[str, str, Optional[Callable[[Any], Any]], Callable[[], Any]]]:
+        """Compiles (once per class) how every field is read and converted."""
+        plan = _plans.get(cls)
+        if plan is None:
+            plan = []
+            for name, field in cls.model_fields.items():
+                if field.default_factory is not None:
+                    # empty containers are kept, other factories (e.g. the current time) would make values up
+                    empty = field.default_factory()
+                    kind = type(empty) if isinstance(empty, (list, tuple, set, dict)) and not empty else None
+                    default = (lambda kind=kind: kind()) if kind else (lambda: None)
+                else:
+                    value = None if field.default is PydanticUndefined else field.default
+                    default = lambda value=value: value
+                plan.append((name, field.alias or name, _converter(field.annotation), default))
+            _plans[cls] = plan
+        return plan
+
+    @timed('serialization')
     def to_json(self) -> Dict[str, Any]:
-        data = self.model_dump(by_alias=True)
-    
-        for key, value in data.items():
-            if isinstance(value, (PydanticObjectId, ObjectId)):
-                data[key] = str(value)
-        
-        return data
-    
+        """Converts the model to a JSON-ready dictionary: ObjectIds become strings, datetimes RFC 822 (as jsonify renders them) and timedeltas seconds."""
+        values = self.__dict__
+        return {
+            key: (convert(values[name]) if convert and values[name] is not None else values[name])
+            for name, key, convert, _ in self._plan()
+        }
+
+    @timed('serialization')
     def to_bson(self) -> Dict[str, Any]:
-        data = self.model_dump(by_alias=True)
-    
-        for key, value in data.items():
-            if isinstance(value, PydanticObjectId):
-                data[key] = ObjectId(value)
-    
+        """Converts the model to a document for the database: enums become values and timedeltas seconds."""
+        values = self.__dict__
+        data = {}
+        for name, key, _, _ in self._plan():
+            value = values[name]
+            if isinstance(value, Enum):
+                value = value.value
+            elif isinstance(value, datetime.timedelta):
+                # BSON has no duration type, read back by the model as seconds
+                value = value.total_seconds()
+            elif isinstance(value, list):
+                value = [v.value if isinstance(v, Enum) else v for v in value]
+            data[key] = value
+
         if data.get('_id') is None:
             data.pop('_id', None)
 
         return data
-    
+
+    @classmethod
+    @timed('serialization')
+    def serialize_document(cls, doc: Dict[str, Any], trusted: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Converts a document read from the database straight to the JSON of to_json.
+
+        Documents written by this application are trusted by default (TRUSTED_READS) and are not
+        validated: no model instance is built, missing fields take their defaults (empty lists stay
+        empty, computed defaults such as created_at are None rather than made up) and fields
+        unknown to the model are left out.
+
+        Args
+            doc: raw document.
+            trusted: skips validation, defaults to the TRUSTED_READS setting.
+
+        Returns
+            [Dict[str, Any]]: json ready dictionary.
+        """
+        if trusted is None:
+            trusted = current_app.config.get('TRUSTED_READS', True) if has_app_context() else True
+
+        if not trusted:
+            return cls(**doc).to_json()
+
+        data = {}
+        for _, key, convert, default in cls._plan():
+            value = doc[key] if key in doc else default()
+            data[key] = convert(value) if convert and value is not None else value
+
+        return data
+
 class MutableId:
     def set_id(self, id):
-        self.id = PydanticObjectId(str(id)) if not isinstance(id, PydanticObjectId) else id
\ No newline at end of file
+        self.id = PydanticObjectId(str(id)) if not isinstance(id, PydanticObjectId) else id
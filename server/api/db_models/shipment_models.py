@@ -36,8 +36,8 @@ class Status(str, Enum):
 class Impediment(Serialization, MutableId):
     """Represents an issue that occurred while delivering the shipment"""
     id: Optional[PydanticObjectId] = Field(default = None, alias = '_id')
-    type: ImpedimentType = Field(default = None)
-    delay_caused: datetime.timedelta = Field(default = None)
+    type: Optional[ImpedimentType] = Field(default = None)
+    delay_caused: Optional[datetime.timedelta] = Field(default = None)
     resolved: bool = Field(default = False)
     additional_info: Optional[str] = Field(default = None)
     occurred_at: datetime.datetime = Field(default_factory = lambda:datetime.datetime.now(tz = datetime.timezone.utc))
@@ -51,26 +51,34 @@ class Impediment(Serialization, MutableId):
 class Location(Serialization, MutableId):
     """Represents current or previous location of the shipment"""
     id: Optional[PydanticObjectId] = Field(default = None, alias = '_id')
+    shipment_id: Optional[PydanticObjectId] = Field(default = None) # metaField of the locations time-series collection
     location: Tuple[float, float] = Field(default_factory = tuple)  # (latitude, longitude)
     timestamp: datetime.datetime = Field(default_factory = lambda: datetime.datetime.now(tz = datetime.timezone.utc))
 
 class Route(Serialization, MutableId):
     """Represents predicted and actual routes"""
     id: Optional[PydanticObjectId] = Field(default = None, alias = '_id')
+    carrier_id: Optional[PydanticObjectId] = Field(default = None)
+    shipment_ids: List[PydanticObjectId] = Field(default_factory = list) # shipments served by the route
+    stops: List[Optional[PydanticObjectId]] = Field(default_factory = list) # shipment of every point of path, None for the start
+    stop_types: List[str] = Field(default_factory = list) # start/pickup/delivery, for every point of path
     path: List[Tuple[float, float]] = Field(default_factory = list)  # List of co-ordinates (latitude, longitude)
     distance: Optional[float] = Field(default = None)
     estimated_duration: Optional[datetime.timedelta] = Field(default = None)
+    method: Optional[str] = Field(default = None) # distances used, road_graph or great_circle
+    created_at: datetime.datetime = Field(default_factory = lambda: datetime.datetime.now(tz = datetime.timezone.utc))
 
 class Bid(Serialization, MutableId):
     """Represents bid on a shipment"""
     id: Optional[PydanticObjectId] = Field(default = None, alias = '_id') 
     carrier_id: Optional[PydanticObjectId] = Field(default = None)
     shipment_id: Optional[PydanticObjectId] = Field(default = None)
-    proposed_price: float = Field(default = None)
+    proposed_price: Optional[float] = Field(default = None)
     proposed_vehicle: Optional[PydanticObjectId] = Field(default = None) # id of object of Vehicle model
     proposed_delivery_date: Optional[datetime.datetime] = Field(default = None)
     accepted: bool = Field(default = False)
     additional_notes: Optional[str] = Field(default = '')
+    score: Optional[float] = Field(default = None) # predicted by the bid-ranking model when the bid is placed
     created_at: datetime.datetime = Field(default_factory = lambda: datetime.datetime.now(tz = datetime.timezone.utc))
     accepted_at: Optional[datetime.datetime] = Field(default = None)
 
@@ -84,21 +92,25 @@ class Shipment(Serialization, MutableId):
     id: Optional[PydanticObjectId] = Field(default = None, alias = '_id')
     shipper_id: Optional[PydanticObjectId] = Field(default = None)
     carrier_id: Optional[PydanticObjectId] = Field(default = None)
-    status: Status = Field(default = None)
+    status: Optional[Status] = Field(default = None)
     pickup_point: Optional[str] = Field(default = None)
+    pickup_location: Optional[Dict[str, Any]] = Field(default = None) # GeoJSON Point of origin_code, { type: 'Point', coordinates: [longitude, latitude] }
     origin_code: Optional[str] = Field(default = None)
     destination_code: Optional[str] = Field(default = None)
-    distance: float = Field(default = None)
-    cargo_load: float = Field(default = None)
+    distance: Optional[float] = Field(default = None)
+    cargo_load: Optional[float] = Field(default = None)
     price: Optional[float] = Field(default = None)
     current_location: Optional[PydanticObjectId] = Field(default = None) # id of an object of 'Location' model
+    location_updated_at: Optional[datetime.datetime] = Field(default = None) # timestamp of the current_location ping
     vehicle: Optional[PydanticObjectId] = Field(default = None) # id of an object of 'Vehicle' model
     bids: Optional[List[PydanticObjectId]] = Field(default_factory = list) # list of ids of objects of 'Bid' model
+    top_bid: Optional[PydanticObjectId] = Field(default = None) # id of the highest scored object of 'Bid' model
+    top_bid_score: Optional[float] = Field(default = None)
     impediments: Optional[List[PydanticObjectId]] = Field(default_factory = list) # list of ids of objects of 'Impediment' model
     predicted_route: Optional[PydanticObjectId] = Field(default = None) # id of an object of 'Route' model
     route_taken: Optional[PydanticObjectId] = Field(default = None) # id of an object of 'Route' model
     shipped_at: Optional[datetime.datetime] = Field(default = None) # datetime at which the shipment delivery starts
-    estimated_delivery_date: datetime.datetime = Field(default = None)
+    estimated_delivery_date: Optional[datetime.datetime] = Field(default = None)
     delivered_at: Optional[datetime.datetime] = Field(default = None) # only when status is delivered
     created_at: datetime.datetime = Field(default_factory = lambda: datetime.datetime.now(tz = datetime.timezone.utc))
     updated_at: Optional[datetime.datetime]
@@ -108,13 +120,14 @@ class Shipment(Serialization, MutableId):
         self.delivered_at = datetime.datetime.now(tz = datetime.timezone.utc).date
 
     @field_validator('estimated_delivery_date')
-    def validate_estimated_date(cls, v, values):
-        if 'shipped_at' in values and v < values['shipped_at']:
+    def validate_estimated_date(cls, v, info):
+        shipped_at = info.data.get('shipped_at')
+        if v is not None and shipped_at is not None and v < shipped_at:
             raise ValueError('Estimated date must be greater than or equal to shipping date.')
         return v
 
     @field_validator('price', 'cargo_load', 'distance')
     def positive_values(cls, v):
-        if v <= 0:
+        if v is not None and v <= 0:
             raise ValueError(f'Must be a positive value.')
         return v
\ No newline at end of file
@@ -4,7 +4,6 @@ from enum import Enum
 from bson import ObjectId
 from pydantic import Field
 from typing import Optional, List, Dict, Any
-from fastapi.encoders import jsonable_encoder
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # internal imports
@@ -28,7 +27,7 @@ class Type(str, Enum):
 class User(Serialization, MutableId):
     """Represents an user of the application."""
     id: Optional[PydanticObjectId] = Field(default = None, alias = '_id')
-    role: Role = Field(default = None)
+    role: Optional[Role] = Field(default = None)
     shipper_id: Optional[PydanticObjectId] = Field(default = None)
     carrier_id: Optional[PydanticObjectId] = Field(default = None)
     email: str = Field(default = '')
@@ -74,17 +73,20 @@ class User(Serialization, MutableId):
 
         Returns
         """
-        data = self.model_dump(by_alias=True)
-    
-        for key, value in data.items():
-            if isinstance(value, (PydanticObjectId, ObjectId)):
-                data[key] = str(value)
+        data = super().to_json()
 
         if data.get('hashed_password') and not include_password:
             data.pop('hashed_password')
 
         return data
 
+    @classmethod
+    def serialize_document(cls, doc: Dict[str, Any], trusted: Optional[bool] = None) -> Dict[str, Any]:
+        """Overrides Serialization model's serialize_document method, the password is never included."""
+        data = super().serialize_document(doc, trusted)
+        data.pop('hashed_password', None)
+        return data
+
 class Shipper(Serialization, MutableId):
     """Represents an user who uses the platform to ship cargo."""
     id: Optional[PydanticObjectId] = Field(default = None, alias = '_id')
@@ -103,12 +105,15 @@ class Carrier(Serialization, MutableId):
     modes: Optional[List[Mode]] = Field(default_factory = list)
     org_name: Optional[str] = Field(default = None) # applicable only when type is not individual
     address: Optional[str] = Field(default = '')
+    postal_code: Optional[str] = Field(default = None) # base of the carrier, geocoded into location
+    location: Optional[Dict[str, Any]] = Field(default = None) # GeoJSON Point, { type: 'Point', coordinates: [longitude, latitude] }
     vehicles: Optional[List[PydanticObjectId]] = Field(default_factory = list) # carriers can register their vehicles
     bids: Optional[List[PydanticObjectId]] = Field(default = None)
     delivered_shipments: Optional[List[PydanticObjectId]] = Field(default = None) # _id of Shipment model
     rating: Optional[float] = Field(default = None) # Range: 1.0 - 5.0
     total_ratings: Optional[int] = Field(default = 0) # total ratings
     verified: Optional[bool] = Field(default = False) # TO-DO: Devise a proper and universal method for verification of carriers
+    updated_at: Optional[datetime.datetime] = Field(default = None) # last change of the fields carriers are matched on, polled by the carrier index
 
     def update_rating(self, new_rating: float) -> None:
         """
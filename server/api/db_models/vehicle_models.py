@@ -21,6 +21,6 @@ class Vehicle(Serialization, MutableId):
     
     @field_validator('age')
     def validate_age(cls, v):
-        if v <= 0:
+        if v is not None and v <= 0:
             raise ValueError('Age must be greater than 0.')
         return v
\ No newline at end of file
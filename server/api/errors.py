@@ -1,5 +1,34 @@
 from flask import Flask
 from flask import jsonify
+from werkzeug.exceptions import HTTPException
+from typing import Dict, Any
+
+# message of the error responses per status code
+ERROR_MESSAGES = {
+    400: 'Bad Request',
+    403: 'Forbidden Request',
+    404: 'Not Found',
+    409: 'Conflict',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+def error_body(status: int, error: Any) -> Dict[str, Any]:
+    """
+    Builds the body of an error response, also used by the ASGI app.
+
+    Args
+        status: http status code
+        error: raised exception
+
+    Returns
+        [Dict[str, Any]]: response body
+    """
+    return {
+        'status': status,
+        'message': ERROR_MESSAGES.get(status, 'Error'),
+        'error': str(error)
+    }
 
 def register_error_handlers(app: Flask):
     """
@@ -12,36 +41,22 @@ def register_error_handlers(app: Flask):
     # Errors raised using abort(status_code, description)
     @app.errorhandler(400)
     def bad_request(error):
-        response = {
-            'status': 400,
-            'message': 'Bad Request',
-            'error': str(error)
-        }
-        return jsonify(response), 400
+        return jsonify(error_body(400, error)), 400
     
     @app.errorhandler(403)
     def forbidden(error):
-        response = {
-            'status': 403,
-            'message': 'Forbidden Request',
-            'error': str(error)
-        }
+        return jsonify(error_body(403, error)), 403
 
     @app.errorhandler(404)
     def not_found(error):
-        response = {
-            'status': 404,
-            'message': 'Not Found',
-            'error': str(error)
-        }
-        return jsonify(response), 404
+        return jsonify(error_body(404, error)), 404
+
+    # Any other status code, e.g. 409 or 503
+    @app.errorhandler(HTTPException)
+    def http_exception(error):
+        return jsonify(error_body(error.code, error)), error.code
     
     # Errors raised using raise Exception
     @app.errorhandler(500)
     def exception(error):
-        response = {
-            'status': 500,
-            'message': 'Internal Server Error',
-            'error': str(error)
-        }
-        return jsonify(response), 500
\ No newline at end of file
+        return jsonify(error_body(500, error)), 500
@@ -1,3 +1,5 @@
 from flask import Blueprint
 
 services_bp = Blueprint('services', __name__)
+
+from api.services import distance_routes, ranking_routes, route_routes, matching_routes
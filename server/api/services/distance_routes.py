@@ -0,0 +1,163 @@
+# external imports
+import numpy as np
+from typing import Tuple, Dict, List, Any
+from flask_jwt_extended import jwt_required
+from flask import request, current_app, jsonify, abort
+
+# internal imports
+from api import geo_index, distance_cache, lane_table
+from api.services import services_bp
+from api.admin import admin_required
+from api.utils.geo import distance_matrix, calculate_distance, DISTANCE_METHODS
+from api.utils.lane_table import estimate_hours
+
+def parse_distance_matrix_request(data: Any, max_cells: int) -> Tuple[List[str], List[str], str, str]:
+    """
+    Validates the body of a distance matrix request.
+
+    Args
+        data: request body.
+        max_cells: DISTANCE_MATRIX_MAX_CELLS.
+
+    Returns
+        [Tuple[List[str], List[str], str, str]]: origins, destinations, country, method.
+
+    Raises
+        [ValueError]: message describing the invalid field.
+    """
+    if not isinstance(data, dict) or not data.get('origins'):
+        raise ValueError('Missing required fields.')
+
+    for field in ['origins', 'destinations']:
+        codes = data.get(field)
+        if codes is not None and not (isinstance(codes, list) and all(isinstance(code, str) for code in codes)):
+            raise ValueError(f'{field} must be a list of postal codes.')
+
+    origins = [code.strip() for code in data.get('origins')]
+    destinations = [code.strip() for code in data.get('destinations') or origins]
+    country = str(data.get('country', 'IN')).strip().upper()
+    method = data.get('method', 'haversine')
+
+    if method not in DISTANCE_METHODS:
+        raise ValueError(f'Invalid method. Use one of {DISTANCE_METHODS}.')
+
+    if len(origins) * len(destinations) > max_cells:
+        raise ValueError('Too many origin/destination pairs.')
+
+    return origins, destinations, country, method
+
+def distance_matrix_data(origins: List[str], destinations: List[str], country: str, method: str) -> Dict[str, Any]:
+    """
+    Calculates the matrix and builds the data of the response.
+
+    Args
+        origins: origin postal codes.
+        destinations: destination postal codes.
+        country: ISO country code.
+        method: one of DISTANCE_METHODS.
+
+    Returns
+        [Dict[str, Any]]: data of the response.
+    """
+    matrix, origins_found, destinations_found = distance_matrix(origins, destinations, country, method)
+
+    # NaN is not valid json, unknown postal codes are reported as null
+    rows = np.where(np.isnan(matrix), None, np.round(matrix, 3)).tolist()
+
+    return {
+        'origins': origins,
+        'destinations': destinations,
+        'unit': 'km',
+        'method': method,
+        'matrix': rows,
+        'unresolved': sorted(
+            {code for code, found in zip(origins, origins_found) if not found} |
+            {code for code, found in zip(destinations, destinations_found) if not found}
+        )
+    }
+
+@services_bp.route('/distance-matrix', methods=['POST'])
+@jwt_required()
+def get_distance_matrix() -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to calculate distances between every origin and destination postal code.
+    If destinations are omitted, the matrix is calculated between the origins themselves.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    try:
+        try:
+            origins, destinations, country, method = parse_distance_matrix_request(
+                request.get_json(), current_app.config.get('DISTANCE_MATRIX_MAX_CELLS')
+            )
+        except ValueError as e:
+            abort(400, str(e))
+
+        return jsonify({
+            'message': 'Distance matrix calculated successfully.',
+            'data': distance_matrix_data(origins, destinations, country, method)
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while calculating distance matrix: %s', e)
+        raise e
+
+@services_bp.route('/lanes', methods=['GET'])
+@jwt_required()
+def get_lane() -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to fetch the distance and estimated hours per transport mode of a lane,
+    ?origin=&destination=&country=. Lanes missing from the lane table are computed live.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    try:
+        origin, destination = request.args.get('origin'), request.args.get('destination')
+        country = request.args.get('country', 'IN')
+        if not origin or not destination:
+            abort(400, 'origin and destination are required.')
+
+        lane = lane_table.lane(origin, destination, country, country)
+        source = 'table'
+        if lane is None:
+            try:
+                distance = calculate_distance(origin, destination, country, country)
+            except ValueError:
+                abort(400, 'Invalid postal code or country code.')
+            hours = { mode: float(value) for mode, value in estimate_hours(distance).items() }
+            lane = { 'distance_km': distance, 'road_km': None, 'hours': hours }
+            source = 'live'
+
+        return jsonify({
+            'message': 'Lane fetched successfully.',
+            'data': { 'origin': origin, 'destination': destination, 'country': country, **lane, 'source': source }
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while fetching lane: %s', e)
+        raise e
+
+@services_bp.route('/geo/stats', methods=['GET'])
+@admin_required
+def get_geo_stats() -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to fetch hit/miss counters of the geocoding index, distance cache and lane table of this worker.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    try:
+        return jsonify({
+            'message': 'Geo stats fetched successfully.',
+            'data': {
+                'geocoder': geo_index.stats(),
+                'distance_cache': distance_cache.stats(),
+                'lane_table': lane_table.stats()
+            }
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while fetching geo stats: %s', e)
+        raise e
@@ -0,0 +1,127 @@
+# external imports
+import math
+from bson import ObjectId
+from flask import request, current_app, jsonify, abort
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from typing import Tuple, Dict, List, Optional, Any
+
+# internal imports
+from api import mongo, carrier_index
+from api.services import services_bp
+from api.admin import admin_required
+from api.utils.geo import geo_point
+from api.utils.mongo_pool import read_db
+from api.db_models.shipment_models import Mode, Status
+
+def parse_match_args() -> Tuple[int, float, Optional[List[str]], Optional[float]]:
+    """
+    Reads ?limit=&radius=&mode=&min_rating= of a match request; mode may be repeated.
+
+    Returns
+        [Tuple[int, float, Optional[List[str]], Optional[float]]]: limit, radius in km, modes
+        (None for any), lowest rating (None for any, unrated carriers included).
+    """
+    config = current_app.config
+    try:
+        limit = int(request.args.get('limit', 10))
+        radius_km = float(request.args.get('radius', config.get('MATCHING_DEFAULT_RADIUS_KM')))
+        min_rating = float(request.args['min_rating']) if request.args.get('min_rating') else None
+    except ValueError:
+        abort(400, 'Invalid limit, radius or min_rating.')
+
+    if not 0 < limit <= config.get('MATCHING_MAX_CANDIDATES'):
+        abort(400, f"Limit must be between 1 and {config.get('MATCHING_MAX_CANDIDATES')}.")
+
+    if not 0 < radius_km <= config.get('NEARBY_MAX_RADIUS_KM'):
+        abort(400, f"Radius must be between 0 and {config.get('NEARBY_MAX_RADIUS_KM')} km.")
+
+    if min_rating is not None and not (math.isfinite(min_rating) and 1.0 <= min_rating <= 5.0):
+        abort(400, 'min_rating must be between 1 and 5.')
+
+    modes = request.args.getlist('mode') or None
+    if modes and any(mode not in Mode._value2member_map_ for mode in modes):
+        abort(400, f'Invalid mode, use one of {[mode.value for mode in Mode]}.')
+
+    return limit, radius_km, modes, min_rating
+
+@services_bp.route('/shipments/<string:s_id>/carriers', methods=['GET'])
+@jwt_required()
+def match_carriers(s_id: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint for the shipper of a waiting shipment to find the carriers best suited to it, by
+    rating, verification and distance of their base from the pickup. Carriers that already bid
+    on the shipment are left out.
+
+    Args
+        s_id: id of the shipment.
+
+    Query Params
+        limit: carriers returned, at most MATCHING_MAX_CANDIDATES.
+        radius: farthest carrier base from the pickup in km, MATCHING_DEFAULT_RADIUS_KM by default.
+        mode: transport mode the carriers must offer, repeatable; any mode when omitted.
+        min_rating: lowest carrier rating, unrated carriers are left out when given.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    db = read_db()
+    try:
+        if not ObjectId.is_valid(s_id):
+            abort(400, 'Invalid object id.')
+
+        limit, radius_km, modes, min_rating = parse_match_args()
+
+        shipment = db.shipments.find_one(
+            { '_id': ObjectId(s_id) }, { 'shipper_id': 1, 'status': 1, 'pickup_location': 1, 'origin_code': 1 }
+        )
+        if not shipment:
+            abort(404, 'Shipment not found.')
+
+        shipper = db.shippers.find_one({ 'user_id': ObjectId(get_jwt_identity()) }, { '_id': 1 })
+        if not shipper or shipment.get('shipper_id') != shipper['_id']:
+            abort(403, 'Unauthorized access to shipment.')
+
+        if shipment.get('status') != Status.waiting.value:
+            abort(400, 'Only waiting shipments are matched with carriers.')
+
+        pickup = shipment.get('pickup_location') or (geo_point(shipment['origin_code']) if shipment.get('origin_code') else None)
+        if pickup is None:
+            abort(400, 'Could not geocode the pickup point.')
+        longitude, latitude = pickup['coordinates']
+
+        carrier_index.refresh(mongo.db)
+        candidates = carrier_index.match(
+            latitude, longitude, limit, radius_km, modes, min_rating,
+            exclude=db.bids.distinct('carrier_id', { 'shipment_id': shipment['_id'] })
+        )
+
+        return jsonify({
+            'message': 'Carriers matched successfully.',
+            'data': {
+                'shipment_id': s_id,
+                'candidates': [{ **candidate, 'carrier_id': str(candidate['carrier_id']) } for candidate in candidates]
+            }
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while matching carriers with shipment %s: %s', s_id, e)
+        raise e
+
+@services_bp.route('/matching/stats', methods=['GET'])
+@admin_required
+def get_matching_stats() -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to fetch the size and counters of the carrier index of this worker.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    try:
+        return jsonify({
+            'message': 'Matching stats fetched successfully.',
+            'data': carrier_index.stats()
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while fetching matching stats: %s', e)
+        raise e
@@ -1,30 +1,444 @@
 # external imports
-import os
-import pickle
+import time
+import datetime
+import warnings
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
-
-
-def predict_top_bid(bids: list, model_dir: str):
-    model_path = os.path.join(model_dir, 'model.pkl')
-    model = pickle.load(open(model_path, 'rb'))
-
-    data = pd.DataFrame({
-        'distance': [bid['distance'] for bid in bids],
-        'cargo_load': [bid['cargo_load'] for bid in bids],
-        'price': [bid['price'] for bid in bids],
-        'delivery_duration': [(bid['estimated_delivery_date'] - bid['shipped_at']).days for bid in bids],
-        'start_weekday': [bid['shipped_at'].weekday() for bid in bids],
-        'delivery_weekday': [bid['estimated_delivery_date'].weekday() for bid in bids],
-        'start_month': [bid['shipped_at'].month for bid in bids],
-        'delivery_month': [bid['estimated_delivery_date'].month for bid in bids],
-        'price_per_km': [bid['price'] / bid['distance'] for bid in bids],
-    })
-
-    predictions = model.predict(data)
-    
-    top_bid_index = np.argmax(predictions)
-
-    top_bid = bids[top_bid_index] 
-    return top_bid
+from bson import ObjectId
+from pymongo import UpdateOne, DESCENDING
+from typing import Dict, List, Tuple, Iterable, Any, Optional
+from pymongo.collection import Collection
+
+# internal imports
+from api import mongo, model_registry
+from api.utils.metrics import timed
+
+# order of the columns the model was trained on
+FEATURE_COLUMNS = [
+    'distance',
+    'cargo_load',
+    'price',
+    'delivery_duration',
+    'start_weekday',
+    'delivery_weekday',
+    'start_month',
+    'delivery_month',
+    'price_per_km',
+]
+# bump when the meaning of a feature changes without its name changing
+FEATURE_SCHEMA_VERSION = 2
+
+def check_feature_schema(model: Any, metadata: Optional[Dict[str, Any]]) -> None:
+    """
+    Verifies that a model was trained on the features built here.
+
+    Args
+        model: fitted model.
+        metadata: metadata written next to the artifact by the training pipeline, if any.
+
+    Raises
+        ValueError: the model was trained on other features.
+    """
+    # models fitted on a DataFrame remember the column names, the matrix must follow the same order
+    names = getattr(model, 'feature_names_in_', None)
+    if names is not None and list(names) != FEATURE_COLUMNS:
+        raise ValueError(f'Model features {list(names)} do not match {FEATURE_COLUMNS}.')
+
+    if metadata:
+        if metadata.get('feature_columns') != FEATURE_COLUMNS:
+            raise ValueError(f'Model features {metadata.get("feature_columns")} do not match {FEATURE_COLUMNS}.')
+        if metadata.get('feature_schema_version') != FEATURE_SCHEMA_VERSION:
+            raise ValueError(
+                f'Model feature schema version {metadata.get("feature_schema_version")} '
+                f'does not match {FEATURE_SCHEMA_VERSION}.'
+            )
+
+def bid_feature_pipeline(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Builds the aggregation that joins bids with their shipment and computes the model features
+    inside MongoDB. Each output document holds _id, shipment_id and one field per FEATURE_COLUMNS entry.
+
+    The price and delivery date come from the bid (proposed_price, proposed_delivery_date); the
+    distance, cargo load and start date come from the shipment. The start date is the creation date
+    of the shipment, known when it is bid on: its shipped_at is set after a bid was accepted and
+    would leak the outcome into the training set.
+
+    Args
+        match: filter on the bids collection.
+
+    Returns
+        [List[Dict[str, Any]]]: aggregation pipeline.
+    """
+    day_ms = 24 * 60 * 60 * 1000
+
+    return [
+        { '$match': match },
+        { '$lookup': {
+            'from': 'shipments',
+            'localField': 'shipment_id',
+            'foreignField': '_id',
+            'as': 'shipment'
+        }},
+        { '$unwind': '$shipment' },
+        { '$project': {
+            'shipment_id': 1,
+            'distance': '$shipment.distance',
+            'price': '$proposed_price',
+            'delivery': '$proposed_delivery_date',
+            'start': '$shipment.created_at',
+            'cargo_load': '$shipment.cargo_load'
+        }},
+        { '$project': {
+            'shipment_id': 1,
+            'distance': 1,
+            'cargo_load': 1,
+            'price': 1,
+            # same as timedelta.days, i.e. floored
+            'delivery_duration': { '$floor': { '$divide': [{ '$subtract': ['$delivery', '$start'] }, day_ms] } },
+            # $isoDayOfWeek is 1 (Monday) - 7, datetime.weekday() is 0 - 6
+            'start_weekday': { '$subtract': [{ '$isoDayOfWeek': '$start' }, 1] },
+            'delivery_weekday': { '$subtract': [{ '$isoDayOfWeek': '$delivery' }, 1] },
+            'start_month': { '$month': '$start' },
+            'delivery_month': { '$month': '$delivery' },
+            'price_per_km': { '$cond': [{ '$gt': ['$distance', 0] }, { '$divide': ['$price', '$distance'] }, None] }
+        }}
+    ]
+
+def feature_arrays(
+    docs: Iterable[Dict[str, Any]],
+    expected: int = 1024
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Writes the documents of the feature aggregation straight into preallocated arrays.
+
+    Args
+        docs: documents of bid_feature_pipeline.
+        expected: initial capacity; the arrays double when it is exceeded.
+
+    Returns
+        [Tuple[np.ndarray, np.ndarray, np.ndarray]]: bid ids, shipment ids, (n, len(FEATURE_COLUMNS))
+        float matrix with NaN for missing values.
+    """
+    capacity = max(expected, 1)
+    bid_ids = np.empty(capacity, dtype=object)
+    shipment_ids = np.empty(capacity, dtype=object)
+    features = np.empty((capacity, len(FEATURE_COLUMNS)), dtype=np.float64)
+
+    n = 0
+    for doc in docs:
+        if n == capacity:
+            capacity *= 2
+            bid_ids.resize(capacity, refcheck=False)
+            shipment_ids.resize(capacity, refcheck=False)
+            features.resize((capacity, len(FEATURE_COLUMNS)), refcheck=False)
+
+        bid_ids[n] = doc['_id']
+        shipment_ids[n] = doc['shipment_id']
+        features[n] = [doc.get(column, np.nan) for column in FEATURE_COLUMNS]
+        n += 1
+
+    return bid_ids[:n], shipment_ids[:n], features[:n]
+
+def build_bid_features(
+    bids: Collection,
+    match: Dict[str, Any],
+    expected: int = 1024
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Runs the feature aggregation and writes the rows straight into preallocated arrays.
+
+    Args
+        bids: bids collection.
+        match: filter on the bids collection.
+        expected: initial capacity; the arrays double when it is exceeded.
+
+    Returns
+        [Tuple[np.ndarray, np.ndarray, np.ndarray]]: see feature_arrays.
+    """
+    return feature_arrays(bids.aggregate(bid_feature_pipeline(match)), expected)
+
+def _naive_utc(value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    """Converts aware datetimes to naive UTC, the way pymongo returns them."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+def features_from_documents(bids: List[Dict[str, Any]], shipment: Dict[str, Any]) -> np.ndarray:
+    """
+    Computes the features of bids already in memory, e.g. a bid that is being placed.
+    Mirrors bid_feature_pipeline.
+
+    Args
+        bids: bid documents of one shipment.
+        shipment: the shipment document.
+
+    Returns
+        [np.ndarray]: (n, len(FEATURE_COLUMNS)) float matrix with NaN for missing values.
+    """
+    features = np.full((len(bids), len(FEATURE_COLUMNS)), np.nan)
+
+    distance = shipment.get('distance')
+    cargo_load = shipment.get('cargo_load')
+    start = _naive_utc(shipment.get('created_at'))
+
+    for i, bid in enumerate(bids):
+        price = bid.get('proposed_price')
+        delivery = _naive_utc(bid.get('proposed_delivery_date'))
+
+        features[i, 0:3] = [
+            np.nan if distance is None else distance,
+            np.nan if cargo_load is None else cargo_load,
+            np.nan if price is None else price
+        ]
+        if start is not None and delivery is not None:
+            features[i, 3:8] = [
+                (delivery - start).days,
+                start.weekday(),
+                delivery.weekday(),
+                start.month,
+                delivery.month
+            ]
+        if price is not None and distance:
+            features[i, 8] = price / distance
+
+    return features
+
+@timed('inference')
+def score_features(features: np.ndarray) -> np.ndarray:
+    """
+    Scores feature rows with the resident model.
+
+    Args
+        features: (n, len(FEATURE_COLUMNS)) matrix built by build_bid_features.
+
+    Returns
+        [np.ndarray]: predicted scores, -inf for rows with missing features.
+    """
+    scores = np.full(len(features), -np.inf)
+    complete = ~np.isnan(features).any(axis=1)
+    if not complete.any():
+        return scores
+
+    model = model_registry.get()
+    check_feature_schema(model, model_registry.metadata)
+
+    with warnings.catch_warnings():
+        # predicting on a plain array warns about the missing feature names
+        warnings.simplefilter('ignore', UserWarning)
+        scores[complete] = model.predict(features[complete])
+
+    return scores
+
+def score_bid(bid: Dict[str, Any], shipment: Dict[str, Any]) -> Optional[float]:
+    """
+    Scores a single bid of a shipment.
+
+    Args
+        bid: bid document.
+        shipment: the shipment document.
+
+    Returns
+        [Optional[float]]: predicted score, None if a feature is missing.
+    """
+    score = score_features(features_from_documents([bid], shipment))[0]
+    return float(score) if np.isfinite(score) else None
+
+def push_bid_update(bid_id: ObjectId, score: Optional[float]) -> List[Dict[str, Any]]:
+    """
+    Builds the pipeline update that appends a bid to a shipment and moves the shipment's
+    top_bid pointer to it if it outscores the current top bid, in one atomic write.
+
+    Args
+        bid_id: id of the new bid.
+        score: score of the new bid, None if it could not be scored.
+
+    Returns
+        [List[Dict[str, Any]]]: update pipeline for the shipments collection.
+    """
+    return push_bids_update([bid_id], None if score is None else (bid_id, score))
+
+def push_bids_update(bid_ids: List[ObjectId], best: Optional[Tuple[ObjectId, float]]) -> List[Dict[str, Any]]:
+    """
+    Same as push_bid_update for several bids of one shipment.
+
+    Args
+        bid_ids: ids of the new bids.
+        best: (id, score) of the best scored new bid, None if none could be scored.
+
+    Returns
+        [List[Dict[str, Any]]]: update pipeline for the shipments collection.
+    """
+    update = { 'bids': { '$concatArrays': [{ '$ifNull': ['$bids', []] }, list(bid_ids)] } }
+
+    if best is not None:
+        bid_id, score = best
+        beats_top = { '$or': [
+            { '$eq': [{ '$ifNull': ['$top_bid_score', None] }, None] },
+            { '$gt': [score, '$top_bid_score'] }
+        ]}
+        update['top_bid'] = { '$cond': [beats_top, bid_id, '$top_bid'] }
+        update['top_bid_score'] = { '$cond': [beats_top, score, '$top_bid_score'] }
+
+    return [{ '$set': update }]
+
+def pull_bid_update(bid_id: ObjectId) -> List[Dict[str, Any]]:
+    """
+    Builds the pipeline update that removes a bid from a shipment and clears the top_bid pointer
+    if it pointed to that bid. refresh_top_bid must be called afterwards.
+
+    Args
+        bid_id: id of the removed bid.
+
+    Returns
+        [List[Dict[str, Any]]]: update pipeline for the shipments collection.
+    """
+    was_top = { '$eq': ['$top_bid', bid_id] }
+    return [{ '$set': {
+        'bids': { '$filter': { 'input': { '$ifNull': ['$bids', []] }, 'cond': { '$ne': ['$$this', bid_id] } } },
+        'top_bid': { '$cond': [was_top, None, '$top_bid'] },
+        'top_bid_score': { '$cond': [was_top, None, '$top_bid_score'] }
+    }}]
+
+def refresh_top_bid(shipment_id: ObjectId) -> Optional[Dict[str, Any]]:
+    """
+    Points the shipment at its best scored bid, unless a better bid was placed concurrently.
+
+    Args
+        shipment_id: id of the shipment.
+
+    Returns
+        [Optional[Dict[str, Any]]]: best bid document, None if no bid is scored.
+    """
+    best = mongo.db.bids.find_one(
+        { 'shipment_id': shipment_id, 'score': { '$ne': None } },
+        sort=[('score', DESCENDING), ('_id', DESCENDING)]
+    )
+    if not best:
+        return None
+
+    # only ever move the pointer to a higher score, concurrent placements do the same
+    mongo.db.shipments.update_one(
+        { '_id': shipment_id, '$or': [{ 'top_bid_score': None }, { 'top_bid_score': { '$lt': best['score'] } }] },
+        { '$set': { 'top_bid': best['_id'], 'top_bid_score': best['score'] } }
+    )
+    return best
+
+def rescore_shipment(shipment_id: ObjectId) -> Optional[Dict[str, Any]]:
+    """
+    Scores every bid of a shipment with the resident model, stores the scores and resets the
+    shipment's top_bid pointer. Used for bids placed before scores were stored, or after a
+    new model is deployed.
+
+    Args
+        shipment_id: id of the shipment.
+
+    Returns
+        [Optional[Dict[str, Any]]]: best bid document, None if no bid is scored.
+    """
+    bid_ids, _, features = build_bid_features(mongo.db.bids, { 'shipment_id': shipment_id })
+    if not len(bid_ids):
+        return None
+
+    scores = score_features(features)
+    mongo.db.bids.bulk_write([
+        UpdateOne({ '_id': bid_id }, { '$set': { 'score': float(score) if np.isfinite(score) else None } })
+        for bid_id, score in zip(bid_ids, scores)
+    ], ordered=False)
+    mongo.db.shipments.update_one({ '_id': shipment_id }, { '$set': { 'top_bid': None, 'top_bid_score': None } })
+
+    return refresh_top_bid(shipment_id)
+
+def predict_top_bid(shipment_id: ObjectId) -> Optional[ObjectId]:
+    """
+    Ranks the bids of a shipment with the resident model, without using the stored scores.
+
+    Args
+        shipment_id: id of the shipment.
+
+    Returns
+        [Optional[ObjectId]]: id of the bid with the highest predicted score, None if there is no
+        bid that could be scored.
+    """
+    bid_ids, _, features = build_bid_features(mongo.db.bids, { 'shipment_id': shipment_id })
+    if not len(bid_ids):
+        return None
+
+    scores = score_features(features)
+    best = int(np.argmax(scores))
+    # incomplete rows score -inf, when every row is incomplete no bid is the top bid
+    return bid_ids[best] if np.isfinite(scores[best]) else None
+
+def select_top_bids(
+    bid_ids: np.ndarray,
+    bid_shipment_ids: np.ndarray,
+    scores: np.ndarray
+) -> Dict[ObjectId, Tuple[ObjectId, float]]:
+    """
+    Picks the best scored bid of every shipment.
+
+    Args
+        bid_ids: ids of the bids.
+        bid_shipment_ids: shipment of every bid.
+        scores: score of every bid.
+
+    Returns
+        [Dict[ObjectId, Tuple[ObjectId, float]]]: (top bid id, score) per shipment.
+    """
+    if not len(bid_ids):
+        return {}
+
+    # sort by shipment, then by descending score; the first row of every shipment wins
+    _, groups = np.unique(bid_shipment_ids.astype(str), return_inverse=True)
+    order = np.lexsort((-scores, groups))
+    first = order[np.r_[True, groups[order][1:] != groups[order][:-1]]]
+    return { bid_shipment_ids[i]: (bid_ids[i], float(scores[i])) for i in first }
+
+def rank_bids(
+    bid_ids: np.ndarray,
+    bid_shipment_ids: np.ndarray,
+    features: np.ndarray
+) -> Tuple[Dict[ObjectId, Tuple[ObjectId, float]], Dict[str, float]]:
+    """
+    Scores feature rows with the resident model and picks the best bid of every shipment.
+
+    Args
+        bid_ids: ids of the bids.
+        bid_shipment_ids: shipment of every bid.
+        features: feature matrix, see feature_arrays.
+
+    Returns
+        [Tuple[Dict[ObjectId, Tuple[ObjectId, float]], Dict[str, float]]]: (top bid id, score) per
+        shipment, and timings in milliseconds of the score and select stages.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    scores = score_features(features)
+    timings['score_ms'] = (time.perf_counter() - start) * 1e3
+
+    start = time.perf_counter()
+    winners = select_top_bids(bid_ids, bid_shipment_ids, scores)
+    timings['select_ms'] = (time.perf_counter() - start) * 1e3
+
+    return winners, timings
+
+def predict_top_bids(shipment_ids: List[ObjectId]) -> Tuple[Dict[ObjectId, Tuple[ObjectId, float]], Dict[str, float]]:
+    """
+    Ranks the bids of many shipments with one aggregation and one model call.
+
+    Args
+        shipment_ids: ids of the shipments.
+
+    Returns
+        [Tuple[Dict[ObjectId, Tuple[ObjectId, float]], Dict[str, float]]]: (top bid id, score) per
+        shipment that has bids, and timings in milliseconds of the fetch, score and select stages.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    bid_ids, bid_shipment_ids, features = build_bid_features(
+        mongo.db.bids, { 'shipment_id': { '$in': shipment_ids } }, expected=max(len(shipment_ids) * 16, 1024)
+    )
+    timings['fetch_ms'] = (time.perf_counter() - start) * 1e3
+
+    winners, rank_timings = rank_bids(bid_ids, bid_shipment_ids, features)
+    return winners, { **timings, **rank_timings }
@@ -0,0 +1,106 @@
+# external imports
+import time
+import numpy as np
+from bson import ObjectId
+from typing import Tuple, Dict, List, Optional, Any
+from flask_jwt_extended import jwt_required
+from flask import request, current_app, jsonify, abort
+
+# internal imports
+from api import mongo
+from api.services import services_bp
+from api.db_models.shipment_models import Bid
+from api.services.predict_top_bid import predict_top_bids
+
+def parse_top_bids_request(data: Any, max_shipments: int) -> List[str]:
+    """
+    Validates the body of a top-bids:batch request.
+
+    Args
+        data: request body.
+        max_shipments: TOP_BIDS_BATCH_MAX.
+
+    Returns
+        [List[str]]: unique shipment ids, in request order.
+
+    Raises
+        [ValueError]: message describing the invalid field.
+    """
+    if not isinstance(data, dict) or not data.get('shipment_ids'):
+        raise ValueError('Missing required fields.')
+
+    sh_ids = list(dict.fromkeys(str(sh_id) for sh_id in data.get('shipment_ids')))
+
+    if not all(ObjectId.is_valid(sh_id) for sh_id in sh_ids):
+        raise ValueError('Invalid object id.')
+
+    if len(sh_ids) > max_shipments:
+        raise ValueError('Too many shipments.')
+
+    return sh_ids
+
+def top_bids_results(
+    sh_ids: List[str],
+    winners: Dict[ObjectId, Tuple[ObjectId, float]],
+    top_bids: Dict[ObjectId, Dict[str, Any]]
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Builds the result of every requested shipment.
+
+    Args
+        sh_ids: requested shipment ids.
+        winners: (top bid id, score) per shipment, from predict_top_bids.
+        top_bids: serialized top bids by id.
+
+    Returns
+        [Dict[str, Optional[Dict[str, Any]]]]: bid and score per shipment, None without bids.
+    """
+    results = {}
+    for sh_id in sh_ids:
+        winner = winners.get(ObjectId(sh_id))
+        results[sh_id] = None if winner is None else {
+            'bid': top_bids.get(winner[0]),
+            'score': winner[1] if np.isfinite(winner[1]) else None
+        }
+    return results
+
+@services_bp.route('/top-bids:batch', methods=['POST'])
+@jwt_required()
+def get_top_bids_batch() -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to get the top bid of many shipments at once. All bids are fetched with a single
+    query and scored with a single model call.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    bids = mongo.db.bids
+    try:
+        start = time.perf_counter()
+
+        try:
+            sh_ids = parse_top_bids_request(request.get_json(), current_app.config.get('TOP_BIDS_BATCH_MAX'))
+        except ValueError as e:
+            abort(400, str(e))
+
+        winners, timings = predict_top_bids([ObjectId(sh_id) for sh_id in sh_ids])
+
+        load_start = time.perf_counter()
+        top_bids = {
+            doc['_id']: Bid.serialize_document(doc)
+            for doc in bids.find({ '_id': { '$in': [bid_id for bid_id, _ in winners.values()] } })
+        }
+        timings['load_ms'] = (time.perf_counter() - load_start) * 1e3
+        timings['total_ms'] = (time.perf_counter() - start) * 1e3
+
+        return jsonify({
+            'message': 'Top bids fetched successfully.',
+            'data': {
+                'results': top_bids_results(sh_ids, winners, top_bids),
+                'timings': { stage: round(ms, 3) for stage, ms in timings.items() }
+            }
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while getting top bids in batch: %s', e)
+        raise e
@@ -0,0 +1,297 @@
+# external imports
+import os
+import time
+import numpy as np
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Sequence, Optional, Any
+
+# internal imports
+from api.utils.geo import haversine
+from api.utils.metrics import timed
+from api.utils.road_graph import RoadGraph
+from api.utils.lane_table import LaneTable
+
+# cost of the edges a route may not take, finite so that move deltas stay comparable
+BLOCKED = 1e9
+
+# smallest improvement applied, guards against cycling on rounding errors
+EPSILON = 1e-9
+
+# lengths of the segments moved by or-opt
+OR_OPT_SEGMENTS = (1, 2, 3)
+
+def _fill_missing(matrix: np.ndarray, missing: np.ndarray, points: np.ndarray, graph: RoadGraph) -> None:
+    """
+    Computes the road distances of the missing pairs only, from a small set of stops that
+    covers them (greedily, the stop with the most missing pairs first): its rows, and its
+    columns as distances to it, hold every missing pair.
+    """
+    remaining = missing.copy()
+    counts = remaining.sum(axis=1)
+    cover = []
+    while counts.any():
+        k = int(np.argmax(counts))
+        cover.append(k)
+        counts -= remaining[:, k]
+        counts[k] = 0
+        remaining[k, :] = remaining[:, k] = False
+
+    cover = np.asarray(cover, dtype=np.int64)
+    rows = graph.distances(points[cover], points)
+    columns = graph.distances(points[cover], points, reverse=True) if graph.directed else rows
+
+    fill = missing[cover]
+    block = matrix[cover]
+    block[fill] = rows[fill]
+    matrix[cover] = block
+
+    fill = missing[:, cover].T
+    block = matrix[:, cover].T
+    block[fill] = columns[fill]
+    matrix[:, cover] = block.T
+
+@timed('routing')
+def build_matrix(
+    points: np.ndarray,
+    graph: Optional[RoadGraph] = None,
+    codes: Optional[Sequence[Optional[str]]] = None,
+    lanes: Optional[LaneTable] = None
+) -> np.ndarray:
+    """
+    Distances between the stops of a route. Pairs of stops on a lane of the lane table are read
+    from it, only the others are computed.
+
+    Args
+        points: (n, 2) array of (latitude, longitude)
+        graph: road graph, great-circle distances without one.
+        codes: postal code of every point, None for points without one.
+        lanes: lane table, every distance is computed without one.
+
+    Returns
+        [np.ndarray]: (n, n) distances in km
+    """
+    n = len(points)
+    matrix = lanes.matrix(codes, road=graph is not None) if lanes is not None and codes is not None else None
+    missing = np.isnan(matrix) if matrix is not None else None
+
+    if missing is None or missing.sum() == n * (n - 1):
+        if graph is not None:
+            return graph.distance_matrix(points)
+        lat, lon = points[:, 0], points[:, 1]
+        return haversine(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+    if graph is not None:
+        _fill_missing(matrix, missing, points, graph)
+    elif missing.any():
+        lat, lon = points[:, 0], points[:, 1]
+        matrix[missing] = haversine(lat[:, None], lon[:, None], lat[None, :], lon[None, :])[missing]
+    return matrix
+
+def _augment(matrix: np.ndarray, start: Optional[int], return_to_start: bool) -> np.ndarray:
+    """
+    Adds a fixed first node 0 and a fixed last node n + 1 around the n stops, so that every
+    route is a path between two fixed ends: the first node leads to `start` only (to any stop
+    without one), the last node is reached for free (or at the cost of returning to `start`).
+    """
+    n = len(matrix)
+    d = np.full((n + 2, n + 2), BLOCKED)
+    d[1:n + 1, 1:n + 1] = matrix
+
+    if start is None:
+        d[0, 1:n + 1] = 0.0
+    else:
+        d[0, start + 1] = 0.0
+
+    d[1:n + 1, n + 1] = matrix[:, start] if start is not None and return_to_start else 0.0
+    return d
+
+def _nearest_neighbour(d: np.ndarray, before: np.ndarray) -> np.ndarray:
+    """Builds a route by always driving to the nearest stop whose predecessor was visited."""
+    size = len(d)
+    visited = np.zeros(size, dtype=bool)
+    visited[0] = visited[-1] = True
+    has_before = before >= 0
+    before_index = np.where(has_before, before, 0)
+
+    route = [0]
+    current = 0
+    for _ in range(size - 2):
+        ready = ~visited & (~has_before | visited[before_index])
+        current = int(np.argmin(np.where(ready, d[current], np.inf)))
+        visited[current] = True
+        route.append(current)
+
+    route.append(size - 1)
+    return np.asarray(route)
+
+def _positions(route: np.ndarray) -> np.ndarray:
+    pos = np.empty(len(route), dtype=np.int64)
+    pos[route] = np.arange(len(route))
+    return pos
+
+def _reversal_limits(route: np.ndarray, pos: np.ndarray, after: np.ndarray) -> np.ndarray:
+    """
+    limits[i]: reversing route[i..j] keeps every pickup before its delivery iff j < limits[i],
+    i.e. the segment holds no pickup together with its delivery.
+    """
+    nodes_after = after[route]
+    delivery_pos = np.where(nodes_after >= 0, pos[np.maximum(nodes_after, 0)], len(route))
+    return np.minimum.accumulate(delivery_pos[::-1])[::-1]
+
+def _two_opt_pass(d: np.ndarray, route: np.ndarray, after: np.ndarray, deadline: float) -> int:
+    """
+    Reverses the segments of the route that shorten it, best reversal per segment start. Only
+    valid for symmetric distances.
+    """
+    size = len(route)
+    pos = _positions(route)
+    limits = _reversal_limits(route, pos, after)
+    moves = 0
+
+    i = 1
+    while i <= size - 3 and time.perf_counter() < deadline:
+        last = min(size - 2, limits[i] - 1)
+        if last > i:
+            js = np.arange(i + 1, last + 1)
+            a, b = route[i - 1], route[i]
+            c, e = route[js], route[js + 1]
+            delta = d[a, c] + d[b, e] - d[a, b] - d[c, e]
+
+            k = int(np.argmin(delta))
+            if delta[k] < -EPSILON:
+                j = js[k]
+                route[i:j + 1] = route[i:j + 1][::-1].copy()
+                pos = _positions(route)
+                limits = _reversal_limits(route, pos, after)
+                moves += 1
+                continue
+        i += 1
+
+    return moves
+
+def _or_opt_pass(d: np.ndarray, route: np.ndarray, before: np.ndarray, after: np.ndarray, deadline: float) -> Tuple[np.ndarray, int]:
+    """
+    Moves segments of 1 to 3 consecutive stops to the position that shortens the route most,
+    within the positions that keep pickups before deliveries. Valid for asymmetric distances.
+    """
+    size = len(route)
+    pos = _positions(route)
+    moves = 0
+
+    for length in OR_OPT_SEGMENTS:
+        i = 1
+        while i + length <= size - 1 and time.perf_counter() < deadline:
+            segment = route[i:i + length]
+            first, last = segment[0], segment[-1]
+            prev, nxt = route[i - 1], route[i + length]
+            gain = d[prev, first] + d[last, nxt] - d[prev, nxt]
+
+            # the segment goes between route[k] and route[k + 1], lo <= k <= hi
+            lo, hi = 0, size - 2
+            for node in segment:
+                if before[node] >= 0 and before[node] not in segment:
+                    lo = max(lo, pos[before[node]])
+                if after[node] >= 0 and after[node] not in segment:
+                    hi = min(hi, pos[after[node]] - 1)
+
+            ks = np.arange(lo, hi + 1)
+            ks = ks[(ks < i - 1) | (ks > i + length - 1)]
+            if len(ks):
+                u, v = route[ks], route[ks + 1]
+                delta = d[u, first] + d[last, v] - d[u, v] - gain
+
+                best = int(np.argmin(delta))
+                if delta[best] < -EPSILON:
+                    k = ks[best]
+                    rest = np.concatenate([route[:i], route[i + length:]])
+                    at = k + 1 if k < i else k + 1 - length
+                    route = np.concatenate([rest[:at], segment, rest[at:]])
+                    pos = _positions(route)
+                    moves += 1
+                    continue
+            i += 1
+
+    return route, moves
+
+@timed('routing')
+def solve_route(problem: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Orders the stops of one vehicle: nearest-neighbour construction, then 2-opt and or-opt
+    passes until neither shortens the route or the time limit is reached. Pickups always come
+    before the delivery of the same shipment.
+
+    Args
+        problem: dictionary with
+            matrix: (n, n) distances in km between the stops.
+            before: n stop indices that must be visited before each stop, -1 for none.
+            start: index of the stop the route starts at, None to start anywhere.
+            return_to_start: counts the drive back to `start`.
+            time_limit: seconds spent improving the route.
+
+    Returns
+        [Dict[str, Any]]: order of the stop indices, distance_km of the route, initial_km of the
+        nearest-neighbour route, the number of 2-opt and or-opt moves and the seconds spent.
+    """
+    started = time.perf_counter()
+    matrix = np.asarray(problem['matrix'], dtype=np.float64)
+    n = len(matrix)
+    if n == 0:
+        return { 'order': [], 'distance_km': 0.0, 'initial_km': 0.0, 'two_opt_moves': 0, 'or_opt_moves': 0, 'seconds': 0.0 }
+
+    d = _augment(matrix, problem.get('start'), problem.get('return_to_start', False))
+
+    # precedence on the augmented nodes, stop k is node k + 1
+    before = np.full(n + 2, -1, dtype=np.int64)
+    stop_before = np.asarray(problem.get('before', [-1] * n), dtype=np.int64)
+    before[1:n + 1] = np.where(stop_before >= 0, stop_before + 1, -1)
+    after = np.full(n + 2, -1, dtype=np.int64)
+    has_before = np.flatnonzero(before >= 0)
+    after[before[has_before]] = has_before
+
+    route = _nearest_neighbour(d, before)
+    length = lambda r: float(d[r[:-1], r[1:]].sum())
+    initial_km = length(route)
+
+    deadline = started + problem.get('time_limit', 2.0)
+    symmetric = np.allclose(matrix, matrix.T)
+    two_opt_moves = or_opt_moves = 0
+    while time.perf_counter() < deadline:
+        moves = _two_opt_pass(d, route, after, deadline) if symmetric else 0
+        two_opt_moves += moves
+        route, or_moves = _or_opt_pass(d, route, before, after, deadline)
+        or_opt_moves += or_moves
+        if not moves and not or_moves:
+            break
+
+    return {
+        'order': [int(node) - 1 for node in route[1:-1]],
+        'distance_km': length(route),
+        'initial_km': initial_km,
+        'two_opt_moves': two_opt_moves,
+        'or_opt_moves': or_opt_moves,
+        'seconds': time.perf_counter() - started,
+    }
+
+def solve_routes(problems: List[Dict[str, Any]], processes: int = 0, min_parallel_stops: int = 500) -> List[Dict[str, Any]]:
+    """
+    Solves the routes of many vehicles, on a process pool when the batch has at least
+    min_parallel_stops stops in total; smaller batches do not pay back the start of the pool.
+
+    The workers are spawned rather than forked, forking a process that runs threads (e.g. a
+    gunicorn worker) can deadlock the children.
+
+    Args
+        problems: see solve_route.
+        processes: worker processes, 0 for the cpu count.
+        min_parallel_stops: smallest batch solved in parallel.
+
+    Returns
+        [List[Dict[str, Any]]]: results in the order of the problems, see solve_route.
+    """
+    workers = min(processes or os.cpu_count() or 1, len(problems))
+    if workers <= 1 or sum(len(problem['matrix']) for problem in problems) < min_parallel_stops:
+        return [solve_route(problem) for problem in problems]
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+        return list(pool.map(solve_route, problems))
@@ -0,0 +1,347 @@
+# external imports
+import math
+import click
+import datetime
+import numpy as np
+from bson import ObjectId
+from flask import Flask, request, current_app, jsonify, abort
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from pymongo.database import Database
+from typing import Tuple, Dict, List, Optional, Any
+
+# internal imports
+from api import mongo, geo_index, lane_table
+from api.services import services_bp
+from api.utils.metrics import timed
+from api.utils.mongo_pool import read_db
+from api.utils.road_graph import load_road_graph
+from api.utils.transactions import run_in_transaction
+from api.services.route_optim import build_matrix, solve_route, solve_routes
+from api.db_models.shipment_models import Route, Status
+
+# shipments assigned to a carrier and not delivered yet
+ROUTED_STATUSES = [Status.active.value, Status.delayed.value]
+
+ROUTE_SHIPMENT_FIELDS = { 'origin_code': 1, 'destination_code': 1, 'shipped_at': 1 }
+
+def parse_route_request(data: Any) -> Tuple[Optional[List[ObjectId]], Optional[Tuple[float, float]], bool]:
+    """
+    Validates the body of a route optimization request; every field is optional.
+
+    Args
+        data: request body with `shipment_ids` (defaults to every active or delayed shipment of the
+        carrier), `start` as [latitude, longitude] (defaults to the carrier's location) and
+        `return_to_start`.
+
+    Returns
+        [Tuple[Optional[List[ObjectId]], Optional[Tuple[float, float]], bool]]: shipment ids,
+        start, return_to_start.
+
+    Raises
+        [ValueError]: message describing the invalid field.
+    """
+    data = data or {}
+    if not isinstance(data, dict):
+        raise ValueError('Invalid request body.')
+
+    shipment_ids = data.get('shipment_ids')
+    if shipment_ids is not None:
+        if not isinstance(shipment_ids, list) or not all(ObjectId.is_valid(sh_id) for sh_id in shipment_ids):
+            raise ValueError('Invalid object id.')
+        shipment_ids = [ObjectId(sh_id) for sh_id in dict.fromkeys(shipment_ids)]
+
+    start = data.get('start')
+    if start is not None:
+        try:
+            latitude, longitude = (float(value) for value in start)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid start, use [latitude, longitude].')
+        if not (math.isfinite(latitude) and math.isfinite(longitude) and -90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError('Invalid start, use [latitude, longitude].')
+        start = (latitude, longitude)
+
+    return shipment_ids, start, bool(data.get('return_to_start', False))
+
+@timed('geocoding')
+def _geocode_codes(codes: List[str]) -> Dict[str, Tuple[float, float]]:
+    """Co-ordinates of the known postal codes."""
+    coords = geo_index.lookup_many(codes)
+    return { code: (float(lat), float(lon)) for code, (lat, lon) in zip(codes, coords) if not math.isnan(lat) }
+
+def route_plan(
+    shipments: List[Dict[str, Any]],
+    start: Optional[Tuple[float, float]],
+    return_to_start: bool,
+    time_limit: float,
+    graph=None,
+    lanes=None
+) -> Tuple[Dict[str, Any], Dict[str, Any], List[str]]:
+    """
+    Turns shipments into the stops of one vehicle: a pickup at the origin of every shipment not
+    shipped yet, followed by its delivery at the destination.
+
+    Args
+        shipments: documents with origin_code, destination_code and shipped_at.
+        start: (latitude, longitude) the vehicle starts at, None to start at any stop.
+        return_to_start: counts the drive back to start.
+        time_limit: seconds spent improving the route.
+        graph: road graph, great-circle distances without one.
+        lanes: lane table the distances between postal codes are read from first.
+
+    Returns
+        [Tuple[Dict[str, Any], Dict[str, Any], List[str]]]: problem of solve_route, plan (shipment
+        ids, types and points of the stops, return_to_start), ids of the shipments skipped for
+        unknown postal codes.
+    """
+    coords = _geocode_codes(sorted({ doc.get(field) for doc in shipments for field in ['origin_code', 'destination_code'] if doc.get(field) }))
+
+    stops, stop_types, points, codes, before, skipped = [], [], [], [], [], []
+    if start is not None:
+        stops.append(None)
+        stop_types.append('start')
+        points.append(start)
+        codes.append(None)
+        before.append(-1)
+
+    for doc in shipments:
+        origin, destination = coords.get(doc.get('origin_code')), coords.get(doc.get('destination_code'))
+        if destination is None or (origin is None and not doc.get('shipped_at')):
+            skipped.append(str(doc['_id']))
+            continue
+
+        pickup = -1
+        if not doc.get('shipped_at'):
+            pickup = len(points)
+            stops.append(doc['_id'])
+            stop_types.append('pickup')
+            points.append(origin)
+            codes.append(doc.get('origin_code'))
+            before.append(-1)
+
+        stops.append(doc['_id'])
+        stop_types.append('delivery')
+        points.append(destination)
+        codes.append(doc.get('destination_code'))
+        before.append(pickup)
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return_to_start = return_to_start and start is not None
+    problem = {
+        'matrix': build_matrix(points, graph, codes, lanes) if len(points) else np.zeros((0, 0)),
+        'before': before,
+        'start': 0 if start is not None else None,
+        'return_to_start': return_to_start,
+        'time_limit': time_limit,
+    }
+    plan = { 'stops': stops, 'stop_types': stop_types, 'points': points, 'return_to_start': return_to_start }
+    return problem, plan, skipped
+
+def route_document(carrier_id: ObjectId, plan: Dict[str, Any], result: Dict[str, Any], method: str, speed_kmh: float) -> Route:
+    """
+    Builds the Route of a solved plan.
+
+    Args
+        carrier_id: carrier driving the route.
+        plan: plan of route_plan.
+        result: result of solve_route.
+        method: road_graph or great_circle.
+        speed_kmh: average speed of the estimated duration.
+
+    Returns
+        [Route]: route with a new id.
+    """
+    order = result['order']
+    stops = [plan['stops'][k] for k in order]
+    if plan['return_to_start']:
+        order = order + [0]
+        stops = stops + [None]
+
+    return Route(**{
+        '_id': ObjectId(),
+        'carrier_id': carrier_id,
+        'shipment_ids': list(dict.fromkeys(stop for stop in stops if stop is not None)),
+        'stops': stops,
+        'stop_types': [plan['stop_types'][k] for k in order],
+        'path': [(float(plan['points'][k][0]), float(plan['points'][k][1])) for k in order],
+        'distance': result['distance_km'],
+        'estimated_duration': datetime.timedelta(hours=result['distance_km'] / speed_kmh),
+        'method': method,
+    })
+
+def save_route(db: Database, route: Route) -> None:
+    """Writes the route and makes it the predicted_route of its shipments, in one transaction."""
+    def save(session):
+        db.routes.insert_one(route.to_bson(), session=session)
+        db.shipments.update_many(
+            { '_id': { '$in': route.shipment_ids } },
+            { '$set': { 'predicted_route': route.id } },
+            session=session
+        )
+
+    run_in_transaction(save)
+
+def carrier_start(carrier: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """(latitude, longitude) of the carrier's location, None if it has none."""
+    location = carrier.get('location')
+    if not location:
+        return None
+    longitude, latitude = location['coordinates']
+    return latitude, longitude
+
+@services_bp.route('/routes', methods=['POST'])
+@jwt_required()
+def optimize_route() -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to compute the route of the current carrier through the pickups and deliveries of
+    its active and delayed shipments, which becomes their predicted_route.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    db = mongo.db
+    config = current_app.config
+    try:
+        try:
+            shipment_ids, start, return_to_start = parse_route_request(request.get_json(silent=True))
+        except ValueError as e:
+            abort(400, str(e))
+
+        carrier = db.carriers.find_one({ 'user_id': ObjectId(get_jwt_identity()) }, { '_id': 1, 'location': 1 })
+        if not carrier:
+            abort(404, 'Carrier not found.')
+
+        query = { 'carrier_id': carrier['_id'], 'status': { '$in': ROUTED_STATUSES } }
+        if shipment_ids is not None:
+            query['_id'] = { '$in': shipment_ids }
+
+        shipments = list(db.shipments.find(query, ROUTE_SHIPMENT_FIELDS))
+        if not shipments:
+            abort(404, 'No shipments to route.')
+
+        if 2 * len(shipments) + 1 > config.get('ROUTE_MAX_STOPS'):
+            abort(400, 'Too many stops.')
+
+        graph = load_road_graph(config.get('ROUTE_GRAPH_PATH'))
+        problem, plan, skipped = route_plan(
+            shipments, start or carrier_start(carrier), return_to_start, config.get('ROUTE_TIME_LIMIT'), graph, lane_table
+        )
+        if not any(stop is not None for stop in plan['stops']):
+            abort(400, 'Could not geocode the shipments.')
+
+        result = solve_route(problem)
+
+        route = route_document(
+            carrier['_id'], plan, result, 'road_graph' if graph else 'great_circle', config.get('ROUTE_AVERAGE_SPEED_KMH')
+        )
+        save_route(db, route)
+
+        return jsonify({
+            'message': 'Route optimized successfully.',
+            'data': {
+                'route': route.to_json(),
+                'skipped': skipped,
+                'stats': {
+                    'initial_km': round(result['initial_km'], 3),
+                    'two_opt_moves': result['two_opt_moves'],
+                    'or_opt_moves': result['or_opt_moves'],
+                    'seconds': round(result['seconds'], 3)
+                }
+            }
+        }), 201
+
+    except Exception as e:
+        current_app.logger.error('Error while optimizing route: %s', e)
+        raise e
+
+@services_bp.route('/routes/<string:r_id>', methods=['GET'])
+@jwt_required()
+def get_route(r_id: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to fetch a route, for its carrier and the shippers of its shipments.
+
+    Args
+        r_id: id of the route.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    db = read_db()
+    try:
+        if not ObjectId.is_valid(r_id):
+            abort(400, 'Invalid object id.')
+
+        res = db.routes.find_one({ '_id': ObjectId(r_id) })
+        if not res:
+            abort(404, 'Route not found.')
+
+        user_id = ObjectId(get_jwt_identity())
+        shipper = db.shippers.find_one({ 'user_id': user_id }, { '_id': 1 })
+        if not (
+            db.carriers.count_documents({ '_id': res.get('carrier_id'), 'user_id': user_id }, limit=1) or
+            (shipper and db.shipments.count_documents({ '_id': { '$in': res.get('shipment_ids', []) }, 'shipper_id': shipper['_id'] }, limit=1))
+        ):
+            abort(403, 'Unauthorized access to route.')
+
+        return jsonify({
+            'message': 'Route fetched successfully.',
+            'data': Route.serialize_document(res)
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while fetching route %s: %s', r_id, e)
+        raise e
+
+def register_route_cli(app: Flask) -> None:
+    """
+    Registers the `flask routes optimize` command.
+
+    Args
+        app: flask app instance
+    """
+    @app.cli.group('routes')
+    def routes_cli():
+        """Route optimization of the carriers' shipments."""
+
+    @routes_cli.command('optimize')
+    @click.option('--carrier-id', help='Only this carrier; every carrier with active or delayed shipments when omitted.')
+    @click.option('--processes', type=int, default=None, help='Worker processes, ROUTE_PROCESSES by default.')
+    @click.option('--return-to-start', is_flag=True, help='Count the drive back to the carrier location.')
+    def optimize_command(carrier_id, processes, return_to_start):
+        """Compute the routes of the carriers and set the predicted_route of their shipments."""
+        db, config = mongo.db, app.config
+        query = { 'status': { '$in': ROUTED_STATUSES }, 'carrier_id': { '$ne': None } }
+        if carrier_id:
+            if not ObjectId.is_valid(carrier_id):
+                raise click.BadParameter('Invalid object id.', param_hint='--carrier-id')
+            query['carrier_id'] = ObjectId(carrier_id)
+
+        by_carrier: Dict[ObjectId, List[Dict[str, Any]]] = {}
+        for doc in db.shipments.find(query, { **ROUTE_SHIPMENT_FIELDS, 'carrier_id': 1 }):
+            by_carrier.setdefault(doc['carrier_id'], []).append(doc)
+
+        carriers = { doc['_id']: doc for doc in db.carriers.find({ '_id': { '$in': list(by_carrier) } }, { 'location': 1 }) }
+        graph = load_road_graph(config.get('ROUTE_GRAPH_PATH'))
+
+        plans = []
+        for c_id, shipments in by_carrier.items():
+            problem, plan, skipped = route_plan(
+                shipments, carrier_start(carriers.get(c_id, {})), return_to_start, config.get('ROUTE_TIME_LIMIT'), graph, lane_table
+            )
+            if skipped:
+                click.echo(f'carrier {c_id}: skipped {len(skipped)} shipments with unknown postal codes')
+            if len(problem['matrix']):
+                plans.append((c_id, problem, plan))
+
+        results = solve_routes(
+            [problem for _, problem, _ in plans],
+            config.get('ROUTE_PROCESSES') if processes is None else processes,
+            config.get('ROUTE_PARALLEL_MIN_STOPS')
+        )
+
+        for (c_id, problem, plan), result in zip(plans, results):
+            route = route_document(c_id, plan, result, 'road_graph' if graph else 'great_circle', config.get('ROUTE_AVERAGE_SPEED_KMH'))
+            save_route(db, route)
+            click.echo(
+                f"carrier {c_id}: route {route.id}, {len(route.stops)} stops, {result['distance_km']:.1f} km "
+                f"(nearest neighbour {result['initial_km']:.1f} km), {result['seconds']:.2f}s"
+            )
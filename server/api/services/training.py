@@ -0,0 +1,395 @@
+# external imports
+import os
+import json
+import time
+import click
+import shutil
+import datetime
+import warnings
+import numpy as np
+from flask import Flask
+from pymongo.database import Database
+from typing import Dict, List, Tuple, Iterable, Optional, Any
+
+# internal imports
+from api.utils.bulk_transfer import TRANSFER_FORMATS, read_ndjson, read_parquet
+from api.utils.scoring_backends import SCORING_BACKENDS, backend_file, export_backends
+from api.services.predict_top_bid import (
+    FEATURE_COLUMNS, FEATURE_SCHEMA_VERSION, bid_feature_pipeline, features_from_documents, check_feature_schema
+)
+
+# features plus the label and the group of every row
+Dataset = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# shipment fields features_from_documents reads
+SHIPMENT_FIELDS = ['distance', 'cargo_load', 'created_at']
+
+ARTIFACT_PREFIX = 'top_bid'
+
+def assemble_dataset(rows: List[np.ndarray], labels: List[float], groups: List[str], labelled_only: bool) -> Dataset:
+    """
+    Stacks the rows and drops those that cannot be scored.
+
+    Args
+        rows: feature rows.
+        labels: 1.0 for accepted bids.
+        groups: shipment of every row.
+        labelled_only: also drops the bids of shipments without an accepted bid.
+
+    Returns
+        [Dataset]: features, labels and groups.
+    """
+    features = np.vstack(rows) if rows else np.empty((0, len(FEATURE_COLUMNS)))
+    labels = np.asarray(labels, dtype=np.float64)
+    groups = np.asarray(groups, dtype=object)
+
+    keep = ~np.isnan(features).any(axis=1)
+    if labelled_only and len(groups):
+        keep &= np.isin(groups, np.unique(groups[labels == 1.0]))
+
+    return features[keep], labels[keep], groups[keep]
+
+def dataset_from_db(db: Database, match: Optional[Dict[str, Any]] = None, labelled_only: bool = True) -> Dataset:
+    """
+    Builds the training set with the aggregation the inference side uses (bid_feature_pipeline),
+    labelled with the bids' accepted flag.
+
+    Args
+        db: database holding the bids and shipments collections.
+        match: filter on the bids collection.
+        labelled_only: keeps only the bids of shipments that have an accepted bid.
+
+    Returns
+        [Dataset]: (n, len(FEATURE_COLUMNS)) features, labels (1.0 for accepted bids) and shipment ids.
+    """
+    pipeline = bid_feature_pipeline(match or {})
+    # carry the label through both projections
+    pipeline[-1]['$project']['accepted'] = 1
+    pipeline[-2]['$project']['accepted'] = 1
+
+    rows, labels, groups = [], [], []
+    for doc in db.bids.aggregate(pipeline, allowDiskUse=True):
+        rows.append(np.array([np.nan if doc.get(column) is None else doc[column] for column in FEATURE_COLUMNS], dtype=np.float64))
+        labels.append(1.0 if doc.get('accepted') else 0.0)
+        groups.append(str(doc['shipment_id']))
+
+    return assemble_dataset(rows, labels, groups, labelled_only)
+
+def _read_snapshot(path: str, fmt: str) -> Iterable[Dict[str, Any]]:
+    """Reads an export written by `flask data export`."""
+    if fmt == 'parquet':
+        yield from read_parquet(path)
+        return
+
+    with open(path, 'rb') as f:
+        yield from read_ndjson(f)
+
+def dataset_from_snapshot(shipments_path: str, bids_path: str, fmt: str = 'ndjson', labelled_only: bool = True) -> Dataset:
+    """
+    Builds the training set from exports of the shipments and bids collections, with the
+    in-memory mirror of the aggregation (features_from_documents).
+
+    Args
+        shipments_path: shipments export.
+        bids_path: bids export.
+        fmt: one of TRANSFER_FORMATS.
+        labelled_only: keeps only the bids of shipments that have an accepted bid.
+
+    Returns
+        [Dataset]: same as dataset_from_db.
+    """
+    # parquet exports store ids as strings
+    shipments = {
+        str(doc['_id']): { field: doc.get(field) for field in SHIPMENT_FIELDS }
+        for doc in _read_snapshot(shipments_path, fmt)
+    }
+
+    rows, labels, groups = [], [], []
+    for bid in _read_snapshot(bids_path, fmt):
+        shipment_id = str(bid.get('shipment_id'))
+        shipment = shipments.get(shipment_id)
+        if shipment is None:
+            continue
+        rows.append(features_from_documents([bid], shipment)[0])
+        labels.append(1.0 if bid.get('accepted') else 0.0)
+        groups.append(shipment_id)
+
+    return assemble_dataset(rows, labels, groups, labelled_only)
+
+def top1_accuracy(scores: np.ndarray, labels: np.ndarray, groups: np.ndarray) -> Optional[float]:
+    """
+    Share of shipments whose best scored bid is the accepted one.
+
+    Args
+        scores: predicted scores.
+        labels: 1.0 for accepted bids.
+        groups: shipment of every row.
+
+    Returns
+        [Optional[float]]: accuracy, None if no shipment has an accepted bid.
+    """
+    if not len(scores):
+        return None
+
+    # sort by shipment, then by descending score; the first row of every shipment is its best bid
+    _, inverse = np.unique(groups.astype(str), return_inverse=True)
+    order = np.lexsort((-scores, inverse))
+    first = order[np.r_[True, inverse[order][1:] != inverse[order][:-1]]]
+
+    labelled = np.zeros(inverse.max() + 1, dtype=bool)
+    labelled[inverse[labels == 1.0]] = True
+    first = first[labelled[inverse[first]]]
+
+    return float(labels[first].mean()) if len(first) else None
+
+def inference_latency(model: Any, features: np.ndarray, rows: int = 1000, repeat: int = 5) -> float:
+    """
+    Best time of scoring `rows` bids in one call, in milliseconds.
+
+    Args
+        model: fitted model.
+        features: rows to tile up to `rows`.
+        rows: batch size.
+        repeat: number of measurements.
+
+    Returns
+        [float]: milliseconds per call.
+    """
+    batch = np.resize(features, (rows, features.shape[1]))
+    best = float('inf')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model.predict(batch)
+            best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+def train_model(
+    features: np.ndarray,
+    labels: np.ndarray,
+    groups: np.ndarray,
+    n_estimators: int = 100,
+    max_depth: Optional[int] = None,
+    n_jobs: int = -1,
+    test_size: float = 0.2,
+    seed: int = 0
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Fits the ranking model on all cores and evaluates it on held out shipments.
+
+    The split is made by shipment so that the bids of a shipment are never on both sides. The
+    model is fitted on a DataFrame so that it remembers FEATURE_COLUMNS (see check_feature_schema).
+
+    Args
+        features: (n, len(FEATURE_COLUMNS)) matrix.
+        labels: 1.0 for accepted bids.
+        groups: shipment of every row.
+        n_estimators: number of trees.
+        max_depth: depth limit of the trees.
+        n_jobs: cores used for fitting, -1 for all of them.
+        test_size: share of the shipments held out.
+        seed: seed of the split and the forest, for reproducible runs.
+
+    Returns
+        [Tuple[Dict[str, Any], Dict[str, Any]]]: fitted model per SCORING_BACKENDS entry (see
+        export_backends) and their metrics.
+    """
+    # imported here, the api only needs them once a model is trained
+    import pandas as pd
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import GroupShuffleSplit
+    from sklearn.metrics import mean_absolute_error, roc_auc_score
+
+    if len(features) < 2 or len(np.unique(groups.astype(str))) < 2:
+        raise ValueError('At least two shipments with bids are needed to train the model.')
+
+    splitter = GroupShuffleSplit(n_splits=1, test_size=test_size, random_state=seed)
+    train_rows, test_rows = next(splitter.split(features, labels, groups.astype(str)))
+
+    model = RandomForestRegressor(n_estimators=n_estimators, max_depth=max_depth, n_jobs=n_jobs, random_state=seed)
+    start = time.perf_counter()
+    model.fit(pd.DataFrame(features[train_rows], columns=FEATURE_COLUMNS), labels[train_rows])
+    training_s = time.perf_counter() - start
+
+    backends = export_backends(model, features[train_rows], labels[train_rows])
+    test_labels = labels[test_rows]
+    metrics = {
+        'train_rows': int(len(train_rows)),
+        'test_rows': int(len(test_rows)),
+        'training_s': round(training_s, 3),
+        'backends': {},
+    }
+
+    for name, backend in backends.items():
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            scores = backend.predict(features[test_rows])
+
+        metrics['backends'][name] = {
+            'mae': float(mean_absolute_error(test_labels, scores)),
+            'auc': float(roc_auc_score(test_labels, scores)) if len(np.unique(test_labels)) == 2 else None,
+            'top1_accuracy': top1_accuracy(scores, test_labels, groups[test_rows]),
+            'latency_ms_per_1k': round(inference_latency(backend, features), 3),
+        }
+
+    # the sklearn model's metrics at the top level
+    metrics.update(metrics['backends']['sklearn'])
+
+    return backends, metrics
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    """Writes a json file atomically."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+def save_artifact(models: Dict[str, Any], metrics: Dict[str, Any], params: Dict[str, Any], model_dir: str, source: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Writes the sklearn model as top_bid-<version>.joblib, the other backends as
+    top_bid-<version>.<backend>.joblib and the metadata of all of them in top_bid-<version>.json.
+
+    The artifacts are not compressed so that the registry can memory-map them.
+
+    Args
+        models: fitted model per backend, from train_model.
+        metrics: metrics of train_model.
+        params: training parameters.
+        model_dir: directory of the artifacts.
+        source: where the training data came from.
+
+    Returns
+        [Tuple[str, Dict[str, Any]]]: path of the sklearn artifact and the metadata.
+    """
+    import joblib
+    import sklearn
+
+    os.makedirs(model_dir, exist_ok=True)
+    version = datetime.datetime.now(tz=datetime.timezone.utc).strftime('%Y%m%d%H%M%S%f')
+    path = os.path.join(model_dir, f'{ARTIFACT_PREFIX}-{version}.joblib')
+
+    metrics = { **metrics, 'backends': { name: dict(values) for name, values in metrics['backends'].items() } }
+    for name, model in models.items():
+        backend_path = os.path.join(model_dir, backend_file(os.path.basename(path), name))
+        joblib.dump(model, backend_path)
+        metrics['backends'][name]['size_bytes'] = os.path.getsize(backend_path)
+    metrics['size_bytes'] = metrics['backends']['sklearn']['size_bytes']
+
+    metadata = {
+        'version': version,
+        'created_at': datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+        'model': type(models['sklearn']).__name__,
+        'feature_columns': FEATURE_COLUMNS,
+        'feature_schema_version': FEATURE_SCHEMA_VERSION,
+        'sklearn_version': sklearn.__version__,
+        'source': source,
+        'params': params,
+        'metrics': metrics,
+    }
+    _write_json(os.path.splitext(path)[0] + '.json', metadata)
+
+    return path, metadata
+
+def activate_artifact(path: str, model_dir: str, model_file: str) -> str:
+    """
+    Copies the artifacts of every backend and their metadata over the model files served by
+    the registry, which picks them up on its next mtime check. The schema is checked first.
+
+    Args
+        path: sklearn artifact written by save_artifact.
+        model_dir: MODEL_DIR.
+        model_file: MODEL_FILE, must end in .joblib.
+
+    Returns
+        [str]: path of the served sklearn model file.
+    """
+    import joblib
+
+    if not model_file.endswith('.joblib'):
+        raise ValueError(f'MODEL_FILE must be a .joblib file to serve trained artifacts, got {model_file}.')
+
+    with open(os.path.splitext(path)[0] + '.json') as f:
+        metadata = json.load(f)
+
+    sources = {}
+    for name in SCORING_BACKENDS:
+        source = os.path.join(os.path.dirname(path), backend_file(os.path.basename(path), name))
+        if os.path.exists(source):
+            check_feature_schema(joblib.load(source, mmap_mode='r'), metadata)
+            sources[name] = source
+
+    target = os.path.join(model_dir, model_file)
+    # metadata first: the registry reads it when it sees a new model
+    _write_json(os.path.splitext(target)[0] + '.json', metadata)
+    for name, source in sources.items():
+        backend_target = os.path.join(model_dir, backend_file(model_file, name))
+        shutil.copyfile(source, backend_target + '.tmp')
+        os.replace(backend_target + '.tmp', backend_target)
+
+    return target
+
+def register_model_cli(app: Flask) -> None:
+    """
+    Registers the `flask model train|activate|info` commands.
+
+    Args
+        app: flask app instance
+    """
+    from api import mongo, model_registry
+
+    @app.cli.group('model')
+    def model_cli():
+        """Training and deployment of the top-bid model."""
+
+    @model_cli.command('train')
+    @click.option('--shipments', 'shipments_path', help='Shipments export; trains from the database when omitted.')
+    @click.option('--bids', 'bids_path', help='Bids export, required with --shipments.')
+    @click.option('--format', 'fmt', type=click.Choice(TRANSFER_FORMATS), default='ndjson')
+    @click.option('--all-shipments', is_flag=True, help='Also use shipments without an accepted bid.')
+    @click.option('--n-estimators', type=int, default=100, show_default=True)
+    @click.option('--max-depth', type=int, default=None)
+    @click.option('--n-jobs', type=int, default=-1, show_default=True, help='Cores used for fitting, -1 for all.')
+    @click.option('--test-size', type=float, default=0.2, show_default=True)
+    @click.option('--seed', type=int, default=0, show_default=True)
+    @click.option('--activate', is_flag=True, help='Serve the new model right away.')
+    def train_command(shipments_path, bids_path, fmt, all_shipments, n_estimators, max_depth, n_jobs, test_size, seed, activate):
+        """Train the model and write a versioned artifact to MODEL_DIR."""
+        start = time.perf_counter()
+        if shipments_path or bids_path:
+            if not (shipments_path and bids_path):
+                raise click.UsageError('--shipments and --bids go together.')
+            source = f'snapshot:{shipments_path},{bids_path}'
+            features, labels, groups = dataset_from_snapshot(shipments_path, bids_path, fmt, not all_shipments)
+        else:
+            source = f'db:{mongo.db.name}'
+            features, labels, groups = dataset_from_db(mongo.db, labelled_only=not all_shipments)
+        loading_s = time.perf_counter() - start
+
+        params = { 'n_estimators': n_estimators, 'max_depth': max_depth, 'n_jobs': n_jobs, 'test_size': test_size, 'seed': seed }
+        try:
+            model, metrics = train_model(features, labels, groups, **params)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        metrics['loading_s'] = round(loading_s, 3)
+        path, metadata = save_artifact(model, metrics, params, model_registry.model_dir, source)
+        click.echo(json.dumps({ 'artifact': path, **metadata }, indent=2))
+
+        if activate:
+            click.echo(f'Serving {activate_artifact(path, model_registry.model_dir, model_registry.model_file)}')
+
+    @model_cli.command('activate')
+    @click.argument('path')
+    def activate_command(path):
+        """Serve the artifact at PATH."""
+        try:
+            click.echo(f'Serving {activate_artifact(path, model_registry.model_dir, model_registry.model_file)}')
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+    @model_cli.command('info')
+    def info_command():
+        """Show the served model and its metadata."""
+        model_registry.get()
+        click.echo(json.dumps({ **model_registry.stats(), 'metadata': model_registry.metadata }, indent=2, default=str))
@@ -1,5 +1,10 @@
 from flask import Blueprint
+from api.utils.metrics import RequestThreadPool
 
 ship_bp = Blueprint('shipment', __name__)
 
+# threads for the independent lookups of the write routes, started on first use (i.e. after a fork);
+# their time counts towards the request that submitted them
+lookup_pool = RequestThreadPool(max_workers=8, thread_name_prefix='shipment-lookup')
+
 from api.shipment import management, bidding
\ No newline at end of file
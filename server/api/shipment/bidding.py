@@ -1,25 +1,82 @@
 # external imports
+import numpy as np
 from bson import ObjectId
 from datetime import datetime
-from pymongo import ReturnDocument
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, List, Any
+from pymongo import ReturnDocument, DESCENDING, InsertOne, UpdateOne
 from flask import request, current_app, jsonify, abort
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
 # internal imports
 from api import mongo
-from api.shipment import ship_bp
-from api.services import predict_top_bid
+from api.shipment import ship_bp, lookup_pool
+from api.utils.mongo_pool import read_db
+from api.utils.pagination import open_page
+from api.utils.streaming import response_format, max_per_page, list_response
+from api.utils.transactions import run_in_transaction
+from api.services.predict_top_bid import (
+    score_bid, score_features, features_from_documents, push_bid_update, push_bids_update,
+    pull_bid_update, refresh_top_bid, rescore_shipment
+)
 from api.db_models.user_models import Carrier
-from api.utils.object_id import PydanticObjectId
 from api.db_models.shipment_models import Shipment, Bid
 
+# fields of a shipment the bid-ranking features are computed from
+SCORING_FIELDS = { 'distance': 1, 'cargo_load': 1, 'created_at': 1 }
+
+def parse_bid(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validates the fields of a bid sent by a carrier.
+
+    Args
+        data: bid fields of the request body.
+
+    Returns
+        [Dict[str, Any]]: bid document without shipment and carrier.
+
+    Raises
+        [ValueError]: message describing the invalid field.
+    """
+    req_fields = ['proposed_delivery_date', 'proposed_price', 'proposed_vehicle']
+
+    if not isinstance(data, dict) or not all(field in data for field in req_fields):
+        raise ValueError('Missing required fields.')
+
+    try:
+        proposed_price = int(data.get('proposed_price'))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid proposed_price.')
+
+    if proposed_price < 1:
+        raise ValueError('Price cannot be less than 1.')
+
+    proposed_vehicle = data.get('proposed_vehicle')
+    if not ObjectId.is_valid(proposed_vehicle):
+        raise ValueError('Invalid object id.')
+
+    try:
+        proposed_delivery_date = datetime.strptime(data.get('proposed_delivery_date'), "%Y-%m-%dT%H:%M:%S")
+    except (TypeError, ValueError):
+        raise ValueError('Invalid proposed_delivery_date format. Use ISO 8601 (e.g., "YYYY-MM-DDTHH:MM:SS").')
+
+    return {
+        'proposed_price': proposed_price,
+        'proposed_vehicle': ObjectId(proposed_vehicle),
+        'proposed_delivery_date': proposed_delivery_date,
+        'additional_notes': (data.get('additional_notes') or '').strip(),
+        'accepted': False
+    }
+
 @ship_bp.route('/<string:sh_id>/bids', methods=['POST'])
 @jwt_required()
 def add_bid(sh_id: str) -> Tuple[Dict[str, Any], int]:
     """
     Endpoint to add a bid to a shipment.
 
+    The carrier and the shipment are read concurrently, then the bid is inserted and appended to
+    the shipment and the carrier in one transaction. The updated shipment and carrier are only
+    returned with ?return_documents=true.
+
     Args
         sh_id: id of the shipment.
 
@@ -33,74 +90,203 @@ def add_bid(sh_id: str) -> Tuple[Dict[str, Any], int]:
         if not ObjectId.is_valid(sh_id):
             abort(400, 'Invalid object id.')
 
-        data = request.get_json()
-        req_fields = ['proposed_delivery_date', 'proposed_price', 'proposed_vehicle']
-
-        if not data or not all(field in data for field in req_fields):
-            abort(400, 'Missing required fields.')
-
-        proposed_price = int(data.get('proposed_price'))
-        proposed_vehicle = data.get('proposed_vehicle')
-
-        if not ObjectId.is_valid(proposed_vehicle):
-            abort(400, 'Invalid object id.')
-
-        if proposed_price < 1:
-            abort(400, 'Price cannot be less than 1.')
+        try:
+            bid_data = parse_bid(request.get_json())
+        except ValueError as e:
+            abort(400, str(e))
 
+        return_documents = request.args.get('return_documents', 'false').lower() in ['true', 'yes']
         current_user_id = get_jwt_identity()
 
-        carrier_res = carriers.find_one({ 'user_id': ObjectId(current_user_id) })
+        carrier_res = lookup_pool.submit(carriers.find_one, { 'user_id': ObjectId(current_user_id) }, { '_id': 1 })
+        shipment_res = lookup_pool.submit(shipments.find_one, { '_id': ObjectId(sh_id) }, SCORING_FIELDS)
+
+        carrier_res, shipment_res = carrier_res.result(), shipment_res.result()
         if not carrier_res:
             abort(404, 'Carrier not found.')
-        
-        carrier = Carrier(**carrier_res)
-
-        bid_data = {
-            'shipment_id': ObjectId(sh_id),
-            'carrier_id': ObjectId(carrier.id),
-            'proposed_price': proposed_price,
-            'proposed_vehicle': ObjectId(proposed_vehicle),
-            'additional_notes': data.get('additional_notes').strip(),
-            'accepted': False
-        }
+        if not shipment_res:
+            abort(404, 'Shipment not found.')
 
+        bid_data.update({ '_id': ObjectId(), 'shipment_id': ObjectId(sh_id), 'carrier_id': carrier_res['_id'] })
+
+        # the score is computed once here, /top-bids only reads it
         try:
-            bid_data['proposed_delivery_date'] = datetime.strptime(
-                data.get('proposed_delivery_date'), "%Y-%m-%dT%H:%M:%S"
-            )
-        except ValueError:
-            abort(400, 'Invalid proposed_delivery_date format. Use ISO 8601 (e.g., "YYYY-MM-DDTHH:MM:SS").')
+            bid_data['score'] = score_bid(bid_data, shipment_res)
+        except Exception as e:
+            current_app.logger.warning('Could not score bid for shipment %s: %s', sh_id, e)
 
         bid = Bid(**bid_data)
-        bid_inserted_id = bids.insert_one(bid.to_bson()).inserted_id
-        bid.id = PydanticObjectId(str(bid_inserted_id))
 
-        shipment_res = shipments.find_one_and_update(
-            {'_id': ObjectId(sh_id)},
-            {'$push': {'bids': bid.id}},
-            return_document=ReturnDocument.AFTER,
-        )
-        if not shipment_res:
-            abort(404, 'Shipment not found.')
+        def place(session):
+            bids.insert_one(bid.to_bson(), session=session)
+
+            shipment_filter = { '_id': ObjectId(sh_id) }
+            shipment_update = push_bid_update(bid_data['_id'], bid.score)
+            carrier_filter = { '_id': carrier_res['_id'] }
+            carrier_update = { '$push': { 'bids': bid_data['_id'] } }
+
+            if return_documents:
+                shipment = shipments.find_one_and_update(
+                    shipment_filter, shipment_update, return_document=ReturnDocument.AFTER, session=session
+                )
+            else:
+                shipment = shipments.update_one(shipment_filter, shipment_update, session=session).matched_count
+
+            if not shipment:
+                # a shipment deleted since it was read: aborting rolls the transaction back, without
+                # one the bid is deleted
+                if session is None:
+                    bids.delete_one({ '_id': bid_data['_id'] })
+                abort(404, 'Shipment not found.')
+
+            if not return_documents:
+                carriers.update_one(carrier_filter, carrier_update, session=session)
+                return None, None
+
+            carrier = carriers.find_one_and_update(
+                carrier_filter, carrier_update, return_document=ReturnDocument.AFTER, session=session
+            )
+            return shipment, carrier
 
-        carrier_res = carriers.find_one_and_update(
-            {'_id': ObjectId(carrier.id)},
-            {'$push': {'bids': bid.id}},
-            return_document=ReturnDocument.AFTER,
-        )
+        shipment, carrier = run_in_transaction(place)
+
+        response = { 'bid': bid.to_json() }
+        if return_documents:
+            response.update({ 'shipment': Shipment.serialize_document(shipment), 'carrier': Carrier.serialize_document(carrier) })
 
         return jsonify({
             'message': 'Bid placed successfully.',
+            'data': response
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while adding bid to shipment %s: %s', sh_id, e)
+        raise e
+
+@ship_bp.route('/bids:bulk', methods=['POST'])
+@jwt_required()
+def add_bids_bulk() -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to place many bids of the current carrier at once, e.g. for a fleet.
+
+    Invalid bids and bids on unknown shipments are reported per index and skipped. The rest are
+    scored with a single model call and written with one bulk_write per collection, in one
+    transaction. Bids on shipments deleted while they were written are deleted again and reported
+    the same way, also when the deployment runs without transactions.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    carriers = mongo.db.carriers
+    shipments = mongo.db.shipments
+    bids = mongo.db.bids
+    try:
+        data = request.get_json()
+        items = data.get('bids') if isinstance(data, dict) else None
+
+        if not isinstance(items, list) or not items:
+            abort(400, 'Missing required fields.')
+
+        if len(items) > current_app.config.get('BIDS_BULK_MAX'):
+            abort(400, 'Too many bids.')
+
+        parsed, errors = [], []
+        for index, item in enumerate(items):
+            try:
+                if not isinstance(item, dict) or not ObjectId.is_valid(item.get('shipment_id')):
+                    raise ValueError('Invalid object id.')
+                parsed.append((index, { 'shipment_id': ObjectId(item['shipment_id']), **parse_bid(item) }))
+            except ValueError as e:
+                errors.append({ 'index': index, 'message': str(e) })
+
+        current_user_id = get_jwt_identity()
+        shipment_ids = list({ bid['shipment_id'] for _, bid in parsed })
+
+        carrier_res = lookup_pool.submit(carriers.find_one, { 'user_id': ObjectId(current_user_id) }, { '_id': 1 })
+        shipment_res = lookup_pool.submit(
+            lambda: { doc['_id']: doc for doc in shipments.find({ '_id': { '$in': shipment_ids } }, SCORING_FIELDS) }
+        )
+
+        carrier_res, shipment_res = carrier_res.result(), shipment_res.result()
+        if not carrier_res:
+            abort(404, 'Carrier not found.')
+
+        # grouping by shipment, the features are computed per shipment
+        placed: Dict[ObjectId, List[Tuple[int, Dict[str, Any]]]] = {}
+        for index, bid in parsed:
+            if bid['shipment_id'] not in shipment_res:
+                errors.append({ 'index': index, 'message': 'Shipment not found.' })
+                continue
+            bid.update({ '_id': ObjectId(), 'carrier_id': carrier_res['_id'] })
+            placed.setdefault(bid['shipment_id'], []).append((index, bid))
+
+        if not placed:
+            return jsonify({
+                'message': 'No bid placed.',
+                'data': { 'bids': [], 'errors': sorted(errors, key=lambda error: error['index']) }
+            }), 400
+
+        try:
+            scores = score_features(np.vstack([
+                features_from_documents([bid for _, bid in group], shipment_res[sh_id])
+                for sh_id, group in placed.items()
+            ]))
+        except Exception as e:
+            current_app.logger.warning('Could not score bulk bids: %s', e)
+            scores = np.full(sum(len(group) for group in placed.values()), -np.inf)
+
+        new_bids, shipment_updates = [], []
+        position = 0
+        for sh_id, group in placed.items():
+            group_scores = scores[position:position + len(group)]
+            position += len(group)
+
+            for (_, bid), score in zip(group, group_scores):
+                bid['score'] = float(score) if np.isfinite(score) else None
+                new_bids.append(Bid(**bid).to_bson())
+
+            best = int(np.argmax(group_scores))
+            shipment_updates.append(UpdateOne({ '_id': sh_id }, push_bids_update(
+                [bid['_id'] for _, bid in group],
+                (group[best][1]['_id'], float(group_scores[best])) if np.isfinite(group_scores[best]) else None
+            )))
+
+        def place(session):
+            bids.bulk_write([InsertOne(doc) for doc in new_bids], session=session)
+
+            # shipments deleted since they were read: their bids are deleted and reported
+            missing = set()
+            if shipments.bulk_write(shipment_updates, session=session).matched_count != len(shipment_updates):
+                missing = set(placed) - set(shipments.distinct('_id', { '_id': { '$in': list(placed) } }, session=session))
+                bids.delete_many({ '_id': { '$in': [doc['_id'] for doc in new_bids if doc['shipment_id'] in missing] } }, session=session)
+
+            kept = [doc['_id'] for doc in new_bids if doc['shipment_id'] not in missing]
+            if kept:
+                carriers.update_one({ '_id': carrier_res['_id'] }, { '$push': { 'bids': { '$each': kept } } }, session=session)
+            return missing
+
+        for sh_id in run_in_transaction(place):
+            errors.extend({ 'index': index, 'message': 'Shipment not found.' } for index, _ in placed.pop(sh_id))
+
+        if not placed:
+            return jsonify({
+                'message': 'No bid placed.',
+                'data': { 'bids': [], 'errors': sorted(errors, key=lambda error: error['index']) }
+            }), 400
+
+        return jsonify({
+            'message': 'Bids placed successfully.',
             'data': {
-                'shipment': Shipment(**shipment_res).to_json(),
-                'bid': bid.to_json(),
-                'carrier': Carrier(**carrier_res).to_json()
+                'bids': sorted([
+                    { 'index': index, '_id': str(bid['_id']), 'shipment_id': str(sh_id), 'score': bid['score'] }
+                    for sh_id, group in placed.items() for index, bid in group
+                ], key=lambda bid: bid['index']),
+                'errors': sorted(errors, key=lambda error: error['index'])
             }
         }), 200
 
     except Exception as e:
-        current_app.logger.error('Error while adding bid to shipment %s: %s', sh_id, e)
+        current_app.logger.error('Error while adding bids in bulk: %s', e)
         raise e
 
 @ship_bp.route('/bids/<string:b_id>', methods=['DELETE'])
@@ -129,20 +315,30 @@ def delete_bid(b_id: str) -> Tuple[Dict[str, Any], int]:
         if not deleted_bid:
             abort(404, 'Bid not found.')
 
-        updated_shipment = Shipment(**shipments.find_one_and_update(
+        shipment_res = shipments.find_one_and_update(
             {'_id': ObjectId(deleted_bid['shipment_id'])},
-            {'$pull': {'bids': ObjectId(b_id)}}
-        ))
-        updated_carrier = Carrier(**carriers.find_one_and_update(
+            pull_bid_update(ObjectId(b_id)),
+            return_document=ReturnDocument.AFTER
+        )
+
+        # the deleted bid was the top bid, pointing the shipment at the next best one; the shipment
+        # may have been deleted already
+        if shipment_res is not None and shipment_res.get('top_bid') is None and shipment_res.get('bids'):
+            best = refresh_top_bid(shipment_res['_id'])
+            if best:
+                shipment_res.update({ 'top_bid': best['_id'], 'top_bid_score': best['score'] })
+
+        updated_carrier = carriers.find_one_and_update(
             {'_id': ObjectId(deleted_bid['carrier_id'])},
-            {'$pull': {'bids': ObjectId(b_id)}}
-        ))
+            {'$pull': {'bids': ObjectId(b_id)}},
+            return_document=ReturnDocument.AFTER
+        )
 
         return jsonify({
             'message': 'Bid deleted successfully.',
             'data': {
-                'shipment': updated_shipment.to_json(),
-                'carrier': updated_carrier.to_json()
+                'shipment': Shipment.serialize_document(shipment_res) if shipment_res is not None else None,
+                'carrier': Carrier.serialize_document(updated_carrier) if updated_carrier is not None else None
             }
         }), 200
 
@@ -152,28 +348,77 @@ def delete_bid(b_id: str) -> Tuple[Dict[str, Any], int]:
     
 @ship_bp.route('/<string:sh_id>/top-bids', methods=['GET'])
 @jwt_required()
-def get_top_bid(sh_id: str):
-    """Endpoint to get the top bid."""
-    bids = mongo.db.bids
+def get_top_bid(sh_id: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to get the top bid of a shipment. Bids are scored when they are placed, so the
+    top bid is read from the shipment's top_bid pointer. Passing k, page or cursor returns the
+    bids ranked by score instead, k per page.
+
+    Args
+        sh_id: id of the shipment.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    db = read_db()
+    shipments = db.shipments
+    bids = db.bids
     try:
         if not ObjectId.is_valid(sh_id):
             abort(400, 'Invalid object id.')
 
-        bids_list = bids.find({ 'shipment_id': ObjectId(sh_id) })
-        if not bids_list:
+        shipment_res = shipments.find_one({ '_id': ObjectId(sh_id) }, { 'bids': 1, 'top_bid': 1 })
+        if not shipment_res:
+            abort(404, 'Shipment not found.')
+
+        bid_count = len(shipment_res.get('bids') or [])
+        if not bid_count:
             abort(404, 'No bids found.')
 
-        top_bid = predict_top_bid(bids_list, current_app.config.get('MODEL_DIR'))
+        # bids placed before scores were stored are scored once, on first read
+        if not shipment_res.get('top_bid') and bids.find_one(
+            { 'shipment_id': ObjectId(sh_id), 'score': { '$exists': False } }, { '_id': 1 }
+        ):
+            best = rescore_shipment(ObjectId(sh_id))
+            shipment_res['top_bid'] = best['_id'] if best else None
 
-        print(top_bid)
+        ranking = [('score', DESCENDING), ('_id', DESCENDING)]
 
-        bid = Bid(**top_bid)
+        if not any(arg in request.args for arg in ['k', 'page', 'cursor', 'pagination', 'format']):
+            top_bid = bids.find_one({ '_id': shipment_res['top_bid'] }) if shipment_res.get('top_bid') else None
 
-        return jsonify({
-            'message': 'Top bid fetched successfully.',
-            'data': bid.to_json()
-        }), 200
+            # a pointer to a deleted bid is cleared and moved to the best remaining one
+            if top_bid is None and shipment_res.get('top_bid'):
+                mongo.db.shipments.update_one(
+                    { '_id': ObjectId(sh_id), 'top_bid': shipment_res['top_bid'] },
+                    { '$set': { 'top_bid': None, 'top_bid_score': None } }
+                )
+                top_bid = refresh_top_bid(ObjectId(sh_id))
+
+            if top_bid is None:
+                top_bid = bids.find_one({ 'shipment_id': ObjectId(sh_id) }, sort=ranking)
+
+            if top_bid is None:
+                abort(404, 'No bids found.')
+
+            return jsonify({
+                'message': 'Top bid fetched successfully.',
+                'data': Bid.serialize_document(top_bid)
+            }), 200
+
+        fmt = response_format()
+        k = min(int(request.args.get('k', 10)), max_per_page(fmt))
+
+        if k <= 0:
+            abort(400, 'Invalid arguments.')
+
+        page = open_page(
+            bids, { 'shipment_id': ObjectId(sh_id) }, ranking,
+            '.get_top_bid', k, total_count=bid_count, sh_id=sh_id, k=k
+        )
+
+        return list_response(page, Bid.serialize_document, 'Top bids fetched successfully.', fmt), 200
 
     except Exception as e: 
         current_app.logger.error('Error while getting top bid: %s', e)
-        raise e
\ No newline at end of file
+        raise e
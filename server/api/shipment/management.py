@@ -8,13 +8,20 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 
 # internal imports
 from api import mongo 
-from api.shipment import ship_bp
-from api.utils.geo import calculate_distance
+from api.shipment import ship_bp, lookup_pool
+from api.utils.mongo_pool import read_db
+from api.utils.geo import calculate_distance, geo_point
 from api.utils.object_id import PydanticObjectId
-from api.utils.pagination import pagination_links
+from api.utils.pagination import open_page, cursor_pagination_links
+from api.utils.geo_search import parse_nearby_args, nearby_page, DISTANCE_FIELD
+from api.utils.streaming import response_format, max_per_page, list_response
+from api.utils.transactions import run_in_transaction
 from api.db_models.user_models import Shipper, Carrier
 from api.db_models.shipment_models import Shipment, Status, Mode
 
+# newest first, _id breaks ties so that cursors are unique
+SHIPMENT_ORDER = [('created_at', DESCENDING), ('_id', DESCENDING)]
+
 @ship_bp.route('/<string:s_id>', methods=['GET'])
 def get_shipment(s_id: str) -> Tuple[Dict[str, Any], int]:
     """
@@ -26,8 +33,9 @@ def get_shipment(s_id: str) -> Tuple[Dict[str, Any], int]:
     Returns
         [Tuple[Dict[str, Any]]]: response object, http status code.
     """
-    shippers = mongo.db['shippers']
-    shipments = mongo.db['shipments']
+    db = read_db()
+    shippers = db['shippers']
+    shipments = db['shipments']
     try:
         if not ObjectId.is_valid(s_id):
             abort(400, 'Invalid object id.')
@@ -36,11 +44,9 @@ def get_shipment(s_id: str) -> Tuple[Dict[str, Any], int]:
         if not res:
             abort(404, 'Shipment not found.')
 
-        shipment = Shipment(**res)
-
         return jsonify({
             'message': 'Shipment fetched successfully.',
-            'data': shipment.to_json()
+            'data': Shipment.serialize_document(res)
         }), 200
 
     except Exception as e:
@@ -59,8 +65,9 @@ def get_all_shipments_of_a_shipper(sh_id: str) -> Tuple[Dict[str, Any]]:
     Returns 
         [Tuple[Dict[str, Any], int]]: response object, http status code.
     """
-    shippers = mongo.db['shippers']
-    shipments = mongo.db['shipments']
+    db = read_db()
+    shippers = db['shippers']
+    shipments = db['shipments']
     try:
         if not ObjectId.is_valid(sh_id):
             abort(400, 'Invalid object id.')
@@ -73,28 +80,22 @@ def get_all_shipments_of_a_shipper(sh_id: str) -> Tuple[Dict[str, Any]]:
         shipper = Shipper(**shipper_res)
         user_id = get_jwt_identity()
 
-        if shipper.user_id != user_id:
+        if str(shipper.user_id) != user_id:
             abort(403, 'Identity mismatch.')
 
-        # fetching and paginating shipments
-        page = max(int(request.args.get('page', 1)), 1)
-        per_page = min(int(request.args.get('per_page', 10)), 100)
+        # fetching and paginating shipments, see open_page for the page/cursor modes
+        fmt = response_format()
+        per_page = min(int(request.args.get('per_page', 10)), max_per_page(fmt))
 
-        if page <= 0 or per_page <= 0:
+        if per_page <= 0:
             abort(400, 'Invalid arguments.')
 
-        cursor = shipments.find({ 'shipper_id': ObjectId(sh_id) }) \
-        .sort('created_at', DESCENDING).skip(per_page * page - 1).limit(per_page)
-
-        shipment_count = shipments.count_documents({ 'shipper_id': ObjectId(sh_id) })
-
-        links = pagination_links('.get_all_shipments_of_a_shipper', shipment_count, page, per_page)
+        page = open_page(
+            shipments, { 'shipper_id': ObjectId(sh_id) }, SHIPMENT_ORDER,
+            '.get_all_shipments_of_a_shipper', per_page, sh_id=sh_id
+        )
 
-        return jsonify({
-            'message': 'Shipments fetched successfully.',
-            'data': [Shipment(**doc).to_json() for doc in cursor],
-            'links': links
-        }), 200
+        return list_response(page, Shipment.serialize_document, 'Shipments fetched successfully.', fmt), 200
 
     except Exception as e:
         current_app.logger.error('Error while fetching all shipments of the shipper %s: %s', sh_id, e)
@@ -113,8 +114,9 @@ def get_status_based_shipments_of_a_shipper(sh_id: str, status: Status) -> Tuple
     Returns
         [Tuple[Dict[str, Any], int]]: response object, http status code.
     """
-    shippers = mongo.db['shippers']
-    shipments = mongo.db['shipments']
+    db = read_db()
+    shippers = db['shippers']
+    shipments = db['shipments']
     try:
         if not ObjectId.is_valid(sh_id):
             abort(400, 'Invalid object id.')
@@ -127,39 +129,86 @@ def get_status_based_shipments_of_a_shipper(sh_id: str, status: Status) -> Tuple
         shipper = Shipper(**shipper_res)
         user_id = get_jwt_identity()
 
-        if shipper.user_id != user_id:
+        if str(shipper.user_id) != user_id:
             abort(403, 'Identity mismatch.')
 
-        # fetching and paginating shipments
-        page = max(int(request.args.get('page')), 1)
-        per_page = min(int(request.args.get('per_page')), 100)
+        if status not in [s.value for s in Status]:
+            abort(400, 'Invalid status.')
 
-        if page <= 0 or per_page <= 0:
+        # fetching and paginating shipments, see open_page for the page/cursor modes
+        fmt = response_format()
+        per_page = min(int(request.args.get('per_page', 10)), max_per_page(fmt))
+
+        if per_page <= 0:
             abort(400, 'Invalid arguments.')
 
-        query = { '$and': [{ '_id': ObjectId(sh_id) }, { 'status': status }] }
+        page = open_page(
+            shipments, { 'shipper_id': ObjectId(sh_id), 'status': status }, SHIPMENT_ORDER,
+            '.get_status_based_shipments_of_a_shipper', per_page, sh_id=sh_id, status=status
+        )
+
+        return list_response(page, Shipment.serialize_document, f'{status} shipments fetched successfully.', fmt), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while fetching %s shipments of the shipper %s: %s', status, sh_id, e)
+        raise e
+    
+@ship_bp.route('/nearby', methods=['GET'])
+@jwt_required()
+def get_nearby_shipments() -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint for carriers to find shipments picked up near them, nearest first.
+
+    Query Params
+        lat, lon: centre of the search.
+        radius: km, NEARBY_DEFAULT_RADIUS_KM by default.
+        status: waiting by default.
+        per_page, cursor: cursor pagination, see api.utils.geo_search.nearby_pipeline.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    shipments = read_db()['shipments']
+    try:
+        centre, radius_km = parse_nearby_args()
 
-        cursor = shippers.find(query).sort('created_at', DESCENDING) \
-            .skip(per_page * page - 1).limit(per_page)
+        status = request.args.get('status', Status.waiting.value)
+        if status not in [s.value for s in Status]:
+            abort(400, 'Invalid status.')
 
-        shipment_count = shippers.count_documents(query)
+        per_page = min(int(request.args.get('per_page', 10)), max_per_page('json'))
+        if per_page <= 0:
+            abort(400, 'Invalid arguments.')
 
-        links = pagination_links('.get_status_based_shipments_of_a_shipper', shipment_count, page, per_page)
+        docs, next_cursor = nearby_page(shipments, 'pickup_location', centre, radius_km, { 'status': status }, per_page)
 
+        trusted = current_app.config.get('TRUSTED_READS')
         return jsonify({
-            'message': f'{status} shipments fetched successfully.',
-            'data': [Shipment(**doc).to_json() for doc in cursor],
-            'links': links
+            'message': 'Nearby shipments fetched successfully.',
+            'data': [{ **Shipment.serialize_document(doc, trusted), DISTANCE_FIELD: doc[DISTANCE_FIELD] } for doc in docs],
+            'links': cursor_pagination_links(
+                '.get_nearby_shipments', per_page, request.args.get('cursor'), next_cursor,
+                lat=request.args.get('lat'), lon=request.args.get('lon'), radius=radius_km, status=status
+            )
         }), 200
 
     except Exception as e:
-        current_app.logger.error('Error while fetching %s shipments of the shipper %s: %s', status, sh_id, e)
+        current_app.logger.error('Error while fetching nearby shipments: %s', e)
         raise e
-    
+
 @ship_bp.route('/', methods=['POST'])
 @jwt_required()
 def create_shipment() -> Tuple[Dict[str, Any], int]:
-    """Endpoint to create shipments."""
+    """
+    Endpoint to create shipments.
+
+    The postal code check and the distance calculation run concurrently. The shipment id is
+    generated client side so that appending it to the shipper ($push) and inserting the shipment
+    are the only writes, both inside one transaction.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
     shippers = mongo.db['shippers']
     shipments = mongo.db['shipments']
     try: 
@@ -174,65 +223,75 @@ def create_shipment() -> Tuple[Dict[str, Any], int]:
             abort(400, 'Missing required fields.')
 
         # Extracting origin and destination codes
-        origin_code = data.get('origin_code').strip()
-        destination_code = data.get('destination_code').strip()
-        
-        # Fetch origin and destination details
-        origin = shippers.find_one({"postal_code": origin_code})
-        destination = shippers.find_one({"postal_code": destination_code})
-
-        if not origin or not destination:
-            abort(404, 'Origin or destination not found.')
+        origin_code = str(data.get('origin_code')).strip()
+        destination_code = str(data.get('destination_code')).strip()
 
-        # Calculate distance between the locations
-        distance = calculate_distance(
-            origin_code,
-            destination_code
-        )
+        try:
+            cargo_load = float(data.get('cargo_load'))
+        except (TypeError, ValueError):
+            abort(400, 'Invalid cargo load.')
 
-        # Fetching the current shipper
-        user_id = get_jwt_identity()
+        # Checking both postal codes in one query while the distance is calculated
+        known_codes = lookup_pool.submit(
+            shippers.distinct, 'postal_code', { 'postal_code': { '$in': [origin_code, destination_code] } }
+        )
+        distance = lookup_pool.submit(calculate_distance, origin_code, destination_code)
 
-        res = shippers.find_one({ 'user_id': ObjectId(user_id) })
-        if not res:
-            abort(404, 'Shipper not found.')
+        if not { origin_code, destination_code } <= set(known_codes.result()):
+            abort(404, 'Origin or destination not found.')
 
-        shipper = Shipper(**res)
+        try:
+            distance_km = distance.result()
+        except ValueError:
+            abort(400, 'Could not calculate the distance between origin and destination.')
 
-        # Initializing and inserting shipment into database
-        shipment_data = {
-            'shipper_id': str(shipper.id),
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        new_shipment = Shipment(**{
+            '_id': ObjectId(),
             'origin_code': origin_code,
             'destination_code': destination_code,
-            'distance': distance,
+            'pickup_location': geo_point(origin_code),
+            'distance': distance_km,
             'status': 'waiting',
-            'cargo_load': data.get('cargo_load').strip(),
-            'created_at': datetime.datetime.now(tz=datetime.timezone.utc),
-            'updated_at': datetime.datetime.now(tz=datetime.timezone.utc)
-        }
-
-        new_shipment = Shipment(**shipment_data)
-        shipment_id = shipments.insert_one(new_shipment.to_bson()).inserted_id
-        new_shipment.id = str(shipment_id)
-
-        shipper.sent_shipments.append(shipment_id)
-        shippers.find_one_and_update(
-            { '_id': ObjectId(shipper.id) },
-            { '$set': shipper.to_bson() },
-            return_document=ReturnDocument.AFTER
-        )
+            'cargo_load': cargo_load,
+            'created_at': now,
+            'updated_at': now
+        })
+
+        user_id = get_jwt_identity()
+
+        def create(session):
+            # appending first also resolves the shipper of the current user
+            shipper = shippers.find_one_and_update(
+                { 'user_id': ObjectId(user_id) },
+                { '$push': { 'sent_shipments': new_shipment.id } },
+                projection={ '_id': 1 },
+                session=session
+            )
+            if not shipper:
+                abort(404, 'Shipper not found.')
+
+            new_shipment.shipper_id = shipper['_id']
+            try:
+                shipments.insert_one(new_shipment.to_bson(), session=session)
+            except Exception as e:
+                # without a transaction, the id appended to the shipper is taken back
+                if session is None:
+                    shippers.update_one({ '_id': shipper['_id'] }, { '$pull': { 'sent_shipments': new_shipment.id } })
+                raise e
+
+        run_in_transaction(create)
 
         return jsonify({
             'message': 'Shipment created successfully.',
             'data': {
-                'shipment': new_shipment.to_bson(),
-                'shipper': shipper.to_bson()
+                'shipment': new_shipment.to_json()
             }
         }), 201
 
     except Exception as e:
         current_app.logger.error('Error while creating shipment: %s', e)
-        abort(500, 'Internal server error.')
+        raise e
     
 @ship_bp.route('/<string:s_id>', methods=['PUT'])
 @jwt_required()
@@ -256,6 +315,12 @@ def update_shipment(s_id: str) -> Tuple[Dict[str, Any], int]:
         if not data: 
             abort(400, 'No field to update.')
 
+        # the nearby search reads the geocoded origin
+        if 'origin_code' in data:
+            data['pickup_location'] = geo_point(str(data['origin_code']).strip())
+            if data['pickup_location'] is None:
+                abort(400, 'Invalid origin code.')
+
         res = shipments.find_one_and_update(
             { '_id': ObjectId(s_id) }, 
             { '$set': data }, 
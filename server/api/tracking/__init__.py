@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+tracking_bp = Blueprint('tracking', __name__)
+
+from api.tracking import pings
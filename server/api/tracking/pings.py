@@ -0,0 +1,234 @@
+# external imports
+import math
+import datetime
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+from typing import Tuple, Dict, Any
+from flask import request, current_app, abort, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+# internal imports
+from api import mongo, ping_buffer
+from api.tracking import tracking_bp
+from api.admin import admin_required
+from api.utils.mongo_pool import read_db
+from api.utils.ping_buffer import PINGS_COLLECTION
+from api.utils.pagination import encode_cursor, decode_cursor, keyset_filter
+from api.db_models.shipment_models import Location
+
+# oldest first, _id breaks ties so that cursors are unique
+PING_ORDER = [('timestamp', ASCENDING), ('_id', ASCENDING)]
+
+# pings timestamped further ahead of the server clock are rejected
+MAX_CLOCK_SKEW = datetime.timedelta(minutes=5)
+
+def parse_ping(data: Dict[str, Any], now: datetime.datetime) -> Dict[str, Any]:
+    """
+    Validates a location ping sent by a carrier.
+
+    Args
+        data: ping fields, `shipment_id`, `location` as [latitude, longitude] and an optional
+        ISO 8601 `timestamp`, UTC when it has no offset.
+        now: time the pings were received, the timestamp of pings without one.
+
+    Returns
+        [Dict[str, Any]]: location document with a new `_id`.
+
+    Raises
+        [ValueError]: message describing the invalid field.
+    """
+    if not isinstance(data, dict) or not all(field in data for field in ['shipment_id', 'location']):
+        raise ValueError('Missing required fields.')
+
+    if not ObjectId.is_valid(data.get('shipment_id')):
+        raise ValueError('Invalid object id.')
+
+    location = data.get('location')
+    try:
+        latitude, longitude = (float(value) for value in location)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid location, use [latitude, longitude].')
+
+    if not (math.isfinite(latitude) and math.isfinite(longitude) and -90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('Invalid location, use [latitude, longitude].')
+
+    timestamp = now
+    if data.get('timestamp') is not None:
+        try:
+            timestamp = datetime.datetime.fromisoformat(data.get('timestamp'))
+        except (TypeError, ValueError):
+            raise ValueError('Invalid timestamp format. Use ISO 8601 (e.g., "YYYY-MM-DDTHH:MM:SSZ").')
+
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+        if timestamp > now + MAX_CLOCK_SKEW:
+            raise ValueError('Timestamp is in the future.')
+
+    return {
+        '_id': ObjectId(),
+        'shipment_id': ObjectId(data.get('shipment_id')),
+        'location': [latitude, longitude],
+        'timestamp': timestamp
+    }
+
+@tracking_bp.route('/pings', methods=['POST'])
+@jwt_required()
+def add_pings() -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint for the location pings of the current carrier's shipments, many per request.
+
+    Invalid pings and pings of shipments not assigned to the carrier are reported per index and
+    skipped. The rest are buffered and written in the background (see api.utils.ping_buffer),
+    so they are accepted before they are stored. A full buffer that cannot be written answers 503
+    without taking any ping, the request can be sent again.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    db = mongo.db
+    try:
+        data = request.get_json()
+        items = data.get('pings') if isinstance(data, dict) else None
+
+        if not isinstance(items, list) or not items:
+            abort(400, 'Missing required fields.')
+
+        if len(items) > current_app.config.get('TRACKING_BATCH_MAX'):
+            abort(400, 'Too many pings.')
+
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        parsed, errors = [], []
+        for index, item in enumerate(items):
+            try:
+                parsed.append((index, parse_ping(item, now)))
+            except ValueError as e:
+                errors.append({ 'index': index, 'message': str(e) })
+
+        carrier_res = db.carriers.find_one({ 'user_id': ObjectId(get_jwt_identity()) }, { '_id': 1 })
+        if not carrier_res:
+            abort(404, 'Carrier not found.')
+
+        assigned = { doc['_id'] for doc in db.shipments.find({
+            '_id': { '$in': list({ ping['shipment_id'] for _, ping in parsed }) },
+            'carrier_id': carrier_res['_id']
+        }, { '_id': 1 }) } if parsed else set()
+
+        accepted = []
+        for index, ping in parsed:
+            if ping['shipment_id'] not in assigned:
+                errors.append({ 'index': index, 'message': 'Shipment not found.' })
+                continue
+            accepted.append(ping)
+
+        errors.sort(key=lambda error: error['index'])
+        if not accepted:
+            return jsonify({
+                'message': 'No ping accepted.',
+                'data': { 'accepted': 0, 'errors': errors }
+            }), 400
+
+        try:
+            ping_buffer.add(accepted)
+        except PyMongoError:
+            # nothing was buffered, the pings can be sent again
+            abort(503, 'Location pings cannot be stored right now, retry later.')
+
+        return jsonify({
+            'message': 'Pings accepted.',
+            'data': { 'accepted': len(accepted), 'errors': errors }
+        }), 202
+
+    except Exception as e:
+        current_app.logger.error('Error while adding location pings: %s', e)
+        raise e
+
+@tracking_bp.route('/shipments/<string:sh_id>/pings', methods=['GET'])
+@jwt_required()
+def get_pings(sh_id: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint to fetch the location history of a shipment, oldest first, for its shipper or carrier.
+    Pings still buffered by a worker are not returned yet.
+
+    Args
+        sh_id: id of the shipment.
+
+    Query Params
+        since: ISO 8601 timestamp, only pings after it are returned.
+        cursor: `next_cursor` of the previous page.
+        limit: maximum number of pings, at most TRACKING_BATCH_MAX.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    db = read_db()
+    try:
+        if not ObjectId.is_valid(sh_id):
+            abort(400, 'Invalid object id.')
+
+        max_limit = current_app.config.get('TRACKING_BATCH_MAX')
+        try:
+            limit = min(max(int(request.args.get('limit', max_limit)), 1), max_limit)
+        except ValueError:
+            abort(400, 'Invalid limit.')
+
+        query = { 'shipment_id': ObjectId(sh_id) }
+        if request.args.get('since'):
+            try:
+                since = datetime.datetime.fromisoformat(request.args.get('since'))
+            except ValueError:
+                abort(400, 'Invalid since format. Use ISO 8601 (e.g., "YYYY-MM-DDTHH:MM:SSZ").')
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=datetime.timezone.utc)
+            query['timestamp'] = { '$gt': since }
+
+        if request.args.get('cursor'):
+            try:
+                query.update(keyset_filter(PING_ORDER, decode_cursor(request.args.get('cursor'))))
+            except ValueError as e:
+                abort(400, str(e))
+
+        shipment = db.shipments.find_one({ '_id': ObjectId(sh_id) }, { 'shipper_id': 1, 'carrier_id': 1 })
+        if not shipment:
+            abort(404, 'Shipment not found.')
+
+        user_id = ObjectId(get_jwt_identity())
+        if not (
+            db.shippers.count_documents({ '_id': shipment.get('shipper_id'), 'user_id': user_id }, limit=1) or
+            (shipment.get('carrier_id') and db.carriers.count_documents({ '_id': shipment['carrier_id'], 'user_id': user_id }, limit=1))
+        ):
+            abort(403, 'Unauthorized access to shipment.')
+
+        trusted = current_app.config.get('TRUSTED_READS')
+        docs = list(db[PINGS_COLLECTION].find(query).sort(PING_ORDER).limit(limit))
+
+        return jsonify({
+            'message': 'Pings fetched successfully.',
+            'data': {
+                'pings': [Location.serialize_document(doc, trusted) for doc in docs],
+                'next_cursor': encode_cursor([docs[-1]['timestamp'], docs[-1]['_id']]) if len(docs) == limit else None
+            }
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while fetching pings of shipment %s: %s', sh_id, e)
+        raise e
+
+@tracking_bp.route('/stats', methods=['GET'])
+@admin_required
+def get_tracking_stats() -> Tuple[Dict[str, Any], int]:
+    """
+    Endpoint for the ping buffer counters of the worker answering the request.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    try:
+        return jsonify({
+            'message': 'Tracking stats fetched successfully.',
+            'data': ping_buffer.stats()
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while fetching tracking stats: %s', e)
+        raise e
@@ -1,13 +1,13 @@
 # external imports
 from bson import ObjectId
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Tuple, Any
 from pydantic import ValidationError
 from flask_jwt_extended import create_access_token
 from flask import request, current_app, jsonify, abort, make_response
 
 # internal imports
-from api import mongo
+from api import mongo, carrier_index
 from api.user import user_bp
 from api.utils.object_id import PydanticObjectId
 from api.db_models.user_models import User, Shipper, Carrier
@@ -55,8 +55,9 @@ def register() -> Tuple[Dict[str, Any], int]:
             shipper_id = shippers.insert_one(shipper.to_bson()).inserted_id
             users.update_one({'_id': user_id}, {'$set': {'shipper_id': shipper_id}})
         else:
-            carrier = Carrier(user_id=PydanticObjectId(str(user_id)))
+            carrier = Carrier(user_id=PydanticObjectId(str(user_id)), updated_at=datetime.now(tz=timezone.utc))
             carrier_id = carriers.insert_one(carrier.to_bson()).inserted_id
+            carrier_index.upsert({ **carrier.to_bson(), '_id': carrier_id })
             users.update_one({'_id': user_id}, {'$set': {'carrier_id': carrier_id}})
 
         return jsonify({
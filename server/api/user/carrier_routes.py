@@ -1,13 +1,23 @@
 # external imports
+import datetime
 from bson import ObjectId
 from pymongo import ReturnDocument
 from flask import request, current_app, jsonify, abort
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
 # internal imports
-from api import mongo
+from api import mongo, carrier_index
 from api.user import user_bp
-from api.db_models.user_models import Carrier
+from api.utils.geo import geo_point
+from api.utils.mongo_pool import read_db
+from api.utils.streaming import max_per_page
+from api.utils.pagination import cursor_pagination_links
+from api.utils.geo_search import parse_nearby_args, nearby_page, DISTANCE_FIELD
+from api.db_models.shipment_models import Mode
+from api.db_models.user_models import Carrier, Type
+
+# fields a carrier may change about itself; rating and verified are set by the platform only
+CARRIER_UPDATE_FIELDS = ['type', 'modes', 'org_name', 'address', 'postal_code']
 
 @user_bp.route('/carriers/update', methods=['PUT'])
 @jwt_required()
@@ -19,13 +29,36 @@ def update_carrier():
         current_user_id = get_jwt_identity()
 
         data = request.get_json()
-        if not data:
+        if not data or not isinstance(data, dict):
             abort(400, 'No data to update.')
 
+        unknown = sorted(set(data) - set(CARRIER_UPDATE_FIELDS))
+        if unknown:
+            abort(400, f'Fields {unknown} cannot be updated, use any of {CARRIER_UPDATE_FIELDS}.')
+
+        if 'modes' in data and (
+            not isinstance(data['modes'], list) or any(mode not in Mode._value2member_map_ for mode in data['modes'])
+        ):
+            abort(400, f'Invalid modes, use any of {[mode.value for mode in Mode]}.')
+
+        if 'type' in data and data['type'] not in Type._value2member_map_:
+            abort(400, f'Invalid type, use one of {[t.value for t in Type]}.')
+
+        # the nearby search reads the geocoded base of the carrier
+        if 'postal_code' in data:
+            data['postal_code'] = str(data['postal_code']).strip()
+            data['location'] = geo_point(data['postal_code'])
+            if data['location'] is None:
+                abort(400, 'Invalid postal code.')
+
+        # the carrier index of every worker polls updated_at
+        data['updated_at'] = datetime.datetime.now(tz = datetime.timezone.utc)
         res = carriers.find_one_and_update({ 'user_id': ObjectId(current_user_id) }, { '$set': data }, return_document=ReturnDocument.AFTER)
         if not res:
             abort(404, 'Carrier not found.')
 
+        carrier_index.upsert(res)
+
         carrier = Carrier(**res)
 
         return jsonify({
@@ -35,4 +68,52 @@ def update_carrier():
 
     except Exception as e:
         current_app.logger.error('Error while updating carrier: %s', e)
-        raise e
\ No newline at end of file
+        raise e
+
+@user_bp.route('/carriers/nearby', methods=['GET'])
+@jwt_required()
+def get_nearby_carriers():
+    """
+    Endpoint for shippers to find carriers based near a pickup point, nearest first. Carriers
+    are located by the postal_code of their profile.
+
+    Query Params
+        lat, lon: centre of the search, e.g. the pickup_location of a shipment.
+        radius: km, NEARBY_DEFAULT_RADIUS_KM by default.
+        mode: only carriers offering this transportation mode.
+        per_page, cursor: cursor pagination, see api.utils.geo_search.nearby_pipeline.
+
+    Returns
+        [Tuple[Dict[str, Any], int]]: json response object, http status code.
+    """
+    carriers = read_db().carriers
+
+    try:
+        centre, radius_km = parse_nearby_args()
+
+        query = {}
+        mode = request.args.get('mode')
+        if mode is not None:
+            if mode not in [m.value for m in Mode]:
+                abort(400, 'Invalid mode.')
+            query['modes'] = mode
+
+        per_page = min(int(request.args.get('per_page', 10)), max_per_page('json'))
+        if per_page <= 0:
+            abort(400, 'Invalid arguments.')
+
+        docs, next_cursor = nearby_page(carriers, 'location', centre, radius_km, query, per_page)
+
+        trusted = current_app.config.get('TRUSTED_READS')
+        return jsonify({
+            'message': 'Nearby carriers fetched successfully.',
+            'data': [{ **Carrier.serialize_document(doc, trusted), DISTANCE_FIELD: doc[DISTANCE_FIELD] } for doc in docs],
+            'links': cursor_pagination_links(
+                '.get_nearby_carriers', per_page, request.args.get('cursor'), next_cursor,
+                lat=request.args.get('lat'), lon=request.args.get('lon'), radius=radius_km, mode=mode
+            )
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error('Error while fetching nearby carriers: %s', e)
+        raise e
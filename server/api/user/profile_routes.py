@@ -7,9 +7,9 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 
 # internal imports
 from api import mongo
+from api.utils.mongo_pool import read_db
 from api.user import user_bp
 from api.db_models.user_models import User
-from api.utils.object_id import PydanticObjectId
 from api.utils.validators import email_validator
 
 @user_bp.route('/<string:id>', methods=['GET'])
@@ -23,7 +23,8 @@ def get_profile(id: str) -> Tuple[Dict[str, Any], int]:
     Returns
         [Tuple[Dict[str, Any]]]: json representation, http status code
     """
-    users = mongo.db.users
+    db = read_db()
+    users = db.users
     try: 
         if not ObjectId.is_valid(id):
             abort(400, 'Invalid user id.')
@@ -33,12 +34,9 @@ def get_profile(id: str) -> Tuple[Dict[str, Any], int]:
         if not res:
             abort(404, 'User not found.')
 
-        res['_id'] = PydanticObjectId(str(id))
-        user = User(**res)
-
         return jsonify({ 
             'message': 'User fetched successfully.',
-            'data': user.to_json()
+            'data': User.serialize_document(res)
         }), 200
 
     except Exception as e:
@@ -7,11 +7,13 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask import request, current_app, abort, jsonify, url_for
 
 # internal imports
-from api import mongo
+from api import mongo, carrier_index
+from api.utils.mongo_pool import read_db
 from api.user import user_bp
 from api.db_models.user_models import Carrier
 from api.utils.object_id import PydanticObjectId
-from api.utils.pagination import pagination_links
+from api.utils.pagination import open_page
+from api.utils.streaming import response_format, max_per_page, list_response
 from api.db_models.vehicle_models import Vehicle
 
 @user_bp.route('/vehicles/<string:v_id>', methods=['GET'])
@@ -25,9 +27,10 @@ def get_vehicle(v_id: str) -> Tuple[Dict[str, Any], int]:
     Returns
         [Tuple[Dict[str, Any], int]]: response object, http status code.
     """
-    carriers = mongo.db.carriers
-    vehicles = mongo.db.vehicles
-    rent_information = mongo.db['rent_information']
+    db = read_db()
+    carriers = db.carriers
+    vehicles = db.vehicles
+    rent_information = db['rent_information']
     try:
         if not ObjectId.is_valid(v_id):
             abort(400, 'Invalid object id.')
@@ -36,11 +39,9 @@ def get_vehicle(v_id: str) -> Tuple[Dict[str, Any], int]:
         if not res:
             abort(404, 'Vehicle not found.')
 
-        vehicle = Vehicle(**res)
-
         return jsonify({
             'message': 'Vehicle fetched successfully.',
-            'data': vehicle.to_json()
+            'data': Vehicle.serialize_document(res)
         }), 200
 
     except Exception as e:
@@ -59,8 +60,9 @@ def get_vehicles(c_id: str) -> Tuple[Dict[str, Any], int]:
     Returns
         [Tuple[Dict[str, Any], int]]: paginated response, http status code.
     """
-    carriers = mongo.db.carriers
-    vehicles = mongo.db.vehicles
+    db = read_db()
+    carriers = db.carriers
+    vehicles = db.vehicles
     try:
         if not ObjectId.is_valid(c_id):
             abort(400, 'Invalid carrier id.')
@@ -74,30 +76,22 @@ def get_vehicles(c_id: str) -> Tuple[Dict[str, Any], int]:
 
         # confirming if current user has the necessary permission
         user_id = get_jwt_identity()        
-        if carrier.user_id != user_id:
+        if str(carrier.user_id) != user_id:
             abort(403, 'Identity mismatch.')
 
-        # paginating response
-        page = max(int(request.args.get('page', 1)), 1)
-        per_page = min(int(request.args.get('per_page', 10)), 100)
+        # paginating response, see open_page for the page/cursor modes
+        fmt = response_format()
+        per_page = min(int(request.args.get('per_page', 10)), max_per_page(fmt))
 
-        if page <= 0 or per_page <= 0:
+        if per_page <= 0:
             abort(400, 'Invalid arguments.')
 
-        cursor = vehicles.find({ 'carrier_id': ObjectId(c_id) }) \
-        .sort('updated_at', DESCENDING).skip(per_page * (page - 1)).limit(per_page)
-
-        vehicle_count = vehicles.count_documents({ 'carrier_id': ObjectId(c_id) })
-
-        links = pagination_links('.get_vehicles', vehicle_count, page, per_page)
+        page = open_page(
+            vehicles, { 'carrier_id': ObjectId(c_id) }, [('updated_at', DESCENDING), ('_id', DESCENDING)],
+            '.get_vehicles', per_page, c_id=c_id
+        )
 
-        return jsonify({
-            'message': 'Vehicles fetched successfully.',
-            'data': {
-                'vehicles': [Vehicle(**doc).to_json() for doc in cursor],
-                'links': links
-            }
-        }), 200
+        return list_response(page, Vehicle.serialize_document, 'Vehicles fetched successfully.', fmt, data_key='vehicles'), 200
 
     except Exception as e:
         current_app.logger.error('Error while fetching vehicles: %s', e)
@@ -141,12 +135,12 @@ def add_vehicle(c_id: str) -> Tuple[Dict[str, Any], int]:
 
         # confirming if the given user has the permission to add vehicle
         user_id = get_jwt_identity()
-        if carrier.user_id != user_id:
+        if str(carrier.user_id) != user_id:
             abort(403, 'Identity mismatch.')
 
         # initializing Vehicle object and inserting it into database
         vehicle_data = {
-            'c_id': PydanticObjectId(c_id),
+            'carrier_id': PydanticObjectId(c_id),
             'age': int(data.get('age')),
             'is_rented': is_rented,
             'owner_name': data.get('owner_name').strip(),
@@ -159,6 +153,14 @@ def add_vehicle(c_id: str) -> Tuple[Dict[str, Any], int]:
         vehicle_id = vehicles.insert_one(vehicle.to_bson()).inserted_id
         vehicle.id = PydanticObjectId(str(vehicle_id))
 
+        # carriers are matched on their vehicles, see api.utils.carrier_index
+        res = carriers.find_one_and_update(
+            { '_id': ObjectId(c_id) },
+            { '$push': { 'vehicles': vehicle_id }, '$set': { 'updated_at': vehicle_data['updated_at'] } },
+            return_document = ReturnDocument.AFTER
+        )
+        carrier_index.upsert(res)
+
         return jsonify({
             'message': 'Vehicle added successfully.',
             'data': vehicle.to_json()
@@ -235,7 +237,7 @@ def delete_vehicle(c_id: str, v_id: str) -> Tuple[Dict[str, Any], int]:
         user_id = get_jwt_identity()
         carrier = Carrier(**res)
         
-        if carrier.user_id != user_id:
+        if str(carrier.user_id) != user_id:
             abort(403, 'Identity mismatch.')
 
         # deleting the vehicle
@@ -243,6 +245,13 @@ def delete_vehicle(c_id: str, v_id: str) -> Tuple[Dict[str, Any], int]:
         if not deleted_vehicle:
             abort(404, 'Vehicle not found.')
 
+        res = carriers.find_one_and_update(
+            { '_id': ObjectId(c_id) },
+            { '$pull': { 'vehicles': ObjectId(v_id) }, '$set': { 'updated_at': datetime.datetime.now(tz = datetime.timezone.utc) } },
+            return_document = ReturnDocument.AFTER
+        )
+        carrier_index.upsert(res)
+
         return jsonify({
             'message': 'Vehicle record deleted successfully.',
             'data': None
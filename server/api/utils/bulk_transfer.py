@@ -0,0 +1,455 @@
+# external imports
+import os
+import glob
+import json
+import click
+import datetime
+from enum import Enum
+from bson import ObjectId, json_util
+from flask import Flask
+from pydantic import ValidationError
+from pymongo.database import Database
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+from typing import Dict, List, Tuple, Iterable, Iterator, IO, Optional, Union, Any, get_args, get_origin
+
+# internal imports
+from api.db_models.vehicle_models import Vehicle
+from api.db_models.shipment_models import Shipment, Bid
+
+# collections that can be exported and imported, with the model validating their documents
+TRANSFER_MODELS: Dict[str, type] = {
+    'shipments': Shipment,
+    'bids': Bid,
+    'vehicles': Vehicle,
+}
+TRANSFER_FORMATS = ['ndjson', 'parquet']
+MAX_ERROR_SAMPLES = 20
+
+def _pyarrow():
+    """Imports pyarrow, which is only needed for Parquet."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise RuntimeError('Parquet needs pyarrow, install it with `pip install pyarrow`.')
+
+def _arrow_type(annotation: Any) -> Any:
+    """Maps the annotation of a model field to an Arrow type."""
+    pa = _pyarrow()
+    origin = get_origin(annotation)
+
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _arrow_type(args[0]) if len(args) == 1 else pa.string()
+    if origin in (list, tuple, set):
+        args = [arg for arg in get_args(annotation) if arg is not Ellipsis]
+        return pa.list_(_arrow_type(args[0]) if len(set(args)) == 1 else pa.string())
+    if origin is dict or annotation is dict:
+        # the only dict fields of the models are GeoJSON points, e.g. Shipment.pickup_location
+        return pa.struct([('type', pa.string()), ('coordinates', pa.list_(pa.float64()))])
+
+    if isinstance(annotation, type):
+        if issubclass(annotation, ObjectId):
+            return pa.string()
+        if issubclass(annotation, datetime.datetime):
+            return pa.timestamp('ms', tz='UTC')
+        if issubclass(annotation, datetime.timedelta):
+            return pa.duration('ms')
+        if issubclass(annotation, (str, Enum)):
+            return pa.string()
+        if issubclass(annotation, bool):
+            return pa.bool_()
+        if issubclass(annotation, int):
+            return pa.int64()
+        if issubclass(annotation, float):
+            return pa.float64()
+
+    return pa.string()
+
+def arrow_schema(model: type) -> Any:
+    """
+    Builds the Parquet schema of a model. ObjectIds are stored as strings.
+
+    Args
+        model: db model class.
+
+    Returns
+        [pyarrow.Schema]: one column per model field.
+    """
+    pa = _pyarrow()
+    return pa.schema([
+        pa.field(field.alias or name, _arrow_type(field.annotation)) for name, field in model.model_fields.items()
+    ])
+
+def _ids_to_str(value: Any) -> Any:
+    """Replaces ObjectIds by strings, also inside lists."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return [_ids_to_str(v) for v in value]
+    return value
+
+class Checkpoint:
+    """
+    Progress of an export or import, stored as JSON next to its file. Every chunk updates it
+    atomically so that an interrupted run resumes after the last completed chunk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state: Dict[str, Any] = {}
+
+        if os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def save(self, **state: Any) -> None:
+        """Replaces the stored progress."""
+        self.state = state
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        """Removes the stored progress."""
+        self.state = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def _new_stats() -> Dict[str, Any]:
+    return { 'read': 0, 'written': 0, 'invalid': 0, 'duplicates': 0, 'errors': [] }
+
+def _validate(model: type, doc: Dict[str, Any], stats: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Runs a document through its model, counting it as invalid when it does not validate."""
+    try:
+        return model(**doc).to_bson()
+    except (ValidationError, TypeError, ValueError) as e:
+        stats['invalid'] += 1
+        if len(stats['errors']) < MAX_ERROR_SAMPLES:
+            if isinstance(e, ValidationError):
+                message = '; '.join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            else:
+                message = str(e)
+            stats['errors'].append({ '_id': str(doc.get('_id')), 'error': message })
+        return None
+
+def export_chunks(
+    collection: Collection,
+    model: type,
+    chunk_size: int = 1000,
+    after: Optional[ObjectId] = None,
+    stats: Optional[Dict[str, Any]] = None
+) -> Iterator[Tuple[List[Dict[str, Any]], ObjectId]]:
+    """
+    Reads a collection in _id order with a batch cursor and validates it through its model.
+
+    Args
+        collection: collection to export.
+        model: model of the documents.
+        chunk_size: documents per chunk, also the cursor batch size.
+        after: resumes after this _id.
+        stats: counters updated in place.
+
+    Returns
+        [Iterator[Tuple[List[Dict[str, Any]], ObjectId]]]: valid documents of every chunk and the last _id read.
+    """
+    stats = stats if stats is not None else _new_stats()
+    query = { '_id': { '$gt': after } } if after else {}
+    cursor = collection.find(query).sort('_id', 1).batch_size(chunk_size)
+
+    chunk, pending, last_id = [], 0, None
+    for doc in cursor:
+        stats['read'] += 1
+        pending += 1
+        last_id = doc['_id']
+
+        valid = _validate(model, doc, stats)
+        if valid is not None:
+            chunk.append(valid)
+
+        if pending == chunk_size:
+            stats['written'] += len(chunk)
+            yield chunk, last_id
+            chunk, pending = [], 0
+
+    if pending:
+        stats['written'] += len(chunk)
+        yield chunk, last_id
+
+def ndjson_lines(docs: Iterable[Dict[str, Any]]) -> str:
+    """Encodes documents as NDJSON in relaxed extended JSON, which keeps ObjectIds and dates."""
+    return ''.join(json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS) + '\n' for doc in docs)
+
+def parquet_table(model: type, docs: List[Dict[str, Any]]) -> Any:
+    """
+    Converts validated documents to an Arrow table with the model's schema.
+
+    Args
+        model: model of the documents.
+        docs: documents returned by to_bson.
+
+    Returns
+        [pyarrow.Table]: table of the documents.
+    """
+    pa = _pyarrow()
+    schema = arrow_schema(model)
+    return pa.Table.from_pylist(
+        [{ name: _ids_to_str(doc.get(name)) for name in schema.names } for doc in docs], schema=schema
+    )
+
+def write_parquet(path: str, model: type, chunks: Iterable[Tuple[List[Dict[str, Any]], ObjectId]]) -> None:
+    """
+    Writes the chunks of export_chunks to a single Parquet file, one row group per chunk.
+
+    Args
+        path: output file.
+        model: model of the documents.
+        chunks: chunks returned by export_chunks.
+    """
+    pq = _pyarrow().parquet
+    with pq.ParquetWriter(path, arrow_schema(model)) as writer:
+        for chunk, _ in chunks:
+            if chunk:
+                writer.write_table(parquet_table(model, chunk))
+
+def read_ndjson(stream: IO, offset: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Decodes NDJSON documents written by ndjson_lines.
+
+    Args
+        stream: text or binary stream.
+        offset: number of documents to skip.
+
+    Returns
+        [Iterator[Dict[str, Any]]]: documents.
+    """
+    count = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        count += 1
+        if count > offset:
+            yield json_util.loads(line)
+
+def _parquet_files(path: str) -> List[str]:
+    """A Parquet file, or the part files of an exported directory in order."""
+    return sorted(glob.glob(os.path.join(path, '*.parquet'))) if os.path.isdir(path) else [path]
+
+def read_parquet(path: str, offset: int = 0, chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """
+    Reads the rows of a Parquet file or directory of part files in batches.
+
+    Args
+        path: file or directory.
+        offset: number of rows to skip; whole row groups are skipped without being read.
+        chunk_size: rows per batch.
+
+    Returns
+        [Iterator[Dict[str, Any]]]: rows.
+    """
+    pq = _pyarrow().parquet
+
+    for file in _parquet_files(path):
+        parquet = pq.ParquetFile(file)
+        if offset >= parquet.metadata.num_rows:
+            offset -= parquet.metadata.num_rows
+            continue
+
+        groups = []
+        for i in range(parquet.num_row_groups):
+            rows = parquet.metadata.row_group(i).num_rows
+            if offset >= rows and not groups:
+                offset -= rows
+            else:
+                groups.append(i)
+
+        for batch in parquet.iter_batches(batch_size=chunk_size, row_groups=groups):
+            for row in batch.to_pylist():
+                if offset:
+                    offset -= 1
+                    continue
+                yield row
+
+def import_documents(
+    collection: Collection,
+    model: type,
+    docs: Iterable[Dict[str, Any]],
+    chunk_size: int = 1000,
+    on_chunk: Optional[Any] = None,
+    stats: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Validates documents through their model and inserts them with unordered insert_many, one
+    chunk at a time. Documents whose _id already exists (e.g. after resuming) count as duplicates.
+
+    Args
+        collection: target collection.
+        model: model of the documents.
+        docs: documents to import.
+        chunk_size: documents per insert_many.
+        on_chunk: called with the stats after every chunk, e.g. to save a checkpoint.
+        stats: counters updated in place.
+
+    Returns
+        [Dict[str, Any]]: read, written (inserted), invalid and duplicates counters and error samples.
+    """
+    stats = stats if stats is not None else _new_stats()
+
+    def flush(chunk):
+        if chunk:
+            try:
+                stats['written'] += len(collection.insert_many(chunk, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                stats['written'] += e.details['nInserted']
+                errors = e.details['writeErrors']
+                stats['duplicates'] += sum(error['code'] == 11000 for error in errors)
+                if any(error['code'] != 11000 for error in errors):
+                    raise
+        if on_chunk:
+            on_chunk(stats)
+
+    chunk, pending = [], 0
+    for doc in docs:
+        stats['read'] += 1
+        pending += 1
+
+        valid = _validate(model, doc, stats)
+        if valid is not None:
+            chunk.append(valid)
+
+        if pending == chunk_size:
+            flush(chunk)
+            chunk, pending = [], 0
+
+    if pending:
+        flush(chunk)
+
+    return stats
+
+def export_collection(db: Database, name: str, path: str, fmt: str = 'ndjson', chunk_size: int = 1000, resume: bool = False) -> Dict[str, Any]:
+    """
+    Exports a collection to an NDJSON file or a directory of Parquet part files (one per chunk).
+    Progress is checkpointed to <path>.checkpoint.json after every chunk.
+
+    Args
+        db: mongo database.
+        name: one of TRANSFER_MODELS.
+        path: output file (ndjson) or directory (parquet).
+        fmt: one of TRANSFER_FORMATS.
+        chunk_size: documents per chunk.
+        resume: continues an interrupted export instead of starting over.
+
+    Returns
+        [Dict[str, Any]]: counters of the run.
+    """
+    model = TRANSFER_MODELS[name]
+    checkpoint = Checkpoint(f'{path}.checkpoint.json')
+    if not resume:
+        checkpoint.clear()
+
+    state = checkpoint.state
+    after = ObjectId(state['last_id']) if state.get('last_id') else None
+    stats = { **_new_stats(), **{ key: state[key] for key in ['read', 'written', 'invalid'] if key in state } }
+    part = state.get('part', 0)
+
+    if fmt == 'ndjson':
+        # dropping whatever was written after the last checkpoint
+        with open(path, 'a+b') as f:
+            f.truncate(state.get('bytes', 0))
+
+        with open(path, 'ab') as f:
+            for chunk, last_id in export_chunks(db[name], model, chunk_size, after, stats):
+                f.write(ndjson_lines(chunk).encode())
+                f.flush()
+                os.fsync(f.fileno())
+                checkpoint.save(last_id=str(last_id), bytes=f.tell(), read=stats['read'], written=stats['written'], invalid=stats['invalid'])
+    else:
+        pq = _pyarrow().parquet
+        os.makedirs(path, exist_ok=True)
+        if not resume:
+            for file in glob.glob(os.path.join(path, 'part-*.parquet')):
+                os.remove(file)
+        for chunk, last_id in export_chunks(db[name], model, chunk_size, after, stats):
+            if chunk:
+                pq.write_table(parquet_table(model, chunk), os.path.join(path, f'part-{part:05d}.parquet'))
+                part += 1
+            checkpoint.save(last_id=str(last_id), part=part, read=stats['read'], written=stats['written'], invalid=stats['invalid'])
+
+    return stats
+
+def import_collection(db: Database, name: str, path: str, fmt: str = 'ndjson', chunk_size: int = 1000, resume: bool = False) -> Dict[str, Any]:
+    """
+    Imports an NDJSON file or a Parquet file/directory into a collection. The number of records
+    consumed is checkpointed to <path>.checkpoint.json after every chunk.
+
+    Args
+        db: mongo database.
+        name: one of TRANSFER_MODELS.
+        path: input file (ndjson) or file/directory (parquet).
+        fmt: one of TRANSFER_FORMATS.
+        chunk_size: documents per insert_many.
+        resume: skips the records imported by an interrupted run.
+
+    Returns
+        [Dict[str, Any]]: counters of the run.
+    """
+    model = TRANSFER_MODELS[name]
+    checkpoint = Checkpoint(f'{path}.checkpoint.json')
+    if not resume:
+        checkpoint.clear()
+
+    offset = checkpoint.state.get('offset', 0)
+    stats = _new_stats()
+
+    def save(stats):
+        checkpoint.save(offset=offset + stats['read'], written=stats['written'])
+
+    if fmt == 'ndjson':
+        with open(path, 'rb') as f:
+            return import_documents(db[name], model, read_ndjson(f, offset), chunk_size, save, stats)
+
+    return import_documents(db[name], model, read_parquet(path, offset, chunk_size), chunk_size, save, stats)
+
+def register_bulk_transfer(app: Flask) -> None:
+    """
+    Registers the `flask data export|import` commands.
+
+    Args
+        app: flask app instance
+    """
+    from api import mongo
+
+    @app.cli.group('data')
+    def data_cli():
+        """Bulk export and import of collections."""
+
+    collection_arg = click.argument('collection', type=click.Choice(list(TRANSFER_MODELS)))
+    options = [
+        click.option('--format', 'fmt', type=click.Choice(TRANSFER_FORMATS), default='ndjson'),
+        click.option('--chunk-size', type=int, default=1000, show_default=True),
+        click.option('--resume', is_flag=True, help='Continue from the checkpoint of an interrupted run.'),
+    ]
+
+    def with_options(command):
+        for option in reversed(options):
+            command = option(command)
+        return command
+
+    @data_cli.command('export')
+    @collection_arg
+    @click.argument('path')
+    @with_options
+    def export_command(collection, path, fmt, chunk_size, resume):
+        """Export COLLECTION to PATH (a file for ndjson, a directory for parquet)."""
+        click.echo(json.dumps(export_collection(mongo.db, collection, path, fmt, chunk_size, resume), indent=2))
+
+    @data_cli.command('import')
+    @collection_arg
+    @click.argument('path')
+    @with_options
+    def import_command(collection, path, fmt, chunk_size, resume):
+        """Import PATH into COLLECTION."""
+        click.echo(json.dumps(import_collection(mongo.db, collection, path, fmt, chunk_size, resume), indent=2))
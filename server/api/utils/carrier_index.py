@@ -0,0 +1,431 @@
+# external imports
+import math
+import time
+import datetime
+import threading
+import numpy as np
+from bson import ObjectId
+from flask import Flask
+from pymongo.database import Database
+from typing import Dict, List, Tuple, Set, Iterable, Optional, Any
+
+# internal imports
+from api.db_models.shipment_models import Mode
+
+# bit of every mode in the modes column, and the mode part of the bucket keys
+MODE_BITS = { mode.value: k for k, mode in enumerate(Mode) }
+
+# rating buckets are floor(rating), 1 to 5; unrated carriers are in bucket 0
+UNRATED = 0
+RATING_BUCKETS = range(1, 6)
+
+# rating an unrated carrier is scored with
+UNRATED_RATING = 3.0
+
+# regions are cells of CELL_DEG x CELL_DEG degrees, about 111 km high
+CELL_DEG = 1.0
+EARTH_RADIUS_KM = 6371.0088
+
+# score = RATING_WEIGHT * rating / 5 + VERIFIED_WEIGHT * verified + DISTANCE_WEIGHT * (1 - distance / radius)
+RATING_WEIGHT = 0.6
+VERIFIED_WEIGHT = 0.1
+DISTANCE_WEIGHT = 0.3
+
+# seconds of changes polled again, covers the clock skew between the app servers
+REFRESH_OVERLAP = 5.0
+
+# fields of the carrier documents the index is built from
+MATCH_FIELDS = { 'modes': 1, 'vehicles': 1, 'rating': 1, 'location': 1, 'verified': 1, 'updated_at': 1 }
+
+# attributes replaced by a reload
+STATE = ('_rows', '_ids', '_free', '_keys', '_buckets', '_arrays', '_latitude', '_longitude', '_rating', '_verified', '_vehicles', '_modes')
+
+def _utc(value: datetime.datetime) -> datetime.datetime:
+    """Naive UTC datetime, as pymongo returns them."""
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+def _cell(latitude: float, longitude: float) -> Tuple[int, int]:
+    rows, columns = int(180 / CELL_DEG), int(360 / CELL_DEG)
+    row = min(max(int(math.floor((latitude + 90) / CELL_DEG)), 0), rows - 1)
+    return row, int(math.floor((longitude + 180) / CELL_DEG)) % columns
+
+class CarrierIndex:
+    """
+    In-memory index of the carriers that can be matched with shipments.
+
+    Carriers with a location, at least one mode and (with MATCHING_REQUIRE_VEHICLE) a vehicle
+    are kept in buckets keyed by (region cell, mode, rating bucket), their attributes in numpy
+    columns. A match only reads the buckets of the requested modes and ratings in the cells
+    near the pickup, in order of the best score their carriers could reach (nearest cells and
+    highest ratings first), and stops once no remaining bucket can beat the current top-N, so
+    it costs milliseconds at any number of carriers.
+
+    The index is loaded from the primary on first use. Writes of this worker update it at once
+    (upsert); changes of the other workers and processes are polled every
+    MATCHING_REFRESH_INTERVAL seconds through the updated_at field of the carriers, from the
+    latest updated_at seen rather than the local clock. Deleted carriers and writes that do not
+    set updated_at are picked up by a full reload every MATCHING_RELOAD_INTERVAL seconds.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.refresh_interval = 5.0
+        self.reload_interval = 600.0
+        self.require_vehicle = True
+        self.loaded = False
+        self.load_seconds = 0.0
+        self.loads = 0
+        self.refreshes = 0
+        self.upserts = 0
+        self.matches = 0
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._refreshed_at = 0.0
+        self._loaded_at = 0.0
+        self._watermark: Optional[datetime.datetime] = None
+        self._reset()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Configures the polling intervals and eligibility of the index, which is loaded on first use.
+
+        Args
+            app: flask app instance
+        """
+        self.refresh_interval = app.config.get('MATCHING_REFRESH_INTERVAL', self.refresh_interval)
+        self.reload_interval = app.config.get('MATCHING_RELOAD_INTERVAL', self.reload_interval)
+        self.require_vehicle = app.config.get('MATCHING_REQUIRE_VEHICLE', self.require_vehicle)
+        app.extensions['carrier_index'] = self
+
+    def _reset(self) -> None:
+        self._rows: Dict[ObjectId, int] = {}
+        self._ids: List[Optional[ObjectId]] = []
+        self._free: List[int] = []
+        self._keys: Dict[int, List[Tuple[int, int, int, int]]] = {}
+        self._buckets: Dict[Tuple[int, int, int, int], Set[int]] = {}
+        self._arrays: Dict[Tuple[int, int, int, int], np.ndarray] = {} # buckets as arrays, dropped when they change
+        self._latitude = np.full(0, np.nan)
+        self._longitude = np.full(0, np.nan)
+        self._rating = np.full(0, np.nan)
+        self._verified = np.zeros(0, dtype=bool)
+        self._vehicles = np.zeros(0, dtype=np.int32)
+        self._modes = np.zeros(0, dtype=np.uint8)
+
+    def _grow(self) -> None:
+        """Doubles the capacity of the columns."""
+        size = max(2 * len(self._ids), 1024)
+        extra = size - len(self._latitude)
+        self._latitude = np.concatenate([self._latitude, np.full(extra, np.nan)])
+        self._longitude = np.concatenate([self._longitude, np.full(extra, np.nan)])
+        self._rating = np.concatenate([self._rating, np.full(extra, np.nan)])
+        self._verified = np.concatenate([self._verified, np.zeros(extra, dtype=bool)])
+        self._vehicles = np.concatenate([self._vehicles, np.zeros(extra, dtype=np.int32)])
+        self._modes = np.concatenate([self._modes, np.zeros(extra, dtype=np.uint8)])
+
+    def _bucket(self, key: Tuple[int, int, int, int]) -> Optional[np.ndarray]:
+        rows = self._arrays.get(key)
+        if rows is None:
+            bucket = self._buckets.get(key)
+            if not bucket:
+                return None
+            rows = self._arrays[key] = np.fromiter(bucket, dtype=np.int64, count=len(bucket))
+        return rows
+
+    def _unlink(self, row: int) -> None:
+        for key in self._keys.pop(row, []):
+            self._arrays.pop(key, None)
+            bucket = self._buckets[key]
+            bucket.discard(row)
+            if not bucket:
+                del self._buckets[key]
+
+    def _upsert(self, doc: Dict[str, Any]) -> None:
+        row = self._rows.get(doc['_id'])
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+                self._ids[row] = doc['_id']
+            else:
+                row = len(self._ids)
+                self._ids.append(doc['_id'])
+                if row >= len(self._latitude):
+                    self._grow()
+            self._rows[doc['_id']] = row
+        else:
+            self._unlink(row)
+
+        location = doc.get('location')
+        longitude, latitude = location['coordinates'] if location else (np.nan, np.nan)
+        rating = doc.get('rating')
+        modes = [MODE_BITS[mode] for mode in doc.get('modes') or [] if mode in MODE_BITS]
+        vehicles = len(doc.get('vehicles') or [])
+
+        self._latitude[row], self._longitude[row] = latitude, longitude
+        self._rating[row] = np.nan if rating is None else rating
+        self._verified[row] = bool(doc.get('verified'))
+        self._vehicles[row] = vehicles
+        self._modes[row] = sum(1 << bit for bit in set(modes))
+
+        if location and modes and (vehicles or not self.require_vehicle):
+            cell = _cell(latitude, longitude)
+            bucket = UNRATED if rating is None else min(max(int(rating), RATING_BUCKETS[0]), RATING_BUCKETS[-1])
+            keys = [(cell[0], cell[1], bit, bucket) for bit in set(modes)]
+            for key in keys:
+                self._buckets.setdefault(key, set()).add(row)
+                self._arrays.pop(key, None)
+            self._keys[row] = keys
+
+    def load(self, docs: Iterable[Dict[str, Any]]) -> None:
+        """
+        Replaces the index with the given carriers. The new index is built aside, matches keep
+        reading the current one until it is swapped in.
+
+        Args
+            docs: carrier documents with at least the MATCH_FIELDS
+        """
+        started = time.perf_counter()
+        fresh = CarrierIndex()
+        fresh.require_vehicle = self.require_vehicle
+        for doc in docs:
+            fresh._upsert(doc)
+        with self._lock:
+            for name in STATE:
+                setattr(self, name, getattr(fresh, name))
+            self.loaded = True
+            self.loads += 1
+        self.load_seconds = time.perf_counter() - started
+
+    def upsert(self, doc: Dict[str, Any]) -> None:
+        """
+        Adds or updates a carrier after a write of this worker; a no-op until the index is loaded.
+
+        Args
+            doc: carrier document with at least the MATCH_FIELDS
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            self._upsert(doc)
+            self.upserts += 1
+
+    def remove(self, carrier_id: ObjectId) -> None:
+        """
+        Removes a carrier from the index.
+
+        Args
+            carrier_id: _id of the carrier
+        """
+        with self._lock:
+            row = self._rows.pop(carrier_id, None)
+            if row is not None:
+                self._unlink(row)
+                self._ids[row] = None
+                self._free.append(row)
+
+    def refresh(self, db: Database, force: bool = False) -> None:
+        """
+        Loads the index on first use and every reload_interval seconds, in between applies the
+        carriers updated since the last poll once every refresh_interval seconds. Concurrent
+        requests do not wait for a poll in progress. Read from the primary: a lagging secondary
+        would return changes after the watermark moved past them.
+
+        Args
+            db: database, of the primary
+            force: polls regardless of the interval
+        """
+        if self.loaded and not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+
+        if not self._refresh_lock.acquire(blocking=not self.loaded):
+            return
+        try:
+            reload = not self.loaded or (self.reload_interval > 0 and time.monotonic() - self._loaded_at >= self.reload_interval)
+            latest = None if reload else self._watermark
+
+            def seen(docs: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+                nonlocal latest
+                for doc in docs:
+                    if isinstance(doc.get('updated_at'), datetime.datetime):
+                        updated_at = _utc(doc['updated_at'])
+                        if latest is None or updated_at > latest:
+                            latest = updated_at
+                    yield doc
+
+            if reload:
+                self._loaded_at = time.monotonic()
+                self.load(seen(db.carriers.find({}, MATCH_FIELDS)))
+            else:
+                # until a carrier has an updated_at, every dated change is new
+                since = self._watermark - datetime.timedelta(seconds=REFRESH_OVERLAP) if self._watermark else datetime.datetime.min
+                for doc in seen(db.carriers.find({ 'updated_at': { '$gte': since } }, MATCH_FIELDS)):
+                    self.upsert(doc)
+            self._watermark = latest
+            self._refreshed_at = time.monotonic()
+            self.refreshes += 1
+        finally:
+            self._refresh_lock.release()
+
+    def _cells(self, latitude: float, longitude: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Cells within radius_km of a point with a lower bound of their distance to it. A latitude
+        gap of x radians is at least R * x away; a longitude gap of y is at least
+        R * asin(sin(y) * cos(latitude)) away, the inverse of the bounding box of a cap.
+
+        Returns
+            [Tuple[np.ndarray, np.ndarray, np.ndarray]]: bounds in km, cell rows, cell columns
+        """
+        radius = radius_km / EARTH_RADIUS_KM
+        phi = math.radians(latitude)
+        rows, columns = int(180 / CELL_DEG), int(360 / CELL_DEG)
+        _, column = _cell(latitude, longitude)
+
+        low = max(int(math.floor((latitude - math.degrees(radius) + 90) / CELL_DEG)), 0)
+        high = min(int(math.floor((latitude + math.degrees(radius) + 90) / CELL_DEG)), rows - 1)
+        if abs(phi) + radius >= math.pi / 2 or radius >= math.pi / 2:
+            span = columns // 2
+        else:
+            span = min(int(math.ceil(math.degrees(math.asin(math.sin(radius) / math.cos(phi))) / CELL_DEG)) + 1, columns // 2)
+
+        cell_rows = np.arange(low, high + 1)
+        cell_columns = np.unique((column + np.arange(-span, span + 1)) % columns)
+
+        south = cell_rows * CELL_DEG - 90
+        lat_gap = np.radians(np.maximum(np.maximum(south - latitude, latitude - south - CELL_DEG), 0.0))
+
+        # edges of the cells relative to the point, in [-180, 180)
+        west = ((cell_columns * CELL_DEG - 180) - longitude + 180) % 360 - 180
+        east = west + CELL_DEG
+        lon_gap = np.where(
+            (west <= 0) & (east >= 0), 0.0, np.radians(np.minimum(np.abs(west), np.abs(np.where(east > 180, east - 360, east))))
+        )
+        lon_bound = np.arcsin(np.sin(np.minimum(lon_gap, math.pi / 2)) * math.cos(phi))
+
+        bounds = EARTH_RADIUS_KM * np.maximum(lat_gap[:, None], lon_bound[None, :])
+        r, c = np.nonzero(bounds <= radius_km)
+        return bounds[r, c], cell_rows[r], cell_columns[c]
+
+    def match(
+        self,
+        latitude: float,
+        longitude: float,
+        limit: int,
+        radius_km: float,
+        modes: Optional[List[str]] = None,
+        min_rating: Optional[float] = None,
+        exclude: Optional[Iterable[ObjectId]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Top carriers for a pickup point, by score (see RATING_WEIGHT), best first.
+
+        Args
+            latitude: pickup latitude
+            longitude: pickup longitude
+            limit: carriers returned
+            radius_km: farthest carrier location from the pickup
+            modes: carriers offering any of these modes, every mode when None
+            min_rating: lowest rating, unrated carriers are left out when given
+            exclude: ids of carriers left out, e.g. those that already bid
+
+        Returns
+            [List[Dict[str, Any]]]: carrier_id, score, distance_km, rating, verified, vehicles and modes
+        """
+        # api.utils.geo imports the extensions of api, which import this module
+        from api.utils.geo import haversine
+
+        bits = sorted({ MODE_BITS[mode] for mode in modes }) if modes else sorted(MODE_BITS.values())
+        buckets = [UNRATED, *RATING_BUCKETS] if min_rating is None else [b for b in RATING_BUCKETS if b + 1 > min_rating]
+        excluded = set(exclude or [])
+
+        with self._lock:
+            self.matches += 1
+            excluded_rows = np.asarray([self._rows[i] for i in excluded if i in self._rows], dtype=np.int64)
+
+            # (cell, rating bucket) groups, best possible score first: the nearest cells and highest ratings
+            bounds, cell_rows, cell_columns = self._cells(latitude, longitude, radius_km)
+            best_rating = np.asarray([UNRATED_RATING if b == UNRATED else min(b + 1, RATING_BUCKETS[-1]) for b in buckets])
+            ceilings = (
+                RATING_WEIGHT * best_rating[None, :] / 5 + VERIFIED_WEIGHT + DISTANCE_WEIGHT * (1 - bounds[:, None] / radius_km)
+            ).ravel()
+            order = np.argsort(-ceilings, kind='stable')
+            groups = [
+                (ceilings[g], int(cell_rows[g // len(buckets)]), int(cell_columns[g // len(buckets)]), buckets[g % len(buckets)])
+                for g in order.tolist()
+            ]
+
+            top_rows, top_scores, top_distances = np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+            pending: List[np.ndarray] = []
+            gathered = 0
+
+            for k, (_, row, column, bucket) in enumerate(groups):
+                for bit in bits:
+                    rows = self._bucket((row, column, bit, bucket))
+                    if rows is not None:
+                        pending.append(rows)
+                        gathered += len(rows)
+
+                last = k == len(groups) - 1
+                if not gathered or (gathered < limit and not last):
+                    continue
+
+                # carriers offering several of the modes are in several buckets of a group
+                rows = np.unique(np.concatenate(pending)) if len(bits) > 1 else np.concatenate(pending)
+                pending, gathered = [], 0
+                rows = rows[~np.isin(rows, excluded_rows)]
+                rating = self._rating[rows]
+                if min_rating is not None:
+                    keep = rating >= min_rating
+                    rows, rating = rows[keep], rating[keep]
+
+                distance = haversine(latitude, longitude, self._latitude[rows], self._longitude[rows])
+                keep = distance <= radius_km
+                rows, rating, distance = rows[keep], rating[keep], distance[keep]
+
+                score = (
+                    RATING_WEIGHT * np.where(np.isnan(rating), UNRATED_RATING, rating) / 5
+                    + VERIFIED_WEIGHT * self._verified[rows]
+                    + DISTANCE_WEIGHT * (1 - distance / radius_km)
+                )
+                top_rows = np.concatenate([top_rows, rows])
+                top_scores = np.concatenate([top_scores, score])
+                top_distances = np.concatenate([top_distances, distance])
+                if len(top_rows) > limit:
+                    keep = np.argpartition(-top_scores, limit - 1)[:limit]
+                    top_rows, top_scores, top_distances = top_rows[keep], top_scores[keep], top_distances[keep]
+
+                # no carrier of the remaining groups can score above the next group's ceiling
+                if len(top_rows) == limit and not last and top_scores.min() >= groups[k + 1][0]:
+                    break
+
+            matches = []
+            for k in np.lexsort((top_distances, -top_scores)):
+                row = top_rows[k]
+                matches.append({
+                    'carrier_id': self._ids[row],
+                    'score': round(float(top_scores[k]), 4),
+                    'distance_km': round(float(top_distances[k]), 3),
+                    'rating': None if np.isnan(self._rating[row]) else float(self._rating[row]),
+                    'verified': bool(self._verified[row]),
+                    'vehicles': int(self._vehicles[row]),
+                    'modes': [mode for mode, bit in MODE_BITS.items() if self._modes[row] & (1 << bit)]
+                })
+            return matches
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the size of the index and the counters of this worker."""
+        with self._lock:
+            return {
+                'loaded': self.loaded,
+                'carriers': len(self._rows),
+                'matchable': len(self._keys),
+                'buckets': len(self._buckets),
+                'load_seconds': round(self.load_seconds, 3),
+                'loads': self.loads,
+                'watermark': self._watermark,
+                'refreshes': self.refreshes,
+                'upserts': self.upserts,
+                'matches': self.matches
+            }
@@ -0,0 +1,234 @@
+# external imports
+import os
+import time
+import atexit
+import logging
+import sqlite3
+import threading
+from flask import Flask
+from collections import OrderedDict
+from typing import Dict, Optional, Any
+
+# internal imports
+from api.utils.geo_index import PostalCodeIndex
+
+logger = logging.getLogger(__name__)
+
+# new lanes written to disk per sqlite transaction, and the longest they wait for one
+WRITE_BATCH = 100
+WRITE_INTERVAL = 1.0
+
+class DistanceCache:
+    """
+    Symmetric cache of distances between postal codes.
+
+    Entries are kept in an in-memory LRU of DISTANCE_CACHE_SIZE lanes. When DISTANCE_CACHE_PATH
+    is set, new entries are also written to a sqlite file, in batches, so that workers started
+    later (or restarted) begin warm; lanes evicted from memory are served from that file.
+
+    The file is best-effort: sqlite errors are logged and the cache carries on in memory, a
+    distance never fails because it could not be cached.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.max_size = 10000
+        self.path = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_errors = 0
+        self._entries: OrderedDict[str, float] = OrderedDict()
+        # lanes not written to disk yet
+        self._pending: Dict[str, float] = {}
+        self._last_write = time.monotonic()
+        self._lock = threading.Lock()
+        # serializes the use of the sqlite connection, held without _lock
+        self._disk_lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Configures the cache size and the optional on-disk spill.
+
+        Args
+            app: flask app instance
+        """
+        self.max_size = app.config.get('DISTANCE_CACHE_SIZE', self.max_size)
+        self.path = app.config.get('DISTANCE_CACHE_PATH')
+        app.extensions['distance_cache'] = self
+
+        if self.path:
+            atexit.register(self.flush)
+
+    @staticmethod
+    def key(code1: str, code2: str, country1: str = 'IN', country2: str = 'IN') -> str:
+        """
+        Builds the cache key of a lane. A -> B and B -> A share the same key.
+
+        Args
+            code1: postal code of the first location
+            code2: postal code of the second location
+            country1: country code of the first location
+            country2: country code of the second location
+
+        Returns
+            [str]: key such as 'IN:110001|IN:400001'
+        """
+        ends = sorted(
+            ':'.join(PostalCodeIndex.normalize(code, country))
+            for code, country in [(code1, country1), (code2, country2)]
+        )
+        return '|'.join(ends)
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """Returns this process' sqlite connection, opening it after a fork if needed."""
+        if not self.path:
+            return None
+
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS distances (key TEXT PRIMARY KEY, km REAL NOT NULL)')
+            conn.commit()
+            self._conn, self._conn_pid = conn, os.getpid()
+
+        return self._conn
+
+    def get(self, key: str) -> Optional[float]:
+        """
+        Fetches a cached distance.
+
+        Args
+            key: lane key created with DistanceCache.key
+
+        Returns
+            [Optional[float]]: distance in kilometers or None on a miss
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        distance = self._read(key)
+
+        with self._lock:
+            if distance is None:
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            self._remember(key, distance)
+            return distance
+
+    def set(self, key: str, distance: float) -> None:
+        """
+        Stores a distance in memory and, if configured, queues it for the next write to disk.
+
+        Args
+            key: lane key created with DistanceCache.key
+            distance: distance in kilometers
+        """
+        with self._lock:
+            self._remember(key, distance)
+            if not self.path:
+                return
+
+            self._pending[key] = distance
+            due = len(self._pending) >= WRITE_BATCH or time.monotonic() - self._last_write >= WRITE_INTERVAL
+
+        if due:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Writes the lanes set since the last write to disk, in one transaction.
+
+        Returns
+            [int]: number of lanes written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_write = time.monotonic()
+        if not pending:
+            return 0
+
+        with self._disk_lock:
+            try:
+                db = self._db()
+                db.executemany('INSERT OR REPLACE INTO distances (key, km) VALUES (?, ?)', pending.items())
+                db.commit()
+            except (sqlite3.Error, OSError) as e:
+                # the lanes stay cached in memory only
+                self._failed('writing', e)
+                return 0
+        return len(pending)
+
+    def _read(self, key: str) -> Optional[float]:
+        """Reads a lane from disk, None when it is not there or the file cannot be read."""
+        if not self.path:
+            return None
+
+        with self._disk_lock:
+            try:
+                row = self._db().execute('SELECT km FROM distances WHERE key = ?', (key,)).fetchone()
+            except (sqlite3.Error, OSError) as e:
+                self._failed('reading', e)
+                return None
+        return row[0] if row else None
+
+    def _failed(self, action: str, e: Exception) -> None:
+        """Logs a sqlite error and drops the connection, the next use opens it again. Called with _disk_lock held."""
+        self.disk_errors += 1
+        logger.warning('Error while %s the distance cache %s, continuing without it: %s', action, self.path, e)
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+        self._conn = None
+
+    def _remember(self, key: str, distance: float) -> None:
+        """Inserts into the in-memory LRU, evicting the least recently used lane when full."""
+        self._entries[key] = distance
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drops every cached distance, in memory and on disk."""
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+
+        if not self.path:
+            return
+
+        with self._disk_lock:
+            try:
+                db = self._db()
+                db.execute('DELETE FROM distances')
+                db.commit()
+            except (sqlite3.Error, OSError) as e:
+                self._failed('clearing', e)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters and the cache occupancy."""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'persistent': bool(self.path),
+            'pending_writes': len(self._pending),
+            'disk_errors': self.disk_errors,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else None
+        }
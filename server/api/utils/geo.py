@@ -1,37 +1,242 @@
-import geopy
-import pgeocode
+import numpy as np
+from typing import Iterable, Sequence, Tuple, Dict, Optional, Any
 
+# internal imports
+from api import geo_index, distance_cache, lane_table
+from api.utils.metrics import timed
+
+EARTH_RADIUS_KM = 6371.0088 # mean earth radius
+WGS84_A = 6378.137 # semi-major axis in km
+WGS84_F = 1 / 298.257223563 # flattening
+WGS84_B = WGS84_A * (1 - WGS84_F) # semi-minor axis in km
+
+DISTANCE_METHODS = ['haversine', 'vincenty', 'geodesic']
+
+def _geodesic_km(point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
+    """Ellipsoidal distance computed by geopy, which is imported on first use."""
+    from geopy.distance import geodesic
+    return geodesic(point1, point2).kilometers
+
+@timed('geocoding')
 def calculate_distance(code1: str, code2: str, country1: str = 'IN', country2: str = 'IN') -> float:
     """
     Calculates distance between two locations using postal codes and country codes.
+    Frequent lanes are read from the precomputed lane table, the others are cached per lane,
+    in either direction.
 
     Args:
         code1: Postal code of the first location.
         code2: Postal code of the second location.
-        country1: Country code of the first location 
-        country2: Country code of the second location 
+        country1: Country code of the first location
+        country2: Country code of the second location
 
     Returns:
         float: Distance in kilometers between the two locations.
     """
     try:
-        nomi1 = pgeocode.Nominatim(country1)
-        nomi2 = pgeocode.Nominatim(country2)
+        distance = lane_table.distance(code1, code2, country1, country2)
+        if distance is not None:
+            return distance
 
-        loc1 = nomi1.query_postal_code(code1)
-        loc2 = nomi2.query_postal_code(code2)
+        key = distance_cache.key(code1, code2, country1, country2)
+        distance = distance_cache.get(key)
+        if distance is not None:
+            return distance
 
-        if loc1.empty or loc2.empty or loc1.isnull().any() or loc2.isnull().any():
-            raise ValueError('Invalid postal code or country code.')
+        loc1 = geo_index.lookup(code1, country1)
+        loc2 = geo_index.lookup(code2, country2)
 
-        lat1, lon1 = loc1.latitude, loc1.longitude
-        lat2, lon2 = loc2.latitude, loc2.longitude
+        if loc1 is None or loc2 is None:
+            raise ValueError('Invalid postal code or country code.')
 
-        if any(val is None for val in [lat1, lon1, lat2, lon2]):
-            raise ValueError('Could not determine latitude and longitude for one of the locations.')
+        distance = _geodesic_km(loc1, loc2)
+        distance_cache.set(key, distance)
 
-        from geopy.distance import geodesic
-        return geodesic((lat1, lon1), (lat2, lon2)).kilometers
+        return distance
 
     except Exception as e:
-        raise ValueError(f"Error calculating distance: {e}")
\ No newline at end of file
+        raise ValueError(f"Error calculating distance: {e}")
+
+def point(latitude: float, longitude: float) -> Dict[str, Any]:
+    """
+    GeoJSON Point of 2dsphere indexes and $geoNear, which take longitude first.
+
+    Args
+        latitude: degrees
+        longitude: degrees
+
+    Returns
+        [Dict[str, Any]]: { 'type': 'Point', 'coordinates': [longitude, latitude] }
+    """
+    return { 'type': 'Point', 'coordinates': [float(longitude), float(latitude)] }
+
+@timed('geocoding')
+def geo_point(code: str, country: str = 'IN') -> Optional[Dict[str, Any]]:
+    """
+    Geocodes a postal code into a GeoJSON Point.
+
+    Args
+        code: postal code
+        country: ISO country code
+
+    Returns
+        [Optional[Dict[str, Any]]]: GeoJSON Point or None if the code is unknown
+    """
+    location = geo_index.lookup(code, country)
+    return point(*location) if location is not None else None
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Great-circle distance on a spherical earth, evaluated element-wise over arrays.
+
+    Args
+        lat1, lon1: co-ordinates (degrees) of the first points
+        lat2, lon2: co-ordinates (degrees) of the second points
+
+    Returns
+        [np.ndarray]: distances in kilometers (broadcast shape of the inputs)
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def vincenty(lat1, lon1, lat2, lon2, max_iter: int = 200, tol: float = 1e-12) -> np.ndarray:
+    """
+    Distance on the WGS-84 ellipsoid (Vincenty's inverse formula), evaluated element-wise over arrays.
+    Nearly antipodal points for which the iteration does not converge are delegated to geopy.
+
+    Args
+        lat1, lon1: co-ordinates (degrees) of the first points
+        lat2, lon2: co-ordinates (degrees) of the second points
+        max_iter: maximum number of iterations
+        tol: convergence threshold on lambda (radians)
+
+    Returns
+        [np.ndarray]: distances in kilometers (broadcast shape of the inputs)
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (lat1, lon1, lat2, lon2)))
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    L = np.radians(lon2 - lon1)
+
+    U1 = np.arctan((1 - WGS84_F) * np.tan(phi1))
+    U2 = np.arctan((1 - WGS84_F) * np.tan(phi2))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iter):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt((cosU2 * sin_lam) ** 2 + (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam) ** 2)
+            cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cosU1 * cosU2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # equatorial lines have cos2_alpha == 0
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha)
+
+            C = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * WGS84_F * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+            )
+
+            converged = np.abs(lam - lam_prev) < tol
+            if converged.all():
+                break
+
+        u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+        ))
+        distance = WGS84_B * A * (sigma - delta_sigma)
+
+    # NaN inputs never converge, only real co-ordinates need the fallback
+    fallback = ~converged & ~np.isnan(distance)
+    for idx in zip(*np.nonzero(fallback)):
+        distance[idx] = _geodesic_km((lat1[idx], lon1[idx]), (lat2[idx], lon2[idx]))
+
+    return distance
+
+def _pairwise(lat1, lon1, lat2, lon2, method: str) -> np.ndarray:
+    """Dispatches a distance computation to the requested method."""
+    if method == 'haversine':
+        return haversine(lat1, lon1, lat2, lon2)
+    if method == 'vincenty':
+        return vincenty(lat1, lon1, lat2, lon2)
+    if method == 'geodesic':
+        lat1, lon1, lat2, lon2 = np.broadcast_arrays(lat1, lon1, lat2, lon2)
+        distance = np.full(lat1.shape, np.nan)
+        for idx in np.ndindex(lat1.shape):
+            if not np.isnan([lat1[idx], lon1[idx], lat2[idx], lon2[idx]]).any():
+                distance[idx] = _geodesic_km((lat1[idx], lon1[idx]), (lat2[idx], lon2[idx]))
+        return distance
+
+    raise ValueError(f'Unknown distance method: {method}. Use one of {DISTANCE_METHODS}.')
+
+def _geocode(codes: Sequence[str], countries: Sequence[str]) -> np.ndarray:
+    """Geocodes postal codes with one vectorized index lookup per country."""
+    coords = np.full((len(codes), 2), np.nan)
+    countries = np.asarray([c.strip().upper() for c in countries], dtype=str)
+
+    for country in np.unique(countries):
+        mask = countries == country
+        coords[mask] = geo_index.lookup_many([codes[i] for i in np.nonzero(mask)[0]], country)
+
+    return coords
+
+@timed('geocoding')
+def calculate_distances(pairs: Iterable[Sequence[str]], method: str = 'haversine') -> np.ndarray:
+    """
+    Calculates distances for many pairs of postal codes at once.
+
+    Args
+        pairs: (code1, code2) or (code1, code2, country1, country2) tuples; country defaults to 'IN'.
+        method: 'haversine' (spherical), 'vincenty' (ellipsoidal) or 'geodesic' (geopy, per pair).
+
+    Returns
+        [np.ndarray]: distances in kilometers, NaN for pairs with an unknown postal code.
+    """
+    pairs = [tuple(pair) + ('IN', 'IN')[len(pair) - 2:] for pair in pairs]
+    if not pairs:
+        return np.empty(0)
+
+    codes1, codes2, countries1, countries2 = zip(*pairs)
+    coords1 = _geocode(codes1, countries1)
+    coords2 = _geocode(codes2, countries2)
+
+    return _pairwise(coords1[:, 0], coords1[:, 1], coords2[:, 0], coords2[:, 1], method)
+
+@timed('geocoding')
+def distance_matrix(
+    origins: Sequence[str],
+    destinations: Sequence[str],
+    country: str = 'IN',
+    method: str = 'haversine'
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calculates an N x M distance matrix between two lists of postal codes of a country.
+
+    Args
+        origins: N postal codes.
+        destinations: M postal codes.
+        country: country code shared by all postal codes.
+        method: see calculate_distances.
+
+    Returns
+        [Tuple[np.ndarray, np.ndarray, np.ndarray]]: (N, M) distances in kilometers (NaN where a
+        code is unknown), resolved mask of origins, resolved mask of destinations.
+    """
+    src = geo_index.lookup_many(origins, country)
+    dst = geo_index.lookup_many(destinations, country)
+
+    matrix = _pairwise(src[:, None, 0], src[:, None, 1], dst[None, :, 0], dst[None, :, 1], method)
+
+    return matrix, ~np.isnan(src[:, 0]), ~np.isnan(dst[:, 0])
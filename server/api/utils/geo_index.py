@@ -0,0 +1,215 @@
+# external imports
+import os
+import threading
+import numpy as np
+from flask import Flask
+from typing import Dict, Tuple, Optional, Iterable, Any
+
+def _postal_code_frame(country: str) -> Any:
+    """
+    One row per postal code of the pgeocode dataset, with averaged co-ordinates.
+
+    pgeocode keeps it in the private Nominatim._data_frame of the version pinned in
+    requirements.txt. Should another version drop it, the places are read from the file pgeocode
+    downloads to STORAGE_DIR and grouped by postal code the same way.
+
+    Args
+        country: ISO country code
+
+    Returns
+        [pd.DataFrame]: postal_code, latitude and longitude columns
+    """
+    import pgeocode
+
+    nominatim = pgeocode.Nominatim(country)
+    df = getattr(nominatim, '_data_frame', None)
+    if df is not None and { 'postal_code', 'latitude', 'longitude' } <= set(df.columns):
+        return df
+
+    import pandas as pd
+    places = pd.read_csv(
+        os.path.join(pgeocode.STORAGE_DIR, f'{country.upper()}.txt'),
+        dtype={ 'postal_code': str }, na_values=pgeocode.NA_VALUES, keep_default_na=False
+    )
+    return places.groupby('postal_code', as_index=False)[['latitude', 'longitude']].mean()
+
+class PostalCodeIndex:
+    """
+    Process-wide lookup table mapping (country, postal_code) to (latitude, longitude).
+
+    Each country is held as a sorted array of postal codes and a parallel (n, 2) float array
+    of co-ordinates, so a lookup is a binary search instead of a pandas query. Countries are
+    loaded from an on-disk snapshot (built from the pgeocode dataset on first use) and stay
+    resident for the lifetime of the worker.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.data_dir = None
+        self.hits = 0
+        self.misses = 0
+        self._tables: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Configures the index and warms the countries listed in GEO_PRELOAD_COUNTRIES.
+
+        Args
+            app: flask app instance
+        """
+        self.data_dir = app.config.get('GEO_DATA_DIR')
+
+        for country in app.config.get('GEO_PRELOAD_COUNTRIES', []):
+            try:
+                self.load(country)
+            except Exception as e:
+                app.logger.warning('Could not preload postal codes for %s: %s', country, e)
+
+        app.extensions['geo_index'] = self
+
+    @staticmethod
+    def normalize(code: str, country: str) -> Tuple[str, str]:
+        """
+        Normalizes a postal code the same way pgeocode does before querying.
+
+        Args
+            code: postal code
+            country: ISO country code
+
+        Returns
+            [Tuple[str, str]]: normalized (country, postal code)
+        """
+        country = country.strip().upper()
+        code = str(code).strip().upper()
+
+        if country in ['GB', 'IE', 'CA'] and code:
+            code = code.split()[0]
+
+        return country, code
+
+    def snapshot_path(self, country: str) -> str:
+        """Returns the path of the snapshot file for a country."""
+        return os.path.join(self.data_dir, f'postal_codes_{country.upper()}.npz')
+
+    def load(self, country: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Loads a country into memory, building its snapshot first if it does not exist.
+
+        Args
+            country: ISO country code
+
+        Returns
+            [Tuple[np.ndarray, np.ndarray]]: sorted postal codes, co-ordinates
+        """
+        country = country.strip().upper()
+        table = self._tables.get(country)
+        if table is not None:
+            return table
+
+        with self._lock:
+            # another thread may have loaded the country while we were waiting
+            if country in self._tables:
+                return self._tables[country]
+
+            path = self.snapshot_path(country)
+            if not os.path.exists(path):
+                self.build_snapshot(country)
+
+            with np.load(path, allow_pickle=False) as snapshot:
+                table = (snapshot['codes'], snapshot['coords'])
+
+            self._tables[country] = table
+            return table
+
+    def build_snapshot(self, country: str) -> str:
+        """
+        Builds the snapshot of a country from the pgeocode dataset.
+
+        Args
+            country: ISO country code
+
+        Returns
+            [str]: path of the written snapshot
+        """
+        df = _postal_code_frame(country)[['postal_code', 'latitude', 'longitude']].dropna()
+
+        codes = df['postal_code'].astype(str).str.strip().str.upper().to_numpy(dtype=str)
+        coords = df[['latitude', 'longitude']].to_numpy(dtype=np.float64)
+
+        # sorted once normalized, lookups binary search the codes; codes that only differed in
+        # case keep the first co-ordinates
+        codes, first = np.unique(codes, return_index=True)
+        coords = coords[first]
+
+        os.makedirs(self.data_dir, exist_ok=True)
+        path = self.snapshot_path(country)
+        np.savez(path, codes=codes, coords=coords)
+
+        return path
+
+    def lookup(self, code: str, country: str = 'IN') -> Optional[Tuple[float, float]]:
+        """
+        Fetches the co-ordinates of a postal code.
+
+        Args
+            code: postal code
+            country: ISO country code
+
+        Returns
+            [Optional[Tuple[float, float]]]: (latitude, longitude) or None if the code is unknown
+        """
+        country, code = self.normalize(code, country)
+        codes, coords = self.load(country)
+
+        i = np.searchsorted(codes, code)
+        if i < len(codes) and codes[i] == code:
+            self.hits += 1
+            return float(coords[i, 0]), float(coords[i, 1])
+
+        self.misses += 1
+        return None
+
+    def lookup_many(self, codes: Iterable[str], country: str = 'IN') -> np.ndarray:
+        """
+        Fetches the co-ordinates of many postal codes of the same country in one pass.
+
+        Args
+            codes: postal codes
+            country: ISO country code
+
+        Returns
+            [np.ndarray]: (n, 2) array of (latitude, longitude), NaN rows for unknown codes
+        """
+        normalized = [self.normalize(code, country)[1] for code in codes]
+        table_codes, coords = self.load(country)
+
+        result = np.full((len(normalized), 2), np.nan)
+        if not normalized or not len(table_codes):
+            self.misses += len(normalized)
+            return result
+
+        query = np.asarray(normalized, dtype=str)
+        idx = np.searchsorted(table_codes, query)
+        idx_clipped = np.minimum(idx, len(table_codes) - 1)
+        found = (idx < len(table_codes)) & (table_codes[idx_clipped] == query)
+
+        result[found] = coords[idx_clipped[found]]
+
+        hits = int(found.sum())
+        self.hits += hits
+        self.misses += len(normalized) - hits
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns lookup counters and the size of the loaded tables."""
+        lookups = self.hits + self.misses
+        return {
+            'countries': sorted(self._tables),
+            'entries': sum(len(codes) for codes, _ in self._tables.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None
+        }
@@ -0,0 +1,171 @@
+# external imports
+import json
+import math
+import datetime
+import click
+from flask import Flask, request, abort, current_app
+from pymongo import UpdateMany
+from pymongo.collection import Collection
+from pymongo.database import Database
+from typing import Dict, List, Tuple, Optional, Any
+
+# internal imports
+from api.utils.geo import point
+from api.utils.pagination import encode_cursor, decode_cursor, keyset_filter
+
+# field $geoNear writes the distance in km to, not stored
+DISTANCE_FIELD = 'distance_km'
+
+# nearest first, _id breaks ties, e.g. between shipments picked up at the same postal code
+NEARBY_ORDER = [(DISTANCE_FIELD, 1), ('_id', 1)]
+
+def parse_nearby_args() -> Tuple[Dict[str, Any], float]:
+    """
+    Reads the centre and radius of a nearby search from ?lat=&lon=&radius= (km).
+
+    Returns
+        [Tuple[Dict[str, Any], float]]: GeoJSON Point of the centre, radius in km.
+    """
+    try:
+        latitude = float(request.args['lat'])
+        longitude = float(request.args['lon'])
+        radius_km = float(request.args.get('radius', current_app.config.get('NEARBY_DEFAULT_RADIUS_KM')))
+    except (KeyError, ValueError):
+        abort(400, 'Invalid arguments, lat and lon are required.')
+
+    if not (math.isfinite(latitude) and math.isfinite(longitude) and -90 <= latitude <= 90 and -180 <= longitude <= 180):
+        abort(400, 'Invalid lat or lon.')
+
+    if not 0 < radius_km <= current_app.config.get('NEARBY_MAX_RADIUS_KM'):
+        abort(400, f"Radius must be between 0 and {current_app.config.get('NEARBY_MAX_RADIUS_KM')} km.")
+
+    return point(latitude, longitude), radius_km
+
+def nearby_pipeline(
+    key: str,
+    centre: Dict[str, Any],
+    radius_km: float,
+    query: Dict[str, Any],
+    limit: int,
+    after: Optional[List[Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Builds the aggregation of one page of documents within radius_km of centre, nearest first.
+
+    Following pages start the $geoNear at the distance of the previous page's last document
+    (minDistance) instead of skipping the documents before it, so every page costs about the same.
+    Documents at that very distance are told apart by _id.
+
+    Args
+        key: field with the 2dsphere index, e.g. pickup_location.
+        centre: GeoJSON Point.
+        radius_km: search radius.
+        query: filter of the documents, e.g. on status.
+        limit: documents per page.
+        after: sort key (distance_km, _id) of the previous page's last document.
+
+    Returns
+        [List[Dict[str, Any]]]: aggregation pipeline.
+    """
+    geo_near = {
+        'near': centre,
+        'key': key,
+        'distanceField': DISTANCE_FIELD,
+        'distanceMultiplier': 0.001,
+        'maxDistance': radius_km * 1000,
+        'spherical': True,
+        'query': query
+    }
+    pipeline = [{ '$geoNear': geo_near }]
+
+    if after:
+        # minDistance is in meters, one meter of slack for the km round trip; the $match is exact
+        geo_near['minDistance'] = max(after[0] * 1000 - 1, 0)
+        pipeline.append({ '$match': keyset_filter(NEARBY_ORDER, after) })
+
+    pipeline += [{ '$sort': dict(NEARBY_ORDER) }, { '$limit': limit }]
+    return pipeline
+
+def nearby_page(
+    collection: Collection,
+    key: str,
+    centre: Dict[str, Any],
+    radius_km: float,
+    query: Dict[str, Any],
+    limit: int
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetches the page of a nearby search selected by ?cursor=.
+
+    Args
+        collection: collection with a 2dsphere index on key.
+        key: field with the 2dsphere index.
+        centre: GeoJSON Point.
+        radius_km: search radius.
+        query: filter of the documents.
+        limit: documents per page.
+
+    Returns
+        [Tuple[List[Dict[str, Any]], Optional[str]]]: documents with their distance_km, cursor of
+        the next page or None on the last page.
+    """
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args.get('cursor'))
+        except ValueError as e:
+            abort(400, str(e))
+
+    docs = list(collection.aggregate(nearby_pipeline(key, centre, radius_km, query, limit, after)))
+    next_cursor = encode_cursor([docs[-1][DISTANCE_FIELD], docs[-1]['_id']]) if len(docs) == limit else None
+
+    return docs, next_cursor
+
+def backfill_locations(db: Database) -> Dict[str, int]:
+    """
+    Geocodes the shipments and carriers written before they had a location: pickup_location from
+    the origin_code of shipments, location from the postal_code of carriers. One update_many per
+    postal code.
+
+    Args
+        db: mongo database
+
+    Returns
+        [Dict[str, int]]: documents updated per collection
+    """
+    # imported here, api imports this module through the routes
+    from api import geo_index
+
+    updated = {}
+    for collection, code_field, location_field in [('shipments', 'origin_code', 'pickup_location'), ('carriers', 'postal_code', 'location')]:
+        missing = { location_field: None, code_field: { '$nin': [None, ''] } }
+        codes = db[collection].distinct(code_field, missing)
+        coords = geo_index.lookup_many(codes)
+
+        # carriers are matched on their location, see api.utils.carrier_index
+        stamp = { 'updated_at': datetime.datetime.now(tz=datetime.timezone.utc) } if collection == 'carriers' else {}
+        updates = [
+            UpdateMany({ **missing, code_field: code }, { '$set': { location_field: point(*location), **stamp } })
+            for code, location in zip(codes, coords) if not math.isnan(location[0])
+        ]
+        updated[collection] = db[collection].bulk_write(updates, ordered=False).modified_count if updates else 0
+
+    return updated
+
+def register_geo_cli(app: Flask) -> None:
+    """
+    Registers the `flask geo backfill` command.
+
+    Args
+        app: flask app instance
+    """
+    from api import mongo
+
+    @app.cli.group('geo')
+    def geo_cli():
+        """Geospatial data of shipments and carriers."""
+
+    @geo_cli.command('backfill')
+    def backfill_command():
+        """Geocode the shipments and carriers that have no location yet."""
+        click.echo(json.dumps(backfill_locations(mongo.db), indent=2))
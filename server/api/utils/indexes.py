@@ -0,0 +1,234 @@
+# external imports
+import json
+import logging
+import datetime
+import click
+from bson import ObjectId
+from flask import Flask
+from pymongo.database import Database
+from pymongo.errors import PyMongoError, CollectionInvalid, OperationFailure
+from typing import Dict, List, Tuple, Any
+from pymongo import IndexModel, ASCENDING, DESCENDING, GEOSPHERE
+
+# Indexes backing every query pattern of the routes, keyed by collection
+INDEXES: Dict[str, List[IndexModel]] = {
+    'users': [
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+    ],
+    'shippers': [
+        IndexModel([('user_id', ASCENDING)], name='user_id_unique', unique=True),
+        IndexModel([('postal_code', ASCENDING)], name='postal_code'),
+    ],
+    'carriers': [
+        IndexModel([('user_id', ASCENDING)], name='user_id_unique', unique=True),
+        IndexModel([('location', GEOSPHERE)], name='location'),
+        # changes polled by the carrier index of every worker
+        IndexModel([('updated_at', ASCENDING)], name='updated_at'),
+    ],
+    'bids': [
+        # also serves the plain shipment_id filter of the feature aggregation
+        IndexModel([('shipment_id', ASCENDING), ('score', DESCENDING), ('_id', DESCENDING)], name='shipment_id_score'),
+        IndexModel([('carrier_id', ASCENDING)], name='carrier_id'),
+    ],
+    'vehicles': [
+        IndexModel([('carrier_id', ASCENDING), ('updated_at', DESCENDING), ('_id', DESCENDING)], name='carrier_id_updated_at'),
+    ],
+    'shipments': [
+        # _id completes the keyset pagination order
+        IndexModel([('shipper_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], name='shipper_id_created_at'),
+        IndexModel([('shipper_id', ASCENDING), ('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], name='shipper_id_status_created_at'),
+        # shipments of a carrier to route, and to track
+        IndexModel([('carrier_id', ASCENDING), ('status', ASCENDING)], name='carrier_id_status'),
+        # $geoNear of the nearby search, which filters on status
+        IndexModel([('pickup_location', GEOSPHERE), ('status', ASCENDING)], name='pickup_location_status'),
+    ],
+    'locations': [
+        IndexModel([('shipment_id', ASCENDING), ('timestamp', ASCENDING)], name='shipment_id_timestamp'),
+    ],
+}
+
+# Collections created as time-series collections before their indexes, keyed by collection
+TIMESERIES: Dict[str, Dict[str, str]] = {
+    'locations': { 'timeField': 'timestamp', 'metaField': 'shipment_id', 'granularity': 'seconds' },
+}
+
+# code of the error of creating a collection that exists, e.g. created by another process meanwhile
+NAMESPACE_EXISTS = 48
+
+logger = logging.getLogger(__name__)
+
+# Representative query of each route: (route, collection, filter, sort)
+_ID = ObjectId('000000000000000000000000')
+_POINT = { 'type': 'Point', 'coordinates': [77.2, 28.6] }
+ROUTE_QUERIES: List[Tuple[str, str, Dict[str, Any], List[Tuple[str, int]]]] = [
+    ('user.register / user.login', 'users', { 'email': 'someone@example.com' }, []),
+    ('shipment.create_shipment (origin/destination)', 'shippers', { 'postal_code': '110001' }, []),
+    ('shipment.create_shipment (shipper)', 'shippers', { 'user_id': _ID }, []),
+    ('shipment.add_bid (carrier)', 'carriers', { 'user_id': _ID }, []),
+    ('shipment.get_all_shipments_of_a_shipper', 'shipments', { 'shipper_id': _ID }, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('shipment.get_status_based_shipments_of_a_shipper', 'shipments', { 'shipper_id': _ID, 'status': 'waiting' }, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('shipment.get_top_bid (ranked)', 'bids', { 'shipment_id': _ID }, [('score', DESCENDING), ('_id', DESCENDING)]),
+    ('shipment.get_top_bid (backfill check)', 'bids', { 'shipment_id': _ID, 'score': { '$exists': False } }, []),
+    ('user.get_vehicles', 'vehicles', { 'carrier_id': _ID }, [('updated_at', DESCENDING), ('_id', DESCENDING)]),
+    ('services.optimize_route', 'shipments', { 'carrier_id': _ID, 'status': { '$in': ['active', 'delayed'] } }, []),
+    # $geoNear cannot be explained with find, $nearSphere uses the same index
+    ('shipment.get_nearby_shipments', 'shipments', { 'pickup_location': { '$nearSphere': { '$geometry': _POINT, '$maxDistance': 50000 } }, 'status': 'waiting' }, []),
+    ('user.get_nearby_carriers', 'carriers', { 'location': { '$nearSphere': { '$geometry': _POINT, '$maxDistance': 50000 } } }, []),
+    ('services.match_carriers (refresh)', 'carriers', { 'updated_at': { '$gte': datetime.datetime(2024, 1, 1) } }, []),
+    ('tracking.get_pings', 'locations', { 'shipment_id': _ID }, [('timestamp', ASCENDING), ('_id', ASCENDING)]),
+]
+
+def ensure_indexes(db: Database) -> Dict[str, List[str]]:
+    """
+    Creates the declared time-series collections and indexes. Collections and indexes that already
+    exist are left untouched, also when another process creates them meanwhile. A collection whose
+    indexes cannot be created (e.g. an index of the same name with other keys) is logged and left
+    out of the result, the other collections are still provisioned.
+
+    Args
+        db: mongo database
+
+    Returns
+        [Dict[str, List[str]]]: names of the indexes per collection
+    """
+    existing = set(db.list_collection_names())
+    for name, options in TIMESERIES.items():
+        if name not in existing:
+            try:
+                db.create_collection(name, timeseries=options)
+            except CollectionInvalid:
+                pass
+            except OperationFailure as e:
+                if e.code != NAMESPACE_EXISTS:
+                    raise e
+
+    created = {}
+    for name, models in INDEXES.items():
+        try:
+            created[name] = db[name].create_indexes(models)
+        except OperationFailure as e:
+            logger.warning('Could not create the indexes of %s: %s', name, e)
+    return created
+
+def check_indexes(db: Database) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Compares the declared indexes with the live database.
+
+    Args
+        db: mongo database
+
+    Returns
+        [Dict[str, Dict[str, List[str]]]]: per collection, the declared indexes that are 'missing',
+        exist with different keys or options ('mismatched') and live indexes that are not declared ('extra').
+    """
+    report = {}
+    for name, models in INDEXES.items():
+        live = db[name].index_information()
+        declared = { model.document['name']: model.document for model in models }
+
+        mismatched = []
+        for index_name, spec in declared.items():
+            info = live.get(index_name)
+            if info and (list(info['key']) != list(spec['key'].items()) or bool(info.get('unique')) != bool(spec.get('unique'))):
+                mismatched.append(index_name)
+
+        report[name] = {
+            'missing': [index_name for index_name in declared if index_name not in live],
+            'mismatched': mismatched,
+            'extra': [index_name for index_name in live if index_name != '_id_' and index_name not in declared]
+        }
+
+    return report
+
+def _plan_summary(plan: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """Flattens a winning plan into its stages and the indexes it uses."""
+    stages, index_names = [], []
+    while plan:
+        stages.append(plan.get('stage'))
+        if plan.get('indexName'):
+            index_names.append(plan['indexName'])
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0] or plan.get('queryPlan')
+    return stages, index_names
+
+def explain_queries(db: Database) -> List[Dict[str, Any]]:
+    """
+    Runs explain() on the representative query of every route.
+
+    Args
+        db: mongo database
+
+    Returns
+        [List[Dict[str, Any]]]: summary of the winning plan of every query
+    """
+    results = []
+    for route, collection, query, sort in ROUTE_QUERIES:
+        cursor = db[collection].find(query).limit(10)
+        if sort:
+            cursor = cursor.sort(sort)
+
+        explain = cursor.explain()
+        stages, index_names = _plan_summary(explain.get('queryPlanner', {}).get('winningPlan', {}))
+        stats = explain.get('executionStats', {})
+
+        results.append({
+            'route': route,
+            'collection': collection,
+            'stages': stages,
+            'indexes': index_names,
+            'collection_scan': 'COLLSCAN' in stages,
+            'keys_examined': stats.get('totalKeysExamined'),
+            'docs_examined': stats.get('totalDocsExamined'),
+            'returned': stats.get('nReturned')
+        })
+
+    return results
+
+def register_indexes(app: Flask) -> None:
+    """
+    Applies the declared indexes at startup (when MONGO_ENSURE_INDEXES is set), logs any drift
+    from the live database and registers the `flask indexes` commands. Deployments provision
+    the indexes with `flask indexes ensure` rather than in every create_app, which would wait
+    for the server selection timeout when the database is unreachable.
+
+    Args
+        app: flask app instance
+    """
+    from api import mongo
+
+    if app.config.get('MONGO_ENSURE_INDEXES'):
+        try:
+            ensure_indexes(mongo.db)
+            for collection, report in check_indexes(mongo.db).items():
+                if report['missing'] or report['mismatched']:
+                    app.logger.warning('Index drift on %s: %s', collection, report)
+        except PyMongoError as e:
+            app.logger.warning('Could not provision indexes: %s', e)
+
+    @app.cli.group('indexes')
+    def indexes_cli():
+        """Manage MongoDB indexes."""
+
+    @indexes_cli.command('ensure')
+    def ensure_command():
+        """Create the declared indexes, fails when some are still missing."""
+        click.echo(json.dumps(ensure_indexes(mongo.db), indent=2))
+        drift = { name: report for name, report in check_indexes(mongo.db).items() if report['missing'] or report['mismatched'] }
+        if drift:
+            raise click.ClickException(f'Indexes not provisioned: {json.dumps(drift)}')
+
+    @indexes_cli.command('check')
+    def check_command():
+        """Compare the declared indexes with the database."""
+        click.echo(json.dumps(check_indexes(mongo.db), indent=2))
+
+    @indexes_cli.command('explain')
+    def explain_command():
+        """Print the query plan of every route's query."""
+        for result in explain_queries(mongo.db):
+            flag = 'COLLSCAN' if result['collection_scan'] else 'ok'
+            click.echo(
+                f"[{flag:>8}] {result['route']}\n"
+                f"           {result['collection']}: {' <- '.join(filter(None, result['stages']))} "
+                f"index={','.join(result['indexes']) or '-'} keys={result['keys_examined']} "
+                f"docs={result['docs_examined']} returned={result['returned']}"
+            )
@@ -0,0 +1,523 @@
+# external imports
+import os
+import time
+import json
+import click
+import hashlib
+import logging
+import threading
+import numpy as np
+from flask import Flask
+from functools import lru_cache
+from pymongo.database import Database
+from typing import Dict, List, Tuple, Sequence, NamedTuple, Optional, Any
+
+# internal imports
+from api.utils.geo_index import PostalCodeIndex
+
+logger = logging.getLogger(__name__)
+
+# values of api.db_models.shipment_models.Mode, in the order of the hours_* fields
+MODES = ('air', 'water', 'railway', 'road')
+
+# per mode: detour over the great-circle distance, average speed in km/h, fixed hours of
+# loading, transfers and waiting; road lanes use the road distance when the table has one
+MODE_PROFILES = {
+    'air': (1.05, 650.0, 6.0),
+    'water': (1.4, 25.0, 48.0),
+    'railway': (1.2, 45.0, 12.0),
+    'road': (1.3, 40.0, 0.0),
+}
+
+# one slot of the open-addressing table, 24 bytes; key 0 marks an empty slot
+LANE_DTYPE = np.dtype(
+    [('key', '<u8'), ('distance_km', '<f4'), ('road_km', '<f4'), ('road_km_back', '<f4')]
+    + [(f'hours_{mode}', '<f2') for mode in MODES]
+)
+
+# slots per lane, linear probing stays short below half full
+LOAD_FACTOR = 0.5
+
+# odd 64-bit multiplier (golden ratio) combining the hashes of a lane's two ends
+_MIX = 0x9E3779B97F4A7C15
+_MASK = (1 << 64) - 1
+
+@lru_cache(maxsize=65536)
+def code_hash(code: str, country: str = 'IN') -> int:
+    """
+    64-bit hash of a normalized postal code, stable across processes and builds.
+
+    Args
+        code: postal code
+        country: ISO country code
+
+    Returns
+        [int]: unsigned 64-bit hash
+    """
+    country, code = PostalCodeIndex.normalize(code, country)
+    return int.from_bytes(hashlib.blake2b(f'{country}:{code}'.encode(), digest_size=8).digest(), 'little')
+
+def lane_keys(hashes1: np.ndarray, hashes2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Table keys of lanes, the same in either direction.
+
+    Args
+        hashes1: uint64 code_hash of the first ends.
+        hashes2: uint64 code_hash of the second ends.
+
+    Returns
+        [Tuple[np.ndarray, np.ndarray]]: uint64 keys, whether each lane is stored the other way
+        round (the stored direction runs from the smaller to the larger hash).
+    """
+    swapped = hashes1 > hashes2
+    lo = np.where(swapped, hashes2, hashes1)
+    hi = np.where(swapped, hashes1, hashes2)
+    keys = lo * np.uint64(_MIX) + hi # wraps around like the scalar key
+    keys[keys == 0] = 1
+    return keys, swapped
+
+def estimate_hours(distance_km, road_km=None) -> Dict[str, Any]:
+    """
+    Estimated door-to-door hours of a lane per transport mode, see MODE_PROFILES.
+
+    Args
+        distance_km: great-circle distance(s) of the lane(s).
+        road_km: road distance(s), NaN or None where unknown.
+
+    Returns
+        [Dict[str, Any]]: hours per mode, arrays when given arrays.
+    """
+    hours = {}
+    for mode, (detour, speed, fixed) in MODE_PROFILES.items():
+        km = np.multiply(distance_km, detour)
+        if mode == 'road' and road_km is not None:
+            km = np.where(np.isnan(road_km), km, road_km)
+        hours[mode] = fixed + km / speed
+    return hours
+
+class MappedTable(NamedTuple):
+    """A mapped table file, swapped as a whole when the file changes."""
+    table: np.ndarray
+    keys: np.ndarray
+    distances: np.ndarray
+    shift: int
+
+class LaneTable:
+    """
+    Precomputed distances and durations of the most frequent postal code lanes, built offline
+    from the shipments history by `flask lanes build` (see build_lane_table).
+
+    The table is a single .npy file (LANE_TABLE_PATH) holding an open-addressing hash table of
+    LANE_DTYPE slots, keyed by the hashes of the lane's two ends. It is memory-mapped, so the
+    workers of a host share one copy in the page cache, nothing is parsed at startup and a
+    lookup is a hash and, on average, one or two slot reads. Lanes not in the table are
+    computed live by the callers.
+
+    The file's mtime is checked every LANE_TABLE_RELOAD_INTERVAL seconds, so that running
+    workers map a table built (or rebuilt) after they started.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.path = None
+        self.reload_interval = 5.0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self._mapped: Optional[MappedTable] = None
+        self._mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Configures the path of the table, which is mapped on first use.
+
+        Args
+            app: flask app instance
+        """
+        self.path = app.config.get('LANE_TABLE_PATH')
+        self.reload_interval = app.config.get('LANE_TABLE_RELOAD_INTERVAL', self.reload_interval)
+        app.extensions['lane_table'] = self
+
+    def table(self) -> Optional[np.ndarray]:
+        """Returns the memory-mapped slots, None without a table file."""
+        mapped = self._current()
+        return mapped.table if mapped is not None else None
+
+    def _current(self) -> Optional[MappedTable]:
+        """The mapped table, mapped again when the file changed since the last check."""
+        if self._loaded and time.monotonic() - self._checked_at < self.reload_interval:
+            return self._mapped
+
+        with self._lock:
+            if not self._loaded or time.monotonic() - self._checked_at >= self.reload_interval:
+                self._checked_at = time.monotonic()
+                try:
+                    mtime = os.stat(self.path).st_mtime_ns if self.path else None
+                except FileNotFoundError:
+                    mtime = None
+                except OSError as e:
+                    # e.g. a network filesystem hiccup, the mapped table keeps serving
+                    logger.warning('Could not check the lane table %s: %s', self.path, e)
+                    mtime = self._mtime
+                if not self._loaded or mtime != self._mtime:
+                    self._mapped = self._load()
+                    self._mtime = mtime
+                    self._loaded = True
+            return self._mapped
+
+    def _load(self) -> Optional[MappedTable]:
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            table = np.load(self.path, mmap_mode='r')
+            capacity = len(table)
+            if table.dtype != LANE_DTYPE or capacity & (capacity - 1):
+                raise ValueError('not a lane table, rebuild it with `flask lanes build`')
+            self.loads += 1
+            return MappedTable(table, table['key'], table['distance_km'], 64 - (capacity.bit_length() - 1))
+        except Exception as e:
+            logger.warning('Could not load the lane table %s: %s', self.path, e)
+            return None
+
+    def reload(self) -> None:
+        """Maps the table file again on next use, e.g. after a build in this process."""
+        with self._lock:
+            self._loaded = False
+
+    @staticmethod
+    def _find(mapped: MappedTable, key: int) -> int:
+        """Slot of a key, -1 if the lane is not in the table."""
+        keys = mapped.keys
+        mask = len(keys) - 1
+        slot = key >> mapped.shift
+        while True:
+            stored = int(keys[slot])
+            if stored == key:
+                return slot
+            if stored == 0:
+                return -1
+            slot = (slot + 1) & mask
+
+    @staticmethod
+    def _find_many(mapped: MappedTable, keys: np.ndarray) -> np.ndarray:
+        """Vectorized _find, one probe step of every pending key at a time."""
+        mask = len(mapped.keys) - 1
+        slots = (keys >> np.uint64(mapped.shift)).astype(np.int64)
+        found = np.full(len(keys), -1, dtype=np.int64)
+        pending = np.arange(len(keys))
+
+        while len(pending):
+            stored = mapped.keys[slots[pending]]
+            hit = stored == keys[pending]
+            found[pending[hit]] = slots[pending[hit]]
+            pending = pending[~hit & (stored != 0)]
+            slots[pending] = (slots[pending] + 1) & mask
+
+        return found
+
+    def _slot(self, mapped: MappedTable, code1: str, code2: str, country1: str, country2: str) -> Tuple[int, bool]:
+        """Slot of a lane (-1 if not in the table) and whether it is stored the other way round."""
+        hash1, hash2 = code_hash(code1, country1), code_hash(code2, country2)
+        lo, hi = min(hash1, hash2), max(hash1, hash2)
+        slot = self._find(mapped, ((lo * _MIX + hi) & _MASK) or 1)
+        if slot < 0:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return slot, hash1 > hash2
+
+    def lane(self, code1: str, code2: str, country1: str = 'IN', country2: str = 'IN') -> Optional[Dict[str, Any]]:
+        """
+        Looks up a lane.
+
+        Args
+            code1: postal code of the origin
+            code2: postal code of the destination
+            country1: country code of the origin
+            country2: country code of the destination
+
+        Returns
+            [Optional[Dict[str, Any]]]: distance_km, road_km from origin to destination (None if
+            the table was built without a road graph) and hours per mode; None if not in the table
+        """
+        mapped = self._current()
+        if mapped is None:
+            return None
+
+        slot, swapped = self._slot(mapped, code1, code2, country1, country2)
+        if slot < 0:
+            return None
+
+        row = mapped.table[slot]
+        road_km = float(row['road_km_back'] if swapped else row['road_km'])
+        return {
+            'distance_km': float(row['distance_km']),
+            'road_km': None if np.isnan(road_km) else road_km,
+            'hours': { mode: float(row[f'hours_{mode}']) for mode in MODES }
+        }
+
+    def distance(self, code1: str, code2: str, country1: str = 'IN', country2: str = 'IN') -> Optional[float]:
+        """
+        Great-circle (ellipsoidal) distance of a lane, as calculate_distance computes it.
+
+        Returns
+            [Optional[float]]: kilometers, None if the lane is not in the table
+        """
+        mapped = self._current()
+        if mapped is None:
+            return None
+
+        slot, _ = self._slot(mapped, code1, code2, country1, country2)
+        return float(mapped.distances[slot]) if slot >= 0 else None
+
+    def matrix(self, codes: Sequence[Optional[str]], country: str = 'IN', road: bool = False) -> np.ndarray:
+        """
+        Distances between the postal codes of a list, e.g. of the stops of a route.
+
+        Args
+            codes: postal codes, None for points without one.
+            country: country code of the postal codes.
+            road: road distances (asymmetric) instead of great-circle ones.
+
+        Returns
+            [np.ndarray]: (n, n) distances in km, NaN for the pairs the table does not have.
+        """
+        n = len(codes)
+        matrix = np.full((n, n), np.nan)
+        np.fill_diagonal(matrix, 0.0)
+
+        known = np.asarray([k for k, code in enumerate(codes) if code], dtype=np.int64)
+        mapped = self._current()
+        if mapped is None or len(known) < 2:
+            return matrix
+
+        hashes = np.asarray([code_hash(codes[k], country) for k in known], dtype=np.uint64)
+        first, second = np.triu_indices(len(known), k=1)
+
+        # stops at the same postal code
+        same = hashes[first] == hashes[second]
+        matrix[known[first[same]], known[second[same]]] = 0.0
+        matrix[known[second[same]], known[first[same]]] = 0.0
+        first, second = first[~same], second[~same]
+
+        keys, swapped = lane_keys(hashes[first], hashes[second])
+        slots = self._find_many(mapped, keys)
+        found = slots >= 0
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+
+        rows = mapped.table[slots[found]]
+        forward = rows['road_km'] if road else rows['distance_km']
+        back = rows['road_km_back'] if road else forward
+        swapped = swapped[found]
+        i, j = known[first[found]], known[second[found]]
+        matrix[i, j] = np.where(swapped, back, forward)
+        matrix[j, i] = np.where(swapped, forward, back)
+        return matrix
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the size of the table and the hit/miss counters of this worker."""
+        mapped = self._current()
+        return {
+            'path': self.path,
+            'loaded': mapped is not None,
+            'lanes': int(np.count_nonzero(mapped.keys)) if mapped is not None else 0,
+            'capacity': len(mapped.table) if mapped is not None else 0,
+            'loads': self.loads,
+            'mtime_ns': self._mtime,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+def lane_counts(db: Database, top: int, min_count: int = 1) -> List[Tuple[str, str, int]]:
+    """
+    The most frequent lanes of the shipments history, either direction counted as one lane.
+
+    Args
+        db: database
+        top: lanes returned
+        min_count: fewest shipments of a lane
+
+    Returns
+        [List[Tuple[str, str, int]]]: (postal code, postal code, shipments), most frequent first
+    """
+    pipeline = [
+        { '$match': { 'origin_code': { '$type': 'string' }, 'destination_code': { '$type': 'string' } } },
+        { '$project': {
+            'a': { '$min': ['$origin_code', '$destination_code'] },
+            'b': { '$max': ['$origin_code', '$destination_code'] }
+        } },
+        { '$match': { '$expr': { '$ne': ['$a', '$b'] } } },
+        { '$group': { '_id': { 'a': '$a', 'b': '$b' }, 'count': { '$sum': 1 } } },
+        { '$match': { 'count': { '$gte': min_count } } },
+        { '$sort': { 'count': -1, '_id': 1 } },
+        { '$limit': top }
+    ]
+    return [(doc['_id']['a'], doc['_id']['b'], doc['count']) for doc in db.shipments.aggregate(pipeline, allowDiskUse=True)]
+
+def _road_distances(graph, coords: np.ndarray, first: np.ndarray, second: np.ndarray, batch: int = 256) -> Tuple[np.ndarray, np.ndarray]:
+    """Road km of every lane in both directions, one Dijkstra per postal code in batches of origins."""
+    forward = np.full(len(first), np.nan)
+    back = np.full(len(first), np.nan)
+    for start in range(0, len(coords), batch):
+        origins = np.arange(start, min(start + batch, len(coords)))
+        rows = graph.distances(coords[origins], coords)
+        out = (first >= start) & (first < start + batch)
+        forward[out] = rows[first[out] - start, second[out]]
+        into = (second >= start) & (second < start + batch)
+        back[into] = rows[second[into] - start, first[into]]
+    return forward, back
+
+def write_lane_table(
+    path: str,
+    codes: Sequence[str],
+    coords: np.ndarray,
+    first: np.ndarray,
+    second: np.ndarray,
+    country: str = 'IN',
+    graph=None
+) -> None:
+    """
+    Computes the distances and hours of lanes and atomically replaces the table file at path.
+
+    Args
+        path: .npy file of the table
+        codes: normalized postal codes
+        coords: (n, 2) (latitude, longitude) of the codes
+        first: index in codes of one end of every lane
+        second: index in codes of the other end
+        country: country code of the postal codes
+        graph: RoadGraph of the road distances, None to leave them out
+    """
+    from api.utils.geo import vincenty
+
+    # the stored direction runs from the end with the smaller hash
+    hashes = np.asarray([code_hash(code, country) for code in codes], dtype=np.uint64)
+    keys, swapped = lane_keys(hashes[first], hashes[second])
+    first, second = np.where(swapped, second, first), np.where(swapped, first, second)
+
+    distance = vincenty(coords[first, 0], coords[first, 1], coords[second, 0], coords[second, 1])
+    if graph is not None and len(first):
+        road_km, road_km_back = _road_distances(graph, coords, first, second)
+    else:
+        road_km = road_km_back = np.full(len(first), np.nan)
+
+    capacity = 16
+    while capacity * LOAD_FACTOR < len(first):
+        capacity *= 2
+
+    table = np.zeros(capacity, dtype=LANE_DTYPE)
+    shift, mask = 64 - (capacity.bit_length() - 1), capacity - 1
+    slots = np.empty(len(first), dtype=np.int64)
+    for k, key in enumerate(keys.tolist()):
+        slot = key >> shift
+        while table['key'][slot] != 0:
+            slot = (slot + 1) & mask
+        table['key'][slot] = key
+        slots[k] = slot
+
+    table['distance_km'][slots] = distance
+    table['road_km'][slots] = road_km
+    table['road_km_back'][slots] = road_km_back
+    for mode, hours in estimate_hours(distance, (road_km + road_km_back) / 2).items():
+        table[f'hours_{mode}'][slots] = hours
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, table)
+    os.replace(tmp, path)
+
+def build_lane_table(
+    db: Database,
+    path: str,
+    top: int,
+    min_count: int = 1,
+    country: str = 'IN',
+    graph=None
+) -> Dict[str, Any]:
+    """
+    Builds the lane table of the most frequent lanes and atomically replaces the file at path.
+
+    Args
+        db: database with the shipments history
+        path: .npy file of the table
+        top: lanes kept
+        min_count: fewest shipments of a kept lane
+        country: country code of the postal codes
+        graph: RoadGraph of the road distances, None to leave them out
+
+    Returns
+        [Dict[str, Any]]: lanes written, shipments they cover, lanes with unknown postal codes,
+        size of the file and seconds spent
+    """
+    from api import geo_index
+
+    started = time.perf_counter()
+
+    # postal codes are normalized after counting, merge the lanes that become one
+    counts: Dict[Tuple[str, str], int] = {}
+    for a, b, count in lane_counts(db, top, min_count):
+        a, b = sorted(PostalCodeIndex.normalize(code, country)[1] for code in (a, b))
+        if a != b:
+            counts[(a, b)] = counts.get((a, b), 0) + count
+
+    codes = sorted({ code for lane in counts for code in lane })
+    coords = geo_index.lookup_many(codes, country) if codes else np.empty((0, 2))
+    known = { code: location for code, location in zip(codes, coords) if not np.isnan(location[0]) }
+    lanes = [lane for lane in counts if lane[0] in known and lane[1] in known]
+    unknown = len(counts) - len(lanes)
+
+    codes = sorted({ code for lane in lanes for code in lane })
+    coords = np.asarray([known[code] for code in codes], dtype=np.float64).reshape(-1, 2)
+    position = { code: k for k, code in enumerate(codes) }
+
+    first = np.asarray([position[a] for a, _ in lanes], dtype=np.int64)
+    second = np.asarray([position[b] for _, b in lanes], dtype=np.int64)
+    write_lane_table(path, codes, coords, first, second, country, graph)
+
+    return {
+        'lanes': len(lanes),
+        'shipments': sum(counts[lane] for lane in lanes),
+        'unknown_codes': unknown,
+        'road_distances': graph is not None,
+        'bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+def register_lane_cli(app: Flask) -> None:
+    """
+    Registers the `flask lanes build` command.
+
+    Args
+        app: flask app instance
+    """
+    from api import mongo, lane_table
+    from api.utils.road_graph import load_road_graph
+
+    @app.cli.group('lanes')
+    def lanes_cli():
+        """Precomputed distances and durations of frequent lanes."""
+
+    @lanes_cli.command('build')
+    @click.option('--top', type=int, default=None, help='Lanes kept, LANE_TABLE_TOP by default.')
+    @click.option('--min-count', type=int, default=1, help='Fewest shipments of a kept lane.')
+    @click.option('--country', default='IN', help='Country of the postal codes.')
+    @click.option('--road/--no-road', default=True, help='Road distances from ROUTE_GRAPH_PATH when it is set.')
+    def build_command(top, min_count, country, road):
+        """Build the lane table (LANE_TABLE_PATH) from the shipments history."""
+        config = app.config
+        if not config.get('LANE_TABLE_PATH'):
+            raise click.UsageError('LANE_TABLE_PATH is not set.')
+
+        graph = load_road_graph(config.get('ROUTE_GRAPH_PATH')) if road else None
+        stats = build_lane_table(
+            mongo.db, config.get('LANE_TABLE_PATH'), top or config.get('LANE_TABLE_TOP'), min_count, country, graph
+        )
+        lane_table.reload()
+        click.echo(json.dumps(stats, indent=2))
@@ -0,0 +1,420 @@
+# external imports
+import os
+import json
+import glob
+import time
+import bisect
+import contextlib
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future
+from pymongo import monitoring
+from flask import Flask, Response, g, request
+from flask.json.provider import DefaultJSONProvider
+from typing import Dict, List, Tuple, Callable, Iterator, Optional, Any
+
+# parts of a request timed separately, the rest of the request time is reported as 'other'
+COMPONENTS = ['mongo', 'validation', 'serialization', 'geocoding', 'inference', 'routing']
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # seconds
+COMPONENT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5) # seconds
+
+class Breakdown:
+    """
+    Time spent per component by one request.
+
+    Components timed with `timed` are exclusive: entering one pauses the enclosing one, so that
+    e.g. the validation of a model built while serializing a document is not also counted as
+    serialization. MongoDB commands are timed by the driver (CommandTimer). Work done for the
+    request on other threads is timed on forked breakdowns, which are never shared between
+    threads and are added up when the request is recorded.
+    """
+
+    __slots__ = ('seconds', 'commands', 'children', '_stack', '_since')
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = dict.fromkeys(COMPONENTS, 0.0)
+        self.commands: List[Tuple[str, float]] = []
+        self.children: List['Breakdown'] = []
+        self._stack: List[str] = []
+        self._since = 0.0
+
+    def enter(self, component: str) -> None:
+        now = time.perf_counter()
+        if self._stack:
+            self.seconds[self._stack[-1]] += now - self._since
+        self._stack.append(component)
+        self._since = now
+
+    def exit(self) -> None:
+        now = time.perf_counter()
+        self.seconds[self._stack.pop()] += now - self._since
+        self._since = now
+
+    @contextlib.contextmanager
+    def active(self) -> Iterator['Breakdown']:
+        """Makes this the breakdown of the current context (thread or task)."""
+        token = _breakdown.set(self)
+        try:
+            yield self
+        finally:
+            _breakdown.reset(token)
+
+    def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Runs fn on this breakdown, e.g. in an executor thread which does not share the caller's context."""
+        with self.active():
+            return fn(*args, **kwargs)
+
+    def fork(self) -> 'Breakdown':
+        """Breakdown of work done for this request on another thread."""
+        child = Breakdown()
+        self.children.append(child)
+        return child
+
+    def collapse(self) -> 'Breakdown':
+        """Adds the time of the forked breakdowns to this one."""
+        children, self.children = self.children, []
+        for child in children:
+            child.collapse()
+            for component, seconds in child.seconds.items():
+                self.seconds[component] += seconds
+            self.commands.extend(child.commands)
+        return self
+
+_breakdown: contextvars.ContextVar[Optional[Breakdown]] = contextvars.ContextVar('request_breakdown', default=None)
+
+def current_breakdown() -> Optional[Breakdown]:
+    """Breakdown of the request being handled, None outside of requests or when metrics are disabled."""
+    return _breakdown.get()
+
+def timed(component: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorator adding the time spent in a function to a component of the current request.
+
+    Args
+        component: one of COMPONENTS.
+
+    Returns
+        [Callable]: decorator; outside of requests the function is called as is.
+    """
+    if component not in COMPONENTS:
+        raise ValueError(f'Unknown component {component}, use one of {COMPONENTS}.')
+
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            breakdown = _breakdown.get()
+            if breakdown is None:
+                return fn(*args, **kwargs)
+
+            breakdown.enter(component)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                breakdown.exit()
+        return wrapper
+    return decorator
+
+class RequestThreadPool(ThreadPoolExecutor):
+    """Thread pool whose tasks are timed as part of the request that submitted them."""
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        parent = _breakdown.get()
+        if parent is None:
+            return super().submit(fn, *args, **kwargs)
+        return super().submit(parent.fork().run, fn, *args, **kwargs)
+
+class CommandTimer(monitoring.CommandListener):
+    """
+    Adds the duration of every MongoDB command to the current request. Events are published on
+    the thread (or coroutine) that sent the command, so the request is found in the context.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    @staticmethod
+    def _record(event) -> None:
+        breakdown = _breakdown.get()
+        if breakdown is not None:
+            seconds = event.duration_micros / 1e6
+            breakdown.seconds['mongo'] += seconds
+            breakdown.commands.append((event.command_name, seconds))
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's json provider, with encoding counted as serialization."""
+
+    @timed('serialization')
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return super().dumps(obj, **kwargs)
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Histogram:
+    """Prometheus histogram family; per label values, the count of every bucket then the sum."""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, values: Tuple[str, ...], amount: float) -> None:
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, amount)] += 1
+        series[-1] += amount
+
+    def render(self, series: Dict[Tuple[str, ...], List[float]]) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for values, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip([*map(repr, self.buckets), '+Inf'], counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {counts[-1]!r}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {cumulative}')
+        return lines
+
+class Counter:
+    """Prometheus counter family."""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def inc(self, values: Tuple[str, ...], amount: float = 1) -> None:
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = [0]
+        series[0] += amount
+
+    def render(self, series: Dict[Tuple[str, ...], List[float]]) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for values, (count,) in sorted(series.items()):
+            lines.append(f'{self.name}{_labels(self.labels, values)} {count}')
+        return lines
+
+class RequestMetrics:
+    """
+    Per-request timing of the flask app, exposed in the Prometheus text format.
+
+    Every request gets a Breakdown of the time spent in MongoDB commands, pydantic validation,
+    serialization (models and json encoding), geocoding and model inference. Request and
+    component times are recorded in histograms labelled with the flask endpoint, and requests
+    slower than SLOW_REQUEST_MS are logged with their full breakdown, including every MongoDB
+    command. The time of streamed response bodies is not included.
+
+    The histograms are kept per process. When METRICS_DIR is set, every worker also writes them
+    to a file of that directory at most every METRICS_FLUSH_INTERVAL seconds, and METRICS_PATH
+    serves the sum over all the files, so a scrape of any gunicorn worker covers every worker.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.enabled = True
+        self.slow_request_ms = 1000.0
+        self.directory = None
+        self.flush_interval = 5.0
+        self.logger = None
+        self.listener = CommandTimer()
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Time to handle a request.', ('endpoint', 'method', 'status'), REQUEST_BUCKETS
+        )
+        self.component_duration = Histogram(
+            'http_request_component_seconds', 'Time a request spent per component.', ('endpoint', 'component'), COMPONENT_BUCKETS
+        )
+        self.mongo_commands = Counter(
+            'mongo_commands_total', 'MongoDB commands sent while handling requests.', ('endpoint', 'command')
+        )
+        self.slow_requests = Counter(
+            'http_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS.', ('endpoint',)
+        )
+        self.families = [self.request_duration, self.component_duration, self.mongo_commands, self.slow_requests]
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Registers the request hooks, the json provider and the metrics endpoint.
+        The MongoDB client must be created with `listener` in its event_listeners.
+
+        Args
+            app: flask app instance
+        """
+        self.enabled = app.config.get('METRICS_ENABLED', self.enabled)
+        self.slow_request_ms = app.config.get('SLOW_REQUEST_MS', self.slow_request_ms)
+        self.directory = app.config.get('METRICS_DIR') or None
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', self.flush_interval)
+        self.logger = app.logger
+        app.extensions['request_metrics'] = self
+
+        if not self.enabled:
+            return
+
+        if type(app.json) is DefaultJSONProvider:
+            app.json = TimedJSONProvider(app)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+        path = app.config.get('METRICS_PATH')
+        if path:
+            app.add_url_rule(path, 'metrics', self.metrics_view, methods=['GET'])
+
+    def _before_request(self) -> None:
+        g._metrics_token = _breakdown.set(Breakdown())
+        g._metrics_start = time.perf_counter()
+
+    def _after_request(self, response: Response) -> Response:
+        start = g.pop('_metrics_start', None)
+        breakdown = _breakdown.get()
+        if start is not None and breakdown is not None:
+            self.observe(
+                request.endpoint or 'unmatched', request.method, response.status_code,
+                time.perf_counter() - start, breakdown, request.full_path.rstrip('?')
+            )
+        return response
+
+    def _teardown_request(self, error: Optional[BaseException]) -> None:
+        token = g.pop('_metrics_token', None)
+        if token is not None:
+            _breakdown.reset(token)
+
+    def observe(self, endpoint: str, method: str, status: int, seconds: float, breakdown: Breakdown, target: str) -> None:
+        """
+        Records a finished request.
+
+        Args
+            endpoint: endpoint label.
+            method: http method.
+            status: response status code.
+            seconds: time to handle the request.
+            breakdown: time spent per component.
+            target: path and query string, for the slow-request log.
+        """
+        breakdown.collapse()
+        with self._lock:
+            self.request_duration.observe((endpoint, method, str(status)), seconds)
+            for component, spent in breakdown.seconds.items():
+                self.component_duration.observe((endpoint, component), spent)
+            for command, _ in breakdown.commands:
+                self.mongo_commands.inc((endpoint, command))
+
+            slow = self.slow_request_ms and seconds * 1e3 >= self.slow_request_ms
+            if slow:
+                self.slow_requests.inc((endpoint,))
+
+        if slow and self.logger:
+            self.logger.warning(
+                'Slow request %s %s (%s) %d in %.1f ms: %s', method, target, endpoint, status, seconds * 1e3,
+                self.describe(seconds, breakdown)
+            )
+
+        if self.directory and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self._try_flush()
+
+    @staticmethod
+    def describe(seconds: float, breakdown: Breakdown) -> str:
+        """Full breakdown of a request, e.g. 'mongo 12.0 ms in 2 commands [find 4.0 ms, insert 8.0 ms], validation 0.3 ms, ...'."""
+        parts = []
+        for component, spent in breakdown.seconds.items():
+            part = f'{component} {spent * 1e3:.1f} ms'
+            if component == 'mongo':
+                commands = ', '.join(f'{command} {took * 1e3:.1f} ms' for command, took in breakdown.commands)
+                part += f' in {len(breakdown.commands)} commands [{commands}]'
+            parts.append(part)
+        parts.append(f'other {max(seconds - sum(breakdown.seconds.values()), 0.0) * 1e3:.1f} ms')
+        return ', '.join(parts)
+
+    def snapshot(self) -> Dict[str, List[Tuple[List[str], List[float]]]]:
+        """Copy of every series of this process, json serializable."""
+        with self._lock:
+            return {
+                family.name: [(list(values), list(series)) for values, series in family.series.items()]
+                for family in self.families
+            }
+
+    def flush(self) -> None:
+        """Writes the series of this process to METRICS_DIR."""
+        self._flushed_at = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _try_flush(self) -> bool:
+        """Flushes, logging the error instead of raising it: metrics never fail the request they measure."""
+        try:
+            self.flush()
+            return True
+        except Exception as e:
+            if self.logger:
+                self.logger.error('Error while writing metrics to %s: %s', self.directory, e)
+            return False
+
+    def collect(self) -> Dict[str, Dict[Tuple[str, ...], List[float]]]:
+        """Series of this process, summed with those of the other workers when METRICS_DIR is set."""
+        if not self.directory:
+            snapshots = [self.snapshot()]
+        else:
+            # files of exited workers are kept, so that totals never go down
+            flushed = self._try_flush()
+            # this worker's series from memory when its file could not be written
+            snapshots = [] if flushed else [self.snapshot()]
+            own = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+                if not flushed and path == own:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        merged = { family.name: {} for family in self.families }
+        for snapshot in snapshots:
+            for name, entries in snapshot.items():
+                for values, series in entries:
+                    total = merged.setdefault(name, {}).get(tuple(values))
+                    if total is None:
+                        merged[name][tuple(values)] = list(series)
+                    else:
+                        merged[name][tuple(values)] = [a + b for a, b in zip(total, series)]
+        return merged
+
+    def render(self) -> str:
+        """Every family in the Prometheus text exposition format."""
+        merged = self.collect()
+        lines = []
+        for family in self.families:
+            lines.extend(family.render(merged.get(family.name, {})))
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self) -> Response:
+        """GET METRICS_PATH, scraped by Prometheus."""
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
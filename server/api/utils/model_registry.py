@@ -0,0 +1,142 @@
+# external imports
+import os
+import json
+import logging
+import time
+import pickle
+import threading
+from flask import Flask
+from typing import Dict, Optional, Any
+
+# internal imports
+from api.utils.scoring_backends import backend_file
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """
+    Keeps the bid-ranking model resident in the process.
+
+    The model is unpickled once (lazily, or in create_app when MODEL_PRELOAD is set) and reloaded
+    only when the mtime of the model file changes; the file is stat-ed at most once every
+    MODEL_RELOAD_INTERVAL seconds. Files ending in .joblib are loaded with mmap_mode='r' when
+    MODEL_MMAP is set, so the numpy arrays of the model are backed by the page cache and shared by
+    every worker. Loading at startup under `gunicorn --preload` additionally lets forked workers
+    share the master's copy of the model copy-on-write.
+
+    The metadata written by the training pipeline next to the model file (same name, .json
+    extension) is reloaded with it and exposed as `metadata`, None when there is no such file.
+
+    SCORING_BACKEND selects which artifact is served: the sklearn model in MODEL_FILE, or the flat
+    forest / linear model exported next to it (see api.utils.scoring_backends), which load and
+    predict without importing sklearn.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.model_dir = None
+        self.model_file = 'model.pkl'
+        self.backend = 'sklearn'
+        self.mmap = True
+        self.reload_interval = 5.0
+        self.loads = 0
+        self.metadata = None
+        self._model = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Configures the registry and optionally loads the model right away.
+
+        Args
+            app: flask app instance
+        """
+        self.model_dir = app.config.get('MODEL_DIR')
+        self.model_file = app.config.get('MODEL_FILE', self.model_file)
+        self.backend = app.config.get('SCORING_BACKEND', self.backend)
+        # fails early on an unknown backend
+        backend_file(self.model_file, self.backend)
+        self.mmap = app.config.get('MODEL_MMAP', self.mmap)
+        self.reload_interval = app.config.get('MODEL_RELOAD_INTERVAL', self.reload_interval)
+
+        if app.config.get('MODEL_PRELOAD'):
+            try:
+                self.get()
+            except Exception as e:
+                app.logger.warning('Could not preload model %s: %s', self.path, e)
+
+        app.extensions['model_registry'] = self
+
+    @property
+    def path(self) -> str:
+        """Path of the artifact of the scoring backend."""
+        return os.path.join(self.model_dir, backend_file(self.model_file, self.backend))
+
+    @property
+    def metadata_path(self) -> str:
+        """Path of the metadata file of the model."""
+        return os.path.join(self.model_dir, os.path.splitext(self.model_file)[0] + '.json')
+
+    def _load_metadata(self) -> Optional[Dict[str, Any]]:
+        """Reads the metadata file, None if the model has none."""
+        try:
+            with open(self.metadata_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _load(self, path: str) -> Any:
+        """Deserializes the model file."""
+        if path.endswith('.joblib'):
+            import joblib
+            return joblib.load(path, mmap_mode='r' if self.mmap else None)
+
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def get(self) -> Any:
+        """
+        Returns the resident model, (re)loading it if the file changed. Once a model is resident,
+        a file that cannot be stat-ed or loaded is logged and the resident model keeps serving.
+
+        Returns
+            [Any]: fitted model
+        """
+        now = time.monotonic()
+        if self._model is not None and now - self._checked_at < self.reload_interval:
+            return self._model
+
+        with self._lock:
+            path = self.path
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                if self._model is None or mtime != self._mtime:
+                    model = self._load(path)
+                    self.metadata = self._load_metadata()
+                    self._model = model
+                    self._mtime = mtime
+                    self.loads += 1
+            except Exception as e:
+                if self._model is None:
+                    raise e
+                logger.error('Could not reload model %s, serving the resident one: %s', path, e)
+            self._checked_at = now
+
+            return self._model
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns information about the resident model."""
+        return {
+            'path': self.path,
+            'loaded': self._model is not None,
+            'model': type(self._model).__name__ if self._model is not None else None,
+            'mtime_ns': self._mtime,
+            'loads': self.loads,
+            'backend': self.backend,
+            'version': (self.metadata or {}).get('version'),
+            'mmap': self.mmap and self.path.endswith('.joblib')
+        }
@@ -0,0 +1,210 @@
+# external imports
+import os
+import threading
+from flask import Flask
+from collections import deque
+from pymongo import common, monitoring, read_preferences
+from pymongo.database import Database
+from typing import Dict, Optional, Any
+
+# MONGO_READ_PREFERENCE values
+READ_PREFERENCES = {
+    'primary': read_preferences.Primary,
+    'primaryPreferred': read_preferences.PrimaryPreferred,
+    'secondary': read_preferences.Secondary,
+    'secondaryPreferred': read_preferences.SecondaryPreferred,
+    'nearest': read_preferences.Nearest,
+}
+
+def client_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pool, timeout and write concern options of the MongoDB client, from the MONGO_* settings.
+    They take precedence over the same options in MONGO_URI.
+
+    Args
+        config: app configuration.
+
+    Returns
+        [Dict[str, Any]]: keyword arguments of MongoClient / AsyncMongoClient.
+    """
+    options = {
+        'maxPoolSize': config.get('MONGO_MAX_POOL_SIZE', common.MAX_POOL_SIZE),
+        'minPoolSize': config.get('MONGO_MIN_POOL_SIZE', common.MIN_POOL_SIZE),
+        # 0 waits for a free connection until the operation's timeout
+        'waitQueueTimeoutMS': config.get('MONGO_WAIT_QUEUE_TIMEOUT_MS') or None,
+        'serverSelectionTimeoutMS': config.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000),
+        'connectTimeoutMS': config.get('MONGO_CONNECT_TIMEOUT_MS', 20000),
+    }
+
+    w = str(config.get('MONGO_WRITE_CONCERN') or '').strip()
+    if w:
+        options['w'] = int(w) if w.isdigit() else w
+    if config.get('MONGO_WRITE_TIMEOUT_MS'):
+        options['wTimeoutMS'] = config.get('MONGO_WRITE_TIMEOUT_MS')
+
+    return options
+
+def read_preference(config: Dict[str, Any]) -> read_preferences._ServerMode:
+    """
+    Read preference of the read-only GET routes.
+
+    Args
+        config: app configuration, MONGO_READ_PREFERENCE and MONGO_MAX_STALENESS_SECONDS.
+
+    Returns
+        [read_preferences._ServerMode]: read preference.
+    """
+    mode = config.get('MONGO_READ_PREFERENCE') or 'primary'
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f'Unknown read preference {mode}, use one of {list(READ_PREFERENCES)}.')
+
+    if mode == 'primary':
+        return read_preferences.Primary()
+    return READ_PREFERENCES[mode](max_staleness=config.get('MONGO_MAX_STALENESS_SECONDS') or -1)
+
+def _percentile_ms(values, q: float) -> Optional[float]:
+    """q-quantile of sorted durations in seconds, in milliseconds."""
+    return round(values[min(int(q * len(values)), len(values) - 1)] * 1e3, 3) if values else None
+
+def read_db() -> Database:
+    """
+    Database of the read-only GET routes, read with MONGO_READ_PREFERENCE. Reads from
+    secondaries can miss writes made just before.
+
+    Returns
+        [Database]: mongo.db with the read preference applied.
+    """
+    # imported here, api imports this module
+    from api import mongo, pool_monitor
+    return mongo.db.with_options(read_preference=pool_monitor.read_preference)
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Connection pool statistics of this process, per server, from the driver's CMAP events.
+
+    The pools of every client the monitor is registered with are added up per server, e.g. the
+    pools of the flask app's client and of the ASGI app's async client. Saturation (connections in
+    use over the pool size) and the number of threads waiting for a connection rise before
+    request latency does; the wait times of the last WAIT_SAMPLES check outs give its percentiles.
+    """
+
+    WAIT_SAMPLES = 1000
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.read_preference = read_preferences.Primary()
+        self._pools: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Reads the read preference of the GET routes. The MongoDB client must be created with the
+        monitor in its event_listeners.
+
+        Args
+            app: flask app instance
+        """
+        self.read_preference = read_preference(app.config)
+        app.extensions['pool_monitor'] = self
+
+    def _pool(self, address) -> Dict[str, Any]:
+        key = '%s:%s' % address
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                'max_pool_size': 0,
+                'connections': 0,
+                'in_use': 0,
+                'waiting': 0,
+                'peak_in_use': 0,
+                'peak_waiting': 0,
+                'checkouts': 0,
+                'checkout_failures': {},
+                'cleared': 0,
+                'waits': deque(maxlen=self.WAIT_SAMPLES),
+            }
+        return pool
+
+    def pool_created(self, event):
+        with self._lock:
+            # options only holds the values that differ from the driver defaults
+            self._pool(event.address)['max_pool_size'] += event.options.get('maxPoolSize', common.MAX_POOL_SIZE) or 0
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event.address)['cleared'] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event.address)['connections'] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._pool(event.address)['connections'] -= 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool['waiting'] += 1
+            pool['peak_waiting'] = max(pool['peak_waiting'], pool['waiting'])
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool['waiting'] -= 1
+            pool['checkout_failures'][event.reason] = pool['checkout_failures'].get(event.reason, 0) + 1
+            pool['waits'].append(event.duration)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool['waiting'] -= 1
+            pool['in_use'] += 1
+            pool['checkouts'] += 1
+            pool['peak_in_use'] = max(pool['peak_in_use'], pool['in_use'])
+            pool['waits'].append(event.duration)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._pool(event.address)['in_use'] -= 1
+
+    def stats(self, reset_peaks: bool = False) -> Dict[str, Any]:
+        """
+        Returns the pool statistics per server.
+
+        Args
+            reset_peaks: starts the peaks and wait samples over after reading them.
+
+        Returns
+            [Dict[str, Any]]: pid of the worker and, per server, connections open and in use,
+            threads waiting, peaks, saturation, check out counts and wait time percentiles.
+        """
+        servers = {}
+        with self._lock:
+            for key, pool in self._pools.items():
+                waits = sorted(pool['waits'])
+                size = pool['max_pool_size']
+                servers[key] = {
+                    **{ k: v for k, v in pool.items() if k not in ('waits', 'checkout_failures') },
+                    'available': pool['connections'] - pool['in_use'],
+                    'saturation': pool['in_use'] / size if size else None,
+                    'peak_saturation': pool['peak_in_use'] / size if size else None,
+                    'checkout_failures': dict(pool['checkout_failures']),
+                    'wait_ms': { 'p50': _percentile_ms(waits, 0.5), 'p99': _percentile_ms(waits, 0.99), 'max': _percentile_ms(waits, 1.0) },
+                }
+                if reset_peaks:
+                    pool['peak_in_use'], pool['peak_waiting'] = pool['in_use'], pool['waiting']
+                    pool['waits'].clear()
+
+        return { 'pid': os.getpid(), 'servers': servers }
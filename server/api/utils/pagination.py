@@ -1,7 +1,15 @@
-from flask import url_for
-from typing import Dict, Any
+import time
+import base64
+from bson import BSON
+from flask import url_for, request, abort, current_app
+from pymongo.collection import Collection
+from typing import Dict, List, Tuple, Iterator, Optional, Any
 
-def pagination_links(endpoint: str, total_count: int, page: int, per_page: int) -> Dict[str, Any]:
+# query -> (count, expiry) for count_documents results reused across requests
+_count_cache: Dict[Tuple[str, bytes], Tuple[int, float]] = {}
+_COUNT_CACHE_MAX_SIZE = 4096
+
+def pagination_links(endpoint: str, total_count: int, page: int, per_page: int, **values: Any) -> Dict[str, Any]:
     """
     Creates a dictionary containing paginated links.
 
@@ -10,22 +18,279 @@ def pagination_links(endpoint: str, total_count: int, page: int, per_page: int)
         total_count: total number of documents received from query.
         page: current page.
         per_page: number of items per page.
+        values: url variables and query arguments of the endpoint.
 
     Returns
         [Dict[str, Any]]: links dictionary.
     """
     links = {
-        'self': { 'href': url_for(endpoint, page=page, _external=True) },
-        'last': { 'href': url_for(endpoint, page=(total_count // per_page) + 1, _external=True) }
+        'self': { 'href': url_for(endpoint, page=page, _external=True, **values) },
+        'last': { 'href': url_for(endpoint, page=(total_count // per_page) + 1, _external=True, **values) }
     }
 
     if page > 1: 
         links['prev'] = {
-            'href': url_for(endpoint, page=page - 1, _external=True)
+            'href': url_for(endpoint, page=page - 1, _external=True, **values)
         }
     if page - 1 < total_count // per_page:
         links['next'] = {
-            'href': url_for(endpoint, page=page + 1, _external=True)
+            'href': url_for(endpoint, page=page + 1, _external=True, **values)
+        }
+
+    return links
+
+def encode_cursor(values: List[Any]) -> str:
+    """
+    Encodes the sort key of the last document of a page into an opaque cursor.
+
+    Args
+        values: values of the sort fields, e.g. [created_at, _id].
+
+    Returns
+        [str]: url safe cursor.
+    """
+    return base64.urlsafe_b64encode(BSON.encode({ 'v': values })).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """
+    Decodes a cursor created by encode_cursor.
+
+    Args
+        cursor: opaque cursor.
+
+    Returns
+        [List[Any]]: values of the sort fields.
+    """
+    try:
+        return BSON(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))).decode()['v']
+    except Exception:
+        raise ValueError('Invalid cursor.')
+
+def keyset_filter(sort: List[Tuple[str, int]], values: List[Any]) -> Dict[str, Any]:
+    """
+    Builds the filter matching the documents that come after `values` in `sort` order.
+    Null/missing values are handled the way MongoDB sorts them, i.e. lowest.
+
+    Args
+        sort: sort specification ending with a unique field, e.g. [('created_at', -1), ('_id', -1)].
+        values: sort key of the last document of the previous page.
+
+    Returns
+        [Dict[str, Any]]: filter document.
+    """
+    branches = []
+    for i, ((field, direction), value) in enumerate(zip(sort, values)):
+        ties = { f: v for (f, _), v in zip(sort[:i], values[:i]) }
+
+        if value is None:
+            # in descending order only ties come after null
+            if direction < 0:
+                continue
+            after = { field: { '$ne': None } }
+        elif direction < 0 and field != '_id':
+            after = { '$or': [{ field: { '$lt': value } }, { field: None }] }
+        else:
+            after = { field: { '$lt' if direction < 0 else '$gt': value } }
+
+        branches.append({ '$and': [ties, after] } if ties else after)
+
+    return { '$or': branches } if branches else { '_id': { '$exists': False } }
+
+def cached_count(collection: Collection, query: Dict[str, Any], ttl: float) -> int:
+    """
+    count_documents whose result is reused for `ttl` seconds.
+
+    Args
+        collection: collection to count in.
+        query: filter document.
+        ttl: seconds a count stays valid.
+
+    Returns
+        [int]: number of matching documents.
+    """
+    key = (collection.full_name, BSON.encode(query))
+    now = time.monotonic()
+
+    hit = _count_cache.get(key)
+    if hit and hit[1] > now:
+        return hit[0]
+
+    if len(_count_cache) >= _COUNT_CACHE_MAX_SIZE:
+        _count_cache.clear()
+
+    count = collection.count_documents(query)
+    _count_cache[key] = (count, now + ttl)
+    return count
+
+def cursor_pagination_links(endpoint: str, per_page: int, cursor: Optional[str], next_cursor: Optional[str], **values: Any) -> Dict[str, Any]:
+    """
+    Creates a dictionary containing links of cursor based pages.
+
+    Args
+        endpoint: name of the endpoint function.
+        per_page: number of items per page.
+        cursor: cursor of the current page, None for the first page.
+        next_cursor: cursor of the next page, None on the last page.
+        values: url variables and query arguments of the endpoint.
+
+    Returns
+        [Dict[str, Any]]: links dictionary.
+    """
+    values = { **values, 'pagination': 'cursor', 'per_page': per_page }
+    links = {
+        'self': { 'href': url_for(endpoint, cursor=cursor, _external=True, **values) },
+        'first': { 'href': url_for(endpoint, _external=True, **values) }
+    }
+
+    if next_cursor:
+        links['next'] = {
+            'href': url_for(endpoint, cursor=next_cursor, _external=True, **values)
         }
 
-    return links
\ No newline at end of file
+    return links
+
+class Page:
+    """
+    One page of a query. The documents are fetched lazily: iterating the page yields them as the
+    database cursor returns them, so a page never has to be held in memory. In cursor mode the
+    next link is only known once the page has been iterated.
+    """
+
+    def __init__(
+        self,
+        collection: Collection,
+        query: Dict[str, Any],
+        sort: List[Tuple[str, int]],
+        endpoint: str,
+        per_page: int,
+        mode: str,
+        total_count: Optional[int],
+        page: int = 1,
+        cursor: Optional[str] = None,
+        values: Optional[Dict[str, Any]] = None
+    ):
+        self.collection = collection
+        self.query = query
+        self.sort = sort
+        self.endpoint = endpoint
+        self.per_page = per_page
+        self.mode = mode
+        self.total_count = total_count
+        self.page = page
+        self.cursor = cursor
+        self.values = values or {}
+        self.next_cursor = None
+
+    def documents(self, batch_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the documents of the page.
+
+        Args
+            batch_size: documents per round trip to the database, bounds the memory used.
+
+        Returns
+            [Iterator[Dict[str, Any]]]: raw documents.
+        """
+        if self.mode == 'page':
+            db_cursor = self.collection.find(self.query).sort(self.sort) \
+                .skip(self.per_page * (self.page - 1)).limit(self.per_page)
+            if batch_size:
+                db_cursor = db_cursor.batch_size(batch_size)
+            yield from db_cursor
+            return
+
+        # one extra document tells whether there is a next page
+        db_cursor = self.collection.find(self._keyset_query()).sort(self.sort).limit(self.per_page + 1)
+        if batch_size:
+            db_cursor = db_cursor.batch_size(batch_size)
+
+        last = None
+        for count, doc in enumerate(db_cursor):
+            if count == self.per_page:
+                self.next_cursor = encode_cursor([last.get(field) for field, _ in self.sort])
+                break
+            last = doc
+            yield doc
+
+    def _keyset_query(self) -> Dict[str, Any]:
+        """Filter of the documents of a cursor mode page."""
+        if not self.cursor:
+            return self.query
+        return { '$and': [self.query, keyset_filter(self.sort, decode_cursor(self.cursor))] }
+
+    def prefetch_next_cursor(self) -> None:
+        """
+        Resolves the next cursor before the page is iterated, e.g. to send it in a header, by
+        reading the sort fields of the last document of the page and of the one after it.
+        """
+        if self.mode != 'cursor':
+            return
+
+        keys = list(
+            self.collection.find(self._keyset_query(), { field: 1 for field, _ in self.sort })
+            .sort(self.sort).skip(self.per_page - 1).limit(2)
+        )
+        if len(keys) == 2:
+            self.next_cursor = encode_cursor([keys[0].get(field) for field, _ in self.sort])
+
+    def links(self) -> Dict[str, Any]:
+        """Links of the page, complete once the page has been iterated."""
+        if self.mode == 'page':
+            return pagination_links(self.endpoint, self.total_count, self.page, self.per_page, **self.values)
+
+        return cursor_pagination_links(self.endpoint, self.per_page, self.cursor, self.next_cursor, **self.values)
+
+def open_page(
+    collection: Collection,
+    query: Dict[str, Any],
+    sort: List[Tuple[str, int]],
+    endpoint: str,
+    per_page: int,
+    total_count: Optional[int] = None,
+    **values: Any
+) -> Page:
+    """
+    Prepares one page of a query in the mode selected by the request arguments:
+
+        pagination=page (default): ?page=N, cost grows with N.
+        pagination=cursor: ?cursor=<opaque>, every page costs the same as the first one.
+        count=exact|cached|none: how the total is obtained; defaults to exact for page mode and
+        none for cursor mode. cached reuses counts for PAGINATION_COUNT_TTL seconds.
+
+    Args
+        collection: collection to query.
+        query: filter document.
+        sort: sort specification ending with a unique field, e.g. [('created_at', -1), ('_id', -1)].
+        endpoint: name of the endpoint function, for the links.
+        per_page: number of items per page.
+        total_count: known total, skips the count query.
+        values: url variables and query arguments of the endpoint.
+
+    Returns
+        [Page]: the page, its documents are not fetched yet.
+    """
+    cursor = request.args.get('cursor')
+    mode = request.args.get('pagination', 'cursor' if cursor else 'page')
+    count_mode = request.args.get('count', 'none' if mode == 'cursor' else 'exact')
+
+    if mode not in ['page', 'cursor'] or count_mode not in ['exact', 'cached', 'none']:
+        abort(400, 'Invalid arguments.')
+
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            abort(400, 'Invalid cursor.')
+
+    # page links need a total, a cached one is good enough
+    if mode == 'page' and count_mode == 'none':
+        count_mode = 'cached'
+
+    if total_count is None and count_mode == 'exact':
+        total_count = collection.count_documents(query)
+    elif total_count is None and count_mode == 'cached':
+        total_count = cached_count(collection, query, current_app.config.get('PAGINATION_COUNT_TTL', 30))
+
+    page = max(int(request.args.get('page', 1)), 1)
+
+    return Page(collection, query, sort, endpoint, per_page, mode, total_count, page, cursor, values)
@@ -0,0 +1,225 @@
+# external imports
+import os
+import time
+import atexit
+import logging
+import threading
+from flask import Flask
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# collection of the location pings, a time-series collection (see api.utils.indexes.TIMESERIES)
+PINGS_COLLECTION = 'locations'
+
+# duplicate key, a ping of a retried flush that was already written
+DUPLICATE_KEY = 11000
+
+class PingBuffer:
+    """
+    In-memory buffer of the location pings of this worker.
+
+    Pings are appended by the ingest route and written by a background thread every
+    TRACKING_FLUSH_INTERVAL seconds, or as soon as TRACKING_FLUSH_SIZE pings are waiting, with one
+    insert_many into the pings collection and one bulk_write updating `current_location` of each
+    shipment of the flush to its latest ping. A buffer reaching TRACKING_BUFFER_MAX pings is flushed
+    by the request adding to it, which slows clients down to the write rate of the database, and
+    turns them away while the database cannot be written.
+
+    Pings still buffered when a worker is killed are lost; a TRACKING_FLUSH_INTERVAL of 0 writes
+    the pings of every request before it is answered.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.flush_interval = 1.0
+        self.flush_size = 5000
+        self.max_size = 100000
+        self.received = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.last_flush_ms = None
+        self._pings: List[Dict[str, Any]] = []
+        # latest ping per shipment whose current_location update failed, retried by the next flush
+        self._latest: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Configures the flush interval and sizes.
+
+        Args
+            app: flask app instance
+        """
+        self.flush_interval = app.config.get('TRACKING_FLUSH_INTERVAL', self.flush_interval)
+        self.flush_size = app.config.get('TRACKING_FLUSH_SIZE', self.flush_size)
+        self.max_size = max(app.config.get('TRACKING_BUFFER_MAX', self.max_size), self.flush_size)
+        app.extensions['ping_buffer'] = self
+
+    def add(self, pings: List[Dict[str, Any]]) -> None:
+        """
+        Buffers pings for the next flush. A buffer without room for them, and with a
+        TRACKING_FLUSH_INTERVAL of 0 every buffer, is flushed before the pings are taken: when that
+        write fails none of them are buffered, so that a retry of the request cannot store them
+        twice. Once taken, a failed write only leaves them buffered for the next flush.
+
+        Args
+            pings: location documents with `_id`, `shipment_id`, `location` and `timestamp`.
+
+        Raises
+            [PyMongoError]: the buffer had to be written first and could not be, no ping was buffered.
+        """
+        if self.flush_interval:
+            self._start()
+
+        with self._lock:
+            full = len(self._pings) + len(pings) > self.max_size
+        if full or not self.flush_interval:
+            self.flush()
+
+        with self._lock:
+            self.received += len(pings)
+            self._pings.extend(pings)
+            size = len(self._pings)
+
+        if not self.flush_interval:
+            try:
+                self.flush()
+            except PyMongoError as e:
+                logger.error('Error while flushing location pings, %d kept for the next flush: %s', len(pings), e)
+        elif size >= self.flush_size:
+            self._wake.set()
+
+    def _start(self) -> None:
+        """Starts the flush thread of this process, i.e. again in a forked worker."""
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # pings buffered by the parent are flushed by the parent
+            if self._pid is not None:
+                self._pings, self._latest = [], {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='ping-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error('Error while flushing location pings: %s', e)
+
+    def flush(self) -> int:
+        """
+        Writes the buffered pings and moves `current_location` of their shipments to the latest
+        ping, at most one update per shipment. A shipment only moves to a ping newer than its
+        `location_updated_at`, so late or replayed pings do not move it back. Pings that could not
+        be written are put back into the buffer while there is room for them; shipment updates that
+        failed after the pings were written are retried without writing the pings again, as
+        time-series collections do not reject duplicate _ids.
+
+        Returns
+            [int]: number of pings written.
+        """
+        # imported here, api imports this module
+        from api import mongo
+
+        with self._flush_lock:
+            with self._lock:
+                pings, self._pings = self._pings, []
+                latest, self._latest = self._latest, {}
+            if not pings and not latest:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                if pings:
+                    mongo.db[PINGS_COLLECTION].insert_many(pings, ordered=False)
+            except BulkWriteError as e:
+                # pings of a retried flush already written to a collection with a unique _id
+                if e.details.get('writeConcernErrors') or any(
+                    error['code'] != DUPLICATE_KEY for error in e.details.get('writeErrors', [])
+                ):
+                    self._restore(pings, latest)
+                    raise
+            except PyMongoError:
+                self._restore(pings, latest)
+                raise
+
+            with self._lock:
+                self.flushed += len(pings)
+
+            for ping in pings:
+                current = latest.get(ping['shipment_id'])
+                if current is None or ping['timestamp'] >= current['timestamp']:
+                    latest[ping['shipment_id']] = ping
+
+            try:
+                mongo.db.shipments.bulk_write([
+                    UpdateOne(
+                        {
+                            '_id': sh_id,
+                            '$or': [{ 'location_updated_at': None }, { 'location_updated_at': { '$lt': ping['timestamp'] } }]
+                        },
+                        { '$set': { 'current_location': ping['_id'], 'location_updated_at': ping['timestamp'] } }
+                    )
+                    for sh_id, ping in latest.items()
+                ], ordered=False)
+            except PyMongoError:
+                # the pings are stored, only the updates are retried
+                self._restore([], latest)
+                raise
+
+            with self._lock:
+                self.flushes += 1
+                self.last_flush_ms = round((time.perf_counter() - start) * 1e3, 3)
+            return len(pings)
+
+    def _restore(self, pings: List[Dict[str, Any]], latest: Dict[Any, Dict[str, Any]]) -> None:
+        """Puts the pings and shipment updates of a failed flush back, while there is room for the pings."""
+        with self._lock:
+            self.failed_flushes += 1
+            room = max(self.max_size - len(self._pings), 0)
+            self.dropped += max(len(pings) - room, 0)
+            self._pings[:0] = pings[:room]
+            for sh_id, ping in latest.items():
+                current = self._latest.get(sh_id)
+                if current is None or ping['timestamp'] >= current['timestamp']:
+                    self._latest[sh_id] = ping
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of this worker.
+
+        Returns
+            [Dict[str, Any]]: pid, pings buffered, received, written and dropped, flush counts and
+            the duration of the last flush.
+        """
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'buffered': len(self._pings),
+                'pending_updates': len(self._latest),
+                'received': self.received,
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'flushes': self.flushes,
+                'failed_flushes': self.failed_flushes,
+                'last_flush_ms': self.last_flush_ms,
+            }
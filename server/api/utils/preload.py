@@ -0,0 +1,57 @@
+# external imports
+import time
+import importlib
+from flask import Flask
+from typing import Dict, Iterable
+
+# dependencies the api imports on first use rather than at startup
+HEAVY_MODULES = [
+    'fastapi.encoders', # jsonable_encoder of the db models
+    'geopy.distance', # calculate_distance, method=geodesic
+    'pandas', # pgeocode, model training
+    'pgeocode', # building the postal code snapshots
+    'joblib', # loading .joblib models
+    'sklearn.ensemble', # the sklearn scoring backend, training
+    'pyarrow', # parquet export and import
+]
+
+def import_modules(modules: Iterable[str]) -> Dict[str, float]:
+    """
+    Imports modules and times them.
+
+    Args
+        modules: dotted module names.
+
+    Returns
+        [Dict[str, float]]: milliseconds spent importing each module, 0 for already imported ones.
+    """
+    timings = {}
+    for module in modules:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        timings[module] = (time.perf_counter() - start) * 1e3
+    return timings
+
+def preload_dependencies(app: Flask) -> None:
+    """
+    Opt-in warm-up: imports the modules listed in PRELOAD_MODULES in create_app, so that the
+    first request of a worker does not pay for them. Under `gunicorn --preload` this happens once
+    in the master and the forked workers share the imported modules. The model (MODEL_PRELOAD)
+    and the postal codes (GEO_PRELOAD_COUNTRIES) have their own switches.
+
+    Args
+        app: flask app instance
+    """
+    modules = app.config.get('PRELOAD_MODULES', [])
+    if not modules:
+        return
+
+    try:
+        timings = import_modules(modules)
+    except ImportError as e:
+        app.logger.warning('Could not preload %s: %s', modules, e)
+        return
+
+    app.logger.info(
+        'Preloaded %s in %.0f ms', ', '.join(f'{m} ({t:.0f} ms)' for m, t in timings.items()), sum(timings.values())
+    )
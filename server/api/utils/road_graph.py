@@ -0,0 +1,143 @@
+# external imports
+import threading
+import numpy as np
+from typing import Dict, Optional
+
+# internal imports
+from api.utils.geo import haversine, EARTH_RADIUS_KM
+
+# graphs loaded by this process, by path
+_graphs: Dict[str, 'RoadGraph'] = {}
+_lock = threading.Lock()
+
+class RoadGraph:
+    """
+    Road network read from a local .npz file (ROUTE_GRAPH_PATH) with the arrays
+
+        nodes: (n, 2) float, (latitude, longitude) of the junctions
+        edges: (m, 2) int, node indices of the road segments
+        lengths: (m,) float, km
+        oneway: (m,) bool, optional, segments only drivable from the first to the second node
+
+    e.g. exported from OpenStreetMap. Points are snapped to their nearest node; the great-circle
+    distance to it is added to both ends of a leg.
+    """
+
+    def __init__(self, path: str):
+        # scipy and scikit-learn take a while to import, only routing needs them
+        from scipy.sparse import csr_matrix
+        from sklearn.neighbors import BallTree
+
+        with np.load(path) as data:
+            self.nodes = np.asarray(data['nodes'], dtype=np.float64)
+            edges = np.asarray(data['edges'], dtype=np.int64)
+            lengths = np.asarray(data['lengths'], dtype=np.float64)
+            oneway = np.asarray(data['oneway'], dtype=bool) if 'oneway' in data.files else np.zeros(len(edges), dtype=bool)
+
+        two_way = ~oneway
+        rows = np.concatenate([edges[:, 0], edges[two_way, 1]])
+        cols = np.concatenate([edges[:, 1], edges[two_way, 0]])
+        weights = np.concatenate([lengths, lengths[two_way]])
+
+        n = len(self.nodes)
+        # duplicate segments between two nodes are summed by csr_matrix, keep the shortest
+        order = np.lexsort((weights, cols, rows))
+        rows, cols, weights = rows[order], cols[order], weights[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        self.graph = csr_matrix((weights[first], (rows[first], cols[first])), shape=(n, n))
+        self.directed = bool(oneway.any())
+        self.tree = BallTree(np.radians(self.nodes), metric='haversine')
+
+    def snap(self, points: np.ndarray):
+        """
+        Finds the nearest node of every point.
+
+        Args
+            points: (k, 2) array of (latitude, longitude)
+
+        Returns
+            [Tuple[np.ndarray, np.ndarray]]: node indices, great-circle distances to them in km
+        """
+        distances, indices = self.tree.query(np.radians(points), k=1)
+        return indices[:, 0], distances[:, 0] * EARTH_RADIUS_KM
+
+    def distance_matrix(self, points: np.ndarray) -> np.ndarray:
+        """
+        Road distances between points, one Dijkstra per distinct snapped node. Pairs the graph
+        does not connect fall back to the great-circle distance.
+
+        Args
+            points: (k, 2) array of (latitude, longitude)
+
+        Returns
+            [np.ndarray]: (k, k) distances in km, asymmetric when the graph has one-way segments
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        nodes, offsets = self.snap(points)
+        unique, inverse = np.unique(nodes, return_inverse=True)
+
+        road = dijkstra(self.graph, directed=self.directed, indices=unique)[:, unique]
+        matrix = road[inverse][:, inverse] + offsets[:, None] + offsets[None, :]
+
+        unreachable = ~np.isfinite(matrix)
+        if unreachable.any():
+            lat, lon = points[:, 0], points[:, 1]
+            matrix[unreachable] = haversine(lat[:, None], lon[:, None], lat[None, :], lon[None, :])[unreachable]
+
+        np.fill_diagonal(matrix, 0.0)
+        return matrix
+
+    def distances(self, origins: np.ndarray, destinations: np.ndarray, reverse: bool = False) -> np.ndarray:
+        """
+        Road distances from every origin to every destination, one Dijkstra per distinct snapped
+        origin, e.g. to fill the rows of a matrix a lane table did not cover.
+
+        Args
+            origins: (k, 2) array of (latitude, longitude)
+            destinations: (l, 2) array of (latitude, longitude)
+            reverse: distances from the destinations to the origins instead, which only differ
+                when the graph has one-way segments.
+
+        Returns
+            [np.ndarray]: (k, l) distances in km, great-circle for pairs the graph does not connect
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        origin_nodes, origin_offsets = self.snap(origins)
+        destination_nodes, destination_offsets = self.snap(destinations)
+        unique, inverse = np.unique(origin_nodes, return_inverse=True)
+
+        graph = self.graph.T.tocsr() if reverse and self.directed else self.graph
+        road = dijkstra(graph, directed=self.directed, indices=unique)[:, destination_nodes]
+        matrix = road[inverse] + origin_offsets[:, None] + destination_offsets[None, :]
+
+        unreachable = ~np.isfinite(matrix)
+        if unreachable.any():
+            matrix[unreachable] = haversine(
+                origins[:, None, 0], origins[:, None, 1], destinations[None, :, 0], destinations[None, :, 1]
+            )[unreachable]
+
+        return matrix
+
+def load_road_graph(path: Optional[str]) -> Optional[RoadGraph]:
+    """
+    Loads the road graph of a path once per process.
+
+    Args
+        path: .npz file, see RoadGraph; empty for none.
+
+    Returns
+        [Optional[RoadGraph]]: the graph, None without a path.
+    """
+    if not path:
+        return None
+
+    graph = _graphs.get(path)
+    if graph is None:
+        with _lock:
+            graph = _graphs.get(path)
+            if graph is None:
+                graph = _graphs[path] = RoadGraph(path)
+    return graph
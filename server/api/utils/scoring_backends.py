@@ -0,0 +1,192 @@
+# external imports
+import os
+import numpy as np
+from typing import Dict, List, Any
+
+# SCORING_BACKEND values: the fitted sklearn model, the same forest evaluated over flat numpy
+# arrays, or a linear model fitted on the same training set
+SCORING_BACKENDS = ['sklearn', 'forest', 'linear']
+
+def backend_file(model_file: str, backend: str) -> str:
+    """
+    Name of the artifact of a backend, next to the sklearn model file.
+
+    Args
+        model_file: MODEL_FILE, e.g. model.joblib.
+        backend: one of SCORING_BACKENDS.
+
+    Returns
+        [str]: model.joblib for sklearn, model.forest.joblib and model.linear.joblib for the others.
+    """
+    if backend not in SCORING_BACKENDS:
+        raise ValueError(f'Unknown scoring backend {backend}, use one of {SCORING_BACKENDS}.')
+
+    if backend == 'sklearn':
+        return model_file
+    return f'{os.path.splitext(model_file)[0]}.{backend}.joblib'
+
+class ForestBackend:
+    """
+    Tree ensemble evaluated over flat numpy arrays, without sklearn.
+
+    The nodes of every tree are renumbered breadth first so that the right child of a node
+    directly follows its left child, then concatenated: one level of every (row, tree) pair is a
+    step `node = left[node] + (x > threshold[node])`. Leaves point to themselves with an infinite
+    threshold, and pairs that reached a leaf are dropped from the next levels. Predictions are
+    identical to RandomForestRegressor.predict, which also compares float32 features with float64
+    thresholds.
+    """
+
+    def __init__(self, roots, feature, threshold, left, value, depth: int, feature_names: List[str]):
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.value = value
+        self.depth = depth
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+
+    @classmethod
+    def from_sklearn(cls, model: Any) -> 'ForestBackend':
+        """
+        Exports a fitted RandomForestRegressor (or any ensemble of single output regression trees).
+
+        Args
+            model: fitted forest with estimators_.
+
+        Returns
+            [ForestBackend]: flat forest.
+        """
+        roots, feature, threshold, left, value = [], [], [], [], []
+        offset, depth = 0, 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            children_left, children_right = tree.children_left, tree.children_right
+
+            # breadth first order, siblings next to each other
+            order = [0]
+            for node in order:
+                if children_left[node] != -1:
+                    order.extend((children_left[node], children_right[node]))
+            order = np.asarray(order)
+            position = np.empty(tree.node_count, dtype=np.int64)
+            position[order] = np.arange(tree.node_count)
+
+            leaf = children_left[order] == -1
+            roots.append(offset)
+            feature.append(np.where(leaf, 0, tree.feature[order]))
+            threshold.append(np.where(leaf, np.inf, tree.threshold[order]))
+            left.append(np.where(leaf, np.arange(tree.node_count), position[np.where(leaf, 0, children_left[order])]) + offset)
+            value.append(tree.value[order, 0, 0])
+            offset += tree.node_count
+            depth = max(depth, tree.max_depth)
+
+        names = getattr(model, 'feature_names_in_', None)
+        return cls(
+            np.asarray(roots, dtype=np.intp),
+            np.concatenate(feature).astype(np.intp),
+            np.concatenate(threshold).astype(np.float64),
+            np.concatenate(left).astype(np.intp),
+            np.concatenate(value).astype(np.float64),
+            depth,
+            [] if names is None else list(names)
+        )
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Args
+            features: (n, n_features) matrix without missing values.
+
+        Returns
+            [np.ndarray]: mean of the leaf values of every tree.
+        """
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        n, n_features = features.shape
+        n_trees = len(self.roots)
+        x = features.ravel()
+
+        # one entry per (row, tree) pair still walking down
+        pairs = np.arange(n * n_trees)
+        nodes = np.tile(self.roots, n)
+        offsets = np.repeat(np.arange(n) * n_features, n_trees)
+        leaves = np.empty(n * n_trees, dtype=np.intp)
+
+        for _ in range(self.depth + 1):
+            if not len(pairs):
+                break
+            step = self.left[nodes] + (x[offsets + self.feature[nodes]] > self.threshold[nodes])
+            done = step == nodes
+            leaves[pairs[done]] = nodes[done]
+            walking = ~done
+            pairs, nodes, offsets = pairs[walking], step[walking], offsets[walking]
+
+        # summed tree by tree like sklearn, a pairwise mean rounds differently
+        values = self.value[leaves].reshape(n, n_trees)
+        total = np.zeros(n)
+        for tree in range(n_trees):
+            total += values[:, tree]
+        return total / n_trees
+
+class LinearBackend:
+    """Linear model over standardized features, fitted with least squares. Cheap fallback scorer."""
+
+    def __init__(self, mean, scale, coef, intercept: float, feature_names: List[str]):
+        self.mean = mean
+        self.scale = scale
+        self.coef = coef
+        self.intercept = intercept
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+
+    @classmethod
+    def fit(cls, features: np.ndarray, labels: np.ndarray, feature_names: List[str], alpha: float = 1.0) -> 'LinearBackend':
+        """
+        Fits a ridge regression.
+
+        Args
+            features: (n, n_features) training matrix without missing values.
+            labels: training targets.
+            feature_names: column names, checked by check_feature_schema.
+            alpha: L2 penalty on the standardized coefficients.
+
+        Returns
+            [LinearBackend]: fitted model.
+        """
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0)
+        scale[scale == 0] = 1.0
+        z = (features - mean) / scale
+
+        intercept = float(labels.mean())
+        coef = np.linalg.solve(z.T @ z + alpha * np.eye(z.shape[1]), z.T @ (labels - intercept))
+
+        return cls(mean, scale, coef, intercept, feature_names)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Args
+            features: (n, n_features) matrix without missing values.
+
+        Returns
+            [np.ndarray]: predicted scores.
+        """
+        return ((np.asarray(features, dtype=np.float64) - self.mean) / self.scale) @ self.coef + self.intercept
+
+def export_backends(model: Any, features: np.ndarray, labels: np.ndarray) -> Dict[str, Any]:
+    """
+    Builds every backend from a fitted sklearn forest and its training set.
+
+    Args
+        model: fitted RandomForestRegressor.
+        features: training matrix.
+        labels: training targets.
+
+    Returns
+        [Dict[str, Any]]: model per SCORING_BACKENDS entry.
+    """
+    names = list(getattr(model, 'feature_names_in_', []))
+    return {
+        'sklearn': model,
+        'forest': ForestBackend.from_sklearn(model),
+        'linear': LinearBackend.fit(features, labels, names),
+    }
@@ -0,0 +1,97 @@
+# external imports
+from typing import Dict, Callable, Iterator, Optional, Any
+from flask import Response, request, current_app, abort, jsonify, stream_with_context
+
+# internal imports
+from api.utils.pagination import Page
+
+# json: buffered response (default), json-stream: same body written document by document,
+# ndjson: one document per line, links in the Link header and the total in X-Total-Count
+RESPONSE_FORMATS = ['json', 'json-stream', 'ndjson']
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def response_format() -> str:
+    """
+    Reads the response format of a list endpoint from ?format= or the Accept header.
+
+    Returns
+        [str]: one of RESPONSE_FORMATS.
+    """
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'ndjson' if request.accept_mimetypes.best == NDJSON_MIMETYPE else 'json'
+
+    if fmt not in RESPONSE_FORMATS:
+        abort(400, f'Invalid format, use one of {RESPONSE_FORMATS}.')
+
+    return fmt
+
+def max_per_page(fmt: str) -> int:
+    """Largest page size of a format; streamed pages are not held in memory."""
+    return 100 if fmt == 'json' else current_app.config.get('STREAM_MAX_PER_PAGE', 1000)
+
+def list_response(
+    page: Page,
+    serialize: Callable[[Dict[str, Any]], Dict[str, Any]],
+    message: str,
+    fmt: str,
+    data_key: Optional[str] = None
+) -> Response:
+    """
+    Renders a page of a list endpoint in the requested format.
+
+    Body of json and json-stream: {message, data: [...], links, total}, or
+    {message, data: {<data_key>: [...], links, total}} when data_key is set.
+
+    Args
+        page: page opened with open_page.
+        serialize: converts a raw document to json, e.g. Shipment.serialize_document.
+        message: response message.
+        fmt: one of RESPONSE_FORMATS.
+        data_key: key of the documents inside data.
+
+    Returns
+        [Response]: flask response.
+    """
+    if fmt != 'json':
+        # links keep the format
+        page.values.setdefault('format', fmt)
+
+    if fmt == 'json':
+        docs = [serialize(doc) for doc in page.documents()]
+        body = { 'links': page.links(), 'total': page.total_count }
+        if data_key:
+            return jsonify({ 'message': message, 'data': { data_key: docs, **body } })
+        return jsonify({ 'message': message, 'data': docs, **body })
+
+    dumps = current_app.json.dumps
+    batch_size = current_app.config.get('STREAM_BATCH_SIZE', 20)
+
+    if fmt == 'ndjson':
+        def lines() -> Iterator[str]:
+            for doc in page.documents(batch_size):
+                yield dumps(serialize(doc)) + '\n'
+
+        headers = {}
+        if page.total_count is not None:
+            headers['X-Total-Count'] = str(page.total_count)
+        page.prefetch_next_cursor()
+        headers['Link'] = ', '.join(f'<{link["href"]}>; rel="{rel}"' for rel, link in page.links().items())
+
+        return Response(stream_with_context(lines()), mimetype=NDJSON_MIMETYPE, headers=headers)
+
+    def chunks() -> Iterator[str]:
+        yield '{' + dumps('message') + ':' + dumps(message) + ',' + dumps('data') + ':'
+        if data_key:
+            yield '{' + dumps(data_key) + ':'
+
+        yield '['
+        for i, doc in enumerate(page.documents(batch_size)):
+            yield (',' if i else '') + dumps(serialize(doc))
+        yield ']'
+
+        # in cursor mode the next link is known only now
+        yield ',' + dumps('links') + ':' + dumps(page.links()) + ',' + dumps('total') + ':' + dumps(page.total_count)
+        yield '}}' if data_key else '}'
+
+    return Response(stream_with_context(chunks()), mimetype='application/json')
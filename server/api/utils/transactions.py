@@ -0,0 +1,103 @@
+# external imports
+from flask import current_app
+from typing import Callable, Awaitable, Dict, Optional, TypeVar, Union, Any
+from pymongo import AsyncMongoClient
+from pymongo.client_session import ClientSession
+from pymongo.asynchronous.client_session import AsyncClientSession
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+
+# internal imports
+from api import mongo
+
+T = TypeVar('T')
+
+# transaction support of the deployments seen by this process, by id of the client
+_supported: Dict[int, bool] = {}
+
+def supports_transactions(hello: Dict[str, Any]) -> bool:
+    """
+    Tells from the reply of the `hello` command whether the deployment supports transactions:
+    replica set members report their setName and mongos routers the msg isdbgrid; a standalone
+    mongod does neither.
+
+    Args
+        hello: reply of the hello command.
+
+    Returns
+        [bool]: True for a replica set or sharded cluster.
+    """
+    return bool(hello.get('setName')) or hello.get('msg') == 'isdbgrid'
+
+def transactions_enabled() -> bool:
+    """
+    Resolves MONGO_TRANSACTIONS; with `auto` the deployment is asked once per client.
+
+    Returns
+        [bool]: True when writes should run in transactions.
+    """
+    setting = current_app.config.get('MONGO_TRANSACTIONS')
+    if setting != 'auto':
+        return bool(setting)
+
+    client = mongo.cx
+    if id(client) not in _supported:
+        _supported[id(client)] = supports_transactions(client.admin.command('hello'))
+        if not _supported[id(client)]:
+            current_app.logger.info('MongoDB is a standalone server, writes run without transactions.')
+    return _supported[id(client)]
+
+def run_in_transaction(callback: Callable[[Optional[ClientSession]], T]) -> T:
+    """
+    Runs `callback` inside a MongoDB transaction. The callback receives the session and must pass
+    it to every operation; it is retried as a whole on transient errors and the transaction is
+    aborted when it raises. With MONGO_TRANSACTIONS disabled, or set to auto against a standalone
+    mongod (which does not support transactions), the callback runs with session None.
+
+    Args
+        callback: function performing the reads and writes of the transaction.
+
+    Returns
+        [T]: value returned by the callback.
+    """
+    if not transactions_enabled():
+        return callback(None)
+
+    with mongo.cx.start_session() as session:
+        return session.with_transaction(
+            callback,
+            read_concern=ReadConcern('snapshot'),
+            write_concern=WriteConcern('majority')
+        )
+
+async def run_in_transaction_async(
+    client: AsyncMongoClient,
+    callback: Callable[[Optional[AsyncClientSession]], Awaitable[T]],
+    enabled: Union[bool, str] = True
+) -> T:
+    """
+    run_in_transaction for the ASGI app, with the async client and a coroutine callback.
+
+    Args
+        client: async mongo client.
+        callback: coroutine function performing the reads and writes of the transaction.
+        enabled: MONGO_TRANSACTIONS, runs the callback with session None when False, or when auto
+        and the deployment does not support transactions.
+
+    Returns
+        [T]: value returned by the callback.
+    """
+    if enabled == 'auto':
+        if id(client) not in _supported:
+            _supported[id(client)] = supports_transactions(await client.admin.command('hello'))
+        enabled = _supported[id(client)]
+
+    if not enabled:
+        return await callback(None)
+
+    async with client.start_session() as session:
+        return await session.with_transaction(
+            callback,
+            read_concern=ReadConcern('snapshot'),
+            write_concern=WriteConcern('majority')
+        )
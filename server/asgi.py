@@ -0,0 +1,4 @@
+from api.asgi import create_asgi_app
+from api.config import Config
+
+app = create_asgi_app(Config)
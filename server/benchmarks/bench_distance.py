@@ -0,0 +1,54 @@
+"""
+Compares the per-pair geopy loop used by calculate_distance against the vectorized
+haversine and Vincenty implementations behind calculate_distances.
+
+Usage (from the server directory)
+    python -m benchmarks.bench_distance --pairs 1000
+"""
+# external imports
+import time
+import argparse
+import numpy as np
+from geopy.distance import geodesic
+
+# internal imports
+from api.utils.geo import haversine, vincenty
+
+def timed(fn, repeat: int):
+    """Returns the best wall time of `repeat` runs and the last result."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pairs', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # random points inside India's bounding box
+    rng = np.random.default_rng(args.seed)
+    lat1, lat2 = rng.uniform(8, 34, (2, args.pairs))
+    lon1, lon2 = rng.uniform(68, 97, (2, args.pairs))
+
+    def loop():
+        return np.array([geodesic((a, b), (c, d)).kilometers for a, b, c, d in zip(lat1, lon1, lat2, lon2)])
+
+    t_loop, exact = timed(loop, args.repeat)
+    t_hav, hav = timed(lambda: haversine(lat1, lon1, lat2, lon2), args.repeat)
+    t_vin, vin = timed(lambda: vincenty(lat1, lon1, lat2, lon2), args.repeat)
+
+    print(f'{args.pairs} pairs, best of {args.repeat}')
+    print(f'{"method":<18}{"total ms":>12}{"us/pair":>12}{"speedup":>10}{"max err km":>14}')
+    for name, t, values in [('geopy loop', t_loop, exact), ('numpy haversine', t_hav, hav), ('numpy vincenty', t_vin, vin)]:
+        print(
+            f'{name:<18}{t * 1e3:>12.2f}{t / args.pairs * 1e6:>12.2f}'
+            f'{t_loop / t:>9.1f}x{np.abs(values - exact).max():>14.6f}'
+        )
+
+if __name__ == '__main__':
+    main()
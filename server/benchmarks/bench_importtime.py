@@ -0,0 +1,100 @@
+"""
+Import-time profile of create_app, from `python -X importtime`, as a cold-start regression check.
+
+Every run starts a fresh interpreter that imports the api and calls create_app(Config). The
+report lists the wall time of the median run, the imports of create_app (two levels deep) by
+cumulative time and which of the heavy dependencies (api.utils.preload.HEAVY_MODULES) were
+imported. The exit status is 1 when a forbidden module is imported or the median exceeds
+--budget-ms, so the script can gate a CI job. --preload measures a worker with PRELOAD_MODULES
+set to all of them.
+
+No database is needed: the client connects lazily and index creation is turned off.
+
+Usage (from the server directory)
+    python -m benchmarks.bench_importtime --runs 5 --top 15 --budget-ms 1500
+"""
+# external imports
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+# internal imports
+from api.utils.preload import HEAVY_MODULES
+
+CODE = '''
+import sys, json, time
+start = time.perf_counter()
+from api import create_app
+from api.config import Config
+create_app(Config)
+print(json.dumps({ 'wall_ms': (time.perf_counter() - start) * 1e3, 'modules': sorted(sys.modules) }))
+'''
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, float, float]]:
+    """
+    Parses the `-X importtime` lines.
+
+    Returns
+        [List[Tuple[str, int, float, float]]]: (module, nesting level, self ms, cumulative ms).
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), level, int(self_us) / 1e3, int(cumulative_us) / 1e3))
+    return rows
+
+def run(env: Dict[str, str]) -> Tuple[Dict, List[Tuple[str, int, float, float]]]:
+    """Runs create_app in a fresh interpreter."""
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', CODE], env=env, capture_output=True, text=True)
+    if process.returncode:
+        raise SystemExit(process.stderr[-2000:])
+    return json.loads(process.stdout.strip().splitlines()[-1]), parse_importtime(process.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--budget-ms', type=float, default=None, help='fail when the median wall time is higher')
+    parser.add_argument('--forbid', nargs='*', default=HEAVY_MODULES, help='modules create_app must not import')
+    parser.add_argument('--preload', action='store_true', help='set PRELOAD_MODULES to every heavy module')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('MONGO_URI', 'mongodb://localhost:27017/shipassure_bench')
+    env.setdefault('JWT_SECRET_KEY', 'bench')
+    env.update({ 'MONGO_ENSURE_INDEXES': 'False', 'DISTANCE_CACHE_PATH': '' })
+    if args.preload:
+        env['PRELOAD_MODULES'] = ','.join(HEAVY_MODULES)
+        args.forbid = []
+
+    results = [run(env) for _ in range(args.runs)]
+    walls = [result['wall_ms'] for result, _ in results]
+    median = statistics.median(walls)
+    result, rows = sorted(results, key=lambda r: r[0]['wall_ms'])[len(results) // 2]
+
+    print(f'create_app wall time over {args.runs} runs: median {median:.0f} ms, min {min(walls):.0f} ms, max {max(walls):.0f} ms')
+    print(f'{len(rows)} modules imported, {sum(r[2] for r in rows):.0f} ms in total')
+    print('\nimports of the median run by cumulative time, two levels deep')
+    print(f'{"cumulative ms":>14}{"self ms":>10}  module')
+    for name, level, self_ms, cumulative_ms in sorted((r for r in rows if r[1] <= 1), key=lambda r: -r[3])[:args.top]:
+        print(f'{cumulative_ms:>14.1f}{self_ms:>10.1f}  {"  " * level}{name}')
+
+    imported = set(result['modules'])
+    print('\nheavy modules: ' + ', '.join(f'{m} {"imported" if m in imported else "deferred"}' for m in HEAVY_MODULES))
+
+    failures = [f'{m} is imported by create_app' for m in args.forbid if m in imported]
+    if args.budget_ms is not None and median > args.budget_ms:
+        failures.append(f'median {median:.0f} ms is over the budget of {args.budget_ms:.0f} ms')
+
+    print('\n' + ('FAIL: ' + '; '.join(failures) if failures else 'PASS'))
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark of the lane table (api.utils.lane_table): build time and size, single lane lookups
+against the live geodesic computation of calculate_distance, and the distance matrix of a route
+whose stops are on table lanes against computing it (great-circle, or a road graph with --graph).
+
+Lanes are synthetic: every pair of --hot postal codes, the busy lanes whose stops routes are
+drawn from, plus random pairs of --codes codes up to --lanes lanes.
+
+Usage (from the server directory)
+    python -m benchmarks.bench_lanes --codes 20000 --hot 300 --lanes 200000 --lookups 100000 --stops 200
+"""
+# external imports
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from geopy.distance import geodesic
+
+# internal imports
+from api.utils.road_graph import RoadGraph
+from api.utils.lane_table import LaneTable, write_lane_table
+from api.services.route_optim import build_matrix
+
+def best_of(fn, repeat: int):
+    """Returns the best wall time of `repeat` runs and the last result."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--codes', type=int, default=20000)
+    parser.add_argument('--hot', type=int, default=300, help='codes whose pairs are all in the table')
+    parser.add_argument('--lanes', type=int, default=200000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--stops', type=int, default=200, help='stops of the route matrix')
+    parser.add_argument('--graph', help='road graph .npz, great-circle distances when omitted')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    codes = [str(code) for code in rng.choice(np.arange(100000, 1000000), size=args.codes, replace=False)]
+    coords = np.column_stack([rng.uniform(8, 34, args.codes), rng.uniform(68, 97, args.codes)])
+    graph = RoadGraph(args.graph) if args.graph else None
+
+    first, second = np.triu_indices(args.hot, k=1)
+    extra = max(args.lanes - len(first), 0)
+    a, b = rng.integers(0, args.codes, (2, 2 * extra))
+    pairs = { (int(min(x, y)), int(max(x, y))) for x, y in zip(a, b) if x != y and max(x, y) >= args.hot }
+    pairs = np.asarray(sorted(pairs)[:extra], dtype=np.int64).reshape(-1, 2)
+    first, second = np.concatenate([first, pairs[:, 0]]), np.concatenate([second, pairs[:, 1]])
+
+    path = os.path.join(tempfile.mkdtemp(), 'lanes.npy')
+    start = time.perf_counter()
+    write_lane_table(path, codes, coords, first, second, graph=graph)
+    print(f'build: {len(first)} lanes in {time.perf_counter() - start:.2f}s, {os.path.getsize(path) / 2**20:.1f} MiB')
+
+    lanes = LaneTable()
+    lanes.path = path
+    lanes.table()
+
+    picks = rng.integers(0, len(first), args.lookups)
+    hits = [(codes[first[k]], codes[second[k]]) for k in picks]
+    misses = [(codes[k], codes[k + 1]) for k in rng.integers(args.hot, args.codes - 1, args.lookups)]
+    live = [(tuple(coords[first[k]]), tuple(coords[second[k]])) for k in picks[:min(args.lookups, 10000)]]
+
+    print(f'\n{"lookup":<22}{"us/lane":>10}')
+    seconds, _ = best_of(lambda: [lanes.distance(x, y) for x, y in hits], args.repeat)
+    print(f'{"table hit":<22}{seconds / len(hits) * 1e6:>10.2f}')
+    seconds, _ = best_of(lambda: [lanes.distance(x, y) for x, y in misses], args.repeat)
+    print(f'{"table miss":<22}{seconds / len(misses) * 1e6:>10.2f}')
+    seconds, _ = best_of(lambda: [geodesic(x, y).kilometers for x, y in live], args.repeat)
+    print(f'{"live geodesic":<22}{seconds / len(live) * 1e6:>10.2f}')
+
+    stops = rng.integers(0, args.hot, args.stops)
+    points = np.vstack([[20.0, 78.0], coords[stops]])
+    stop_codes = [None] + [codes[k] for k in stops]
+
+    print(f'\nroute of {args.stops} stops + start, {"road graph " + args.graph if graph else "great-circle"}')
+    print(f'{"matrix":<22}{"ms":>10}')
+    computed_s, computed = best_of(lambda: build_matrix(points, graph), args.repeat)
+    print(f'{"computed":<22}{computed_s * 1e3:>10.2f}')
+    table_s, table = best_of(lambda: build_matrix(points, graph, stop_codes, lanes), args.repeat)
+    print(f'{"lane table":<22}{table_s * 1e3:>10.2f}')
+
+    same = np.asarray(stop_codes[1:])[:, None] == np.asarray(stop_codes[1:])[None, :]
+    off = ~np.eye(len(points), dtype=bool)
+    off[1:, 1:] &= ~same
+    print(f'max relative difference: {np.max(np.abs(table - computed)[off] / computed[off]):.2e}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Peak Python memory of GET /shipments/shipper/<id> per page size and response format.
+Buffered json grows with per_page, json-stream and ndjson stay flat.
+
+Seeds shipments with large bids arrays into a throwaway database that is dropped afterwards.
+
+Usage (from the server directory)
+    python -m benchmarks.bench_list_memory --uri mongodb://localhost:27017/shipassure_bench --shipments 1000 --bids 500
+"""
+# external imports
+import datetime
+import argparse
+import tracemalloc
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+# internal imports
+from api import create_app, mongo
+from api.config import Config
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', required=True, help='connection string including a throwaway database name')
+    parser.add_argument('--shipments', type=int, default=1000)
+    parser.add_argument('--bids', type=int, default=500, help='bid ids per shipment')
+    args = parser.parse_args()
+
+    class BenchConfig(Config):
+        MONGO_URI = args.uri
+        MONGO_ENSURE_INDEXES = False
+
+    app = create_app(BenchConfig)
+    client = app.test_client()
+
+    with app.app_context():
+        db = mongo.db
+        user_id = ObjectId()
+        shipper_id = db.shippers.insert_one({ 'user_id': user_id, 'sent_shipments': [] }).inserted_id
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        db.shipments.insert_many([{
+            'shipper_id': shipper_id, 'status': 'waiting', 'distance': 100.0, 'cargo_load': 1.0,
+            'bids': [ObjectId() for _ in range(args.bids)], 'created_at': now, 'updated_at': now
+        } for _ in range(args.shipments)])
+        headers = { 'Authorization': f'Bearer {create_access_token(identity=str(user_id))}' }
+
+        print(f'{args.shipments} shipments with {args.bids} bids each, peak KiB per request')
+        print(f'{"per_page":>10}{"json":>12}{"json-stream":>14}{"ndjson":>12}')
+        try:
+            for per_page in [10, 100, 1000]:
+                peaks = []
+                for fmt in ['json', 'json-stream', 'ndjson']:
+                    if fmt == 'json' and per_page > 100:
+                        peaks.append(None)
+                        continue
+
+                    tracemalloc.start()
+                    response = client.get(
+                        f'/shipments/shipper/{shipper_id}?pagination=cursor&per_page={per_page}&format={fmt}',
+                        headers=headers, buffered=False
+                    )
+                    # consuming the body chunk by chunk, like a socket would
+                    for _ in response.response:
+                        pass
+                    response.close()
+                    peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+                    tracemalloc.stop()
+
+                print(f'{per_page:>10}' + ''.join(
+                    f'{"-" if peak is None else f"{peak:.0f}":>{width}}' for peak, width in zip(peaks, [12, 14, 12])
+                ))
+        finally:
+            mongo.cx.drop_database(db.name)
+
+if __name__ == '__main__':
+    main()
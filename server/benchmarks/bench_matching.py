@@ -0,0 +1,120 @@
+"""
+Benchmark of the carrier index (api.utils.carrier_index) at 100k carriers: load time, latency
+of matches with and without filters against a vectorized scan of every carrier (whose results
+they must equal), and the rate of incremental updates.
+
+Carriers are synthetic, based around Indian cities with one to three modes, a rating (a fifth
+unrated) and zero to three vehicles.
+
+Usage (from the server directory)
+    python -m benchmarks.bench_matching --carriers 100000 --queries 1000 --limit 10
+"""
+# external imports
+import time
+import argparse
+import numpy as np
+from bson import ObjectId
+
+# internal imports
+from api.utils.geo import haversine
+from api.utils.carrier_index import CarrierIndex, MODE_BITS, RATING_WEIGHT, VERIFIED_WEIGHT, DISTANCE_WEIGHT, UNRATED_RATING
+
+# (latitude, longitude) of the cities the carriers and pickups are drawn around
+CITIES = np.array([
+    (28.61, 77.21), (19.08, 72.88), (12.97, 77.59), (22.57, 88.36), (13.08, 80.27),
+    (17.39, 78.49), (23.02, 72.57), (18.52, 73.86), (26.91, 75.79), (26.85, 80.95),
+])
+
+MODES = list(MODE_BITS)
+
+def make_carriers(n: int, rng: np.random.Generator):
+    """Carrier documents and the same data as columns for the scan."""
+    points = CITIES[rng.integers(0, len(CITIES), n)] + rng.normal(0, 1.5, (n, 2))
+    rating = np.where(rng.random(n) < 0.2, np.nan, np.round(rng.uniform(1, 5, n), 1))
+    vehicles = rng.integers(0, 4, n)
+    verified = rng.random(n) < 0.1
+    modes = [list(rng.choice(MODES, size=rng.integers(1, 4), replace=False)) for _ in range(n)]
+
+    docs = [
+        {
+            '_id': ObjectId(),
+            'modes': modes[k],
+            'rating': None if np.isnan(rating[k]) else float(rating[k]),
+            'vehicles': [ObjectId() for _ in range(vehicles[k])],
+            'verified': bool(verified[k]),
+            'location': { 'type': 'Point', 'coordinates': [float(points[k, 1]), float(points[k, 0])] }
+        }
+        for k in range(n)
+    ]
+    mode_bits = np.asarray([sum(1 << MODE_BITS[mode] for mode in m) for m in modes])
+    return docs, { 'points': points, 'rating': rating, 'vehicles': vehicles, 'verified': verified, 'modes': mode_bits }
+
+def scan(columns, latitude, longitude, limit, radius_km, modes, min_rating):
+    """Top scores of every eligible carrier, computed over all of them."""
+    distance = haversine(latitude, longitude, columns['points'][:, 0], columns['points'][:, 1])
+    ok = (distance <= radius_km) & (columns['vehicles'] > 0)
+    if modes:
+        ok &= (columns['modes'] & sum(1 << MODE_BITS[mode] for mode in modes)) > 0
+    if min_rating is not None:
+        ok &= columns['rating'] >= min_rating
+
+    score = (
+        RATING_WEIGHT * np.where(np.isnan(columns['rating']), UNRATED_RATING, columns['rating']) / 5
+        + VERIFIED_WEIGHT * columns['verified'] + DISTANCE_WEIGHT * (1 - distance / radius_km)
+    )[ok]
+    return np.sort(score)[::-1][:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--carriers', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    docs, columns = make_carriers(args.carriers, rng)
+
+    index = CarrierIndex()
+    index.load(docs)
+    stats = index.stats()
+    print(f"load: {stats['carriers']} carriers ({stats['matchable']} matchable) in {stats['load_seconds']:.2f}s, {stats['buckets']} buckets")
+
+    pickups = CITIES[rng.integers(0, len(CITIES), args.queries)] + rng.normal(0, 1.0, (args.queries, 2))
+    cases = [
+        ('any carrier, 200 km', 200.0, None, None),
+        ('road, rating >= 4', 200.0, ['road'], 4.0),
+        ('air or water, 500 km', 500.0, ['air', 'water'], None),
+        ('any carrier, 50 km', 50.0, None, None),
+    ]
+
+    print(f'\n{"query":<24}{"p50 ms":>9}{"p99 ms":>9}{"scan p50":>10}{"speedup":>9}')
+    for name, radius_km, modes, min_rating in cases:
+        index_ms, scan_ms = [], []
+        for latitude, longitude in pickups:
+            start = time.perf_counter()
+            found = index.match(latitude, longitude, args.limit, radius_km, modes, min_rating)
+            index_ms.append((time.perf_counter() - start) * 1e3)
+
+            start = time.perf_counter()
+            expected = scan(columns, latitude, longitude, args.limit, radius_km, modes, min_rating)
+            scan_ms.append((time.perf_counter() - start) * 1e3)
+
+            got = np.asarray([candidate['score'] for candidate in found])
+            assert len(got) == len(expected) and np.allclose(got, np.round(expected, 4), atol=1e-4), 'index and scan differ'
+
+        p50, p99, scan_p50 = np.percentile(index_ms, 50), np.percentile(index_ms, 99), np.percentile(scan_ms, 50)
+        print(f'{name:<24}{p50:>9.2f}{p99:>9.2f}{scan_p50:>10.2f}{scan_p50 / p50:>8.1f}x')
+
+    updates = [docs[k] for k in rng.integers(0, len(docs), args.updates)]
+    for doc in updates:
+        doc['rating'] = float(np.round(rng.uniform(1, 5), 1))
+    start = time.perf_counter()
+    for doc in updates:
+        index.upsert(doc)
+    elapsed = time.perf_counter() - start
+    print(f'\nupdates: {args.updates / elapsed:,.0f}/s ({elapsed / args.updates * 1e6:.1f} us each)')
+
+if __name__ == '__main__':
+    main()
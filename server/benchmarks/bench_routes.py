@@ -0,0 +1,88 @@
+"""
+Benchmark of the route optimizer (api.services.route_optim): time and route length at 10, 100
+and 1000 stops, nearest-neighbour construction against the 2-opt/or-opt improvement, and a batch
+of routes solved in-process against the process pool.
+
+Stops are pickup/delivery pairs drawn around Indian cities, each pickup constrained before its
+delivery, with a fixed start. Distances are great-circle unless --graph points to a road graph
+(see api.utils.road_graph), in which case building the matrix is timed too.
+
+Usage (from the server directory)
+    python -m benchmarks.bench_routes --stops 10 100 1000 --repeat 3 --batch 32 --batch-stops 100 --processes 1 4
+"""
+# external imports
+import time
+import argparse
+import numpy as np
+from typing import Dict, Any
+
+# internal imports
+from api.utils.road_graph import RoadGraph
+from api.services.route_optim import build_matrix, solve_route, solve_routes
+
+# (latitude, longitude) of the cities the stops are drawn around
+CITIES = np.array([
+    (28.61, 77.21), (19.08, 72.88), (12.97, 77.59), (22.57, 88.36), (13.08, 80.27),
+    (17.39, 78.49), (23.02, 72.57), (18.52, 73.86), (26.91, 75.79), (26.85, 80.95),
+])
+
+def make_problem(stops: int, rng: np.random.Generator, time_limit: float, graph=None) -> Dict[str, Any]:
+    """A start followed by (stops - 1) // 2 pickup/delivery pairs."""
+    pairs = max((stops - 1) // 2, 1)
+    cities = rng.integers(0, len(CITIES), size=2 * pairs)
+    points = np.vstack([CITIES[0], CITIES[cities] + rng.normal(0, 0.3, size=(2 * pairs, 2))])
+
+    before = [-1] * len(points)
+    for pair in range(pairs):
+        before[2 + 2 * pair] = 1 + 2 * pair
+
+    return { 'matrix': build_matrix(points, graph), 'before': before, 'start': 0, 'time_limit': time_limit }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stops', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=3, help='problems per size')
+    parser.add_argument('--time-limit', type=float, default=30.0, help='seconds of improvement per route')
+    parser.add_argument('--graph', help='road graph .npz, great-circle distances when omitted')
+    parser.add_argument('--batch', type=int, default=32, help='routes of the batch run, 0 to skip it')
+    parser.add_argument('--batch-stops', type=int, default=100, help='stops per route of the batch run')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    graph = RoadGraph(args.graph) if args.graph else None
+
+    print(f'distances: {"road graph " + args.graph if graph else "great-circle"}, {args.repeat} problems per size')
+    print(f'{"stops":>6}{"matrix ms":>11}{"nn km":>11}{"km":>11}{"saved":>8}{"2-opt":>8}{"or-opt":>8}{"solve ms":>11}')
+    for stops in args.stops:
+        rows = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            problem = make_problem(stops, rng, args.time_limit, graph)
+            matrix_ms = (time.perf_counter() - start) * 1e3
+
+            result = solve_route(problem)
+            rows.append((
+                matrix_ms, result['initial_km'], result['distance_km'],
+                result['two_opt_moves'], result['or_opt_moves'], result['seconds'] * 1e3
+            ))
+
+        matrix_ms, initial_km, distance_km, two_opt, or_opt, solve_ms = np.mean(rows, axis=0)
+        print(
+            f'{stops:>6}{matrix_ms:>11.2f}{initial_km:>11.0f}{distance_km:>11.0f}{1 - distance_km / initial_km:>8.1%}'
+            f'{two_opt:>8.0f}{or_opt:>8.0f}{solve_ms:>11.1f}'
+        )
+
+    if args.batch:
+        problems = [make_problem(args.batch_stops, rng, args.time_limit, graph) for _ in range(args.batch)]
+        print(f'\nbatch of {args.batch} routes of {args.batch_stops} stops')
+        print(f'{"processes":>10}{"seconds":>10}{"routes/s":>10}')
+        for processes in args.processes:
+            start = time.perf_counter()
+            solve_routes(problems, processes, min_parallel_stops=0)
+            elapsed = time.perf_counter() - start
+            print(f'{processes:>10}{elapsed:>10.2f}{args.batch / elapsed:>10.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Latency and memory of every SCORING_BACKEND on the same bids.
+
+Trains the model on the seeded synthetic dataset of bench_training, exports all backends into a
+temporary MODEL_DIR, then scores the same bids with each backend in a fresh interpreter so that
+the import and load cost (sklearn is only imported by the sklearn backend) and the resident
+memory are measured separately. Scores are compared with the sklearn model's.
+
+Usage (from the server directory)
+    python -m benchmarks.bench_scoring --shipments 3000 --n-estimators 100 --bids 1000
+"""
+# external imports
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+
+def rss_mib() -> float:
+    """Current resident set size, in MiB."""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+def child(backend: str, model_dir: str, repeat: int) -> None:
+    """Loads one backend through the registry, scores the bids and prints the measurements as json."""
+    from api.utils.model_registry import ModelRegistry
+
+    rss_before = rss_mib()
+    registry = ModelRegistry()
+    registry.model_dir, registry.model_file, registry.backend = model_dir, 'model.joblib', backend
+
+    start = time.perf_counter()
+    model = registry.get()
+    load_ms = (time.perf_counter() - start) * 1e3
+    rss_after = rss_mib()
+
+    features = np.load(os.path.join(model_dir, 'bids.npy'))
+    model.predict(features)
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scores = model.predict(features)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    model.predict(features)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    np.save(os.path.join(model_dir, f'scores.{backend}.npy'), scores)
+    print(json.dumps({
+        'load_ms': load_ms,
+        'rss_load_mib': rss_after - rss_before,
+        'predict_ms_per_1k': best * 1e3 / len(features) * 1000,
+        'predict_peak_kib': peak / 1024,
+        'sklearn_imported': 'sklearn' in sys.modules,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shipments', type=int, default=3000)
+    parser.add_argument('--n-estimators', type=int, default=100)
+    parser.add_argument('--max-depth', type=int, default=None)
+    parser.add_argument('--bids', type=int, default=1000, help='bids scored per call')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--model-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.child, args.model_dir, args.repeat)
+
+    from api.utils.scoring_backends import SCORING_BACKENDS
+    from api.services.training import train_model, save_artifact, activate_artifact
+    from benchmarks.bench_training import synthetic_dataset
+
+    features, labels, groups = synthetic_dataset(args.shipments, args.seed)
+    params = { 'n_estimators': args.n_estimators, 'max_depth': args.max_depth, 'n_jobs': -1, 'seed': args.seed }
+    models, metrics = train_model(features, labels, groups, **params)
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        path, metadata = save_artifact(models, metrics, params, model_dir, 'synthetic')
+        activate_artifact(path, model_dir, 'model.joblib')
+        np.save(os.path.join(model_dir, 'bids.npy'), np.resize(features, (args.bids, features.shape[1])))
+
+        print(f'{args.bids} bids per call, {args.n_estimators} trees, best of {args.repeat}')
+        print(
+            f'{"backend":<10}{"load ms":>10}{"load RSS MiB":>14}{"ms/1k bids":>12}{"peak KiB":>10}'
+            f'{"size KiB":>10}{"top1":>8}{"max |diff|":>12}  sklearn imported'
+        )
+        for backend in SCORING_BACKENDS:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_scoring', '--child', backend, '--model-dir', model_dir, '--repeat', str(args.repeat)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            backend_metrics = metadata['metrics']['backends'][backend]
+            diff = np.abs(
+                np.load(os.path.join(model_dir, f'scores.{backend}.npy')) - np.load(os.path.join(model_dir, 'scores.sklearn.npy'))
+            ).max()
+
+            print(
+                f'{backend:<10}{result["load_ms"]:>10.1f}{result["rss_load_mib"]:>14.1f}{result["predict_ms_per_1k"]:>12.2f}'
+                f'{result["predict_peak_kib"]:>10.0f}{backend_metrics["size_bytes"] / 1024:>10.0f}'
+                f'{backend_metrics["top1_accuracy"]:>8.3f}{diff:>12.2e}  {result["sklearn_imported"]}'
+            )
+
+if __name__ == '__main__':
+    main()
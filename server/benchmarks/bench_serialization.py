@@ -0,0 +1,110 @@
+"""
+Microbenchmarks of the serialization of every db model: the previous model_dump-then-loop
+to_json, the compiled to_json of a validated model, and serialize_document (trusted read,
+no validation).
+
+Usage (from the server directory)
+    python -m benchmarks.bench_serialization --repeat 5 --number 2000
+"""
+# external imports
+import json
+import time
+import argparse
+import datetime
+from bson import ObjectId
+from typing import Dict, Any
+from flask.json.provider import DefaultJSONProvider
+
+# internal imports
+from api.db_models.vehicle_models import Vehicle
+from api.db_models.user_models import User, Shipper, Carrier
+from api.db_models.shipment_models import Shipment, Bid, Impediment, Location, Route
+
+NOW = datetime.datetime(2025, 1, 6, 10, 30)
+
+# representative documents as they come out of the database
+DOCUMENTS = {
+    User: {
+        '_id': ObjectId(), 'role': 'shipper', 'shipper_id': ObjectId(), 'email': 'someone@example.com',
+        'first_name': 'Some', 'last_name': 'One', 'country': 'IN', 'hashed_password': 'scrypt:32768:8:1$x', 'created_at': NOW
+    },
+    Shipper: {
+        '_id': ObjectId(), 'user_id': ObjectId(), 'type': 'small business', 'org_name': 'Org', 'address': 'Street 1',
+        'industry': 'textiles', 'postal_code': '110001', 'sent_shipments': [ObjectId() for _ in range(50)]
+    },
+    Carrier: {
+        '_id': ObjectId(), 'user_id': ObjectId(), 'type': 'large business', 'modes': ['road', 'railway'],
+        'vehicles': [ObjectId() for _ in range(20)], 'bids': [ObjectId() for _ in range(200)], 'delivered_shipments': []
+    },
+    Vehicle: {
+        '_id': ObjectId(), 'carrier_id': ObjectId(), 'age': 3, 'registration_number': 'DL01AB1234',
+        'is_rented': False, 'updated_at': NOW
+    },
+    Shipment: {
+        '_id': ObjectId(), 'shipper_id': ObjectId(), 'status': 'waiting', 'origin_code': '110001', 'destination_code': '400001',
+        'distance': 1150.2, 'cargo_load': 12.5, 'bids': [ObjectId() for _ in range(30)], 'top_bid': ObjectId(),
+        'top_bid_score': 0.93, 'impediments': [ObjectId() for _ in range(2)], 'created_at': NOW, 'updated_at': NOW
+    },
+    Bid: {
+        '_id': ObjectId(), 'carrier_id': ObjectId(), 'shipment_id': ObjectId(), 'proposed_price': 25000.0,
+        'proposed_vehicle': ObjectId(), 'proposed_delivery_date': NOW, 'score': 0.81, 'created_at': NOW
+    },
+    Impediment: {
+        '_id': ObjectId(), 'type': 'weather', 'delay_caused': datetime.timedelta(hours=5), 'occurred_at': NOW
+    },
+    Location: {
+        '_id': ObjectId(), 'location': [28.61, 77.2], 'timestamp': NOW
+    },
+    Route: {
+        '_id': ObjectId(), 'path': [[28.61 + i / 100, 77.2 + i / 100] for i in range(100)], 'distance': 1150.2,
+        'estimated_duration': datetime.timedelta(hours=20)
+    },
+}
+
+def legacy_to_json(model) -> Dict[str, Any]:
+    """to_json as it was before the compiled serializer."""
+    data = model.model_dump(by_alias=True)
+
+    for key, value in data.items():
+        if isinstance(value, ObjectId):
+            data[key] = str(value)
+
+    return data
+
+def timed(fn, repeat: int, number: int) -> float:
+    """Returns the best time per call in microseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f'us per document, best of {args.repeat} x {args.number}')
+    print(f'{"model":<12}{"legacy":>10}{"compiled":>10}{"trusted":>10}{"speedup":>10}  legacy jsonify')
+    for cls, doc in DOCUMENTS.items():
+        t_legacy = timed(lambda: legacy_to_json(cls(**doc)), args.repeat, args.number)
+        t_compiled = timed(lambda: cls(**doc).to_json(), args.repeat, args.number)
+        t_trusted = timed(lambda: cls.serialize_document(doc, trusted=True), args.repeat, args.number)
+
+        # the legacy output leaves nested ObjectIds and timedeltas to jsonify, which cannot encode them
+        try:
+            json.dumps(legacy_to_json(cls(**doc)), default=DefaultJSONProvider.default)
+            legacy_ok = 'ok'
+        except TypeError as e:
+            legacy_ok = f'fails: {e}'
+
+        print(
+            f'{cls.__name__:<12}{t_legacy:>10.2f}{t_compiled:>10.2f}{t_trusted:>10.2f}'
+            f'{t_legacy / t_trusted:>9.1f}x  {legacy_ok}'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Throughput of location ping ingestion in pings per second: one insert_one and one update_one of
+`current_location` per ping against POST /tracking/pings, with the pings of each request written
+before it is answered (TRACKING_FLUSH_INTERVAL=0) and buffered by the worker.
+
+Each request carries --batch pings spread over --shipments shipments of one carrier. The
+buffered run is timed until the buffer is drained, so its rate is the rate the database accepts
+the pings at, not the rate the requests are answered at. The number of MongoDB commands per
+1000 pings shows the round trips saved by insert_many and the single update per shipment and flush.
+
+Creates the pings as a time-series collection (MongoDB 5.0 or later) in a throwaway database
+that is dropped afterwards.
+
+Usage (from the server directory)
+    python -m benchmarks.bench_tracking --uri mongodb://localhost:27017/shipassure_load --pings 100000 --batch 500 --threads 1 8
+"""
+# external imports
+import time
+import argparse
+import datetime
+import threading
+import numpy as np
+from bson import ObjectId
+from pymongo import monitoring
+from concurrent.futures import ThreadPoolExecutor
+from flask_jwt_extended import create_access_token
+
+# internal imports
+from api import create_app, mongo, ping_buffer
+from api.config import Config
+from api.utils.indexes import ensure_indexes
+from api.utils.ping_buffer import PINGS_COLLECTION
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands sent to the server, i.e. the network round trips."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def make_batches(shipment_ids, pings: int, batch: int):
+    """Request bodies of `pings` pings in total, timestamps increasing per shipment."""
+    rng = np.random.default_rng(0)
+    start = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1)
+    batches = []
+    for first in range(0, pings, batch):
+        batches.append([
+            {
+                'shipment_id': str(shipment_ids[i % len(shipment_ids)]),
+                'location': [float(rng.uniform(8, 35)), float(rng.uniform(68, 97))],
+                'timestamp': (start + datetime.timedelta(seconds=i)).isoformat()
+            }
+            for i in range(first, min(first + batch, pings))
+        ])
+    return batches
+
+def per_ping_write(body) -> None:
+    """The per-ping sequence this benchmark compares against, without the HTTP layer."""
+    db = mongo.db
+    for item in body:
+        ping = {
+            '_id': ObjectId(),
+            'shipment_id': ObjectId(item['shipment_id']),
+            'location': item['location'],
+            'timestamp': datetime.datetime.fromisoformat(item['timestamp'])
+        }
+        db[PINGS_COLLECTION].insert_one(ping)
+        db.shipments.update_one(
+            { '_id': ping['shipment_id'] },
+            { '$set': { 'current_location': ping['_id'], 'location_updated_at': ping['timestamp'] } }
+        )
+
+def run(name, fn, batches, counter, threads, drain=False) -> None:
+    """Sends every batch through fn on `threads` threads and prints one report line."""
+    pings = sum(len(body) for body in batches)
+    latencies = np.empty(len(batches))
+
+    def call(i):
+        start = time.perf_counter()
+        fn(batches[i])
+        latencies[i] = time.perf_counter() - start
+
+    commands = counter.count
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(call, range(len(batches))))
+    if drain:
+        ping_buffer.flush()
+    elapsed = time.perf_counter() - start
+    commands = counter.count - commands
+
+    print(
+        f'{name:<10}{threads:>8}{commands * 1000 / pings:>16.1f}{np.percentile(latencies, 50) * 1e3:>10.2f}'
+        f'{np.percentile(latencies, 99) * 1e3:>10.2f}{pings / elapsed:>12.0f}'
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', required=True, help='connection string including a throwaway database name')
+    parser.add_argument('--pings', type=int, default=100000, help='pings per run')
+    parser.add_argument('--batch', type=int, default=500, help='pings per request')
+    parser.add_argument('--shipments', type=int, default=200, help='shipments the pings are spread over')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='TRACKING_FLUSH_INTERVAL of the buffered run')
+    parser.add_argument('--flush-size', type=int, default=5000, help='TRACKING_FLUSH_SIZE of the buffered run')
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    monitoring.register(counter) # must happen before the client is created
+
+    class LoadConfig(Config):
+        MONGO_URI = args.uri
+        MONGO_ENSURE_INDEXES = False
+        TRACKING_BATCH_MAX = max(args.batch, Config.TRACKING_BATCH_MAX)
+        TRACKING_FLUSH_INTERVAL = args.flush_interval
+        TRACKING_FLUSH_SIZE = args.flush_size
+
+    app = create_app(LoadConfig)
+    client = app.test_client()
+
+    with app.app_context():
+        db = mongo.db
+        try:
+            ensure_indexes(db)
+
+            carrier_user_id = ObjectId()
+            carrier_id = db.carriers.insert_one({ 'user_id': carrier_user_id, 'bids': [] }).inserted_id
+            shipment_ids = db.shipments.insert_many([
+                { 'carrier_id': carrier_id, 'status': 'active' } for _ in range(args.shipments)
+            ]).inserted_ids
+            headers = { 'Authorization': f'Bearer {create_access_token(identity=str(carrier_user_id))}' }
+            batches = make_batches(shipment_ids, args.pings, args.batch)
+
+            def post(body):
+                response = client.post('/tracking/pings', json={ 'pings': body }, headers=headers)
+                assert response.status_code == 202, response.get_json()
+
+            print(f'{args.pings} pings per run, {args.batch} per request over {args.shipments} shipments')
+            print(f'{"path":<10}{"threads":>8}{"commands/1k":>16}{"p50 ms":>10}{"p99 ms":>10}{"pings/s":>12}')
+            for threads in args.threads:
+                run('per-ping', per_ping_write, batches, counter, threads)
+
+                ping_buffer.flush_interval = 0
+                run('sync', post, batches, counter, threads)
+
+                ping_buffer.flush_interval = args.flush_interval
+                run('buffered', post, batches, counter, threads, drain=True)
+
+            stats = ping_buffer.stats()
+            print(f'buffer: {stats["flushes"]} flushes, {stats["failed_flushes"]} failed, {stats["dropped"]} dropped')
+        finally:
+            mongo.cx.drop_database(db.name)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Training time, inference latency per 1k bids and artifact size of the top-bid model per
+n_jobs, on a seeded synthetic dataset so that runs are comparable across machines and commits.
+
+Shipments get 5-30 bids each; the accepted bid is the one with the lowest noisy price per km
+among those delivered in time. Features go through features_from_documents, like a snapshot.
+
+Usage (from the server directory)
+    python -m benchmarks.bench_training --shipments 5000 --n-jobs 1 2 4 -1 --n-estimators 100
+"""
+# external imports
+import os
+import argparse
+import datetime
+import tempfile
+import numpy as np
+
+# internal imports
+from api.services.training import train_model, save_artifact, assemble_dataset
+from api.services.predict_top_bid import features_from_documents
+
+def synthetic_dataset(shipments: int, seed: int):
+    """Seeded shipments and bids run through the feature code of the inference side."""
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime(2025, 1, 1)
+
+    rows, labels, groups = [], [], []
+    for i in range(shipments):
+        created_at = start + datetime.timedelta(hours=int(rng.integers(0, 24 * 365)))
+        shipment = { 'distance': float(rng.uniform(20, 2500)), 'cargo_load': float(rng.uniform(0.5, 30)), 'created_at': created_at }
+        deadline = int(rng.integers(2, 10))
+
+        n = int(rng.integers(5, 31))
+        bids = [{
+            'proposed_price': shipment['distance'] * float(rng.uniform(15, 40)),
+            'proposed_delivery_date': created_at + datetime.timedelta(days=int(rng.integers(1, 14)))
+        } for _ in range(n)]
+        features = features_from_documents(bids, shipment)
+
+        on_time = features[:, 3] <= deadline
+        cost = features[:, 8] * rng.uniform(0.9, 1.1, n) + np.where(on_time, 0, 1e6)
+        accepted = np.zeros(n)
+        accepted[np.argmin(cost)] = 1.0
+
+        rows.extend(features)
+        labels.extend(accepted)
+        groups.extend([str(i)] * n)
+
+    return assemble_dataset(rows, labels, groups, labelled_only=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shipments', type=int, default=5000)
+    parser.add_argument('--n-jobs', type=int, nargs='+', default=[1, -1])
+    parser.add_argument('--n-estimators', type=int, default=100)
+    parser.add_argument('--max-depth', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    features, labels, groups = synthetic_dataset(args.shipments, args.seed)
+    print(f'{len(features)} bids of {args.shipments} shipments, {args.n_estimators} trees, cpu count {os.cpu_count()}')
+    print(f'{"n_jobs":>8}{"train s":>10}{"ms/1k bids":>12}{"size KiB":>11}{"top1":>8}{"auc":>8}')
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        for n_jobs in args.n_jobs:
+            params = { 'n_estimators': args.n_estimators, 'max_depth': args.max_depth, 'n_jobs': n_jobs, 'seed': args.seed }
+            models, metrics = train_model(features, labels, groups, **params)
+            _, metadata = save_artifact(models, metrics, params, model_dir, 'synthetic')
+            metrics = metadata['metrics']
+            print(
+                f'{n_jobs:>8}{metrics["training_s"]:>10.2f}{metrics["latency_ms_per_1k"]:>12.2f}'
+                f'{metrics["size_bytes"] / 1024:>11.0f}{metrics["top1_accuracy"]:>8.3f}{metrics["auc"]:>8.3f}'
+            )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Load test of the ASGI app (asgi:app) against the flask app under gunicorn: requests/sec and
+latency percentiles per endpoint and client concurrency.
+
+Seeds shippers, a carrier and shipments with bids into a throwaway database, then drives every
+endpoint of api.asgi.routes.ROUTES with keep-alive HTTP connections, one per client thread.
+With --launch both servers are started on local ports with the same number of worker processes:
+gunicorn sync workers with --threads for the flask app, uvicorn workers for the ASGI app. Use
+--wsgi-url / --asgi-url instead to measure running deployments, which must use --uri and the
+JWT_SECRET_KEY of this process. The client runs in one Python process, so compare the servers
+on the same machine and client settings, or run the client on a separate host.
+
+Writes run in transactions against a replica set or sharded cluster and without them against a
+standalone server (MONGO_TRANSACTIONS=auto, the default); the database is dropped afterwards.
+
+Usage (from the server directory)
+    python -m benchmarks.load_asgi --uri mongodb://localhost:27017/shipassure_load --launch --workers 4 --threads 8 --concurrency 8 64 --requests 2000
+"""
+# external imports
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import threading
+import subprocess
+import http.client
+import numpy as np
+from bson import ObjectId
+from urllib.parse import urlsplit
+from typing import Callable, Dict, List, Tuple
+from flask_jwt_extended import create_access_token
+
+# internal imports
+from api import create_app, mongo
+from api.config import Config
+
+CODES = ['110001', '400001', '560001', '700001', '600001']
+
+class Client:
+    """Keep-alive HTTP client of one load thread."""
+
+    def __init__(self, base_url: str):
+        url = urlsplit(base_url)
+        self.connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+
+    def request(self, method: str, path: str, body=None, headers: Dict[str, str] = None) -> Tuple[int, bytes]:
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        try:
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # reconnect once, e.g. after a worker restart
+            self.connection.close()
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+        return response.status, response.read()
+
+def seed(shipments: int, bids: int, carrier_headers, shipper_headers, flask_client) -> List[str]:
+    """Creates shipments and bids through the flask app, so the documents have the served shape."""
+    delivery = (datetime.datetime.now() + datetime.timedelta(days=7)).strftime('%Y-%m-%dT%H:%M:%S')
+    rng = np.random.default_rng(0)
+    ids = []
+    for i in range(shipments):
+        response = flask_client.post('/shipments/', json={
+            'origin_code': CODES[0], 'destination_code': CODES[1 + i % (len(CODES) - 1)], 'cargo_load': float(rng.integers(1, 20))
+        }, headers=shipper_headers)
+        assert response.status_code == 201, response.get_json()
+        sh_id = response.get_json()['data']['shipment']['_id']
+        ids.append(sh_id)
+
+        for _ in range(bids):
+            response = flask_client.post(f'/shipments/{sh_id}/bids', json={
+                'proposed_price': float(rng.integers(1000, 50000)),
+                'proposed_delivery_date': delivery,
+                'proposed_vehicle': str(ObjectId())
+            }, headers=carrier_headers)
+            assert response.status_code == 200, response.get_json()
+    return ids
+
+def scenarios(ids: List[str], carrier_headers, shipper_headers, batch: int) -> Dict[str, Callable[[int], Tuple]]:
+    """Request of the i-th call per endpoint, as (method, path, body, headers)."""
+    delivery = (datetime.datetime.now() + datetime.timedelta(days=7)).strftime('%Y-%m-%dT%H:%M:%S')
+    return {
+        'get_shipment': lambda i: ('GET', f'/shipments/{ids[i % len(ids)]}', None, {}),
+        'create_shipment': lambda i: ('POST', '/shipments/', {
+            'origin_code': CODES[0], 'destination_code': CODES[1 + i % (len(CODES) - 1)], 'cargo_load': 5
+        }, shipper_headers),
+        'add_bid': lambda i: ('POST', f'/shipments/{ids[i % len(ids)]}/bids', {
+            'proposed_price': 1000 + i % 40000, 'proposed_delivery_date': delivery, 'proposed_vehicle': str(ObjectId())
+        }, carrier_headers),
+        'top_bids_batch': lambda i: ('POST', '/services/top-bids:batch', {
+            'shipment_ids': [ids[(i + j) % len(ids)] for j in range(batch)]
+        }, carrier_headers),
+        'distance_matrix': lambda i: ('POST', '/services/distance-matrix', {
+            'origins': CODES, 'method': 'vincenty'
+        }, carrier_headers),
+    }
+
+def run(base_url: str, make_request: Callable[[int], Tuple], requests: int, concurrency: int) -> Dict[str, float]:
+    """Sends `requests` requests from `concurrency` threads, returns throughput and latency percentiles."""
+    latencies = np.empty(requests)
+    errors = []
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker():
+        client = Client(base_url)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            method, path, body, headers = make_request(i)
+            start = time.perf_counter()
+            status, payload = client.request(method, path, body, headers)
+            latencies[i] = time.perf_counter() - start
+            if status >= 400:
+                errors.append((status, payload[:200]))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if errors:
+        print(f'    {len(errors)} errors, e.g. {errors[0]}', file=sys.stderr)
+    return {
+        'rps': requests / elapsed,
+        'p50': np.percentile(latencies, 50) * 1e3,
+        'p99': np.percentile(latencies, 99) * 1e3,
+        'errors': len(errors),
+    }
+
+def wait_ready(base_url: str, path: str, timeout: float = 60) -> None:
+    """Polls the server until it answers."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            Client(base_url).request('GET', path)
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+def launch(args, env: Dict[str, str]) -> Tuple[List[subprocess.Popen], Dict[str, str]]:
+    """Starts gunicorn with the flask app and with the ASGI app on local ports."""
+    commands = {
+        'wsgi': [
+            sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '--threads', str(args.threads),
+            '-b', f'127.0.0.1:{args.port}', 'api:create_app()'
+        ],
+        'asgi': [
+            sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '-k', 'uvicorn.workers.UvicornWorker',
+            '-b', f'127.0.0.1:{args.port + 1}', 'asgi:app'
+        ],
+    }
+    processes = [
+        subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for command in commands.values()
+    ]
+    return processes, { 'wsgi': f'http://127.0.0.1:{args.port}', 'asgi': f'http://127.0.0.1:{args.port + 1}' }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', required=True, help='connection string including a throwaway database name')
+    parser.add_argument('--launch', action='store_true', help='start both servers locally')
+    parser.add_argument('--wsgi-url', help='running flask deployment, e.g. http://127.0.0.1:8000')
+    parser.add_argument('--asgi-url', help='running ASGI deployment, e.g. http://127.0.0.1:8001')
+    parser.add_argument('--workers', type=int, default=4, help='worker processes of each launched server')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn sync worker')
+    parser.add_argument('--port', type=int, default=8700, help='port of the flask server, the ASGI server uses the next one')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 64])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per endpoint and concurrency')
+    parser.add_argument('--shipments', type=int, default=200)
+    parser.add_argument('--bids', type=int, default=10, help='seeded bids per shipment')
+    parser.add_argument('--batch', type=int, default=20, help='shipments per top-bids:batch request')
+    parser.add_argument('--endpoints', nargs='*', default=None, help='subset of the endpoints')
+    args = parser.parse_args()
+
+    class LoadConfig(Config):
+        MONGO_URI = args.uri
+        MONGO_ENSURE_INDEXES = False
+
+    app = create_app(LoadConfig)
+    flask_client = app.test_client()
+
+    processes, urls = [], {}
+    with app.app_context():
+        db = mongo.db
+        shipper_id, carrier_id = ObjectId(), ObjectId()
+        db.shippers.insert_many([
+            { 'user_id': shipper_id if code == CODES[0] else ObjectId(), 'postal_code': code, 'sent_shipments': [] }
+            for code in CODES
+        ])
+        db.carriers.insert_one({ 'user_id': carrier_id, 'bids': [] })
+        shipper_headers = { 'Authorization': f'Bearer {create_access_token(identity=str(shipper_id))}' }
+        carrier_headers = { 'Authorization': f'Bearer {create_access_token(identity=str(carrier_id))}' }
+
+        try:
+            ids = seed(args.shipments, args.bids, carrier_headers, shipper_headers, flask_client)
+            requests = scenarios(ids, carrier_headers, shipper_headers, args.batch)
+            endpoints = args.endpoints or list(requests)
+
+            if args.launch:
+                env = dict(os.environ, MONGO_URI=args.uri, MONGO_ENSURE_INDEXES='False', JWT_SECRET_KEY=app.config['JWT_SECRET_KEY'])
+                processes, urls = launch(args, env)
+            urls.update({ name: url for name, url in [('wsgi', args.wsgi_url), ('asgi', args.asgi_url)] if url })
+            if not urls:
+                parser.error('pass --launch, --wsgi-url or --asgi-url')
+
+            for url in urls.values():
+                wait_ready(url, f'/shipments/{ids[0]}')
+
+            print(f'{args.requests} requests per run, {args.shipments} shipments with {args.bids} bids, batch of {args.batch}')
+            print(f'{"endpoint":<18}{"clients":>8}' + ''.join(f'{name + " req/s":>13}{"p50 ms":>9}{"p99 ms":>9}' for name in urls))
+            for endpoint in endpoints:
+                for concurrency in args.concurrency:
+                    row = f'{endpoint:<18}{concurrency:>8}'
+                    for url in urls.values():
+                        run(url, requests[endpoint], min(args.requests, 50), concurrency) # warm up
+                        result = run(url, requests[endpoint], args.requests, concurrency)
+                        row += f'{result["rps"]:>13.1f}{result["p50"]:>9.2f}{result["p99"]:>9.2f}'
+                    print(row)
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+            mongo.cx.drop_database(db.name)
+
+if __name__ == '__main__':
+    main()
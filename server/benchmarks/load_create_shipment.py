@@ -0,0 +1,151 @@
+"""
+Load test of shipment creation: the previous read-modify-write sequence (three find_one,
+insert, full-document $set of the shipper) against POST /shipments/.
+
+Every MongoDB command is counted with a CommandListener, so the report shows the round trips
+per request next to the latency. The concurrent phase creates shipments for one shipper from
+many threads and counts the ids lost from shipper.sent_shipments.
+
+Shipments are created in transactions against a replica set or sharded cluster and without them
+against a standalone server (MONGO_TRANSACTIONS=auto, the default); the data is written to a
+throwaway database that is dropped afterwards.
+
+Usage (from the server directory)
+    python -m benchmarks.load_create_shipment --uri mongodb://localhost:27017/shipassure_load --requests 500 --threads 16
+"""
+# external imports
+import time
+import datetime
+import argparse
+import threading
+import numpy as np
+from bson import ObjectId
+from pymongo import monitoring, ReturnDocument
+from concurrent.futures import ThreadPoolExecutor
+from flask_jwt_extended import create_access_token
+
+# internal imports
+from api import create_app, mongo
+from api.config import Config
+from api.utils.geo import calculate_distance
+from api.db_models.user_models import Shipper
+from api.db_models.shipment_models import Shipment
+
+ORIGIN, DESTINATION = '110001', '400001'
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands sent to the server, i.e. the network round trips."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def legacy_create(user_id: ObjectId) -> None:
+    """The create_shipment sequence this benchmark compares against."""
+    shippers, shipments = mongo.db['shippers'], mongo.db['shipments']
+
+    origin = shippers.find_one({ 'postal_code': ORIGIN })
+    destination = shippers.find_one({ 'postal_code': DESTINATION })
+    if not origin or not destination:
+        raise RuntimeError('Origin or destination not found.')
+
+    distance = calculate_distance(ORIGIN, DESTINATION)
+    shipper = Shipper(**shippers.find_one({ 'user_id': user_id }))
+
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    new_shipment = Shipment(
+        shipper_id=shipper.id, origin_code=ORIGIN, destination_code=DESTINATION, distance=distance,
+        status='waiting', cargo_load=5.0, created_at=now, updated_at=now
+    )
+    shipment_id = shipments.insert_one(new_shipment.to_bson()).inserted_id
+
+    shipper.sent_shipments.append(shipment_id)
+    shippers.find_one_and_update(
+        { '_id': shipper.id }, { '$set': shipper.to_bson() }, return_document=ReturnDocument.AFTER
+    )
+
+def run(name, fn, counter, requests, threads):
+    """Runs `requests` calls of fn on `threads` threads and prints one report line."""
+    latencies = np.empty(requests)
+
+    def call(i):
+        start = time.perf_counter()
+        fn()
+        latencies[i] = time.perf_counter() - start
+
+    commands = counter.count
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+    commands = counter.count - commands
+
+    print(
+        f'{name:<10}{threads:>8}{commands / requests:>14.2f}{np.percentile(latencies, 50) * 1e3:>10.2f}'
+        f'{np.percentile(latencies, 95) * 1e3:>10.2f}{requests / elapsed:>10.1f}',
+        end=''
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', required=True, help='connection string including a throwaway database name')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    monitoring.register(counter) # must happen before the client is created
+
+    class LoadConfig(Config):
+        MONGO_URI = args.uri
+        MONGO_ENSURE_INDEXES = False
+
+    app = create_app(LoadConfig)
+    client = app.test_client()
+
+    with app.app_context():
+        db = mongo.db
+        db.shippers.insert_many([{ 'user_id': ObjectId(), 'postal_code': code } for code in [ORIGIN, DESTINATION]])
+        calculate_distance(ORIGIN, DESTINATION) # both paths read the distance from the cache
+
+        def new_shipper():
+            user_id = ObjectId()
+            db.shippers.insert_one({ 'user_id': user_id, 'postal_code': ORIGIN, 'sent_shipments': [] })
+            return user_id, { 'Authorization': f'Bearer {create_access_token(identity=str(user_id))}' }
+
+        def post(headers):
+            response = client.post('/shipments/', json={
+                'origin_code': ORIGIN, 'destination_code': DESTINATION, 'cargo_load': 5
+            }, headers=headers)
+            assert response.status_code == 201, response.get_json()
+
+        print(f'transactions: {app.config["MONGO_TRANSACTIONS"]}, {args.requests} requests per run')
+        print(f'{"path":<10}{"threads":>8}{"commands/req":>14}{"p50 ms":>10}{"p95 ms":>10}{"req/s":>10}{"lost":>8}')
+        try:
+            for threads in [1, args.threads]:
+                for name, make_call in [
+                    ('legacy', lambda user_id, headers: lambda: legacy_create(user_id)),
+                    ('pipeline', lambda user_id, headers: lambda: post(headers))
+                ]:
+                    user_id, headers = new_shipper()
+                    run(name, make_call(user_id, headers), counter, args.requests, threads)
+
+                    # appends lost to concurrent full-document $set
+                    shipper = db.shippers.find_one({ 'user_id': user_id })
+                    created = db.shipments.count_documents({ 'shipper_id': shipper['_id'] })
+                    print(f'{created - len(shipper.get("sent_shipments", [])):>8}')
+        finally:
+            mongo.cx.drop_database(db.name)
+
+if __name__ == '__main__':
+    main()
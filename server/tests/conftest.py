@@ -0,0 +1,50 @@
+# external imports
+import pytest
+import mongomock
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+# internal imports
+from api import create_app, mongo
+from api.config import Config
+
+class TestConfig(Config):
+    """Configuration of the test app, backed by an in-memory mongomock client."""
+    TESTING = True
+    MONGO_URI = 'mongodb://localhost:27017/shipassure'
+    JWT_SECRET_KEY = 'test-secret'
+    MONGO_ENSURE_INDEXES = False
+    MONGO_TRANSACTIONS = False
+    DISTANCE_CACHE_PATH = ''
+    LANE_TABLE_PATH = ''
+    METRICS_ENABLED = False
+    TRACKING_FLUSH_INTERVAL = 0
+
+@pytest.fixture
+def config():
+    """Settings overriding TestConfig, parametrize `config` to change them."""
+    return {}
+
+@pytest.fixture
+def app(config):
+    app = create_app(type('Config', (TestConfig,), config))
+    client = mongomock.MongoClient()
+    mongo.cx = client
+    mongo.db = client['shipassure']
+    yield app
+
+@pytest.fixture
+def db(app):
+    return mongo.db
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def auth(app):
+    """Returns the Authorization header of a user id."""
+    def headers(user_id: ObjectId):
+        with app.app_context():
+            return { 'Authorization': f'Bearer {create_access_token(identity=str(user_id))}' }
+    return headers
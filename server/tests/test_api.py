@@ -0,0 +1,349 @@
+# external imports
+import os
+import sys
+import time
+import pickle
+import datetime
+import pytest
+import numpy as np
+from unittest import mock
+from bson import ObjectId
+from flask import abort
+from pymongo.errors import OperationFailure
+
+# internal imports
+from api import mongo
+from api.utils import distance_cache as distance_cache_module
+from api.utils.distance_cache import DistanceCache
+from api.utils.geo import haversine
+from api.utils.carrier_index import CarrierIndex, RATING_WEIGHT, VERIFIED_WEIGHT, DISTANCE_WEIGHT, UNRATED_RATING
+from api.utils.model_registry import ModelRegistry
+from api.utils.scoring_backends import SCORING_BACKENDS, ForestBackend, backend_file, export_backends
+from api.utils.indexes import INDEXES, ensure_indexes
+from api.utils.lane_table import LaneTable, write_lane_table
+from api.utils import transactions
+from api.utils.geo_index import PostalCodeIndex
+from api.services.distance_routes import parse_distance_matrix_request
+from api.utils.transactions import run_in_transaction, supports_transactions
+
+@pytest.mark.parametrize('hello, supported', [
+    ({ 'isWritablePrimary': True }, False),
+    ({ 'isWritablePrimary': True, 'setName': 'rs0' }, True),
+    ({ 'isWritablePrimary': True, 'msg': 'isdbgrid' }, True),
+])
+def test_supports_transactions(hello, supported):
+    assert supports_transactions(hello) is supported
+
+def test_auto_transactions_fall_back_on_a_standalone_server(app, monkeypatch):
+    app.config['MONGO_TRANSACTIONS'] = 'auto'
+    client = mock.MagicMock()
+    client.admin.command.return_value = { 'isWritablePrimary': True }
+    monkeypatch.setattr(mongo, 'cx', client)
+    monkeypatch.setattr(transactions, '_supported', {})
+
+    with app.app_context():
+        assert run_in_transaction(lambda session: session) is None
+        assert run_in_transaction(lambda session: session) is None
+
+    # the deployment is asked once, no session is started
+    client.admin.command.assert_called_once_with('hello')
+    client.start_session.assert_not_called()
+
+def test_auto_transactions_on_a_replica_set(app, monkeypatch):
+    app.config['MONGO_TRANSACTIONS'] = 'auto'
+    client = mock.MagicMock()
+    client.admin.command.return_value = { 'isWritablePrimary': True, 'setName': 'rs0' }
+    session = client.start_session.return_value.__enter__.return_value
+    session.with_transaction.side_effect = lambda callback, **kwargs: callback(session)
+    monkeypatch.setattr(mongo, 'cx', client)
+    monkeypatch.setattr(transactions, '_supported', {})
+
+    with app.app_context():
+        assert run_in_transaction(lambda s: s) is session
+
+def test_distance_cache_writes_new_lanes_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(distance_cache_module, 'WRITE_INTERVAL', 3600)
+    path = str(tmp_path / 'distances.sqlite3')
+    cache = DistanceCache()
+    cache.path = path
+
+    for k in range(3):
+        cache.set(f'lane{k}', float(k))
+    assert cache.stats()['pending_writes'] == 3
+    assert cache.flush() == 3 and cache.stats()['pending_writes'] == 0
+
+    warm = DistanceCache()
+    warm.path = path
+    assert warm.get('lane2') == 2.0 and warm.get('lane9') is None
+    assert warm.stats()['disk_hits'] == 1 and warm.stats()['misses'] == 1
+
+def test_distance_cache_survives_sqlite_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(distance_cache_module, 'WRITE_INTERVAL', 3600)
+    cache = DistanceCache()
+    # a directory cannot be opened as a sqlite file
+    cache.path = str(tmp_path)
+
+    cache.set('lane', 12.5)
+    assert cache.flush() == 0
+    assert cache.get('lane') == 12.5
+    assert cache.get('other') is None
+    cache.clear()
+    assert cache.stats()['disk_errors'] == 3
+
+def test_geo_stats_needs_an_admin(app, client, auth):
+    admin, user = ObjectId(), ObjectId()
+    app.config['ADMIN_USER_IDS'] = [str(admin)]
+
+    assert client.get('/services/geo/stats').status_code == 401
+    assert client.get('/services/geo/stats', headers=auth(user)).status_code == 403
+    assert client.get('/services/geo/stats', headers=auth(admin)).status_code == 200
+
+def test_matching_stats_needs_an_admin(app, client, auth):
+    admin = ObjectId()
+    app.config['ADMIN_USER_IDS'] = [str(admin)]
+
+    assert client.get('/services/matching/stats').status_code == 401
+    assert client.get('/services/matching/stats', headers=auth(ObjectId())).status_code == 403
+    assert client.get('/services/matching/stats', headers=auth(admin)).status_code == 200
+
+@pytest.mark.parametrize('config', [{ 'METRICS_ENABLED': True, 'METRICS_FLUSH_INTERVAL': 0 }])
+def test_metrics_write_errors_do_not_fail_requests(app, client, tmp_path, auth):
+    # a file where the metrics directory should be
+    blocked = tmp_path / 'metrics'
+    blocked.write_text('')
+    request_metrics = app.extensions['request_metrics']
+    request_metrics.directory = str(blocked)
+
+    admin = ObjectId()
+    app.config['ADMIN_USER_IDS'] = [str(admin)]
+    assert client.get('/services/matching/stats', headers=auth(admin)).status_code == 200
+
+    res = client.get('/metrics')
+    assert res.status_code == 200
+    assert 'endpoint="services.get_matching_stats"' in res.get_data(as_text=True)
+
+def test_lane_table_maps_a_table_built_after_it_started(tmp_path):
+    path = str(tmp_path / 'lanes.npy')
+    lanes = LaneTable()
+    lanes.path, lanes.reload_interval = path, 0
+    codes = ['110001', '400001', '560001']
+    first, second = np.asarray([0]), np.asarray([1])
+
+    assert lanes.distance('110001', '400001') is None
+
+    write_lane_table(path, codes, np.asarray([[28.61, 77.21], [18.94, 72.84], [12.97, 77.59]]), first, second)
+    delhi_mumbai = lanes.distance('110001', '400001')
+    assert delhi_mumbai == pytest.approx(1150, rel=0.05)
+
+    # rebuilt with other co-ordinates, the running table follows the new file
+    write_lane_table(path, codes, np.asarray([[28.61, 77.21], [12.97, 77.59], [18.94, 72.84]]), first, second)
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert lanes.distance('110001', '400001') == pytest.approx(1740, rel=0.05)
+    assert lanes.stats()['loads'] == 2
+
+    os.remove(path)
+    assert lanes.distance('110001', '400001') is None
+
+def carrier(db, rating, **fields):
+    return db.carriers.insert_one({
+        'modes': ['road'], 'vehicles': [ObjectId()], 'rating': rating,
+        'location': { 'type': 'Point', 'coordinates': [77.2, 28.6] }, **fields
+    }).inserted_id
+
+def test_carrier_index_polls_from_the_latest_change_seen(db):
+    index = CarrierIndex()
+    index.refresh_interval, index.reload_interval = 0, 0
+    written = datetime.datetime(2024, 1, 1, 12, 0)
+    first = carrier(db, 4.0, updated_at=written)
+    index.refresh(db)
+    assert index.stats()['watermark'] == written
+
+    # replicated late, with an updated_at older than the local clock
+    second = carrier(db, 5.0, updated_at=written - datetime.timedelta(seconds=1))
+    index.refresh(db)
+    assert [m['carrier_id'] for m in index.match(28.6, 77.2, 10, 50)] == [second, first]
+
+def test_carrier_index_reload_drops_deleted_carriers(db):
+    index = CarrierIndex()
+    index.refresh_interval, index.reload_interval = 0, 3600
+    kept, deleted = carrier(db, 4.0), carrier(db, 5.0)
+    index.refresh(db)
+    assert index.stats()['watermark'] is None
+
+    db.carriers.delete_one({ '_id': deleted })
+    index.refresh(db)
+    assert len(index.match(28.6, 77.2, 10, 50)) == 2
+
+    index._loaded_at -= 3600
+    index.refresh(db)
+    assert [m['carrier_id'] for m in index.match(28.6, 77.2, 10, 50)] == [kept]
+    assert index.stats()['loads'] == 2
+
+def test_model_registry_keeps_serving_when_the_file_goes_missing(tmp_path):
+    registry = ModelRegistry()
+    registry.model_dir, registry.reload_interval = str(tmp_path), 0
+    with open(registry.path, 'wb') as f:
+        pickle.dump({ 'weights': [1, 2] }, f)
+    model = registry.get()
+
+    os.remove(registry.path)
+    assert registry.get() is model
+    assert registry.loads == 1
+
+    # without a resident model there is nothing to fall back on
+    empty = ModelRegistry()
+    empty.model_dir = str(tmp_path)
+    with pytest.raises(FileNotFoundError):
+        empty.get()
+
+def test_ensure_indexes_tolerates_collections_created_meanwhile():
+    db = mock.MagicMock()
+    db.list_collection_names.return_value = []
+    # the locations collection is created by another worker between the two calls
+    db.create_collection.side_effect = OperationFailure('Collection already exists.', code=48)
+    collections = { name: mock.MagicMock() for name in INDEXES }
+    collections['carriers'].create_indexes.side_effect = OperationFailure('Index with name: location already exists with different options', code=85)
+    db.__getitem__.side_effect = collections.__getitem__
+
+    created = ensure_indexes(db)
+
+    assert set(created) == set(INDEXES) - { 'carriers' }
+    for name in created:
+        collections[name].create_indexes.assert_called_once_with(INDEXES[name])
+
+def test_http_errors_without_their_own_handler_are_json(app, client):
+    @app.route('/conflict')
+    def conflict():
+        abort(409, 'Shipments changed, try again.')
+
+    res = client.get('/conflict')
+    assert res.status_code == 409 and res.is_json
+    assert res.get_json() == { 'status': 409, 'message': 'Conflict', 'error': '409 Conflict: Shipments changed, try again.' }
+
+@pytest.mark.parametrize('seed', range(6))
+def test_carrier_index_match_agrees_with_a_brute_force_scan(seed):
+    rng = np.random.default_rng(seed)
+    n = 3000
+    # high latitudes and the antimeridian stress the cell bounds
+    latitude = rng.uniform(-80, 80, n) if seed % 2 else rng.uniform(60, 89, n)
+    longitude = rng.uniform(-180, 180, n)
+    rating = np.where(rng.random(n) < 0.2, np.nan, rng.uniform(1, 5, n))
+    road = rng.random(n) < 0.5
+    verified = rng.random(n) < 0.15
+    ids = [ObjectId() for _ in range(n)]
+
+    index = CarrierIndex()
+    index.load({
+        '_id': ids[k], 'modes': ['road'] if road[k] else ['air', 'water'], 'vehicles': [1], 'verified': bool(verified[k]),
+        'rating': None if np.isnan(rating[k]) else float(rating[k]),
+        'location': { 'type': 'Point', 'coordinates': [float(longitude[k]), float(latitude[k])] }
+    } for k in range(n))
+
+    for query in range(10):
+        pickup = float(rng.uniform(-85, 89)), float(rng.choice([179.8, -179.9, rng.uniform(-180, 180)]))
+        radius = float(rng.choice([100, 500, 2000]))
+        modes = ['road'] if query % 3 == 1 else None
+        min_rating = 3.0 if query % 2 else None
+
+        distance = haversine(pickup[0], pickup[1], latitude, longitude)
+        eligible = distance <= radius
+        if modes:
+            eligible &= road
+        if min_rating is not None:
+            eligible &= rating >= min_rating
+        score = (
+            RATING_WEIGHT * np.where(np.isnan(rating), UNRATED_RATING, rating) / 5
+            + VERIFIED_WEIGHT * verified + DISTANCE_WEIGHT * (1 - distance / radius)
+        )
+        expected = np.sort(score[eligible])[::-1][:15]
+
+        matches = index.match(pickup[0], pickup[1], 15, radius, modes, min_rating)
+        assert len(matches) == len(expected)
+        assert np.allclose([m['score'] for m in matches], expected, atol=1e-4)
+        for m in matches:
+            k = ids.index(m['carrier_id'])
+            assert eligible[k] and m['distance_km'] == pytest.approx(distance[k], abs=1e-3)
+
+def fitted_forest(rows=400, columns=4):
+    pd = pytest.importorskip('pandas')
+    ensemble = pytest.importorskip('sklearn.ensemble')
+    rng = np.random.default_rng(7)
+    features = pd.DataFrame(rng.normal(size=(rows, columns)), columns=[f'f{k}' for k in range(columns)])
+    labels = features['f0'] * 2 - features['f1'] + rng.normal(scale=0.1, size=rows)
+    model = ensemble.RandomForestRegressor(n_estimators=20, max_depth=6, random_state=0).fit(features, labels)
+    return model, features, labels.to_numpy()
+
+def test_forest_backend_predicts_like_the_sklearn_forest():
+    model, features, _ = fitted_forest()
+    forest = ForestBackend.from_sklearn(model)
+
+    # thresholds are hit exactly by the training rows, and fresh rows fall between them
+    rows = np.vstack([features, np.random.default_rng(8).normal(size=(200, features.shape[1]))])
+    assert np.array_equal(forest.predict(rows), model.predict(features.__class__(rows, columns=features.columns)))
+    assert list(forest.feature_names_in_) == list(model.feature_names_in_)
+
+def test_exported_backends_are_served_by_the_registry(tmp_path):
+    joblib = pytest.importorskip('joblib')
+    model, features, labels = fitted_forest()
+    backends = export_backends(model, features.to_numpy(), labels)
+    assert set(backends) == set(SCORING_BACKENDS)
+
+    for name, backend in backends.items():
+        joblib.dump(backend, tmp_path / backend_file('model.joblib', name))
+
+    predictions = {}
+    for name in SCORING_BACKENDS:
+        registry = ModelRegistry()
+        registry.model_dir, registry.model_file, registry.backend = str(tmp_path), 'model.joblib', name
+        assert registry.path.endswith(backend_file('model.joblib', name))
+        predictions[name] = registry.get().predict(features)
+
+    assert np.array_equal(predictions['forest'], predictions['sklearn'])
+    # the linear model is fitted on the same set, it ranks the rows much like the forest does
+    assert np.corrcoef(predictions['linear'], predictions['sklearn'])[0, 1] > 0.9
+
+def test_backend_file_rejects_unknown_backends():
+    assert backend_file('model.pkl', 'sklearn') == 'model.pkl'
+    assert backend_file('model.pkl', 'forest') == 'model.forest.joblib'
+    with pytest.raises(ValueError):
+        backend_file('model.pkl', 'onnx')
+
+@pytest.mark.parametrize('data, message', [
+    ({ 'origins': '400001' }, 'origins must be a list of postal codes.'),
+    ({ 'origins': 400001 }, 'origins must be a list of postal codes.'),
+    ({ 'origins': ['110001', 400001] }, 'origins must be a list of postal codes.'),
+    ({ 'origins': ['110001'], 'destinations': '400001' }, 'destinations must be a list of postal codes.'),
+    ({ 'destinations': ['400001'] }, 'Missing required fields.'),
+])
+def test_distance_matrix_request_needs_lists_of_codes(data, message):
+    with pytest.raises(ValueError, match=message):
+        parse_distance_matrix_request(data, 100)
+
+def test_distance_matrix_request_defaults_destinations_to_origins():
+    assert parse_distance_matrix_request({ 'origins': [' 110001', '400001'] }, 100) == (['110001', '400001'], ['110001', '400001'], 'IN', 'haversine')
+
+def fake_pgeocode(tmp_path, frame=True):
+    """pgeocode stand-in whose dataset holds lower case alphanumeric codes, unsorted once upper-cased."""
+    pd = pytest.importorskip('pandas')
+    places = pd.DataFrame({
+        'postal_code': ['a1b', 'B2C', 'a1b', 'c3d'],
+        'latitude': [10.0, 20.0, 12.0, 30.0],
+        'longitude': [100.0, 110.0, 102.0, 120.0],
+    })
+    places.to_csv(tmp_path / 'XX.txt', index=None)
+    nominatim = mock.Mock(spec=['_data_frame'] if frame else [])
+    if frame:
+        nominatim._data_frame = places.groupby('postal_code', as_index=False)[['latitude', 'longitude']].mean()
+    return mock.Mock(Nominatim=mock.Mock(return_value=nominatim), STORAGE_DIR=str(tmp_path), NA_VALUES=[''])
+
+@pytest.mark.parametrize('frame', [True, False])
+def test_postal_code_snapshot_is_sorted_after_normalizing(tmp_path, monkeypatch, frame):
+    monkeypatch.setitem(sys.modules, 'pgeocode', fake_pgeocode(tmp_path, frame))
+    index = PostalCodeIndex()
+    index.data_dir = str(tmp_path / 'geo')
+
+    assert index.lookup('A1B', 'XX') == (11.0, 101.0)
+    assert index.lookup('b2c', 'XX') == (20.0, 110.0)
+    assert index.lookup(' c3d ', 'XX') == (30.0, 120.0)
+    assert index.lookup('D4E', 'XX') is None
+    assert np.isnan(index.lookup_many(['C3D', 'A1B', 'ZZZ'], 'XX')).any(axis=1).tolist() == [False, False, True]
@@ -0,0 +1,174 @@
+# external imports
+import json
+import pytest
+import asyncio
+import datetime
+import mongomock
+from unittest import mock
+from bson import ObjectId
+from concurrent.futures import ThreadPoolExecutor
+from flask_jwt_extended import create_access_token
+
+# internal imports
+from api import mongo
+from api.asgi import create_asgi_app
+from conftest import TestConfig
+
+class AsyncStub:
+    """Awaitable facade of a mongomock database or collection, in place of the AsyncMongoClient ones."""
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getitem__(self, name):
+        return AsyncStub(self._target[name])
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if isinstance(attr, (mongomock.Database, mongomock.Collection)):
+            return AsyncStub(attr)
+        if callable(attr):
+            async def call(*args, **kwargs):
+                return attr(*args, **kwargs)
+            return call
+        return attr
+
+@pytest.fixture
+def asgi_app(config):
+    app = create_asgi_app(type('Config', (TestConfig,), config))
+    client = mongomock.MongoClient()
+    mongo.cx, mongo.db = client, client['shipassure']
+    # what the lifespan sets up against a real server
+    app.state.client = None
+    app.state.db = app.state.read_db = AsyncStub(mongo.db)
+    app.state.executor = ThreadPoolExecutor(max_workers=2)
+    yield app
+    app.state.executor.shutdown()
+
+@pytest.fixture
+def db(asgi_app):
+    return mongo.db
+
+@pytest.fixture
+def call(asgi_app):
+    """Sends one request to the ASGI app, returns the status and the decoded json body."""
+    def send_request(method, path, body=None, headers=None):
+        raw = b'' if body is None else body if isinstance(body, bytes) else json.dumps(body).encode()
+        scope = {
+            'type': 'http', 'http_version': '1.1', 'method': method, 'path': path, 'raw_path': path.encode(),
+            'query_string': b'', 'root_path': '', 'scheme': 'http', 'server': ('test', 80), 'client': ('test', 1),
+            'headers': [(b'content-type', b'application/json')] + [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+        }
+        messages = []
+
+        async def receive():
+            return { 'type': 'http.request', 'body': raw, 'more_body': False }
+
+        async def send(message):
+            messages.append(message)
+
+        async def run():
+            try:
+                await asgi_app(scope, receive, send)
+            except Exception:
+                # the server error middleware re-raises once the 500 is sent, for the server to log
+                pass
+
+        asyncio.run(run())
+        status = next(m['status'] for m in messages if m['type'] == 'http.response.start')
+        content = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+        return status, json.loads(content) if content else None
+    return send_request
+
+@pytest.fixture
+def flask_client(asgi_app):
+    """Client of the flask app behind the ASGI app, whose responses the native handlers mirror."""
+    return asgi_app.state.flask_app.test_client()
+
+@pytest.fixture
+def auth(asgi_app):
+    def headers(user_id, **kwargs):
+        with asgi_app.state.flask_app.app_context():
+            return { 'Authorization': f'Bearer {create_access_token(identity=str(user_id), **kwargs)}' }
+    return headers
+
+@pytest.mark.parametrize('header', [
+    None,
+    'Basic abc',
+    'Bearer',
+    'Bearer a b',
+    'Bearer not-a-token',
+    'expired',
+])
+def test_auth_errors_match_flask_jwt_extended(call, flask_client, auth, header):
+    if header == 'expired':
+        headers = auth(ObjectId(), expires_delta=datetime.timedelta(seconds=-10))
+    else:
+        headers = { 'Authorization': header } if header else {}
+    body = { 'origins': ['110001'], 'destinations': ['400001'] }
+
+    status, res = call('POST', '/services/distance-matrix', body, headers)
+    expected = flask_client.post('/services/distance-matrix', json=body, headers=headers)
+
+    assert status in (401, 422) and set(res) == { 'msg' }
+    assert (status, res) == (expected.status_code, expected.get_json())
+
+@pytest.mark.parametrize('method, path, body', [
+    ('GET', '/shipments/abc', None),
+    ('GET', f'/shipments/{ObjectId()}', None),
+    ('POST', '/services/top-bids:batch', {}),
+    ('POST', '/services/top-bids:batch', { 'shipment_ids': ['abc'] }),
+    ('POST', '/services/distance-matrix', { 'origins': ['110001'], 'method': 'teleport' }),
+    ('POST', f'/shipments/{ObjectId()}/bids', { 'proposed_price': 100 }),
+])
+def test_error_bodies_match_the_flask_app(call, flask_client, auth, method, path, body):
+    headers = auth(ObjectId())
+
+    status, res = call(method, path, body, headers)
+    expected = flask_client.open(path, method=method, json=body, headers=headers)
+
+    assert status in (400, 404) and set(res) == { 'status', 'message', 'error' }
+    assert (status, res) == (expected.status_code, expected.get_json())
+
+def test_invalid_json_body_is_a_bad_request(call, auth):
+    status, res = call('POST', '/services/top-bids:batch', b'{not json', auth(ObjectId()))
+    assert status == 400 and res == { 'status': 400, 'message': 'Bad Request', 'error': '400 Bad Request: Invalid json body.' }
+
+def test_get_shipment_matches_the_flask_app(call, flask_client, db):
+    shipment_id = db.shipments.insert_one({
+        'status': 'waiting', 'origin_code': '110001', 'destination_code': '400001', 'distance': 1150.5,
+        'created_at': datetime.datetime(2026, 1, 5, 10, 30), 'bids': []
+    }).inserted_id
+
+    status, res = call('GET', f'/shipments/{shipment_id}')
+    expected = flask_client.get(f'/shipments/{shipment_id}')
+
+    assert status == 200 and res['data']['created_at'] == 'Mon, 05 Jan 2026 10:30:00 GMT'
+    assert res == expected.get_json()
+
+def test_unexpected_errors_are_a_json_500(asgi_app, call):
+    class Broken:
+        async def find_one(self, *args, **kwargs):
+            raise RuntimeError('connection reset')
+    asgi_app.state.read_db = mock.Mock(shipments=Broken())
+
+    status, res = call('GET', f'/shipments/{ObjectId()}')
+    assert status == 500 and res['status'] == 500 and res['message'] == 'Internal Server Error'
+
+def test_add_bid_to_a_shipment_deleted_meanwhile_leaves_no_bid(call, db, auth):
+    user_id = ObjectId()
+    db.carriers.insert_one({ 'user_id': user_id, 'bids': [] })
+    shipment_id = db.shipments.insert_one({
+        'status': 'waiting', 'distance': 1150.0, 'cargo_load': 5.0, 'created_at': datetime.datetime(2026, 1, 5), 'bids': []
+    }).inserted_id
+    body = { 'proposed_price': 20000, 'proposed_vehicle': str(ObjectId()), 'proposed_delivery_date': '2026-01-12T10:00:00' }
+
+    # the shipment is deleted between its read and the write of the bid
+    def delete_shipment(*args):
+        db.shipments.delete_one({ '_id': shipment_id })
+    with mock.patch('api.asgi.routes.score_bid', side_effect=delete_shipment):
+        status, res = call('POST', f'/shipments/{shipment_id}/bids', body, auth(user_id))
+
+    assert status == 404 and res['error'] == '404 Not Found: Shipment not found.'
+    assert db.bids.count_documents({}) == 0
+    assert db.carriers.find_one({ 'user_id': user_id })['bids'] == []
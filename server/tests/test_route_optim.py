@@ -0,0 +1,142 @@
+# external imports
+import pytest
+import datetime
+import numpy as np
+from bson import ObjectId
+
+# internal imports
+from api import geo_index
+from api.utils.geo import haversine
+from api.services.route_optim import solve_route
+from api.services.route_routes import route_plan, route_document, save_route
+
+CITIES = {
+    '110001': (28.61, 77.21),
+    '400001': (18.94, 72.84),
+    '560001': (12.97, 77.59),
+    '700001': (22.57, 88.36),
+    '600001': (13.08, 80.27),
+}
+
+def random_problem(rng, shipments, start=True):
+    """Pickup and delivery stops of random shipments, with an optional start as stop 0."""
+    points, before = [], []
+    if start:
+        points.append(rng.uniform(-1, 1, 2))
+        before.append(-1)
+    for _ in range(shipments):
+        points += [rng.uniform(-1, 1, 2), rng.uniform(-1, 1, 2)]
+        before += [-1, len(points) - 2]
+    points = np.asarray(points) * 5 + (20, 78)
+    matrix = haversine(points[:, None, 0], points[:, None, 1], points[None, :, 0], points[None, :, 1])
+    return { 'matrix': matrix, 'before': before, 'start': 0 if start else None, 'time_limit': 1.0 }
+
+def route_km(matrix, order, return_to_start=False):
+    order = list(order) + ([order[0]] if return_to_start else [])
+    return float(sum(matrix[a][b] for a, b in zip(order[:-1], order[1:])))
+
+@pytest.fixture
+def known_codes(monkeypatch):
+    """Geocodes CITIES only, like an index without the other postal codes."""
+    def lookup_many(codes):
+        return np.asarray([CITIES.get(code, (np.nan, np.nan)) for code in codes], dtype=np.float64).reshape(-1, 2)
+    monkeypatch.setattr(geo_index, 'lookup_many', lookup_many)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_solve_route_visits_pickups_before_deliveries(seed):
+    problem = random_problem(np.random.default_rng(seed), 12)
+    result = solve_route(problem)
+
+    order = result['order']
+    assert sorted(order) == list(range(len(problem['matrix'])))
+    assert order[0] == 0
+    position = { stop: k for k, stop in enumerate(order) }
+    for stop, first in enumerate(problem['before']):
+        if first >= 0:
+            assert position[first] < position[stop]
+
+    assert result['distance_km'] == pytest.approx(route_km(problem['matrix'], order))
+    assert result['distance_km'] <= result['initial_km'] + 1e-9
+
+def test_solve_route_without_start_begins_anywhere():
+    problem = random_problem(np.random.default_rng(7), 6, start=False)
+    result = solve_route(problem)
+    assert sorted(result['order']) == list(range(12))
+    assert result['distance_km'] == pytest.approx(route_km(problem['matrix'], result['order']))
+
+def test_solve_route_counts_the_drive_back_to_start():
+    # stops on a line, the start in the middle
+    x = np.asarray([0.0, -1.0, 3.0])
+    matrix = np.abs(x[:, None] - x[None, :])
+    one_way = solve_route({ 'matrix': matrix, 'before': [-1, -1, -1], 'start': 0, 'time_limit': 1.0 })
+    round_trip = solve_route({ 'matrix': matrix, 'before': [-1, -1, -1], 'start': 0, 'return_to_start': True, 'time_limit': 1.0 })
+
+    # the nearest stop first when the route ends at the last stop
+    assert one_way['order'] == [0, 1, 2] and one_way['distance_km'] == pytest.approx(5.0)
+    assert round_trip['order'][0] == 0
+    assert round_trip['distance_km'] == pytest.approx(route_km(matrix, round_trip['order'], return_to_start=True)) == pytest.approx(8.0)
+
+def test_solve_route_follows_the_direction_of_asymmetric_distances():
+    # a cycle that is cheap one way round only
+    n = 5
+    matrix = np.full((n, n), 10.0)
+    np.fill_diagonal(matrix, 0.0)
+    for k in range(n):
+        matrix[k, (k + 1) % n] = 1.0
+
+    result = solve_route({ 'matrix': matrix, 'before': [-1] * n, 'start': 2, 'time_limit': 1.0 })
+    assert result['order'] == [2, 3, 4, 0, 1]
+    assert result['distance_km'] == pytest.approx(4.0)
+
+    # the solver must not reverse segments of an asymmetric route
+    rng = np.random.default_rng(3)
+    problem = random_problem(rng, 8)
+    problem['matrix'] = problem['matrix'] * rng.uniform(1.0, 1.5, problem['matrix'].shape)
+    result = solve_route(problem)
+    assert result['distance_km'] == pytest.approx(route_km(problem['matrix'], result['order']))
+
+def test_route_plan_skips_unknown_postal_codes(known_codes):
+    shipped = datetime.datetime(2026, 1, 5, tzinfo=datetime.timezone.utc)
+    shipments = [
+        { '_id': ObjectId(), 'origin_code': '110001', 'destination_code': '400001' },
+        { '_id': ObjectId(), 'origin_code': '999999', 'destination_code': '560001' },
+        { '_id': ObjectId(), 'origin_code': '700001', 'destination_code': '000000' },
+        # shipped, only its delivery is left, the unknown origin does not matter
+        { '_id': ObjectId(), 'origin_code': '999999', 'destination_code': '600001', 'shipped_at': shipped },
+    ]
+    problem, plan, skipped = route_plan(shipments, (28.0, 77.0), True, 1.0)
+
+    assert skipped == [str(shipments[1]['_id']), str(shipments[2]['_id'])]
+    assert plan['stop_types'] == ['start', 'pickup', 'delivery', 'delivery']
+    assert plan['stops'] == [None, shipments[0]['_id'], shipments[0]['_id'], shipments[3]['_id']]
+    assert problem['before'] == [-1, -1, 1, -1]
+    assert problem['start'] == 0 and problem['return_to_start'] is True
+    assert problem['matrix'].shape == (4, 4)
+
+def test_route_document_and_save_route(app, db, known_codes):
+    shipments = [
+        { '_id': ObjectId(), 'origin_code': '110001', 'destination_code': '400001', 'status': 'active' },
+        { '_id': ObjectId(), 'origin_code': '560001', 'destination_code': '600001', 'status': 'active' },
+    ]
+    db.shipments.insert_many([dict(shipment) for shipment in shipments])
+    other = db.shipments.insert_one({ 'status': 'active' }).inserted_id
+
+    problem, plan, _ = route_plan(shipments, None, False, 1.0)
+    result = solve_route(problem)
+    carrier_id = ObjectId()
+    route = route_document(carrier_id, plan, result, 'great_circle', 40.0)
+
+    assert route.carrier_id == carrier_id and set(route.shipment_ids) == { shipment['_id'] for shipment in shipments }
+    assert route.distance == pytest.approx(result['distance_km'])
+    assert route.estimated_duration == datetime.timedelta(hours=result['distance_km'] / 40.0)
+
+    with app.app_context():
+        save_route(db, route)
+
+    doc = db.routes.find_one({ '_id': route.id })
+    # BSON has no duration type, estimated_duration is stored in seconds
+    assert doc['estimated_duration'] == pytest.approx(result['distance_km'] / 40.0 * 3600)
+    assert doc['stop_types'].count('pickup') == 2 and len(doc['path']) == 4
+    for shipment in shipments:
+        assert db.shipments.find_one({ '_id': shipment['_id'] })['predicted_route'] == route.id
+    assert 'predicted_route' not in db.shipments.find_one({ '_id': other })
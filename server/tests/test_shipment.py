@@ -0,0 +1,266 @@
+# external imports
+import os
+import pytest
+import datetime
+import mongomock
+import numpy as np
+from unittest import mock
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+# internal imports
+from api.utils.bulk_transfer import export_collection, import_collection
+from api.services.predict_top_bid import FEATURE_COLUMNS, features_from_documents, predict_top_bid
+
+def test_parquet_round_trip_keeps_pickup_location(tmp_path):
+    pytest.importorskip('pyarrow')
+    source, target = mongomock.MongoClient()['source'], mongomock.MongoClient()['target']
+    now = datetime.datetime(2026, 1, 5, 10, 30, tzinfo=datetime.timezone.utc)
+    shipments = [
+        {
+            '_id': ObjectId(), 'status': 'waiting', 'origin_code': '110001', 'destination_code': '400001',
+            'pickup_location': { 'type': 'Point', 'coordinates': [77.21, 28.61] },
+            'distance': 1150.5, 'bids': [ObjectId()], 'created_at': now, 'updated_at': None
+        },
+        { '_id': ObjectId(), 'status': 'waiting', 'origin_code': '999999', 'pickup_location': None, 'created_at': now, 'updated_at': None },
+    ]
+    source.shipments.insert_many(shipments)
+
+    path = str(tmp_path / 'shipments')
+    exported = export_collection(source, 'shipments', path, 'parquet', chunk_size=1)
+    assert exported['written'] == 2 and exported['invalid'] == 0
+    assert len(os.listdir(path)) == 2
+
+    imported = import_collection(target, 'shipments', path, 'parquet')
+    assert imported['written'] == 2 and imported['invalid'] == 0
+
+    first, second = (target.shipments.find_one({ '_id': shipment['_id'] }) for shipment in shipments)
+    assert first['pickup_location'] == { 'type': 'Point', 'coordinates': [77.21, 28.61] }
+    assert first['bids'] == shipments[0]['bids']
+    assert first['distance'] == 1150.5
+    assert second['pickup_location'] is None
+
+def test_top_bid_moves_a_stale_pointer_to_the_best_remaining_bid(client, db, auth):
+    deleted, low, high = ObjectId(), ObjectId(), ObjectId()
+    shipment_id = db.shipments.insert_one({ 'status': 'waiting', 'bids': [low, high], 'top_bid': deleted, 'top_bid_score': 0.9 }).inserted_id
+    db.bids.insert_many([
+        { '_id': low, 'shipment_id': shipment_id, 'proposed_price': 100.0, 'score': 0.5 },
+        { '_id': high, 'shipment_id': shipment_id, 'proposed_price': 120.0, 'score': 0.7 },
+    ])
+
+    res = client.get(f'/shipments/{shipment_id}/top-bids', headers=auth(ObjectId()))
+    assert res.status_code == 200 and res.get_json()['data']['_id'] == str(high)
+
+    shipment = db.shipments.find_one({ '_id': shipment_id })
+    assert shipment['top_bid'] == high and shipment['top_bid_score'] == 0.7
+
+def test_top_bid_without_bid_documents(client, db, auth):
+    missing = ObjectId()
+    shipment_id = db.shipments.insert_one({ 'status': 'waiting', 'bids': [missing], 'top_bid': missing, 'top_bid_score': 0.4 }).inserted_id
+
+    res = client.get(f'/shipments/{shipment_id}/top-bids', headers=auth(ObjectId()))
+    assert res.status_code == 404
+    assert db.shipments.find_one({ '_id': shipment_id })['top_bid'] is None
+
+def test_serialize_document_keeps_the_jsonify_date_format(app):
+    from api.db_models.shipment_models import Shipment, Route
+
+    shipped = datetime.datetime(2026, 1, 5, 10, 30, tzinfo=datetime.timezone.utc)
+    doc = { '_id': ObjectId(), 'status': 'active', 'shipped_at': shipped, 'updated_at': None }
+
+    with app.app_context():
+        trusted = Shipment.serialize_document(doc, trusted=True)
+        validated = Shipment.serialize_document(doc, trusted=False)
+        assert trusted['shipped_at'] == validated['shipped_at'] == app.json.loads(app.json.dumps({ 'd': shipped }))['d']
+    assert trusted['shipped_at'] == 'Mon, 05 Jan 2026 10:30:00 GMT'
+
+    # missing keys: empty lists stay empty, computed defaults are not made up
+    assert trusted['bids'] == [] and trusted['created_at'] is None
+
+    route = Route.serialize_document({ '_id': ObjectId(), 'estimated_duration': 5400.0 }, trusted=True)
+    assert route['estimated_duration'] == 5400.0 and route['created_at'] is None
+
+def test_bid_features_start_at_the_creation_of_the_shipment(app):
+    created = datetime.datetime(2026, 1, 5)
+    bid = { 'proposed_price': 1000.0, 'proposed_delivery_date': datetime.datetime(2026, 1, 15) }
+    waiting = { 'distance': 100.0, 'cargo_load': 5.0, 'created_at': created }
+    # shipped after the bid was accepted, which the features must not know about
+    shipped = { **waiting, 'shipped_at': datetime.datetime(2026, 2, 20) }
+
+    features = features_from_documents([bid], shipped)[0]
+    assert (features == features_from_documents([bid], waiting)[0]).all()
+    assert features[FEATURE_COLUMNS.index('delivery_duration')] == 10
+    assert features[FEATURE_COLUMNS.index('start_month')] == 1
+
+def make_bid_parties(db):
+    """Inserts a carrier and a waiting shipment, returns the carrier's user id and the shipment id."""
+    user_id = ObjectId()
+    db.carriers.insert_one({ 'user_id': user_id, 'bids': [] })
+    shipment_id = db.shipments.insert_one({
+        'status': 'waiting', 'distance': 1150.0, 'cargo_load': 5.0, 'created_at': datetime.datetime(2026, 1, 5), 'bids': []
+    }).inserted_id
+    return user_id, shipment_id
+
+def bid_body(**fields):
+    return { 'proposed_price': 20000, 'proposed_vehicle': str(ObjectId()), 'proposed_delivery_date': '2026-01-12T10:00:00', **fields }
+
+def test_add_bid_to_a_shipment_deleted_meanwhile_leaves_no_bid(client, db, auth):
+    user_id, shipment_id = make_bid_parties(db)
+
+    # the shipment is deleted between its read and the write of the bid
+    def delete_shipment(*args):
+        db.shipments.delete_one({ '_id': shipment_id })
+    with mock.patch('api.shipment.bidding.score_bid', side_effect=delete_shipment):
+        res = client.post(f'/shipments/{shipment_id}/bids', json=bid_body(), headers=auth(user_id))
+
+    assert res.status_code == 404
+    assert db.bids.count_documents({}) == 0
+    assert db.carriers.find_one({ 'user_id': user_id })['bids'] == []
+
+def test_bulk_bids_on_a_shipment_deleted_meanwhile_are_reported(client, db, auth):
+    user_id, kept = make_bid_parties(db)
+    _, deleted = make_bid_parties(db)
+
+    def delete_shipment(features):
+        db.shipments.delete_one({ '_id': deleted })
+        return np.full(len(features), 0.5)
+    body = { 'bids': [bid_body(shipment_id=str(kept)), bid_body(shipment_id=str(deleted)), bid_body(shipment_id=str(kept))] }
+    with mock.patch('api.shipment.bidding.score_features', side_effect=delete_shipment):
+        res = client.post('/shipments/bids:bulk', json=body, headers=auth(user_id))
+
+    assert res.status_code == 200
+    data = res.get_json()['data']
+    assert [bid['index'] for bid in data['bids']] == [0, 2]
+    assert data['errors'] == [{ 'index': 1, 'message': 'Shipment not found.' }]
+    assert db.bids.count_documents({}) == 2 and db.bids.count_documents({ 'shipment_id': deleted }) == 0
+    assert len(db.carriers.find_one({ 'user_id': user_id })['bids']) == 2
+
+def test_add_bid_appends_it_to_the_shipment_and_the_carrier(client, db, auth):
+    user_id, shipment_id = make_bid_parties(db)
+
+    with mock.patch('api.shipment.bidding.score_bid', return_value=0.8):
+        res = client.post(f'/shipments/{shipment_id}/bids', json=bid_body(), headers=auth(user_id))
+
+    assert res.status_code == 200
+    data = res.get_json()['data']
+    assert set(data) == { 'bid' } and data['bid']['score'] == 0.8
+    bid_id = ObjectId(data['bid']['_id'])
+    shipment = db.shipments.find_one({ '_id': shipment_id })
+    assert shipment['bids'] == [bid_id] and shipment['top_bid'] == bid_id and shipment['top_bid_score'] == 0.8
+    assert db.carriers.find_one({ 'user_id': user_id })['bids'] == [bid_id]
+    assert db.bids.find_one({ '_id': bid_id })['shipment_id'] == shipment_id
+
+def test_add_bid_returns_the_documents_when_asked(client, db, auth):
+    user_id, shipment_id = make_bid_parties(db)
+
+    with mock.patch('api.shipment.bidding.score_bid', return_value=None):
+        res = client.post(f'/shipments/{shipment_id}/bids?return_documents=true', json=bid_body(), headers=auth(user_id))
+
+    assert res.status_code == 200
+    data = res.get_json()['data']
+    assert data['shipment']['bids'] == [data['bid']['_id']] and data['shipment']['top_bid'] is None
+    assert data['carrier']['bids'] == [data['bid']['_id']]
+
+@pytest.mark.parametrize('body, message', [
+    ({ 'proposed_price': 100 }, 'Missing required fields.'),
+    (bid_body(proposed_price=0), 'Price cannot be less than 1.'),
+    (bid_body(proposed_vehicle='abc'), 'Invalid object id.'),
+    (bid_body(proposed_delivery_date='12/01/2026'), 'Invalid proposed_delivery_date format'),
+])
+def test_add_bid_rejects_invalid_bids(client, db, auth, body, message):
+    user_id, shipment_id = make_bid_parties(db)
+
+    res = client.post(f'/shipments/{shipment_id}/bids', json=body, headers=auth(user_id))
+    assert res.status_code == 400 and message in res.get_json()['error']
+    assert db.bids.count_documents({}) == 0
+
+def test_add_bid_needs_a_carrier_and_a_shipment(client, db, auth):
+    user_id, shipment_id = make_bid_parties(db)
+
+    assert client.post(f'/shipments/{shipment_id}/bids', json=bid_body(), headers=auth(ObjectId())).status_code == 404
+    assert client.post(f'/shipments/{ObjectId()}/bids', json=bid_body(), headers=auth(user_id)).status_code == 404
+    assert db.bids.count_documents({}) == 0
+
+def test_bulk_bids_report_invalid_items_by_index(client, db, auth):
+    user_id, shipment_id = make_bid_parties(db)
+    body = { 'bids': [
+        bid_body(shipment_id=str(shipment_id), proposed_price=15000),
+        bid_body(shipment_id='abc'),
+        bid_body(shipment_id=str(ObjectId())),
+        { 'shipment_id': str(shipment_id) },
+        bid_body(shipment_id=str(shipment_id), proposed_price=25000),
+    ]}
+
+    with mock.patch('api.shipment.bidding.score_features', return_value=np.asarray([0.3, 0.9])):
+        res = client.post('/shipments/bids:bulk', json=body, headers=auth(user_id))
+
+    assert res.status_code == 200
+    data = res.get_json()['data']
+    assert [(bid['index'], bid['score']) for bid in data['bids']] == [(0, 0.3), (4, 0.9)]
+    assert data['errors'] == [
+        { 'index': 1, 'message': 'Invalid object id.' },
+        { 'index': 2, 'message': 'Shipment not found.' },
+        { 'index': 3, 'message': 'Missing required fields.' },
+    ]
+
+    placed = [ObjectId(bid['_id']) for bid in data['bids']]
+    shipment = db.shipments.find_one({ '_id': shipment_id })
+    assert shipment['bids'] == placed and shipment['top_bid'] == placed[1] and shipment['top_bid_score'] == 0.9
+    assert db.carriers.find_one({ 'user_id': user_id })['bids'] == placed
+    assert db.bids.count_documents({}) == 2
+
+def test_bulk_bids_without_a_valid_item_write_nothing(client, db, auth):
+    user_id, _ = make_bid_parties(db)
+
+    res = client.post('/shipments/bids:bulk', json={ 'bids': [bid_body(shipment_id=str(ObjectId()))] }, headers=auth(user_id))
+    assert res.status_code == 400 and res.get_json()['data']['errors'] == [{ 'index': 0, 'message': 'Shipment not found.' }]
+    assert client.post('/shipments/bids:bulk', json={ 'bids': [] }, headers=auth(user_id)).status_code == 400
+    assert db.bids.count_documents({}) == 0 and db.carriers.find_one({ 'user_id': user_id })['bids'] == []
+
+@pytest.mark.parametrize('config', [{ 'BIDS_BULK_MAX': 2 }])
+def test_bulk_bids_are_limited(client, db, auth):
+    user_id, shipment_id = make_bid_parties(db)
+
+    res = client.post('/shipments/bids:bulk', json={ 'bids': [bid_body(shipment_id=str(shipment_id))] * 3 }, headers=auth(user_id))
+    assert res.status_code == 400 and res.get_json()['error'] == '400 Bad Request: Too many bids.'
+
+def test_delete_bid_of_a_deleted_shipment(client, db, auth):
+    user_id, shipment_id = make_bid_parties(db)
+    bid_id = db.bids.insert_one({ 'shipment_id': shipment_id, 'carrier_id': db.carriers.find_one()['_id'], 'score': 0.5 }).inserted_id
+    db.carriers.update_one({ 'user_id': user_id }, { '$push': { 'bids': bid_id } })
+    db.shipments.delete_one({ '_id': shipment_id })
+
+    res = client.delete(f'/shipments/bids/{bid_id}', headers=auth(user_id))
+    assert res.status_code == 200
+    assert res.get_json()['data']['shipment'] is None and res.get_json()['data']['carrier']['bids'] == []
+    assert db.bids.count_documents({}) == 0
+
+@pytest.mark.parametrize('query', ['chunk_size=abc', 'chunk_size=0', 'format=csv'])
+def test_export_rejects_invalid_arguments(app, client, auth, query):
+    admin = ObjectId()
+    app.config['ADMIN_USER_IDS'] = [str(admin)]
+
+    res = client.get(f'/admin/export/shipments?{query}', headers=auth(admin))
+    assert res.status_code == 400 and res.is_json
+
+def test_failed_shipment_insert_leaves_no_id_on_the_shipper(client, db, auth):
+    user_id = ObjectId()
+    db.shippers.insert_many([{ 'user_id': user_id, 'postal_code': '110001', 'sent_shipments': [] }, { 'postal_code': '400001' }])
+    body = { 'origin_code': '110001', 'destination_code': '400001', 'cargo_load': 5 }
+
+    with mock.patch('api.shipment.management.calculate_distance', return_value=1150.0), \
+         mock.patch('api.shipment.management.geo_point', return_value=None), \
+         mock.patch.object(mongomock.Collection, 'insert_one', side_effect=AutoReconnect('primary stepped down')):
+        with pytest.raises(AutoReconnect):
+            client.post('/shipments/', json=body, headers=auth(user_id))
+
+    assert db.shippers.find_one({ 'user_id': user_id })['sent_shipments'] == []
+    assert db.shipments.count_documents({}) == 0
+
+def test_predict_top_bid_without_a_complete_bid(app):
+    bid_ids = np.asarray([ObjectId(), ObjectId()], dtype=object)
+    features = np.full((2, len(FEATURE_COLUMNS)), np.nan)
+    built = (bid_ids, np.asarray([ObjectId()] * 2, dtype=object), features)
+
+    with mock.patch('api.services.predict_top_bid.build_bid_features', return_value=built):
+        assert predict_top_bid(ObjectId()) is None
@@ -0,0 +1,201 @@
+# external imports
+import pytest
+import datetime
+from unittest import mock
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+# internal imports
+from api.tracking.pings import parse_ping
+from api.utils.ping_buffer import PingBuffer, PINGS_COLLECTION
+
+NOW = datetime.datetime(2026, 1, 5, 10, 0, tzinfo=datetime.timezone.utc)
+
+def ping(shipment_id, minutes, location=(28.6, 77.2)):
+    return { '_id': ObjectId(), 'shipment_id': shipment_id, 'location': list(location), 'timestamp': NOW + datetime.timedelta(minutes=minutes) }
+
+def make_buffer(**settings):
+    buffer = PingBuffer()
+    buffer.flush_interval = 0
+    for name, value in settings.items():
+        setattr(buffer, name, value)
+    return buffer
+
+@pytest.fixture
+def carrier_shipment(db):
+    """A carrier's user id and a shipment assigned to it."""
+    user_id = ObjectId()
+    carrier_id = db.carriers.insert_one({ 'user_id': user_id }).inserted_id
+    shipment_id = db.shipments.insert_one({ 'carrier_id': carrier_id, 'status': 'active' }).inserted_id
+    return user_id, shipment_id
+
+@pytest.mark.parametrize('data, message', [
+    ({ 'location': [1, 2] }, 'Missing required fields.'),
+    ({ 'shipment_id': 'abc', 'location': [1, 2] }, 'Invalid object id.'),
+    ({ 'shipment_id': str(ObjectId()), 'location': [1] }, 'Invalid location'),
+    ({ 'shipment_id': str(ObjectId()), 'location': 'north' }, 'Invalid location'),
+    ({ 'shipment_id': str(ObjectId()), 'location': [91, 2] }, 'Invalid location'),
+    ({ 'shipment_id': str(ObjectId()), 'location': [1, float('nan')] }, 'Invalid location'),
+    ({ 'shipment_id': str(ObjectId()), 'location': [1, 2], 'timestamp': 'yesterday' }, 'Invalid timestamp'),
+    ({ 'shipment_id': str(ObjectId()), 'location': [1, 2], 'timestamp': '2026-01-05T11:00:00Z' }, 'Timestamp is in the future.'),
+])
+def test_parse_ping_errors(data, message):
+    with pytest.raises(ValueError, match=message.replace('.', r'\.')):
+        parse_ping(data, NOW)
+
+def test_parse_ping_defaults_to_utc_and_receive_time():
+    shipment_id = ObjectId()
+    parsed = parse_ping({ 'shipment_id': str(shipment_id), 'location': ['28.6', 77.2] }, NOW)
+    assert parsed['shipment_id'] == shipment_id and parsed['location'] == [28.6, 77.2] and parsed['timestamp'] == NOW
+
+    parsed = parse_ping({ 'shipment_id': str(shipment_id), 'location': [0, 0], 'timestamp': '2026-01-05T09:30:00' }, NOW)
+    assert parsed['timestamp'] == NOW - datetime.timedelta(minutes=30)
+
+def test_add_pings_reports_errors_per_index(client, db, auth, carrier_shipment):
+    user_id, shipment_id = carrier_shipment
+    other = db.shipments.insert_one({ 'carrier_id': ObjectId() }).inserted_id
+    pings = [
+        { 'shipment_id': str(shipment_id), 'location': [28.6, 77.2], 'timestamp': '2026-01-05T09:00:00Z' },
+        { 'shipment_id': str(other), 'location': [28.6, 77.2] },
+        { 'shipment_id': 'x', 'location': [28.6, 77.2] },
+        { 'shipment_id': str(shipment_id), 'location': [28.7, 77.3], 'timestamp': '2026-01-05T09:05:00Z' },
+        { 'shipment_id': str(shipment_id), 'location': [200, 0] },
+    ]
+
+    res = client.post('/tracking/pings', json={ 'pings': pings }, headers=auth(user_id))
+    assert res.status_code == 202
+    data = res.get_json()['data']
+    assert data['accepted'] == 2
+    assert [error['index'] for error in data['errors']] == [1, 2, 4]
+    assert data['errors'][0]['message'] == 'Shipment not found.'
+
+    # TRACKING_FLUSH_INTERVAL is 0 in tests, the pings are written before the response
+    assert db[PINGS_COLLECTION].count_documents({ 'shipment_id': shipment_id }) == 2
+    assert db.shipments.find_one({ '_id': shipment_id })['location_updated_at'] is not None
+
+def test_add_pings_without_accepted_ping(client, db, auth, carrier_shipment):
+    user_id, _ = carrier_shipment
+    res = client.post('/tracking/pings', json={ 'pings': [{ 'shipment_id': str(ObjectId()), 'location': [1, 2] }] }, headers=auth(user_id))
+    assert res.status_code == 400 and res.get_json()['data']['errors'][0]['index'] == 0
+
+    assert client.post('/tracking/pings', json={ 'pings': [] }, headers=auth(user_id)).status_code == 400
+    assert db[PINGS_COLLECTION].count_documents({}) == 0
+
+def test_flush_writes_once_and_updates_each_shipment_once(db):
+    first, second = db.shipments.insert_many([{}, {}]).inserted_ids
+    pings = [ping(first, 0), ping(first, 2), ping(second, 1), ping(first, 1), ping(second, 0)]
+    buffer = make_buffer(flush_interval=60)
+    buffer._pings = list(pings)
+
+    collection = type(db[PINGS_COLLECTION])
+    with mock.patch.object(collection, 'insert_many', autospec=True, side_effect=collection.insert_many) as insert_many, \
+         mock.patch.object(collection, 'bulk_write', autospec=True, side_effect=collection.bulk_write) as bulk_write:
+        assert buffer.flush() == 5
+
+    assert insert_many.call_count == 1 and len(insert_many.call_args.args[1]) == 5
+    assert bulk_write.call_count == 1 and len(bulk_write.call_args.args[1]) == 2
+    assert db.shipments.find_one({ '_id': first })['current_location'] == pings[1]['_id']
+    assert db.shipments.find_one({ '_id': second })['current_location'] == pings[2]['_id']
+
+    # a late ping is stored but does not move the shipment back
+    late = ping(first, -10)
+    buffer._pings = [late]
+    assert buffer.flush() == 1
+    assert db[PINGS_COLLECTION].count_documents({ '_id': late['_id'] }) == 1
+    assert db.shipments.find_one({ '_id': first })['current_location'] == pings[1]['_id']
+
+def test_failed_flush_restores_pings_while_there_is_room(db):
+    shipment_id = db.shipments.insert_one({}).inserted_id
+    pings = [ping(shipment_id, minutes) for minutes in range(5)]
+    buffer = make_buffer(max_size=3)
+
+    # taken, then kept for the next flush: the failure does not reach the request
+    with mock.patch.object(type(db[PINGS_COLLECTION]), 'insert_many', side_effect=AutoReconnect('down')):
+        buffer.add(pings)
+
+    stats = buffer.stats()
+    assert stats['received'] == 5 and stats['buffered'] == 3 and stats['dropped'] == 2
+    assert stats['failed_flushes'] == 1 and stats['flushed'] == 0
+
+    assert buffer.flush() == 3
+    assert [doc['_id'] for doc in db[PINGS_COLLECTION].find()] == [p['_id'] for p in pings[:3]]
+    assert db.shipments.find_one({ '_id': shipment_id })['current_location'] == pings[2]['_id']
+    assert buffer.stats()['buffered'] == 0
+
+def test_full_buffer_that_cannot_be_written_takes_no_ping(db):
+    shipment_id = db.shipments.insert_one({}).inserted_id
+    buffer = make_buffer(flush_interval=60, max_size=3)
+    buffer._pings = [ping(shipment_id, minutes) for minutes in range(3)]
+
+    with mock.patch.object(type(db[PINGS_COLLECTION]), 'insert_many', side_effect=AutoReconnect('down')):
+        with pytest.raises(AutoReconnect):
+            buffer.add([ping(shipment_id, 10)])
+
+    stats = buffer.stats()
+    assert stats['received'] == 0 and stats['buffered'] == 3 and stats['dropped'] == 0
+
+def test_add_pings_answers_503_while_pings_cannot_be_stored(client, db, auth, carrier_shipment, monkeypatch):
+    from api import ping_buffer
+
+    user_id, shipment_id = carrier_shipment
+    monkeypatch.setattr(ping_buffer, 'flush', mock.Mock(side_effect=AutoReconnect('down')))
+    body = { 'pings': [{ 'shipment_id': str(shipment_id), 'location': [28.6, 77.2] }] }
+
+    res = client.post('/tracking/pings', json=body, headers=auth(user_id))
+    assert res.status_code == 503 and res.is_json
+    assert res.get_json()['message'] == 'Service Unavailable'
+    assert ping_buffer.stats()['buffered'] == 0
+
+def test_failed_shipment_update_is_retried_without_rewriting_pings(db):
+    shipment_id = db.shipments.insert_one({}).inserted_id
+    pings = [ping(shipment_id, 0), ping(shipment_id, 1)]
+    buffer = make_buffer(flush_interval=60)
+    buffer._pings = list(pings)
+
+    with mock.patch.object(type(db.shipments), 'bulk_write', side_effect=AutoReconnect('down')):
+        with pytest.raises(AutoReconnect):
+            buffer.flush()
+
+    assert db[PINGS_COLLECTION].count_documents({}) == 2
+    assert buffer.stats()['buffered'] == 0 and buffer.stats()['pending_updates'] == 1
+
+    assert buffer.flush() == 0
+    assert db[PINGS_COLLECTION].count_documents({}) == 2
+    assert db.shipments.find_one({ '_id': shipment_id })['current_location'] == pings[1]['_id']
+
+def test_get_pings_pages_with_a_keyset_cursor(client, db, auth):
+    shipper_user = ObjectId()
+    shipper_id = db.shippers.insert_one({ 'user_id': shipper_user }).inserted_id
+    shipment_id = db.shipments.insert_one({ 'shipper_id': shipper_id }).inserted_id
+    # two pings share a timestamp, _id orders them
+    pings = [ping(shipment_id, minutes) for minutes in [0, 1, 1, 2, 3]]
+    db[PINGS_COLLECTION].insert_many([dict(p) for p in reversed(pings)])
+    db[PINGS_COLLECTION].insert_one(ping(ObjectId(), 0))
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        res = client.get(
+            f'/tracking/shipments/{shipment_id}/pings', query_string={ 'limit': 2, **({ 'cursor': cursor } if cursor else {}) },
+            headers=auth(shipper_user)
+        )
+        assert res.status_code == 200
+        data = res.get_json()['data']
+        seen += [p['_id'] for p in data['pings']]
+        pages += 1
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    assert seen == [str(p['_id']) for p in pings] and pages == 3
+
+    res = client.get(f'/tracking/shipments/{shipment_id}/pings', query_string={ 'cursor': 'nope' }, headers=auth(shipper_user))
+    assert res.status_code == 400
+    assert client.get(f'/tracking/shipments/{shipment_id}/pings', headers=auth(ObjectId())).status_code == 403
+
+def test_tracking_stats_needs_an_admin(app, client, auth):
+    admin = ObjectId()
+    app.config['ADMIN_USER_IDS'] = [str(admin)]
+
+    assert client.get('/tracking/stats').status_code == 401
+    assert client.get('/tracking/stats', headers=auth(ObjectId())).status_code == 403
+    assert client.get('/tracking/stats', headers=auth(admin)).status_code == 200
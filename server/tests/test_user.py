@@ -0,0 +1,29 @@
+# external imports
+from bson import ObjectId
+
+def make_carrier(db, **fields):
+    user_id = ObjectId()
+    db.carriers.insert_one({ 'user_id': user_id, 'modes': [], 'rating': 2.0, 'verified': False, 'vehicles': [], **fields })
+    return user_id
+
+def test_update_carrier_sets_allowed_fields(client, db, auth):
+    user_id = make_carrier(db)
+    res = client.put('/users/carriers/update', json={ 'modes': ['road', 'railway'], 'address': 'Depot 4' }, headers=auth(user_id))
+    assert res.status_code == 200
+
+    carrier = db.carriers.find_one({ 'user_id': user_id })
+    assert carrier['modes'] == ['road', 'railway'] and carrier['address'] == 'Depot 4'
+    assert carrier['updated_at'] is not None
+
+def test_update_carrier_rejects_platform_fields(client, db, auth):
+    user_id = make_carrier(db)
+    res = client.put('/users/carriers/update', json={ 'modes': ['road'], 'verified': True, 'rating': 5 }, headers=auth(user_id))
+    assert res.status_code == 400
+
+    carrier = db.carriers.find_one({ 'user_id': user_id })
+    assert carrier['rating'] == 2.0 and carrier['verified'] is False and carrier['modes'] == []
+
+def test_update_carrier_rejects_unknown_modes(client, db, auth):
+    user_id = make_carrier(db)
+    assert client.put('/users/carriers/update', json={ 'modes': ['teleport'] }, headers=auth(user_id)).status_code == 400
+    assert client.put('/users/carriers/update', json={ 'modes': 'road' }, headers=auth(user_id)).status_code == 400